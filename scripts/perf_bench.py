@@ -0,0 +1,294 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+Created on 18 Oct 2026
+
+@author: agent
+
+Copyright © 2026 agent
+
+This file is part of Odemis.
+
+Odemis is free software: you can redistribute it and/or modify it under the terms of the GNU General Public License version 2 as published by the Free Software Foundation.
+
+Odemis is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License along with Odemis. If not, see http://www.gnu.org/licenses/.
+'''
+
+# This script runs a set of performance benchmarks on the simulated microscopes.
+# For each configuration, it starts the backend and measures:
+#  * the startup time of the backend,
+#  * the frame rate and the throughput (over IPC) of the dataflow of each detector,
+#  * the time to project a frame to RGB (as done by the streams),
+#  * the speed of exporting the frames as TIFF and HDF5.
+# The results can be saved as JSON, in order to track the performance over time.
+# The backend must not be running.
+# Example usage:
+# python perf_bench.py --duration 5 --json perf-$(date +%Y%m%d).json
+
+from __future__ import division
+
+import argparse
+import json
+import logging
+import numpy
+import odemis
+from odemis import model
+from odemis.dataio import tiff, hdf5
+from odemis.util import img, driver, test
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+
+logging.getLogger().setLevel(logging.INFO)
+
+SIM_PATH = os.path.dirname(odemis.__file__) + "/../../install/linux/usr/share/odemis/sim/"
+# Name -> microscope file. Together they cover the simulators of the main
+# detectors: simsem, andorcam2 (fake), semcomedi (fake), simcam.
+CONFIGS = {"secom": SIM_PATH + "secom-sim.odm.yaml",  # simsem + andorcam2
+           "secom2": SIM_PATH + "secom2-sim.odm.yaml",  # semcomedi + andorcam2
+           "delphi": SIM_PATH + "delphi-sim.odm.yaml",  # simsem + simcam + andorcam2
+          }
+
+# Roles of the detectors whose dataflow is measured
+DETECTOR_ROLES = ("ccd", "se-detector", "bs-detector", "cl-detector", "overview-ccd")
+
+
+class FrameCounter(object):
+    """
+    Counts the frames received from a dataflow
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.nbytes = 0
+        self.latency = 0  # sum of the latencies
+        self.last = None  # last frame received
+        self.first_time = None  # time of the first frame received
+        self.last_time = None
+        self.received = threading.Event()
+
+    def on_data(self, df, data):
+        now = time.time()
+        if self.first_time is None:
+            # The first frame can take longer (eg, due to the start of the
+            # acquisition), so it's only used as reference.
+            self.first_time = now
+        else:
+            self.count += 1
+            self.nbytes += data.nbytes
+            self.latency += now - data.metadata.get(model.MD_ACQ_DATE, now)
+        self.last_time = now
+        self.last = data
+        self.received.set()
+
+
+def start_backend(config):
+    """
+    Start the backend, and wait until it's fully running
+    config (str): path to the microscope file
+    return (float): the time it took to start (in s)
+    raises IOError if the backend failed to start
+    """
+    if driver.get_backend_status() != driver.BACKEND_STOPPED:
+        raise IOError("A backend is already running")
+
+    logging.info("Starting backend with %s", config)
+    startt = time.time()
+    cmd = test.ODEMISD_CMD + test.ODEMISD_ARG + [config]
+    ret = subprocess.call(cmd, preexec_fn=test.setlimits)
+    if ret != 0:
+        raise IOError("Failed starting backend with '%s' (returned %d)" % (cmd, ret))
+
+    end = startt + 60  # s timeout
+    while time.time() < end:
+        status = driver.get_backend_status()
+        if status == driver.BACKEND_RUNNING:
+            return time.time() - startt
+        elif status in (driver.BACKEND_STARTING, driver.BACKEND_STOPPED):
+            # STOPPED: the daemon might not have created its socket yet
+            time.sleep(0.05)
+        else:
+            break
+
+    raise IOError("Backend failed to start, now %s" % (driver.get_backend_status(),))
+
+
+def bench_dataflow(comp, duration):
+    """
+    Measures the frame rate of the .data of the given detector
+    comp (Detector): the component
+    duration (float): time to acquire (in s)
+    return (dict str -> value): the measurements, and the last frame under "data"
+    """
+    counter = FrameCounter()
+    comp.data.subscribe(counter.on_data)
+    try:
+        if not counter.received.wait(30):
+            raise IOError("No data received from %s" % (comp.name,))
+        time.sleep(duration)
+    finally:
+        comp.data.unsubscribe(counter.on_data)
+
+    dur = counter.last_time - counter.first_time
+    if counter.count == 0 or dur <= 0:
+        fps, tput, lat = 0, 0, 0
+    else:
+        fps = counter.count / dur
+        tput = counter.nbytes / dur
+        lat = counter.latency / counter.count
+
+    return {"fps": fps,
+            "throughput": tput,
+            "latency": lat,
+            "frames": counter.count,
+            "data": counter.last}
+
+
+def bench_projection(data, repeat):
+    """
+    Measures the time to convert a frame to a RGB image, in the same way as
+      the streams: histogram, auto brightness/contrast and RGB conversion.
+    data (DataArray): the frame
+    repeat (int): number of times to do the projection
+    return (float): the shortest duration (in s)
+    """
+    data = img.ensure2DImage(data)
+    durations = []
+    for i in range(repeat):
+        startt = time.time()
+        hist, edges = img.histogram(data)
+        irange = img.findOptimalRange(hist, edges, 1 / 256)
+        img.DataArray2RGB(data, irange)
+        durations.append(time.time() - startt)
+
+    return min(durations)
+
+
+def bench_export(exporter, ldata, repeat):
+    """
+    Measures the time to save the frames into a file
+    exporter (module): the dataio converter
+    ldata (list of DataArray): the data to save
+    repeat (int): number of times to save the file
+    return (float): the shortest duration (in s)
+    """
+    fd, fn = tempfile.mkstemp(suffix=exporter.EXTENSIONS[0])
+    os.close(fd)
+    try:
+        durations = []
+        for i in range(repeat):
+            startt = time.time()
+            exporter.export(fn, ldata)
+            durations.append(time.time() - startt)
+    finally:
+        os.remove(fn)
+
+    return min(durations)
+
+
+def bench_config(name, config, duration, repeat):
+    """
+    Runs all the benchmarks on a microscope configuration
+    name (str): name of the configuration
+    config (str): path to the microscope file
+    duration (float): time to acquire on each dataflow (in s)
+    repeat (int): number of times each offline measurement is done
+    return (list of dict): the results, each containing "config", "test",
+      "component", "value" and "unit"
+    """
+    results = []
+
+    def add_result(tname, comp, value, unit):
+        results.append({"config": name, "test": tname, "component": comp,
+                        "value": value, "unit": unit})
+        print "%-8s %-18s %-15s %12.6g %s" % (name, tname, comp, value, unit)
+
+    startt = start_backend(config)
+    add_result("startup", "backend", startt, "s")
+    ldata = []
+    try:
+        comps = [c for c in model.getComponents() if c.role in DETECTOR_ROLES]
+        for comp in sorted(comps, key=lambda c: c.role):
+            res = bench_dataflow(comp, duration)
+            add_result("fps", comp.role, res["fps"], "Hz")
+            add_result("ipc_throughput", comp.role, res["throughput"], "B/s")
+            add_result("latency", comp.role, res["latency"], "s")
+            data = res["data"]
+            ldata.append(data)
+            pdur = bench_projection(data, repeat)
+            add_result("projection", comp.role, pdur, "s")
+    finally:
+        test.stop_backend()
+
+    if ldata:
+        nbytes = sum(d.nbytes for d in ldata)
+        for exporter in (tiff, hdf5):
+            edur = bench_export(exporter, ldata, repeat)
+            add_result("export_throughput", exporter.FORMAT, nbytes / edur, "B/s")
+
+    return results
+
+
+def main(args):
+    """
+    Handles the command line arguments
+    args is the list of arguments passed
+    return (int): value to return to the OS as program exit code
+    """
+    parser = argparse.ArgumentParser(description="Measure the performance of "
+                                     "the acquisition, display and export on "
+                                     "the simulated microscopes.")
+    parser.add_argument("--config", "-c", dest="configs", action="append",
+                        choices=sorted(CONFIGS.keys()),
+                        help="Microscope configuration to use (default: all)")
+    parser.add_argument("--duration", "-d", dest="duration", type=float, default=5,
+                        help="Time (in s) to acquire data on each dataflow")
+    parser.add_argument("--repeat", "-r", dest="repeat", type=int, default=3,
+                        help="Number of times each offline measurement is done "
+                        "(the shortest time is reported)")
+    parser.add_argument("--json", dest="json",
+                        help="Filename where to store the results as JSON")
+
+    options = parser.parse_args(args[1:])
+
+    names = options.configs or sorted(CONFIGS.keys())
+
+    try:
+        if driver.get_backend_status() != driver.BACKEND_STOPPED:
+            raise ValueError("The backend must be stopped to run the benchmark")
+
+        results = []
+        for n in names:
+            results.extend(bench_config(n, CONFIGS[n], options.duration, options.repeat))
+
+        if options.json:
+            with open(options.json, "w") as f:
+                json.dump({"version": odemis.__version__,
+                           "date": time.time(),
+                           "host": platform.node(),
+                           "python": platform.python_version(),
+                           "numpy": numpy.__version__,
+                           "duration": options.duration,
+                           "repeat": options.repeat,
+                           "results": results}, f, indent=2)
+    except ValueError as exp:
+        logging.error("%s", exp)
+        return 127
+    except Exception:
+        logging.exception("Unexpected error while performing action.")
+        return 129
+
+    return 0
+
+
+if __name__ == "__main__":
+    ret = main(sys.argv)
+    logging.shutdown()
+    sys.exit(ret)
@@ -0,0 +1,196 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+Created on 18 Oct 2026
+
+@author: agent
+
+Copyright © 2026 agent
+
+This file is part of Odemis.
+
+Odemis is free software: you can redistribute it and/or modify it under the terms of the GNU General Public License version 2 as published by the Free Software Foundation.
+
+Odemis is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License along with Odemis. If not, see http://www.gnu.org/licenses/.
+'''
+
+# This script measures the time it takes to save typical acquisitions as
+# (OME-)TIFF files, uncompressed, compressed (serially by libtiff or in
+# parallel), and in the pyramidal format.
+# It doesn't need any hardware or backend running.
+# Example usage:
+# python tiff_bench.py --repeat 3 --json tiff_bench.json
+
+from __future__ import division
+
+import argparse
+import json
+import logging
+import multiprocessing
+import numpy
+from odemis import model
+from odemis.dataio import tiff
+import os
+import sys
+import tempfile
+import time
+
+
+logging.getLogger().setLevel(logging.INFO)
+
+# Name -> (compressed, parallel compression, pyramid)
+CASES = [("uncompressed", False, False, False),
+         ("lzw", True, False, False),
+         ("deflate-parallel", True, True, False),
+         ("pyramid-lzw", True, False, True),
+         ("pyramid-deflate-parallel", True, True, True),
+        ]
+
+
+def _fake_image(shape, dtype, base, noise):
+    """
+    Generates an image looking (for the compression) like a real acquisition:
+      smooth features + noise.
+    shape (tuple of int): shape of the image (Y, X)
+    dtype (numpy.dtype): type of the data
+    base (float): average value
+    noise (float): standard deviation of the noise
+    return (numpy.array of shape): the image
+    """
+    y, x = numpy.ogrid[0:shape[0], 0:shape[1]]
+    im = base * (1 + 0.5 * numpy.sin(x / 53) * numpy.cos(y / 71))
+    im = im + numpy.random.normal(0, noise, shape)
+    if numpy.dtype(dtype).kind in "ui":
+        info = numpy.iinfo(dtype)
+        im = numpy.clip(im, info.min, info.max)
+    return im.astype(dtype)
+
+
+def secom_dataset():
+    """
+    return (list of DataArray): 3 fluorescence channels + 1 SEM image
+    """
+    md_fluo = {model.MD_PIXEL_SIZE: (100e-9, 100e-9), model.MD_POS: (1e-3, -2e-3),
+               model.MD_EXP_TIME: 0.5}
+    ldata = []
+    for i, (inwl, outwl) in enumerate(((405e-9, 450e-9), (488e-9, 520e-9), (555e-9, 600e-9))):
+        md = dict(md_fluo)
+        md[model.MD_DESCRIPTION] = "Fluo %d" % (i,)
+        md[model.MD_IN_WL] = (inwl - 5e-9, inwl + 5e-9)
+        md[model.MD_OUT_WL] = (outwl - 15e-9, outwl + 15e-9)
+        ldata.append(model.DataArray(_fake_image((2048, 2048), numpy.uint16, 1000 * (i + 1), 50), md))
+
+    md_sem = {model.MD_DESCRIPTION: "Secondary electrons",
+              model.MD_PIXEL_SIZE: (50e-9, 50e-9), model.MD_POS: (1e-3, -2e-3),
+              model.MD_DWELL_TIME: 1e-6}
+    ldata.append(model.DataArray(_fake_image((2048, 4096), numpy.uint16, 20000, 2000), md_sem))
+    return ldata
+
+
+def sparc_dataset():
+    """
+    return (list of DataArray): 1 SEM survey + 1 spectrum cube + 25 AR images
+    """
+    md_sem = {model.MD_DESCRIPTION: "Secondary electrons survey",
+              model.MD_PIXEL_SIZE: (1e-6, 1e-6), model.MD_POS: (0, 0),
+              model.MD_DWELL_TIME: 1e-6}
+    ldata = [model.DataArray(_fake_image((1024, 1024), numpy.uint16, 20000, 2000), md_sem)]
+
+    # Spectrum cube: CTZYX, with C = 1024 wavelengths, and 64x64 pixels
+    spec = _fake_image((1024, 64 * 64), numpy.uint16, 600, 30).reshape(1024, 1, 1, 64, 64)
+    md_spec = {model.MD_DESCRIPTION: "Spectrum",
+               model.MD_PIXEL_SIZE: (50e-9, 50e-9), model.MD_POS: (0, 0),
+               model.MD_WL_LIST: list(numpy.linspace(400e-9, 900e-9, 1024)),
+               model.MD_EXP_TIME: 0.1}
+    ldata.append(model.DataArray(spec, md_spec))
+
+    # AR images: one per e-beam position
+    for i in range(25):
+        md_ar = {model.MD_DESCRIPTION: "Angle-resolved",
+                 model.MD_PIXEL_SIZE: (13e-6, 13e-6),
+                 model.MD_POS: ((i % 5) * 1e-7, (i // 5) * 1e-7),
+                 model.MD_AR_POLE: (512, 512),
+                 model.MD_EXP_TIME: 1}
+        ldata.append(model.DataArray(_fake_image((1024, 1024), numpy.uint16, 1500, 100), md_ar))
+    return ldata
+
+
+def bench_export(ldata, compressed, parallel, pyramid, repeat):
+    """
+    Saves the data as a TIFF file, several times
+    ldata (list of DataArray): the data to save
+    compressed (bool): whether to compress the data
+    parallel (bool): whether to compress in parallel
+    pyramid (bool): whether to use the pyramidal format
+    repeat (int): number of times to save the file
+    return (float, int): the shortest duration (s), and the file size (bytes)
+    """
+    fd, fn = tempfile.mkstemp(suffix=tiff.EXTENSIONS[0])
+    os.close(fd)
+    try:
+        durations = []
+        for i in range(repeat):
+            startt = time.time()
+            tiff._saveAsMultiTiffLT(fn, ldata, None, compressed=compressed,
+                                    pyramid=pyramid, parallel=parallel)
+            durations.append(time.time() - startt)
+        size = os.path.getsize(fn)
+    finally:
+        os.remove(fn)
+
+    return min(durations), size
+
+
+def main(args):
+    """
+    Handles the command line arguments
+    args is the list of arguments passed
+    return (int): value to return to the OS as program exit code
+    """
+    parser = argparse.ArgumentParser(description="Measure the speed of saving "
+                                     "typical acquisitions as TIFF files.")
+    parser.add_argument("--repeat", "-r", dest="repeat", type=int, default=3,
+                        help="Number of times each case is run (the shortest time is reported)")
+    parser.add_argument("--dataset", "-d", dest="datasets", action="append",
+                        choices=("secom", "sparc"),
+                        help="Dataset to use (default: all)")
+    parser.add_argument("--json", dest="json",
+                        help="Filename where to store the results as JSON")
+
+    options = parser.parse_args(args[1:])
+
+    datasets = {"secom": secom_dataset, "sparc": sparc_dataset}
+    names = options.datasets or sorted(datasets.keys())
+
+    try:
+        results = []
+        print "Using %d CPUs" % (multiprocessing.cpu_count(),)
+        for dsname in names:
+            ldata = datasets[dsname]()
+            nbytes = sum(d.nbytes for d in ldata)
+            print "Dataset %s: %d images, %g MB" % (dsname, len(ldata), nbytes / 2 ** 20)
+            for name, compressed, parallel, pyramid in CASES:
+                dur, size = bench_export(ldata, compressed, parallel, pyramid, options.repeat)
+                print "  %-25s %7.3f s  %7.1f MB/s  %8.1f MB" % (name, dur,
+                                           nbytes / 2 ** 20 / dur, size / 2 ** 20)
+                results.append({"dataset": dsname, "case": name,
+                                "duration": dur, "size": size, "data_size": nbytes})
+
+        if options.json:
+            with open(options.json, "w") as f:
+                json.dump({"cpus": multiprocessing.cpu_count(),
+                           "repeat": options.repeat,
+                           "results": results}, f, indent=2)
+    except Exception:
+        logging.exception("Unexpected error while performing action.")
+        return 129
+
+    return 0
+
+
+if __name__ == "__main__":
+    ret = main(sys.argv)
+    logging.shutdown()
+    sys.exit(ret)
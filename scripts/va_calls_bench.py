@@ -0,0 +1,163 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+Created on 18 Oct 2026
+
+@author: agent
+
+Copyright © 2026 agent
+
+This file is part of Odemis.
+
+Odemis is free software: you can redistribute it and/or modify it under the terms of the GNU General Public License version 2 as published by the Free Software Foundation.
+
+Odemis is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License along with Odemis. If not, see http://www.gnu.org/licenses/.
+'''
+
+# This script counts the number of remote (Pyro) calls needed to access the
+# VAs of the hardware components the way the GUI does when opening each tab,
+# with and without the cache of the VA proxies.
+# It needs the backend running (a simulator is fine).
+# Example usage:
+# python va_calls_bench.py --refresh 20
+
+from __future__ import division
+
+import Pyro4
+import argparse
+import logging
+from odemis import model
+from odemis.model import _vattributes
+import sys
+import time
+
+
+logging.getLogger().setLevel(logging.INFO)
+
+# Tab name -> roles of the components shown in the settings of the tab
+TABS = [("secom_live", ("ccd", "laser-mirror", "e-beam", "se-detector", "light", "filter")),
+        ("secom_align", ("ccd", "e-beam", "focus")),
+        ("sparc_acqui", ("e-beam", "se-detector", "ccd", "spectrometer", "cl-detector")),
+        ("sparc_align", ("ccd", "spectrometer", "lens-switch", "spec-selector")),
+        ("sparc_chamber", ("ccd", "mirror", "stage")),
+       ]
+
+# VAs which are not shown in the settings (cf odemis.gui.conf.data.HIDDEN_VAS)
+HIDDEN_VAS = {"children", "affects", "state", "powerSupply"}
+
+
+class CallCounter(object):
+    """
+    Counts the remote calls done by all the Pyro proxies
+    """
+
+    def __init__(self):
+        self.count = 0
+        self._orig_invoke = Pyro4.core.Proxy._pyroInvoke
+
+    def __enter__(self):
+        orig_invoke = self._orig_invoke
+
+        def _pyroInvoke(proxy, *args, **kwargs):
+            self.count += 1
+            return orig_invoke(proxy, *args, **kwargs)
+
+        Pyro4.core.Proxy._pyroInvoke = _pyroInvoke
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        Pyro4.core.Proxy._pyroInvoke = self._orig_invoke
+
+
+def _on_va_change(value):
+    pass
+
+
+def open_tab(comps, refresh):
+    """
+    Accesses the VAs of the components like the settings of a tab:
+      the controls are created based on the range or choices, connected to
+      the VA, and then their displayed value is updated regularly.
+    comps (list of Component): the components shown in the tab
+    refresh (int): number of times the values are read after creating the controls
+    return (list of VigilantAttributeProxy): the VAs subscribed
+    """
+    vas = []
+    for comp in comps:
+        for name, va in sorted(model.getVAs(comp).items()):
+            if name in HIDDEN_VAS:
+                continue
+            # Creation of the control
+            for mname in ("range", "choices"):
+                try:
+                    getattr(va, mname)
+                except (AttributeError, model.NotApplicableError):
+                    pass
+            # Connection to the VA
+            va.subscribe(_on_va_change, init=True)
+            vas.append(va)
+
+    time.sleep(0.1)  # Let the initial values arrive
+    for i in range(refresh):
+        for va in vas:
+            va.value
+            try:
+                va.range
+            except (AttributeError, model.NotApplicableError):
+                pass
+
+    return vas
+
+
+def close_tab(vas):
+    for va in vas:
+        va.unsubscribe(_on_va_change)
+
+
+def bench_tab(roles, refresh, cache):
+    """
+    return (int): number of remote calls to open the tab
+    """
+    _vattributes.CACHE_PROXY_VALUES = cache
+    # Get new proxies, so that nothing is already cached
+    comps = [c for c in model.getComponents() if c.role in roles]
+    with CallCounter() as counter:
+        vas = open_tab(comps, refresh)
+    close_tab(vas)
+    return counter.count
+
+
+def main(args):
+    """
+    Handles the command line arguments
+    args is the list of arguments passed
+    return (int): value to return to the OS as program exit code
+    """
+    parser = argparse.ArgumentParser(description="Count the number of remote "
+                                     "calls to the VAs when opening each tab.")
+    parser.add_argument("--refresh", "-r", dest="refresh", type=int, default=10,
+                        help="Number of times the values are read after opening the tab")
+
+    options = parser.parse_args(args[1:])
+
+    try:
+        print "%-15s %12s %12s" % ("tab", "no cache", "cache")
+        for tab, roles in TABS:
+            nocache = bench_tab(roles, options.refresh, False)
+            cache = bench_tab(roles, options.refresh, True)
+            print "%-15s %12d %12d" % (tab, nocache, cache)
+    except Exception:
+        logging.exception("Unexpected error while performing action.")
+        return 129
+    finally:
+        _vattributes.CACHE_PROXY_VALUES = True
+
+    return 0
+
+
+if __name__ == "__main__":
+    ret = main(sys.argv)
+    logging.shutdown()
+    sys.exit(ret)
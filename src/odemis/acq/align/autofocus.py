@@ -23,6 +23,7 @@ Odemis. If not, see http://www.gnu.org/licenses/.
 from __future__ import division
 
 import collections
+from concurrent.futures import ThreadPoolExecutor
 from concurrent.futures._base import CancelledError, CANCELLED, FINISHED, \
     RUNNING
 import logging
@@ -107,6 +108,95 @@ def MeasureOpticalFocus(image):
     return cv2.Laplacian(image, cv2.CV_64F).var()
 
 
+def _reduceImage(image, roi=1, binning=1):
+    """
+    Reduces the amount of data on which the focus level is estimated, by
+    keeping only the center of the image and/or binning it.
+    image (numpy array of shape YX or YX3): the image to reduce
+    roi (0 < float <= 1): ratio of the image (in each dimension) which is kept,
+      around the center.
+    binning (1 <= int): number of pixels (in each dimension) which are averaged
+      together.
+    return (numpy array of shape YX or YX3): the reduced image. If nothing
+      has to be reduced, the image is returned unchanged.
+    """
+    if roi < 1:
+        h, w = image.shape[0:2]
+        ch, cw = max(1, int(round(h * roi))), max(1, int(round(w * roi)))
+        t, l = (h - ch) // 2, (w - cw) // 2
+        image = image[t:t + ch, l:l + cw]
+
+    if binning > 1:
+        if len(image.shape) == 3:
+            image = _convertRBGToGrayscale(image)
+        h, w = image.shape[0] // binning, image.shape[1] // binning
+        if h == 0 or w == 0:
+            logging.warning("Image of shape %s too small for binning %d",
+                            image.shape, binning)
+            return image
+        # Drop the last pixels if they don't fit a full bin
+        image = image[:h * binning, :w * binning]
+        image = image.reshape(h, binning, w, binning).mean(axis=(1, 3),
+                                                            dtype=numpy.float32)
+
+    return image
+
+
+def _getFocusMeasure(detector, roi=1, binning=1):
+    """
+    Pick the focus measurement method, based on the heuristics that SEM
+    detectors are typically just a point (ie, shape == data depth).
+    detector (model.DigitalCamera or model.Detector): the detector which will
+      acquire the images
+    roi (0 < float <= 1): ratio of the center of the image used to measure
+    binning (1 <= int): binning applied to the image before measuring
+    return (callable image -> float): the function to measure the focus level
+    """
+    # TODO: is this working as expected? Alternatively, we could check
+    # MD_DET_TYPE.
+    if len(detector.shape) > 1:
+        logging.debug("Using Optical method to estimate focus")
+        measure = MeasureOpticalFocus
+    else:
+        logging.debug("Using SEM method to estimate focus")
+        measure = MeasureSEMFocus
+
+    if roi >= 1 and binning <= 1:
+        return measure
+
+    logging.debug("Measuring focus on %g of the image, with binning %d", roi, binning)
+
+    def measure_reduced(image):
+        return measure(_reduceImage(image, roi, binning))
+
+    return measure_reduced
+
+
+def _getDepthOfField(detector, emt):
+    """
+    Find the depth of field of the system
+    detector (model.DigitalCamera or model.Detector)
+    emt (None or model.Emitter)
+    return (0 < float): the depth of field (m)
+    """
+    avail_depths = (detector, emt)
+    if model.hasVA(emt, "dwellTime"):
+        # Hack in case of using the e-beam with a DigitalCamera detector.
+        # All the digital cameras have a depthOfField, which is updated based
+        # on the optical lens properties... but the depthOfField in this
+        # case depends on the e-beam lens.
+        avail_depths = (emt, detector)
+    for c in avail_depths:
+        if model.hasVA(c, "depthOfField"):
+            dof = c.depthOfField.value
+            break
+    else:
+        logging.debug("No depth of field info found")
+        dof = 1e-6  # m, not too bad value
+    logging.debug("Depth of field is %f", dof)
+    return dof
+
+
 def AcquireNoBackground(ccd, dfbkg=None):
     """
     Performs optical acquisition with background subtraction if possible.
@@ -138,7 +228,8 @@ def _discard_data(df, data):
     pass
 
 
-def _DoBinaryFocus(future, detector, emt, focus, dfbkg, good_focus, rng_focus):
+def _DoBinaryFocus(future, detector, emt, focus, dfbkg, good_focus, rng_focus,
+                   Measure=None):
     """
     Iteratively acquires an optical image, measures its focus level and adjusts
     the optical focus with respect to the focus level.
@@ -151,6 +242,8 @@ def _DoBinaryFocus(future, detector, emt, focus, dfbkg, good_focus, rng_focus):
       taken into consideration while autofocusing
     rng_focus (tuple): if provided, the search of the best focus position is limited
       within this range
+    Measure (None or callable image -> float): function to estimate the focus
+      level of an image. If None, it is picked based on the detector type.
     returns:
         (float): Focus position (m)
         (float): Focus level
@@ -175,21 +268,7 @@ def _DoBinaryFocus(future, detector, emt, focus, dfbkg, good_focus, rng_focus):
 
     try:
         # use the .depthOfField on detector or emitter as maximum stepsize
-        avail_depths = (detector, emt)
-        if model.hasVA(emt, "dwellTime"):
-            # Hack in case of using the e-beam with a DigitalCamera detector.
-            # All the digital cameras have a depthOfField, which is updated based
-            # on the optical lens properties... but the depthOfField in this
-            # case depends on the e-beam lens.
-            avail_depths = (emt, detector)
-        for c in avail_depths:
-            if model.hasVA(c, "depthOfField"):
-                dof = c.depthOfField.value
-                break
-        else:
-            logging.debug("No depth of field info found")
-            dof = 1e-6  # m, not too bad value
-        logging.debug("Depth of field is %f", dof)
+        dof = _getDepthOfField(detector, emt)
         min_step = dof / 2
 
         # adjust to rng_focus if provided
@@ -211,16 +290,8 @@ def _DoBinaryFocus(future, detector, emt, focus, dfbkg, good_focus, rng_focus):
         best_fm = 0
         last_pos = None
 
-        # Pick measurement method based on the heuristics that SEM detectors
-        # are typically just a point (ie, shape == data depth).
-        # TODO: is this working as expected? Alternatively, we could check
-        # MD_DET_TYPE.
-        if len(detector.shape) > 1:
-            logging.debug("Using Optical method to estimate focus")
-            Measure = MeasureOpticalFocus
-        else:
-            logging.debug("Using SEM method to estimate focus")
-            Measure = MeasureSEMFocus
+        if Measure is None:
+            Measure = _getFocusMeasure(detector)
 
         step_factor = 2 ** 7
         if good_focus is not None:
@@ -343,7 +414,8 @@ def _DoBinaryFocus(future, detector, emt, focus, dfbkg, good_focus, rng_focus):
             future._autofocus_state = FINISHED
 
 
-def _DoExhaustiveFocus(future, detector, emt, focus, dfbkg, good_focus, rng_focus):
+def _DoExhaustiveFocus(future, detector, emt, focus, dfbkg, good_focus, rng_focus,
+                       Measure=None):
     """
     Moves the optical focus through the whole given range, measures the focus
     level on each position and ends up where the best focus level was found. In
@@ -358,6 +430,8 @@ def _DoExhaustiveFocus(future, detector, emt, focus, dfbkg, good_focus, rng_focu
       taken into consideration while autofocusing
     rng_focus (tuple): if provided, the search of the best focus position is limited
       within this range
+    Measure (None or callable image -> float): function to estimate the focus
+      level of an image. If None, it is picked based on the detector type.
     returns:
         (float): Focus position (m)
         (float): Focus level
@@ -369,32 +443,10 @@ def _DoExhaustiveFocus(future, detector, emt, focus, dfbkg, good_focus, rng_focu
 
     try:
         # use the .depthOfField on detector or emitter as maximum stepsize
-        avail_depths = (detector, emt)
-        if model.hasVA(emt, "dwellTime"):
-            # Hack in case of using the e-beam with a DigitalCamera detector.
-            # All the digital cameras have a depthOfField, which is updated based
-            # on the optical lens properties... but the depthOfField in this
-            # case depends on the e-beam lens.
-            avail_depths = (emt, detector)
-        for c in avail_depths:
-            if model.hasVA(c, "depthOfField"):
-                dof = c.depthOfField.value
-                break
-        else:
-            logging.debug("No depth of field info found")
-            dof = 1e-6  # m, not too bad value
-        logging.debug("Depth of field is %f", dof)
-
-        # Pick measurement method based on the heuristics that SEM detectors
-        # are typically just a point (ie, shape == data depth).
-        # TODO: is this working as expected? Alternatively, we could check
-        # MD_DET_TYPE.
-        if len(detector.shape) > 1:
-            logging.debug("Using Optical method to estimate focus")
-            Measure = MeasureOpticalFocus
-        else:
-            logging.debug("Using SEM method to estimate focus")
-            Measure = MeasureSEMFocus
+        dof = _getDepthOfField(detector, emt)
+
+        if Measure is None:
+            Measure = _getFocusMeasure(detector)
 
         # adjust to rng_focus if provided
         rng = focus.axes["z"].range
@@ -434,7 +486,8 @@ def _DoExhaustiveFocus(future, detector, emt, focus, dfbkg, good_focus, rng_focu
             if len(focus_levels) >= 10 and AssessFocus(focus_levels):
                 # trigger binary search on if significant deviation was
                 # found in current position
-                return _DoBinaryFocus(future, detector, emt, focus, dfbkg, best_pos, (best_pos - 2 * step, best_pos + 2 * step))
+                return _DoBinaryFocus(future, detector, emt, focus, dfbkg, best_pos,
+                                      (best_pos - 2 * step, best_pos + 2 * step), Measure)
 
         if future._autofocus_state == CANCELLED:
             raise CancelledError()
@@ -454,14 +507,16 @@ def _DoExhaustiveFocus(future, detector, emt, focus, dfbkg, good_focus, rng_focu
             if len(focus_levels) >= 10 and AssessFocus(focus_levels):
                 # trigger binary search on if significant deviation was
                 # found in current position
-                return _DoBinaryFocus(future, detector, emt, focus, dfbkg, best_pos, (best_pos - 2 * step, best_pos + 2 * step))
+                return _DoBinaryFocus(future, detector, emt, focus, dfbkg, best_pos,
+                                      (best_pos - 2 * step, best_pos + 2 * step), Measure)
 
         if future._autofocus_state == CANCELLED:
             raise CancelledError()
 
         logging.debug("No significant focus level was found so far, thus we just move to the best position found %f", best_pos)
         focus.moveAbsSync({"z": best_pos})
-        return _DoBinaryFocus(future, detector, emt, focus, dfbkg, best_pos, (best_pos - 2 * step, best_pos + 2 * step))
+        return _DoBinaryFocus(future, detector, emt, focus, dfbkg, best_pos,
+                              (best_pos - 2 * step, best_pos + 2 * step), Measure)
 
     except CancelledError:
         # Go to the best position known so far
@@ -474,6 +529,202 @@ def _DoExhaustiveFocus(future, detector, emt, focus, dfbkg, good_focus, rng_focu
             future._autofocus_state = FINISHED
 
 
+def _fitFocusPeak(positions, levels):
+    """
+    Estimates the position of the best focus, based on the focus levels already
+    measured. A Gaussian curve (ie, a parabola on the logarithm of the levels)
+    is fitted on the best level and its (up to 2) neighbours on each side.
+    positions (list of floats): focus positions (m)
+    levels (list of floats): focus level at each position
+    returns (float or None): estimated focus position of the peak. None if the
+      best level is at the border of the positions measured (ie, the peak is
+      likely outside).
+    """
+    pos = numpy.asarray(positions, dtype=numpy.float64)
+    lvl = numpy.asarray(levels, dtype=numpy.float64)
+    order = numpy.argsort(pos)
+    pos, lvl = pos[order], lvl[order]
+
+    i_max = lvl.argmax()
+    if i_max == 0 or i_max == len(pos) - 1:
+        return None
+
+    sl = slice(max(0, i_max - 2), i_max + 3)
+    p, l = pos[sl], lvl[sl]
+    if len(numpy.unique(p)) < 3:
+        return pos[i_max]
+
+    if numpy.all(l > 0):
+        y = numpy.log(l)
+    else:
+        y = l  # Fallback to a simple parabola
+    # Normalise the positions, to keep the fitting numerically stable
+    p0 = pos[i_max]
+    scale = numpy.abs(p - p0).max()
+    a, b, c = numpy.polyfit((p - p0) / scale, y, 2)
+    if a >= 0:
+        # Not a peak shape => the best known position is the best guess
+        return p0
+
+    peak = p0 - b / (2 * a) * scale
+    # Never extrapolate outside of the points used for the fitting
+    return min(max(p[0], peak), p[-1])
+
+
+def _measureFocusSeries(future, detector, focus, dfbkg, Measure, positions, executor):
+    """
+    Acquires an image at each given focus position, and measures its focus level.
+    To save time, the move to the next position is started as soon as the
+    acquisition is over, and the focus level is computed in the executor while
+    moving and acquiring the next image.
+    positions (list of floats): the focus positions to go through, in order
+    executor (Executor): to run the focus measurement in
+    returns (dict float -> float): actual focus position -> focus level
+    raises:
+            CancelledError if cancelled
+    """
+    measures = []  # list of tuple: position, future of focus level
+    fmove = focus.moveAbs({"z": positions[0]})
+    try:
+        for i in range(len(positions)):
+            fmove.result()
+            pos = focus.position.value["z"]
+            image = AcquireNoBackground(detector, dfbkg)
+            if i + 1 < len(positions):
+                fmove = focus.moveAbs({"z": positions[i + 1]})
+            measures.append((pos, executor.submit(Measure, image)))
+
+            if future._autofocus_state == CANCELLED:
+                raise CancelledError()
+    finally:
+        # Make sure the focus doesn't move anymore once we return
+        fmove.result()
+
+    levels = {}
+    for pos, fm in measures:
+        levels[pos] = fm.result()
+        logging.debug("Focus level at %f is %f", pos, levels[pos])
+    return levels
+
+
+def _DoPredictiveFocus(future, detector, emt, focus, dfbkg, good_focus, rng_focus,
+                       Measure=None):
+    """
+    Finds the best focus by fitting a focus curve on the focus levels already
+    measured, in order to predict the next position to measure. Compared to
+    the binary focus, it typically needs much less acquisitions.
+    It first measures a few positions around the start position, extends them
+    until the peak is surrounded, and then iteratively measures the predicted
+    peak position, until the prediction doesn't move anymore.
+    future (model.ProgressiveFuture): Progressive future provided by the wrapper
+    detector: model.DigitalCamera or model.Detector
+    emt (None or model.Emitter): In case of a SED this is the scanner used
+    focus (model.Actuator): The optical focus
+    dfbkg (model.DataFlow): dataflow of se- or bs- detector
+    good_focus (float): if provided, an already known good focus position to be
+      taken into consideration while autofocusing
+    rng_focus (tuple): if provided, the search of the best focus position is limited
+      within this range
+    Measure (None or callable image -> float): function to estimate the focus
+      level of an image. If None, it is picked based on the detector type.
+    returns:
+        (float): Focus position (m)
+        (float): Focus level
+    raises:
+            CancelledError if cancelled
+            IOError if procedure failed
+    """
+    logging.debug("Starting predictive autofocus on detector %s...", detector.name)
+
+    # Only one worker, to keep the CPU available for the acquisition
+    executor = ThreadPoolExecutor(max_workers=1)
+    try:
+        best_pos = focus.position.value['z']
+        best_fm = 0
+        focus_levels = {}  # focus pos (float) -> focus level (float)
+
+        dof = _getDepthOfField(detector, emt)
+        min_step = dof / 2
+        if Measure is None:
+            Measure = _getFocusMeasure(detector)
+
+        # adjust to rng_focus if provided
+        rng = focus.axes["z"].range
+        if rng_focus:
+            rng = (max(rng[0], rng_focus[0]), min(rng[1], rng_focus[1]))
+        if rng[1] <= rng[0]:
+            raise ValueError("Unexpected focus range %s" % (rng,))
+
+        def clip(p):
+            return max(rng[0], min(p, rng[1]))
+
+        if good_focus is not None:
+            center = clip(good_focus)
+            step = 2 * dof  # We are supposedly close
+        else:
+            center = best_pos
+            step = 8 * dof
+        step = max(min_step, min(step, (rng[1] - rng[0]) / 4))
+        logging.debug("Starting around %g m, with step %g m", center, step)
+
+        # Go through the first positions in the order which is the fastest
+        # from the current position.
+        positions = sorted(set(clip(center + i * step) for i in range(-2, 3)))
+        if abs(positions[-1] - best_pos) < abs(positions[0] - best_pos):
+            positions.reverse()
+        focus_levels.update(_measureFocusSeries(future, detector, focus, dfbkg,
+                                                Measure, positions, executor))
+
+        for i in range(MAX_STEPS_NUMBER):
+            if future._autofocus_state == CANCELLED:
+                raise CancelledError()
+
+            poss = sorted(focus_levels.keys())
+            lvls = [focus_levels[p] for p in poss]
+            peak = _fitFocusPeak(poss, lvls)
+            if peak is None:
+                # The best level is on the border => extend in that direction
+                if lvls[0] > lvls[-1]:
+                    nxt = [clip(poss[0] - step), clip(poss[0] - 2 * step)]
+                else:
+                    nxt = [clip(poss[-1] + step), clip(poss[-1] + 2 * step)]
+                nxt = [p for p in nxt if all(abs(p - q) >= min_step for q in poss)]
+                if not nxt:
+                    logging.debug("Focus peak seems to be at the range limit %s", rng)
+                    break
+                logging.debug("Extending focus search to %s", nxt)
+            else:
+                # Stop once the prediction is next to a position already measured
+                if min(abs(peak - p) for p in poss) < min_step:
+                    logging.debug("Focus prediction converged at %g m", peak)
+                    break
+                nxt = [peak]
+
+            focus_levels.update(_measureFocusSeries(future, detector, focus, dfbkg,
+                                                    Measure, nxt, executor))
+        else:
+            logging.info("Auto focus gave up after %d steps", MAX_STEPS_NUMBER)
+
+        best_pos = max(focus_levels.keys(), key=focus_levels.get)
+        best_fm = focus_levels[best_pos]
+        focus.moveAbsSync({"z": best_pos})
+        logging.info("Auto focus found best level %g @ %g m after %d acquisitions",
+                     best_fm, best_pos, len(focus_levels))
+        return best_pos, best_fm
+
+    except CancelledError:
+        # Go to the best position known so far
+        if focus_levels:
+            best_pos = max(focus_levels.keys(), key=focus_levels.get)
+        focus.moveAbsSync({"z": best_pos})
+    finally:
+        executor.shutdown(wait=False)
+        with future._autofocus_lock:
+            if future._autofocus_state == CANCELLED:
+                raise CancelledError()
+            future._autofocus_state = FINISHED
+
+
 def _CancelAutoFocus(future):
     """
     Canceller of AutoFocus task.
@@ -497,7 +748,8 @@ def estimateAutoFocusTime(exposure_time, steps=MAX_STEPS_NUMBER):
     return steps * exposure_time
 
 
-def AutoFocus(detector, emt, focus, dfbkg=None, good_focus=None, rng_focus=None, method='binary'):
+def AutoFocus(detector, emt, focus, dfbkg=None, good_focus=None, rng_focus=None, method='binary',
+              measure_roi=1, measure_binning=1):
     """
     Wrapper for DoAutoFocus. It provides the ability to check the progress of autofocus 
     procedure or even cancel it.
@@ -514,7 +766,14 @@ def AutoFocus(detector, emt, focus, dfbkg=None, good_focus=None, rng_focus=None,
     rng_focus (tuple): if provided, the search of the best focus position is limited
       within this range
     method (str): focusing method, if 'binary' we follow a binary method while in
-      case of 'exhaustive' we iterate through the whole provided range
+      case of 'exhaustive' we iterate through the whole provided range. In case
+      of 'predictive', the next position is picked by fitting a focus curve
+      on the focus levels already measured, which needs less acquisitions.
+    measure_roi (0 < float <= 1): ratio of the image (in each dimension), around
+      the center, which is used to measure the focus level. A smaller ratio
+      makes the measurement faster.
+    measure_binning (1 <= int): binning applied on the image before measuring
+      the focus level. A bigger binning makes the measurement faster.
     returns (model.ProgressiveFuture):  Progress of DoAutoFocus, whose result() will return:
             Focus position (m)
             Focus level
@@ -542,13 +801,17 @@ def AutoFocus(detector, emt, focus, dfbkg=None, good_focus=None, rng_focus=None,
         autofocus_fn = _DoExhaustiveFocus
     elif method == "binary":
         autofocus_fn = _DoBinaryFocus
+    elif method == "predictive":
+        autofocus_fn = _DoPredictiveFocus
     else:
         raise ValueError("Unknown autofocus method")
 
+    measure = _getFocusMeasure(detector, measure_roi, measure_binning)
     autofocus_thread = threading.Thread(target=executeTask,
                                         name="Autofocus",
                                         args=(f, autofocus_fn, f, detector, emt,
-                                              focus, dfbkg, good_focus, rng_focus))
+                                              focus, dfbkg, good_focus, rng_focus,
+                                              measure))
 
     autofocus_thread.start()
     return f
@@ -19,8 +19,11 @@ PURPOSE. See the GNU General Public License for more details.
 You should have received a copy of the GNU General Public License along with 
 Odemis. If not, see http://www.gnu.org/licenses/.
 '''
+from __future__ import division
+
 from concurrent.futures._base import CancelledError
 import logging
+import math
 from odemis import model
 import odemis
 from odemis.acq import align
@@ -118,6 +121,34 @@ class TestAutofocus(unittest.TestCase):
         self.assertAlmostEqual(foc_pos, self._opt_good_focus, 3)
         self.assertGreater(foc_lev, 0)
 
+    @timeout(1000)
+    def test_autofocus_opt_predictive(self):
+        """
+        Test AutoFocus on CCD, with the predictive method and a reduced measure
+        """
+        focus = self.focus
+        ccd = self.ccd
+        focus.moveAbs({"z": self._opt_good_focus - 400e-6}).result()
+        ccd.exposureTime.value = ccd.exposureTime.range[0]
+        future_focus = align.AutoFocus(ccd, self.ebeam, focus, method="predictive",
+                                       measure_roi=0.5, measure_binning=2)
+        foc_pos, foc_lev = future_focus.result(timeout=900)
+        self.assertAlmostEqual(foc_pos, self._opt_good_focus, 3)
+        self.assertGreater(foc_lev, 0)
+
+    @timeout(1000)
+    def test_autofocus_sem_predictive(self):
+        """
+        Test AutoFocus on e-beam, with the predictive method
+        """
+        self.efocus.moveAbs({"z": self._sem_good_focus - 100e-06}).result()
+        self.ebeam.dwellTime.value = self.ebeam.dwellTime.range[0]
+        future_focus = align.AutoFocus(self.sed, self.ebeam, self.efocus,
+                                       method="predictive")
+        foc_pos, foc_lev = future_focus.result(timeout=900)
+        self.assertAlmostEqual(foc_pos, self._sem_good_focus, 3)
+        self.assertGreater(foc_lev, 0)
+
     @timeout(1000)
     def test_autofocus_sem(self):
         """
@@ -145,6 +176,48 @@ class TestAutofocus(unittest.TestCase):
         self.assertGreater(foc_lev, 0)
 
 
+class TestFocusCurve(unittest.TestCase):
+    """
+    Test the helper functions of the autofocus, which don't need hardware
+    """
+
+    def test_fit_peak(self):
+        """
+        Test _fitFocusPeak finds the peak of a Gaussian focus curve
+        """
+        good_pos = 3.3e-6
+        pos = [i * 2e-6 for i in range(-4, 5)]
+        lvls = [10 + 100 * math.exp(-(p - good_pos) ** 2 / (2 * 4e-6 ** 2)) for p in pos]
+        peak = autofocus._fitFocusPeak(pos, lvls)
+        self.assertAlmostEqual(peak, good_pos, delta=0.5e-6)
+
+        # Unordered positions should give the same result
+        peak_rev = autofocus._fitFocusPeak(pos[::-1], lvls[::-1])
+        self.assertAlmostEqual(peak, peak_rev)
+
+        # Monotonic levels => no peak known
+        self.assertIsNone(autofocus._fitFocusPeak(pos, sorted(lvls)))
+
+    def test_measure_reduced(self):
+        """
+        Test measuring the focus on a reduced image keeps the focus order
+        """
+        data = hdf5.read_data(os.path.dirname(__file__) + "/grid_10x10.h5")
+        C, T, Z, Y, X = data[0].shape
+        data[0].shape = Y, X
+        input = data[0]
+
+        reduced = autofocus._reduceImage(input, 0.5, 2)
+        self.assertEqual(reduced.shape, ((Y // 2) // 2, (X // 2) // 2))
+
+        prev_res = autofocus.MeasureOpticalFocus(reduced)
+        for i in range(1, 10, 1):
+            blur = ndimage.gaussian_filter(input, sigma=i)
+            res = autofocus.MeasureOpticalFocus(autofocus._reduceImage(blur, 0.5, 2))
+            self.assertGreater(prev_res, res)
+            prev_res = res
+
+
 class TestAutofocusSpectrometer(unittest.TestCase):
     """
     Test autofocus spectrometer function
@@ -28,7 +28,6 @@ import logging
 import math
 from odemis import model, util
 from odemis.acq import stream
-from odemis.model import NotApplicableError
 import time
 from odemis.util import TimeoutError
 
@@ -776,44 +775,64 @@ class OpticalPathManager(object):
             return
         self._fan_enabled = enable
 
+        # The CCD is typically in another container, so read and change all
+        # the VAs at once, instead of one call per VA access.
+        names = ["fanSpeed"]
+        if self._has_fan_temp:
+            names.append("targetTemperature")
+        state = comp.getState(names)["vas"]
+        fan_speed = state["fanSpeed"]["value"]
+        values = []  # (VA name, value) to change, in order
+
         if enable:
             if self._enabled_fan_speed is not None:
                 logging.debug("Turning fan on of %s", comp.name)
-                comp.fanSpeed.value = max(comp.fanSpeed.value, self._enabled_fan_speed)
+                values.append(("fanSpeed", max(fan_speed, self._enabled_fan_speed)))
+            wait_temp = self._has_fan_temp and self._enabled_fan_temp is not None
+            if wait_temp:
+                ttemp = state["targetTemperature"]["value"]
+                values.append(("targetTemperature", min(ttemp, self._enabled_fan_temp)))
+
+            if values:
+                comp.setValues(values)
+            if wait_temp:
+                try:
+                    self._waitTemperatureReached(comp, timeout=60)
+                except Exception as ex:
+                    logging.warning("Failed to reach target temperature of CCD: %s",
+                                    ex)
         else:
-            if comp.fanSpeed.value == 0:
+            if fan_speed == 0:
                 # Already off => don't touch it
                 self._enabled_fan_speed = None
                 self._enabled_fan_temp = None
             else:
                 logging.debug("Turning fan off of %s", comp.name)
-                self._enabled_fan_speed = comp.fanSpeed.value
-                comp.fanSpeed.value = 0
-
-        # Raise targetTemperature to max/ambient to avoid the fan from
-        # automatically starting again. (Some hardware have this built-in when
-        # the current temperature is too high compared to the target)
-        if self._has_fan_temp:
-            temp = comp.targetTemperature
-            if enable:
-                if self._enabled_fan_temp is not None:
-                    temp.value = min(comp.targetTemperature.value, self._enabled_fan_temp)
-                    try:
-                        self._waitTemperatureReached(comp, timeout=60)
-                    except Exception as ex:
-                        logging.warning("Failed to reach target temperature of CCD: %s",
-                                        ex)
-            else:
+                self._enabled_fan_speed = fan_speed
+                values.append(("fanSpeed", 0))
+
+            # Raise targetTemperature to max/ambient to avoid the fan from
+            # automatically starting again. (Some hardware have this built-in when
+            # the current temperature is too high compared to the target)
+            if self._has_fan_temp:
+                tstate = state["targetTemperature"]
+                self._enabled_fan_temp = tstate["value"]
                 # Set ~25°C == ambient temperature
-                self._enabled_fan_temp = temp.value
-                try:
-                    try:
-                        temp.value = min(comp.targetTemperature.range[1], 25)
-                    except (AttributeError, NotApplicableError):
-                        temp.value = util.find_closest(25, comp.targetTemperature.choices)
-                except Exception:
-                    logging.warning("Failed to change targetTemperature when disabling fan",
-                                    exc_info=True)
+                if "range" in tstate:
+                    values.append(("targetTemperature", min(tstate["range"][1], 25)))
+                else:
+                    values.append(("targetTemperature",
+                                   util.find_closest(25, tstate["choices"])))
+
+            try:
+                if values:
+                    comp.setValues(values)
+            except Exception:
+                # Only the change of the target temperature is optional
+                if comp.fanSpeed.value != 0:
+                    raise
+                logging.warning("Failed to change targetTemperature when disabling fan",
+                                exc_info=True)
 
     def _waitTemperatureReached(self, comp, timeout=None):
         """
@@ -828,8 +847,9 @@ class OpticalPathManager(object):
         while timeout is None or time.time() < tstart + timeout:
             # TODO: adjust the timeout depending on whether the temperature
             # gets closer to the target over time or not.
-            ttemp = comp.targetTemperature.value
-            atemp = comp.temperature.value
+            state = comp.getState(["targetTemperature", "temperature"])["vas"]
+            ttemp = state["targetTemperature"]["value"]
+            atemp = state["temperature"]["value"]
             if atemp < ttemp + TEMP_EPSILON:
                 return
             else:
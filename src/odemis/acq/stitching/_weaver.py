@@ -31,15 +31,20 @@ from odemis.util import img
 # directly copy the image already transformed.
 # TODO: handle higher dimensions by just copying them as-is
 # TODO: test with just one tile
-def collageWeaver(tiles, border=None):
+def collageWeaver(tiles, border=None, alloc=numpy.empty):
     """
     Very straight-forward version, which just paste the images where their center
     position is. It expects that the pixel size for all the images are identical.
     It doesn't take into account the rotation and skew metadata.
-    tiles (iterable of 2D DataArray): each image must have at least MD_POS and
-      MD_PIXEL_SIZE metadata. They should all have the same dtype.
+    tiles (iterable of 2D DataArray or DataArrayShadow): each image must have at
+      least MD_POS and MD_PIXEL_SIZE metadata. They should all have the same dtype.
+      The data of a DataArrayShadow is only read when the tile is pasted, so
+      that only one tile at a time needs to be in memory.
     border (None or value): if there is a value, it's used around each image, to
      highlight the position
+    alloc (callable (shape, dtype) -> ndarray): function to create the global
+      image. For instance, it can return an array mapped to a file, in order to
+      create an image bigger than the memory.
     return (2D DataArray): same dtype as the tiles, with shape corresponding to
       the bounding box.
     """
@@ -47,25 +52,25 @@ def collageWeaver(tiles, border=None):
     # Sort the tiles by time, to avoid random order in "Z", and high-light the
     # acquisition order.
     tiles = sorted(tiles, key=lambda t: t.metadata.get(model.MD_ACQ_DATE, 0))
-    # Merge the correction metadata inside each image (to keep the rest of the
+    # Merge the correction metadata of each image (to keep the rest of the
     # code simple)
-    tiles = [model.DataArray(t, t.metadata.copy()) for t in tiles]
-    for t in tiles:
-        img.mergeMetadata(t.metadata)
+    mds = [t.metadata.copy() for t in tiles]
+    for md in mds:
+        img.mergeMetadata(md)
 
     # Compute the bounding box of each tile and the global bounding box
 
     # Get a fixed pixel size by using the first one
     # TODO: use the mean, in case they are all slightly different due to correction?
-    pxs = tiles[0].metadata[model.MD_PIXEL_SIZE]
+    pxs = mds[0][model.MD_PIXEL_SIZE]
 
     tbbx_phy = []  # tuples of ltrb in physical coordinates
-    for t in tiles:
-        c = t.metadata[model.MD_POS]
+    for t, md in zip(tiles, mds):
+        c = md[model.MD_POS]
         w = t.shape[-1], t.shape[-2]
-        if not util.almost_equal(pxs[0], t.metadata[model.MD_PIXEL_SIZE][0], rtol=0.01):
+        if not util.almost_equal(pxs[0], md[model.MD_PIXEL_SIZE][0], rtol=0.01):
             logging.warning("Tile @ %s has a unexpected pixel size (%g vs %g)",
-                            c, t.metadata[model.MD_PIXEL_SIZE][0], pxs[0])
+                            c, md[model.MD_PIXEL_SIZE][0], pxs[0])
         bbx = (c[0] - (w[0] * pxs[0] / 2), c[1] - (w[1] * pxs[1] / 2),
                c[0] + (w[0] * pxs[0] / 2), c[1] + (w[1] * pxs[1] / 2))
         tbbx_phy.append(bbx)
@@ -92,17 +97,19 @@ def collageWeaver(tiles, border=None):
 
     # Paste each tile
     logging.debug("Generating global image of size %dx%d px", gbbx_px[-2], gbbx_px[-1])
-    im = numpy.empty((gbbx_px[-1], gbbx_px[-2]), dtype=tiles[0].dtype)
+    im = alloc((gbbx_px[-1], gbbx_px[-2]), dtype=tiles[0].dtype)
     # TODO: what value to use for background? Use minimum of the values in the tiles
     im[:] = 0
     for b, t in zip(tbbx_px, tiles):
+        if isinstance(t, model.DataArrayShadow):
+            t = t.getData()
         im[b[1]:b[1] + t.shape[0], b[0]:b[0] + t.shape[1]] = t
         # TODO: border
 
     # Update metadata
     # TODO: check this is also correct based on lt + half shape * pxs
     c_phy = ((gbbx_phy[0] + gbbx_phy[2]) / 2, (gbbx_phy[1] + gbbx_phy[3]) / 2)
-    md = tiles[0].metadata.copy()
+    md = mds[0].copy()
     md[model.MD_POS] = c_phy
 
     return model.DataArray(im, md)
@@ -22,7 +22,8 @@ Odemis. If not, see http://www.gnu.org/licenses/.
 import logging
 import numpy
 from odemis import model
-from odemis.dataio import hdf5
+from odemis.dataio import hdf5, tiff
+import os
 import time
 import unittest
 
@@ -31,11 +32,20 @@ from odemis.acq.stitching import collageWeaver
 
 logging.getLogger().setLevel(logging.DEBUG)
 
+FILENAMES = [u"test-tile%d%s" % (i, tiff.EXTENSIONS[0]) for i in range(2)]
+
 
 
 # @unittest.skip("skip")
 class TestCollageWeaver(unittest.TestCase):
 
+    def tearDown(self):
+        for fn in FILENAMES:
+            try:
+                os.remove(fn)
+            except Exception:
+                pass
+
     # @unittest.skip("skip")
     def test_one_tile(self):
         """
@@ -78,6 +88,40 @@ class TestCollageWeaver(unittest.TestCase):
         numpy.testing.assert_array_equal(outd, intile)
         self.assertEqual(outd.metadata, intile.metadata)
 
+    def test_shadow_tiles(self):
+        """
+        Test weaving tiles only opened from a file (DataArrayShadow), into an
+        array allocated by the caller
+        """
+        md = {
+            model.MD_DESCRIPTION: u"test sem",
+            model.MD_PIXEL_SIZE: (1e-6, 1e-6),  # m/px
+            model.MD_DWELL_TIME: 1.2e-6,  # s
+        }
+        tiles = []
+        das = []
+        for i, fn in enumerate(FILENAMES):
+            tmd = md.copy()
+            tmd[model.MD_ACQ_DATE] = time.time() + i
+            tmd[model.MD_POS] = (i * 100e-6, 0)  # side by side
+            tile = model.DataArray(numpy.zeros((80, 100), dtype=numpy.uint16) + i + 1, tmd)
+            tiles.append(tile)
+            tiff.export(fn, tile)
+            das.extend(tiff.open_data(fn).content)
+
+        allocated = []
+        def alloc(shape, dtype):
+            a = numpy.empty(shape, dtype)
+            allocated.append(a)
+            return a
+
+        outd = collageWeaver(das, alloc=alloc)
+        self.assertEqual(outd.shape, (80, 200))
+        self.assertEqual(len(allocated), 1)
+        numpy.testing.assert_array_equal(outd, allocated[0])
+        numpy.testing.assert_array_equal(outd, collageWeaver(tiles))
+        self.assertEqual(outd[0, 0], 1)
+        self.assertEqual(outd[0, -1], 2)
 
 
 if __name__ == '__main__':
@@ -90,6 +90,8 @@ class Stream(object):
         # Note: A Detectors can have multiple dataflows, so that's why a Stream
         # has a separate attribute.
         self._dataflow = dataflow
+        # stage -> acquisition date of the last data whose latency was recorded
+        self._latency_dates = {}
 
         # TODO: We need to reorganise everything so that the
         # image display is done via a dataflow (in a separate thread), instead
@@ -812,6 +814,42 @@ class Stream(object):
         # synchronization allows to delay it (without accumulation).
         self._im_needs_recompute.set()
 
+    def recordLatency(self, stage, data=None):
+        """
+        Record in the statistics of the dataflow the latency of the data (since
+          its acquisition) when reaching the given stage.
+        stage (str): one of model.DATAFLOW_STAGES
+        data (None or DataArray): the data, default to .image
+        """
+        if self._dataflow is None:
+            return
+        if data is None:
+            data = self.image.value
+        try:
+            date = data.metadata[MD_ACQ_DATE]
+        except (AttributeError, KeyError):
+            return  # No data, or unknown acquisition time
+        # Only the first time the data reaches the stage is meaningful (the
+        # same data can be projected or displayed again later)
+        if self._latency_dates.get(stage) == date:
+            return
+        self._latency_dates[stage] = date
+        try:
+            self._dataflow.recordStage(stage, data)
+        except AttributeError:
+            pass  # Not a standard DataFlow
+
+    def getDataFlowStats(self):
+        """
+        return (dict): summary of the statistics of the dataflow (cf
+          model.DataFlowBase.stats). It's empty if there is no dataflow (or
+          no statistics yet).
+        """
+        try:
+            return self._dataflow.stats.value
+        except AttributeError:
+            return {}
+
     @staticmethod
     def _image_thread(wstream):
         """ Called as a separate thread, and recomputes the image whenever it receives an event
@@ -850,6 +888,7 @@ class Stream(object):
                 tnext = time.time() + 0.1  # max 10 Hz
                 im_needs_recompute.clear()
                 stream._updateImage()
+                stream.recordLatency("projection")
         except Exception:
             logging.exception("image update thread failed")
 
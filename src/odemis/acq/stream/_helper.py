@@ -110,6 +110,12 @@ class RepetitionStream(LiveStream):
         # Can be True only if the sstage is not None
         self.useScanStage = model.BooleanVA(False)
 
+        # If True, and the e-beam scanner supports it, the e-beam goes by itself
+        # through all the spots, and triggers the detector at each of them.
+        # Otherwise, each spot is synchronised by software (slower, but doesn't
+        # depend on the hardware synchronisation).
+        self.useHwSync = model.BooleanVA(True)
+
         # exposure time of each pixel is the exposure time of the detector,
         # the dwell time of the emitter will be adapted before acquisition.
 
@@ -459,6 +465,8 @@ class MonochromatorSettingsStream(PMTSettingsStream):
 
         # scan stage is not (yet?) handled for SEM/SEM streams
         del self.useScanStage
+        # driver synchronisation is only handled for SEM/CCD streams
+        del self.useHwSync
 
         # B/C and histogram are meaningless on a chronogram
         del self.auto_bc
@@ -606,6 +614,8 @@ class CLSettingsStream(PMTSettingsStream):
 
         # scan stage is not (yet?) handled for SEM/SEM streams
         del self.useScanStage
+        # driver synchronisation is only handled for SEM/CCD streams
+        del self.useHwSync
 
         # For the live view, we need a way to define the scale and resolution,
         # but not changing any hardware setting would mean we rely on another
@@ -34,10 +34,17 @@ from odemis.acq import calibration
 from odemis.model import MD_POS, MD_PIXEL_SIZE, VigilantAttribute
 from odemis.util import img, conversion, polar, spectrum
 from scipy import ndimage
+import threading
+import weakref
 
 from ._base import Stream
 
 
+# Maximum memory used by a StaticARStream to cache the polar projections.
+# A projection of 1134x1134 px takes ~10 MB.
+MAX_POLAR_CACHE_NBYTES = 500e6  # bytes
+
+
 class StaticStream(Stream):
     """
     Stream containing one static image.
@@ -240,9 +247,15 @@ class StaticARStream(StaticStream):
             except KeyError:
                 logging.info("Skipping DataArray without known position")
 
-        # Cached conversion of the CCD image to polar representation
-        # TODO: automatically fill it in a background thread
-        self._polar = {} # dict tuple 2 floats -> DataArray
+        # Cached conversion of the CCD image to polar representation.
+        # When the background subtraction is linear, it contains the projection
+        # of the raw data, and the projection of the background is subtracted
+        # afterwards. Otherwise, it contains the final projection.
+        self._polar = collections.OrderedDict()  # tuple 2 floats -> DataArray, LRU ordered
+        self._polar_nbytes = 0  # memory used by the cache
+        self._polar_bg = None  # DataArray: projection of the background, if linear
+        self._polar_gen = 0  # incremented every time the cache is invalidated
+        self._polar_lock = threading.Lock()  # to access any of the _polar* attributes
 
         # SEM position displayed, (None, None) == no point selected
         self.point = model.VAEnumerated((None, None),
@@ -272,64 +285,141 @@ class StaticARStream(StaticStream):
 
         super(StaticARStream, self).__init__(name, list(self._sempos.values()))
 
+        # Fill the cache in the background, so that selecting another point
+        # is immediate.
+        if len(self._sempos) > 1:
+            self._polar_thread = threading.Thread(target=self._precompute_polar_thread,
+                                                  args=(weakref.ref(self),),
+                                                  name="AR projection precomputation")
+            self._polar_thread.daemon = True
+            self._polar_thread.start()
+
+    @staticmethod
+    def _precompute_polar_thread(wstream):
+        """
+        Called as a separate thread, and projects all the points, starting with
+        the ones the closest to the current point, until the cache is full.
+        wstream (weakref to a StaticARStream): the stream to project
+        """
+        try:
+            stream = wstream()
+            name = stream.name.value
+            cpos = stream.point.value
+            positions = [p for p in stream._sempos.keys() if p != cpos]
+            if cpos != (None, None):
+                positions.sort(key=lambda p: math.hypot(p[0] - cpos[0], p[1] - cpos[1]))
+            del stream
+
+            for pos in positions:
+                # Only hold a weakref to allow the stream to be garbage collected
+                stream = wstream()
+                if stream is None:
+                    logging.debug("Stream %s disappeared so ending AR precomputation", name)
+                    return
+                if stream._polar_nbytes >= MAX_POLAR_CACHE_NBYTES:
+                    logging.debug("AR projection cache is full, stopping precomputation")
+                    return
+                stream._project2Polar(pos)
+                del stream
+            logging.debug("Precomputed the projections of %d AR points", len(positions))
+        except Exception:
+            logging.exception("AR precomputation thread failed")
+
+    def _isBackgroundLinear(self, bg_data):
+        """
+        Check whether the background subtraction can be done after the polar
+        projection, which is only possible if it doesn't clip the data.
+        bg_data (None or DataArray): the background data
+        return (bool): True if the projection of the background can be
+          subtracted from the projection of the data.
+        """
+        # The baseline subtraction and the unsigned subtraction both clip at 0
+        return (bg_data is not None and
+                all(d.dtype.kind == "f" for d in self._sempos.values()))
+
+    def _projectAR(self, data):
+        """
+        Convert an AR image to its polar projection, at the display resolution
+        data (DataArray of shape YX): the AR image
+        returns (DataArray): the polar projection
+        """
+        if numpy.prod(data.shape) > (1280 * 1080):
+            # AR conversion fails with very large images due to too much
+            # memory consumed (> 2Gb). So, rescale + use a "degraded" type that
+            # uses less memory. As the display size is small (compared
+            # to the size of the input image, it shouldn't actually
+            # affect much the output.
+            logging.info("AR image is very large %s, will convert to "
+                         "azimuthal projection in reduced precision.",
+                         data.shape)
+            y, x = data.shape
+            if y > x:
+                small_shape = 1024, int(round(1024 * x / y))
+            else:
+                small_shape = int(round(1024 * y / x)), 1024
+            # resize
+            data = img.rescale_hq(data, small_shape)
+            dtype = numpy.float16
+        else:
+            dtype = None # just let the function use the best one
+
+        # 2 x size of original image (on smallest axis) and at most
+        # the size of a full-screen canvas
+        size = min(min(data.shape) * 2, 1134)
+
+        # TODO: First compute quickly a low resolution and then
+        # compute a high resolution version.
+        # TODO: could use the size of the canvas that will display
+        # the image to save some computation time.
+
+        # Note: the projection is cached per geometry, so only the
+        # first image of the acquisition is slow to convert.
+        return polar.AngleResolved2Polar(data, size, hole=False, dtype=dtype)
+
     def _project2Polar(self, pos):
         """
         Return the polar projection of the image at the given position.
         pos (tuple of 2 floats): position (must be part of the ._sempos
         returns DataArray: the polar projection
         """
-        if pos in self._polar:
-            polard = self._polar[pos]
-        else:
+        with self._polar_lock:
+            polard = self._polar.pop(pos, None)
+            if polard is not None:
+                self._polar[pos] = polard  # Most recently used => last
+            polar_bg = self._polar_bg
+            gen = self._polar_gen
+            bg_data = self.background.value
+
+        if polard is None:
             # Compute the polar representation
             data = self._sempos[pos]
             try:
-                if numpy.prod(data.shape) > (1280 * 1080):
-                    # AR conversion fails with very large images due to too much
-                    # memory consumed (> 2Gb). So, rescale + use a "degraded" type that
-                    # uses less memory. As the display size is small (compared
-                    # to the size of the input image, it shouldn't actually
-                    # affect much the output.
-                    logging.info("AR image is very large %s, will convert to "
-                                 "azimuthal projection in reduced precision.",
-                                 data.shape)
-                    y, x = data.shape
-                    if y > x:
-                        small_shape = 1024, int(round(1024 * x / y))
-                    else:
-                        small_shape = int(round(1024 * y / x)), 1024
-                    # resize
-                    data = img.rescale_hq(data, small_shape)
-                    dtype = numpy.float16
-                else:
-                    dtype = None # just let the function use the best one
-
-                # 2 x size of original image (on smallest axis) and at most
-                # the size of a full-screen canvas
-                size = min(min(data.shape) * 2, 1134)
-
-                # TODO: First compute quickly a low resolution and then
-                # compute a high resolution version.
-                # TODO: could use the size of the canvas that will display
-                # the image to save some computation time.
-
-                bg_data = self.background.value
-                if bg_data is None:
+                if polar_bg is not None:
+                    # Background will be subtracted on the projection
+                    data0 = data
+                elif bg_data is None:
                     # Simple version: remove the background value
                     data0 = polar.ARBackgroundSubtract(data)
                 else:
                     data0 = img.Subtract(data, bg_data) # metadata from data
 
-                # Warning: allocates lot of memory, which will not be free'd until
-                # the current thread is terminated.
-                polard = polar.AngleResolved2Polar(data0, size, hole=False, dtype=dtype)
-
-                # TODO: don't hold too many of them in cache (eg, max 3 * 1134**2)
-                self._polar[pos] = polard
+                polard = self._projectAR(data0)
             except Exception:
                 logging.exception("Failed to convert to azimuthal projection")
                 return data # display it raw as fallback
 
+            with self._polar_lock:
+                # Don't cache it if the background has changed in the meantime
+                if gen == self._polar_gen and pos not in self._polar:
+                    self._polar[pos] = polard
+                    self._polar_nbytes += polard.nbytes
+                    while self._polar_nbytes > MAX_POLAR_CACHE_NBYTES and len(self._polar) > 1:
+                        _, old = self._polar.popitem(last=False)
+                        self._polar_nbytes -= old.nbytes
+
+        if polar_bg is not None:
+            polard = model.DataArray(polard - polar_bg, polard.metadata)
+
         return polard
 
     def _find_metadata(self, md):
@@ -406,8 +496,25 @@ class StaticARStream(StaticStream):
 
     def _onBackground(self, data):
         """Called when the background is changed"""
-        # uncache all the polar images, and update the current image
-        self._polar = {}
+        if self._isBackgroundLinear(data):
+            try:
+                polar_bg = self._projectAR(data)
+            except Exception:
+                logging.exception("Failed to convert background to azimuthal projection")
+                polar_bg = None
+        else:
+            polar_bg = None
+
+        with self._polar_lock:
+            # If the cache contains the projection of the raw data, it's still
+            # valid, otherwise uncache all the polar images.
+            if polar_bg is None or self._polar_bg is None:
+                self._polar.clear()
+                self._polar_nbytes = 0
+                self._polar_gen += 1
+            self._polar_bg = polar_bg
+
+        # update the current image
         self._shouldUpdateImage()
 
 
@@ -669,6 +776,15 @@ class StaticSpectrumStream(StaticStream):
             min_bw = (max_bw - data.shape[0]) + 1
             return range(min_bw, max_bw + 1), "px"
 
+    def get_spectrum_cube(self):
+        """
+        Return the spectrum of every pixel, after calibration.
+        See get_spectrum_range() to know the wavelength values for each index of
+         the spectrum dimension
+        return (DataArray of shape C, Y, X): the spectrum cube
+        """
+        return self._calibrated[:, 0, 0, :, :]
+
     def get_pixel_spectrum(self):
         """
         Return the (0D) spectrum belonging to the selected pixel.
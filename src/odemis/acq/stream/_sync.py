@@ -597,8 +597,17 @@ class SEMCCDMDStream(MultipleDetectorStream):
        automatically synchronises the CCD. As the dwell time is constant, it
        must be bigger than the worst time for CCD acquisition. Less overhead,
        so good for short dwell times.
+    The driver synchronised acquisition is used whenever the e-beam scanner
+    supports it (ie, it has .scanPath and .newPosition), and the repetition
+    stream .useHwSync is True. Otherwise, it falls back to the software
+    synchronised acquisition.
     """
 
+    # Extra time (in s) the e-beam stays on each spot, compared to the CCD
+    # acquisition time, to be certain the CCD is ready for the next trigger, in
+    # driver synchronised acquisition.
+    HW_SYNC_OVERHEAD = 0.01
+
     def _estimateRawAcquisitionTime(self):
         """
         return (float): time in s for acquiring the whole image, without drift
@@ -616,8 +625,15 @@ class SEMCCDMDStream(MultipleDetectorStream):
             readout = numpy.prod(res) / ro_rate
 
             exp = rep_stream._getDetectorVA("exposureTime").value
-            dur_image = (exp + readout + 0.03) * 1.20
+            if self._supportsHwSync():
+                # The e-beam moves by itself, so there is no overhead per spot
+                dur_image = exp + readout + self.HW_SYNC_OVERHEAD
+            else:
+                dur_image = (exp + readout + 0.03) * 1.20
             duration = numpy.prod(rep_stream.repetition.value) * dur_image
+            if self._supportsHwSync():
+                # One more image, to be sure the detector is ready
+                duration += dur_image
             # Add the setup time
             duration += self.SETUP_OVERHEAD
 
@@ -686,6 +702,8 @@ class SEMCCDMDStream(MultipleDetectorStream):
         """
         if model.hasVA(self._rep_stream, "useScanStage") and self._rep_stream.useScanStage.value:
             return self._runAcquisitionScanStage(future)
+        if self._supportsHwSync():
+            return self._runAcquisitionHwSync(future)
 
         # TODO: handle better very large grid acquisition (than memory oops)
         try:
@@ -907,6 +925,288 @@ class SEMCCDMDStream(MultipleDetectorStream):
             del self._main_data  # regain a bit of memory
             self._acq_done.set()
 
+    def _supportsHwSync(self):
+        """
+        return (bool): True if the acquisition can be driver synchronised: the
+          e-beam scanner goes by itself through all the spots, and triggers the
+          repetition detector at each of them.
+        """
+        if model.hasVA(self._rep_stream, "useHwSync") and not self._rep_stream.useHwSync.value:
+            return False
+        if hasattr(self._rep_stream, "fuzzing") and self._rep_stream.fuzzing.value:
+            # Fuzzing needs to scan a tile at each spot
+            return False
+        return (model.hasVA(self._emitter, "scanPath") and
+                isinstance(getattr(self._emitter, "newPosition", None), model.EventBase))
+
+    def _runAcquisitionHwSync(self, future):
+        """
+        Acquires images from the multiple detectors via driver synchronisation:
+          the list of spots is sent at once to the e-beam scanner, which goes
+          through them and triggers the repetition detector at each spot.
+          If drift correction is needed, the spots are sent by blocks, between
+          each anchor acquisition.
+        Warning: can be quite memory consuming if the grid is big
+        returns (list of DataArray): all the data acquired
+        raises:
+          CancelledError() if cancelled
+          Exceptions if error
+        """
+        try:
+            self._acq_done.clear()
+            rep_time = self._adjustHardwareSettings()
+            # The e-beam must stay on each spot at least as long as the CCD
+            dt = self._emitter.dwellTime.clip(rep_time + self.HW_SYNC_OVERHEAD)
+            self._emitter.dwellTime.value = dt
+            dwell_time = self._emitter.dwellTime.value
+            if dwell_time < rep_time:
+                logging.warning("Dwell time limited to %g s, while CCD needs %g s",
+                                dwell_time, rep_time)
+            spot_pos = self._getSpotPositions()
+            logging.debug("Generating %dx%d spots for %g (dt=%g) s",
+                          spot_pos.shape[1], spot_pos.shape[0], rep_time, dwell_time)
+            rep = self._rep_stream.repetition.value
+            roi = self._rep_stream.roi.value
+            main_pxs = self._emitter.pixelSize.value
+            self._main_data = []
+            self._rep_data = None
+            main_spots = []
+            rep_buf = []
+            self._rep_raw = []
+            self._main_raw = []
+            self._anchor_raw = []
+            logging.info("Starting driver synchronised repetition stream acquisition "
+                         "with components %s and %s",
+                         self._main_det.name, self._rep_det.name)
+
+            tot_num = numpy.prod(rep)
+            n = 0  # number of points acquired so far
+
+            # Translate dc_period to a number of pixels
+            if self._dc_estimator is not None:
+                rep_time_psmt = self._estimateRawAcquisitionTime() / numpy.prod(rep)
+                pxs_dc_period = self._dc_estimator.estimateCorrectionPeriod(
+                                        self._main_stream.dcPeriod.value,
+                                        rep_time_psmt,
+                                        rep)
+                # number of points left to acquire until next drift correction
+                n_til_dc = pxs_dc_period.next()
+                dc_acq_time = self._dc_estimator.estimateAcquisitionTime()
+
+                # First acquisition of anchor area
+                self._dc_estimator.acquire()
+            else:
+                dc_acq_time = 0
+                n_til_dc = tot_num
+
+            dc_period = n_til_dc  # approx. (just for time estimation)
+
+            # The spots are given as translation, so the SEM data position
+            # is the one of the center of the scanning area.
+            self._emitter.translation.value = (0, 0)
+            trans_rng = self._emitter.translation.range
+            # The repetition detector stays subscribed during the whole acquisition
+            self._armRepDetectorHwSync(rep_time * 3 + 5)
+
+            while n < tot_num:
+                nb = min(n_til_dc, tot_num - n)
+                # All the spots in the order of acquisition (X first, then Y)
+                spots = spot_pos.reshape(-1, 2)[n:n + nb]
+                cpspots = numpy.clip(spots, trans_rng[0], trans_rng[1])
+                if (cpspots != spots).any():
+                    if self._dc_estimator:
+                        logging.error("Drift of %s px caused acquisition region out "
+                                      "of bounds: needed to scan spots at %s.",
+                                      self._dc_estimator.tot_drift,
+                                      spots[(cpspots != spots).any(axis=1)])
+                    else:
+                        logging.error("Unexpected clipping in the scan spot positions")
+                path = [tuple(p) for p in cpspots]
+                self._emitter.scanPath.value = path
+
+                nmain = len(self._main_data)
+                failures = 0  # Keep track of synchronizing failures
+                while True:
+                    self._acq_main_complete.clear()
+                    self._acq_rep_complete.clear()
+                    self._rep_data = []
+                    self._acq_rep_tot = nb
+                    self._acq_min_date = time.time()
+                    # The repetition detector is already waiting for a trigger,
+                    # the first newPosition is sent when the SEM starts scanning.
+                    self._rep_df.synchronizedOn(self._emitter.newPosition)
+                    self._main_df.subscribe(self._onMainImage)
+                    start = time.time()
+
+                    timeout = nb * dwell_time * 1.5 + 5
+                    timedout = not self._acq_rep_complete.wait(timeout)
+                    if self._acq_state == CANCELLED:
+                        raise CancelledError()
+                    if not timedout:
+                        break
+
+                    # Probably the detector missed a trigger, so it's still
+                    # waiting for the last spots.
+                    logging.warning("Acquisition of repetition stream for %d spots "
+                                    "timed out after %g s, only received %d. Will try again",
+                                    nb, timeout, len(self._rep_data))
+                    failures += 1
+                    self._main_df.unsubscribe(self._onMainImage)
+                    self._rep_df.unsubscribe(self._onRepetitionImageHwSync)
+                    if failures >= 3:
+                        # In three failures we just give up
+                        raise IOError("Repetition stream acquisition repeatedly fails to synchronize")
+                    # Ensure we don't keep the SEM data for this run
+                    del self._main_data[nmain:]
+                    # Restart the acquisition, hoping this time we will synchronize
+                    # properly
+                    self._armRepDetectorHwSync(rep_time * 3 + 5)
+
+                # Normally, the SEM acquisition has already completed
+                if not self._acq_main_complete.wait(dwell_time * 1.5 + 5):
+                    raise TimeoutError("Acquisition of SEM spots timed out")
+                self._main_df.unsubscribe(self._onMainImage)
+                # Don't let the detector be triggered by the e-beam outside
+                # of the spots (eg, during the anchor acquisition)
+                self._rep_df.synchronizedOn(self._rep_det.softwareTrigger)
+                logging.debug("Got synchronised data of %d spots", nb)
+
+                if self._acq_state == CANCELLED:
+                    raise CancelledError()
+
+                # Separate the SEM data of each spot. MD_POS needs to be the
+                # position of the e-beam (corrected for drift)
+                main_data = self._main_data[-1]
+                center = main_data.metadata[MD_POS]
+                drift_shift = self._dc_estimator.tot_drift if self._dc_estimator else (0, 0)
+                for j, (p, rd) in enumerate(zip(path, self._rep_data)):
+                    raw_pos = (center[0] + p[0] * main_pxs[0],
+                               center[1] - p[1] * main_pxs[1])  # Y is upside down
+                    md = main_data.metadata.copy()
+                    md[MD_POS] = raw_pos
+                    if main_data.ndim == 2:
+                        main_spots.append(model.DataArray(main_data[:, j:j + 1], md))
+                    else:  # no data (eg, counter)
+                        main_spots.append(model.DataArray(main_data, md))
+
+                    cor_pos = (raw_pos[0] + drift_shift[0] * main_pxs[0],
+                               raw_pos[1] - drift_shift[1] * main_pxs[1])
+                    rd.metadata[MD_POS] = cor_pos
+                    i = numpy.unravel_index(n + j, rep[::-1])
+                    rep_buf.append(self._preprocessRepData(rd, i))
+
+                n += nb
+                # guess how many drift anchors to acquire
+                n_anchor = (tot_num - n) // dc_period
+                anchor_time = n_anchor * dc_acq_time
+                self._updateProgress(future, time.time() - start, n, tot_num, anchor_time)
+
+                # Check if it is time for drift correction
+                if self._dc_estimator is not None and n < tot_num:
+                    n_til_dc = pxs_dc_period.next()
+
+                    # Acquisition of anchor area
+                    # Cannot cancel during this time, but hopefully it's short
+                    self._emitter.scanPath.value = []
+                    self._dc_estimator.acquire()
+
+                    if self._acq_state == CANCELLED:
+                        raise CancelledError()
+
+                    # Estimate drift and update next positions
+                    shift = self._dc_estimator.estimate()
+                    spot_pos[:, :, 0] -= shift[0]
+                    spot_pos[:, :, 1] -= shift[1]
+
+            # Done!
+            self._rep_df.unsubscribe(self._onRepetitionImageHwSync)
+            self._rep_df.synchronizedOn(None)
+            self._emitter.scanPath.value = []
+
+            with self._acq_lock:
+                if self._acq_state == CANCELLED:
+                    raise CancelledError()
+                self._acq_state = FINISHED
+
+            main_one = self._assembleMainData(rep, roi, main_spots)  # shape is (Y, X)
+            # explicitly add names to make sure they are different
+            main_one.metadata[MD_DESCRIPTION] = self._main_stream.name.value
+            self._onMultipleDetectorData(main_one, rep_buf, rep)
+
+            if self._dc_estimator is not None:
+                self._anchor_raw.append(self._assembleAnchorData(self._dc_estimator.raw))
+        except Exception as exp:
+            if not isinstance(exp, CancelledError):
+                logging.exception("Driver sync acquisition of multiple detectors failed")
+
+            # make sure it's all stopped
+            self._main_df.unsubscribe(self._onMainImage)
+            self._rep_df.unsubscribe(self._onRepetitionImageHwSync)
+            self._rep_df.synchronizedOn(None)
+            self._emitter.scanPath.value = []
+
+            self._rep_raw = []
+            self._main_raw = []
+            self._anchor_raw = []
+            if not isinstance(exp, CancelledError) and self._acq_state == CANCELLED:
+                logging.warning("Converting exception to cancellation")
+                raise CancelledError()
+            raise
+        else:
+            return self.raw
+        finally:
+            self._main_stream._unlinkHwVAs()
+            self._rep_stream._unlinkHwVAs()
+            self._dc_estimator = None
+            self._current_future = None
+            del self._main_data  # regain a bit of memory
+            self._acq_done.set()
+
+    def _armRepDetectorHwSync(self, timeout):
+        """
+        Starts the acquisition of the repetition detector, and only returns once
+          it's ready to be triggered. As there is no way to know when a detector
+          is ready, it's triggered once by software: once this (discarded) image
+          is received, the detector is waiting for the next trigger.
+          The detector is left synchronised on its software trigger.
+        timeout (float): maximum time to wait for the image (in s)
+        raises:
+          CancelledError() if cancelled
+          TimeoutError: if the image is not received in time
+        """
+        self._acq_rep_complete.clear()
+        self._rep_data = []
+        self._acq_rep_tot = 1
+        self._acq_min_date = time.time()
+        ccd_trigger = self._rep_det.softwareTrigger
+        self._rep_df.synchronizedOn(ccd_trigger)
+        self._rep_df.subscribe(self._onRepetitionImageHwSync)
+        ccd_trigger.notify()
+        if not self._acq_rep_complete.wait(timeout):
+            raise TimeoutError("Repetition detector not ready after %g s" % (timeout,))
+        if self._acq_state == CANCELLED:
+            raise CancelledError()
+        logging.debug("Repetition detector ready for driver synchronisation")
+
+    def _onRepetitionImageHwSync(self, df, data):
+        """
+        Receives the repetition data during driver synchronised acquisition:
+          all the data of the current block of spots is kept in ._rep_data.
+        """
+        if self._acq_min_date > data.metadata.get(model.MD_ACQ_DATE, 0):
+            # Triggered by a previous scan
+            logging.warning("Dropping data because it seems started %g s too early",
+                            self._acq_min_date - data.metadata.get(model.MD_ACQ_DATE, 0))
+            return
+
+        if len(self._rep_data) >= self._acq_rep_tot:
+            logging.warning("Dropping extra repetition data")
+            return
+
+        self._rep_data.append(data)
+        if len(self._rep_data) == self._acq_rep_tot:
+            self._acq_rep_complete.set()
+
     def _adjustHardwareSettingsScanStage(self):
         """
         Read the SEM and CCD stream settings and adapt the SEM scanner
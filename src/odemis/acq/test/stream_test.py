@@ -971,6 +971,70 @@ class SPARCTestCase(unittest.TestCase):
         numpy.testing.assert_allclose(spec_md[model.MD_PIXEL_SIZE], exp_pxs)
 
 
+#     @skip("simple")
+    def test_acq_spec_hw_sync(self):
+        """
+        Test acquisition for Spectrometer, with the e-beam driving the spots
+        """
+        sems = stream.SEMStream("test sem", self.sed, self.sed.data, self.ebeam)
+        specs = stream.SpectrumSettingsStream("test spec", self.spec, self.spec.data, self.ebeam)
+        sps = stream.SEMSpectrumMDStream("test sem-spec", sems, specs)
+        # The simulated SEM supports the scan path
+        self.assertTrue(sps._supportsHwSync())
+
+        specs.roi.value = (0.15, 0.6, 0.8, 0.8)
+        self.spec.exposureTime.value = 0.05  # s
+        specs.repetition.value = (7, 3)
+        exp_pos, exp_pxs, exp_res = self._roiToPhys(specs)
+
+        timeout = 1 + 1.5 * sps.estimateAcquisitionTime()
+        f = sps.acquire()
+        data = f.result(timeout)
+        self.assertEqual(len(data), len(sps.raw))
+        self.assertEqual(sps._main_raw[0].shape, exp_res[::-1])
+        sshape = sps._rep_raw[0].shape
+        self.assertEqual(sshape[-2:], exp_res[::-1])
+        sem_md = sps._main_raw[0].metadata
+        spec_md = sps._rep_raw[0].metadata
+        numpy.testing.assert_allclose(sem_md[model.MD_POS], spec_md[model.MD_POS])
+        numpy.testing.assert_allclose(spec_md[model.MD_POS], exp_pos)
+        numpy.testing.assert_allclose(spec_md[model.MD_PIXEL_SIZE], exp_pxs)
+
+        # The scanner is back to normal scanning
+        self.assertEqual(self.ebeam.scanPath.value, [])
+
+#     @skip("simple")
+    def test_acq_spec_no_hw_sync(self):
+        """
+        Test the software synchronised acquisition can be forced
+        """
+        sems = stream.SEMStream("test sem", self.sed, self.sed.data, self.ebeam)
+        specs = stream.SpectrumSettingsStream("test spec", self.spec, self.spec.data, self.ebeam)
+        sps = stream.SEMSpectrumMDStream("test sem-spec", sems, specs)
+        specs.useHwSync.value = False
+        self.assertFalse(sps._supportsHwSync())
+
+        specs.roi.value = (0.15, 0.6, 0.8, 0.8)
+        self.spec.exposureTime.value = 0.05  # s
+        specs.repetition.value = (3, 2)
+        exp_pos, exp_pxs, exp_res = self._roiToPhys(specs)
+
+        self.ebeam.scanPath.subscribe(self._on_scan_path)
+        self._scan_paths = []
+        try:
+            timeout = 1 + 1.5 * sps.estimateAcquisitionTime()
+            f = sps.acquire()
+            data = f.result(timeout)
+        finally:
+            self.ebeam.scanPath.unsubscribe(self._on_scan_path)
+        self.assertEqual(len(data), len(sps.raw))
+        self.assertEqual(sps._main_raw[0].shape, exp_res[::-1])
+        # The scan path was never used
+        self.assertEqual(self._scan_paths, [])
+
+    def _on_scan_path(self, path):
+        self._scan_paths.append(path)
+
 #     @skip("simple")
     def test_acq_fuz(self):
         """
@@ -2100,6 +2164,64 @@ class StaticStreamsTestCase(unittest.TestCase):
 
         self.assertFalse(im2d1 is im2dc)
 
+    def test_ar_linear_bg(self):
+        """Test StaticARStream with float data, and projection cache"""
+        md = {model.MD_SW_VERSION: "1.0-test",
+             model.MD_HW_NAME: "fake ccd",
+             model.MD_DESCRIPTION: "AR",
+             model.MD_ACQ_DATE: time.time(),
+             model.MD_BINNING: (1, 1),  # px, px
+             model.MD_SENSOR_PIXEL_SIZE: (13e-6, 13e-6),  # m/px
+             model.MD_PIXEL_SIZE: (2e-5, 2e-5),  # m/px
+             model.MD_EXP_TIME: 1.2,  # s
+             model.MD_AR_POLE: (253.1, 65.1),
+             model.MD_LENS_MAG: 0.4,  # ratio
+            }
+
+        # 3x3 points of AR data
+        data = []
+        for i in range(9):
+            mdi = dict(md)
+            mdi[model.MD_POS] = (1.2e-3 + (i % 3) * 1e-6, -30e-3 + (i // 3) * 1e-6)
+            d = numpy.random.randint(1000, 2000, (256, 512)).astype(numpy.float64)
+            data.append(model.DataArray(d, mdi))
+
+        ars = stream.StaticARStream("test", data)
+
+        # All the points should be eventually precomputed
+        for i in range(100):
+            if len(ars._polar) == len(data):
+                break
+            time.sleep(0.1)
+        else:
+            self.fail("Only %d projections precomputed" % (len(ars._polar),))
+
+        # Background subtraction done in polar domain should give the same
+        # result as subtracting it before the projection
+        calib = model.DataArray(numpy.random.randint(0, 500, (256, 512)).astype(numpy.float64), md)
+        ars.background.value = calib
+        self.assertIsNotNone(ars._polar_bg)
+        # The baseline subtraction was not linear => the cache had to be emptied
+        self.assertLess(len(ars._polar), len(data))
+        for d in data:
+            ars._project2Polar(d.metadata[model.MD_POS])
+        self.assertEqual(len(ars._polar), len(data))
+
+        # Changing the background keeps the projections of the raw data
+        calib = model.DataArray(numpy.random.randint(0, 500, (256, 512)).astype(numpy.float64), md)
+        ars.background.value = calib
+        self.assertEqual(len(ars._polar), len(data))
+
+        pos = data[4].metadata[model.MD_POS]
+        polard = ars._project2Polar(pos)
+        exp_polard = ars._projectAR(img.Subtract(data[4], calib))
+        numpy.testing.assert_allclose(polard, exp_polard, atol=1e-6)
+
+        # Back to baseline subtraction => not linear, so the cache is emptied
+        ars.background.value = None
+        self.assertIsNone(ars._polar_bg)
+        self.assertEqual(len(ars._polar), 0)
+
     def test_ar_das(self):
         """Test StaticARStream with a DataArrayShadow"""
         logging.info("setting up stream")
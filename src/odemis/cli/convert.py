@@ -20,23 +20,36 @@ You should have received a copy of the GNU General Public License along with Ode
 # file formats supported by Odemis.
 # Example usage:
 # convert --input file-as.hdf5 --output file-as.ome.tiff
+# Multiple files can be converted at once, in parallel, by passing a "*" in the
+# output filename, which is replaced by the name of each input file:
+# convert --input "night/*.h5" --output "converted/*.ome.tiff"
 
 from __future__ import division
 
 import argparse
+from concurrent.futures import ProcessPoolExecutor
+import functools
 from gettext import ngettext
+import glob
 import logging
+import multiprocessing
 import numpy
 from odemis import dataio, model
 import odemis
 from odemis.acq import stitching
 from odemis.util import spectrum
+from odemis.util import dataio as udataio
 import os
 import sys
+import tempfile
 
 
 logging.getLogger().setLevel(logging.INFO) # use DEBUG for more messages
 
+# Woven images bigger than this (in bytes) are stored in a temporary file,
+# instead of the memory.
+MAX_WEAVE_MEMORY = 2 ** 30
+
 
 def open_acq(fn):
     """
@@ -177,14 +190,49 @@ def minus(data_a, data_b):
     return ret
 
 
-def weave(infns):
+def _alloc_weave_array(shape, dtype, tmpdir=None):
+    """
+    Create the array to store a woven image. If it's big, the array is mapped
+      to a temporary file, so that it doesn't have to fit in memory.
+    shape (tuple of int): shape of the array
+    dtype (numpy.dtype): type of the array
+    tmpdir (None or str): directory where to create the temporary file. If
+      None, the default temporary directory is used.
+    return (ndarray): the (uninitialised) array
+    """
+    nbytes = numpy.prod(shape, dtype=numpy.int64) * numpy.dtype(dtype).itemsize
+    if nbytes <= MAX_WEAVE_MEMORY:
+        return numpy.empty(shape, dtype)
+
+    logging.info("Storing the woven image of %d MB in a temporary file", nbytes // 2 ** 20)
+    # The file is deleted as soon as the array is not used anymore
+    f = tempfile.TemporaryFile(dir=tmpdir)
+    return numpy.memmap(f, dtype=dtype, mode="w+", shape=shape)
+
 
+def weave(infns, tmpdir=None):
+    """
+    Assemble the images of tiles acquisitions into one big image per stream
+    infns (list of str): the files of each tile
+    tmpdir (None or str): directory where to store the big images which don't
+      fit in memory (cf _alloc_weave_array())
+    return (list of DataArray): one image per stream
+    """
     # Connect similar streams of each file together
-    # TODO: use open_data/DataArrayShadow when converter support it
-    da_streams = []  # for each stream, a list of DataArrays
+    da_streams = []  # for each stream, a list of DataArray(Shadow)s
+    full_fmts = set()  # formats of the tiles read fully
     for fn in infns:
         converter = dataio.find_fittest_converter(fn)
-        das = converter.read_data(fn)
+        if hasattr(converter, "open_data"):
+            # Only the metadata is read now, the data of each tile is read when
+            # pasted in the big image.
+            das = converter.open_data(fn).content
+        else:
+            if converter.FORMAT not in full_fmts:
+                logging.info("Format %s doesn't support partial reading, so the "
+                             "tiles are fully loaded in memory", converter.FORMAT)
+                full_fmts.add(converter.FORMAT)
+            das = converter.read_data(fn)
         logging.debug("Got %d streams from file %s", len(das), fn)
 
         # TODO use more clever way (aka MD_DESCRIPTION, MD_OUT_WL, MD_IN_WL...) to detect similar streams
@@ -195,15 +243,110 @@ def weave(infns):
             for da, stream in zip(das, da_streams):
                 stream.append(da)
 
+    alloc = functools.partial(_alloc_weave_array, tmpdir=tmpdir)
     big_das = []
     for da_in in da_streams:
         logging.info("Computing big image out of %d images", len(da_in))
-        da = stitching.collageWeaver(da_in)
+        da = stitching.collageWeaver(da_in, alloc=alloc)
         big_das.append(da)
 
     return big_das
 
 
+def expand_filenames(patterns):
+    """
+    Expand the wildcards in the filenames (in case the shell didn't do it)
+    patterns (list of str): filenames, possibly containing wildcards
+    return (list of str): the filenames, in the same order
+    raises:
+        ValueError: if a pattern doesn't match any file
+    """
+    fns = []
+    for p in patterns:
+        if glob.has_magic(p):
+            matches = sorted(glob.glob(p))
+            if not matches:
+                raise ValueError("No file matching %s" % (p,))
+            fns.extend(matches)
+        else:
+            fns.append(p)
+    return fns
+
+
+def get_output_filename(outpat, infn):
+    """
+    outpat (str): the output filename. If it contains a "*", it is replaced by
+      the name of the input file (without extension).
+    infn (str): the input filename
+    return (str): the output filename
+    """
+    if "*" not in outpat:
+        return outpat
+    basename, _ = udataio.splitext(os.path.basename(infn))
+    return outpat.replace("*", basename, 1)
+
+
+def convert(infn, outfn, minusfns=None, pyramid=False):
+    """
+    Convert one acquisition file
+    infn (str): the input filename
+    outfn (str): the output filename
+    minusfns (None or list of str): acquisition files whose data is subtracted
+      from the input file
+    pyramid (bool): whether to save the data in pyramidal format
+    """
+    data, thumbs = open_acq(infn)
+    logging.info("File %s contains %d %s (and %d %s)", infn,
+                 len(data), ngettext("image", "images", len(data)),
+                 len(thumbs), ngettext("thumbnail", "thumbnails", len(thumbs)))
+
+    if minusfns:
+        if thumbs:
+            logging.info("Dropping thumbnail due to subtraction")
+            thumbs = []
+        for fn in minusfns:
+            sdata, _ = open_acq(fn)
+            data = minus(data, sdata)
+
+    save_acq(outfn, data, thumbs, pyramid)
+    logging.info("Successfully generated file %s", outfn)
+
+
+def convert_batch(infns, outpat, minusfns=None, pyramid=False, jobs=None):
+    """
+    Convert multiple acquisition files, in parallel
+    infns (list of str): the input filenames
+    outpat (str): the output filename, containing a "*" (cf get_output_filename())
+    minusfns (None or list of str): cf convert()
+    pyramid (bool): cf convert()
+    jobs (None or 0<int): number of conversions run simultaneously. If None,
+      it's the number of CPUs.
+    raises:
+        IOError: if some conversions failed
+    """
+    outfns = [get_output_filename(outpat, fn) for fn in infns]
+    if len(set(outfns)) != len(outfns):
+        raise ValueError("Multiple input files would be converted to the same output file")
+
+    jobs = jobs or multiprocessing.cpu_count()
+    logging.info("Converting %d files, with %d jobs", len(infns), jobs)
+    # Each conversion is independent, and mostly limited by the CPU (decompression,
+    # compression...), so use separate processes.
+    failures = 0
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        futs = [(fn, executor.submit(convert, fn, ofn, minusfns, pyramid))
+                for fn, ofn in zip(infns, outfns)]
+        for fn, f in futs:
+            try:
+                f.result()
+            except Exception as ex:
+                logging.error("Failed to convert %s: %s", fn, ex)
+                failures += 1
+
+    if failures:
+        raise IOError("Failed to convert %d files out of %d" % (failures, len(infns)))
+
+
 def main(args):
     """
     Handles the command line arguments
@@ -215,16 +358,21 @@ def main(args):
 
     parser.add_argument('--version', dest="version", action='store_true',
                         help="show program's version number and exit")
-    parser.add_argument("--input", "-i", dest="input",
-                        help="name of the input file")
+    parser.add_argument("--input", "-i", dest="input", nargs="+",
+                        help="name of the input file. Multiple files (or wildcards) "
+                        "can be passed to convert them all, in which case the output "
+                        "filename must contain a \"*\".")
     parser.add_argument("--tiles", "-t", dest="tiles", nargs="+",
-                        help="list of files acquired in tiles to re-assemble")
+                        help="list of files acquired in tiles to re-assemble. "
+                        "Only the TIFF tiles are read lazily, the tiles in other "
+                        "formats (eg, HDF5) are all loaded in memory.")
     parser.add_argument("--effcomp", dest="effcomp",
                         help="name of a spectrum efficiency compensation table (in CSV format)")
     fmts = dataio.get_available_formats(os.O_WRONLY)
     parser.add_argument("--output", "-o", dest="output",
             help="name of the output file. "
-            "The file format is derived from the extension (%s are supported)." %
+            "The file format is derived from the extension (%s are supported). "
+            "A \"*\" is replaced by the name of the input file." %
             (" and ".join(fmts)))
     # TODO: automatically select pyramidal format if image > 4096px?
     parser.add_argument("--pyramid", "-p", dest="pyramid", action='store_true',
@@ -233,6 +381,9 @@ def main(args):
                         "Currently, only the TIFF format supports this option.")
     parser.add_argument("--minus", "-m", dest="minus", action='append',
             help="name of an acquisition file whose data is subtracted from the input file.")
+    parser.add_argument("--jobs", "-j", dest="jobs", type=int,
+                        help="number of files converted simultaneously "
+                        "(default: the number of CPUs)")
 
     # TODO: --export (spatial) image that defaults to a HFW corresponding to the
     # smallest image, and can be overridden by --hfw xxx (in µm).
@@ -248,24 +399,34 @@ def main(args):
                "Licensed under the " + odemis.__license__)
         return 0
 
-    infn = options.input
+    infns = options.input
     tifns = options.tiles
     ecfn = options.effcomp
     outfn = options.output
 
-    if not (infn or tifns or ecfn) or not outfn:
+    if not (infns or tifns or ecfn) or not outfn:
         raise ValueError("--input/--tiles/--effcomp and --output arguments must be provided.")
 
-    if sum(not not o for o in (infn, tifns, ecfn)) != 1:
+    if sum(not not o for o in (infns, tifns, ecfn)) != 1:
         raise ValueError("--input, --tiles, --effcomp cannot be provided simultaneously.")
 
-    if infn:
-        data, thumbs = open_acq(infn)
-        logging.info("File contains %d %s (and %d %s)",
-                     len(data), ngettext("image", "images", len(data)),
-                     len(thumbs), ngettext("thumbnail", "thumbnails", len(thumbs)))
-    elif tifns:
-        data = weave(tifns)
+    if options.jobs is not None and options.jobs < 1:
+        raise ValueError("--jobs must be at least 1.")
+
+    if infns:
+        infns = expand_filenames(infns)
+        if len(infns) > 1:
+            if "*" not in outfn:
+                raise ValueError("--output must contain a \"*\" when converting multiple files.")
+            convert_batch(infns, outfn, options.minus, options.pyramid, options.jobs)
+        else:
+            convert(infns[0], get_output_filename(outfn, infns[0]),
+                    options.minus, options.pyramid)
+        return
+
+    if tifns:
+        # Store the big images which don't fit in memory next to the output
+        data = weave(expand_filenames(tifns), os.path.dirname(os.path.abspath(outfn)))
         thumbs = []
         logging.info("File contains %d %s",
                      len(data), ngettext("stream", "streams", len(data)))
@@ -32,14 +32,17 @@ import importlib
 import inspect
 import logging
 import numbers
+import os
 from odemis import model, dataio, util
 import odemis
+from odemis.model import _callstats
 from odemis.util import units
 from odemis.util.conversion import convert_to_object
 from odemis.util.driver import BACKEND_RUNNING, \
     BACKEND_DEAD, BACKEND_STOPPED, get_backend_status, BACKEND_STARTING
 import sys
 import threading
+import urllib
 
 
 status_to_xtcode = {BACKEND_RUNNING: 0,
@@ -204,10 +207,31 @@ def print_roattributes(component, pretty):
         print_roattribute(name, value, pretty)
 
 def print_data_flow(name, df, pretty):
+    # The statistics of the original dataflow (in the back-end)
+    try:
+        stats = df.getStats()
+    except Exception:
+        logging.debug("Failed to read the statistics of dataflow %s", name, exc_info=True)
+        stats = {}
+
     if pretty:
-        print u"\t" + name + u" (Data-flow)"
+        if stats:
+            lat = stats["latency"]
+            lat_str = u", ".join(u"%s: %s" % (st, units.readable_str(lat[st][0], "s", sig=3))
+                                 for st in model.DATAFLOW_STAGES if st in lat)
+            stats_str = u"\t%s, %s Hz" % (u", ".join(u"%s: %d" % (c, stats[c])
+                                                    for c in model.DATAFLOW_COUNTERS),
+                                         units.readable_str(stats["rate"], sig=3))
+            if lat_str:
+                stats_str += u", latency: " + lat_str
+        else:
+            stats_str = u""
+        print u"\t" + name + u" (Data-flow)" + stats_str
     else:
-        print(u"%s\ttype:data-flow" % (name,))
+        if stats:
+            print(u"%s\ttype:data-flow\tstats:%s" % (name, stats))
+        else:
+            print(u"%s\ttype:data-flow" % (name,))
 
 def print_data_flows(component, pretty):
     # find all dataflows
@@ -225,16 +249,20 @@ def print_events(component, pretty):
     for name, value in model.getEvents(component).items():
         print_event(name, value, pretty)
 
-def print_vattribute(name, va, pretty):
-    if va.unit:
+def print_vattribute(name, info, pretty):
+    """
+    info (dict str -> value): information about the VA, as returned by
+      Component.getState()
+    """
+    if info["unit"]:
         if pretty:
-            unit = u" (unit: %s)" % va.unit
+            unit = u" (unit: %s)" % info["unit"]
         else:
-            unit = u"\tunit:%s" % va.unit
+            unit = u"\tunit:%s" % info["unit"]
     else:
         unit = u""
 
-    if va.readonly:
+    if info["readonly"]:
         if pretty:
             readonly = u"RO "
         else:
@@ -242,46 +270,52 @@ def print_vattribute(name, va, pretty):
     else:
         readonly = u""
 
-    # we cannot discover if it continuous or enumerated, just try and see if it fails
-    try:
-        varange = va.range
+    if "range" in info:
+        varange = info["range"]
         if pretty:
             str_range = u" (range: %s → %s)" % (varange[0], varange[1])
         else:
             str_range = u"\trange:%s" % unicode(varange)
-    except (AttributeError, model.NotApplicableError):
+    else:
         str_range = u""
 
-    try:
-        vachoices = va.choices # set or dict
+    if "choices" in info:
+        vachoices = info["choices"] # set or dict
         if pretty:
-            if isinstance(va.choices, dict):
+            if isinstance(vachoices, dict):
                 str_choices = u" (choices: %s)" % ", ".join(
                                 [u"%s: '%s'" % i for i in vachoices.items()])
             else:
                 str_choices = u" (choices: %s)" % u", ".join([str(c) for c in vachoices])
         else:
             str_choices = u"\tchoices:%s" % unicode(vachoices)
-    except (AttributeError, model.NotApplicableError):
+    else:
         str_choices = ""
 
+    if "value" in info:
+        str_value = str(info["value"])
+    else:
+        str_value = "N/A"  # Failed to read it
+
     if pretty:
         print(u"\t" + name + u" (%sVigilant Attribute)\t value: %s%s%s%s" %
-            (readonly, str(va.value), unit, str_range, str_choices))
+            (readonly, str_value, unit, str_range, str_choices))
     else:
         print(u"%s\ttype:%sva\tvalue:%s%s%s%s" %
-              (name, readonly, str(va.value), unit, str_range, str_choices))
+              (name, readonly, str_value, unit, str_range, str_choices))
 
 special_va_names = ("children", "affects") # , "alive", "ghosts")
 # TODO: handle .ghosts and .alive correctly in print_va and don't consider them special
-def print_vattributes(component, pretty):
-    for name, value in model.getVAs(component).items():
+def print_vattributes(vas_state, pretty):
+    """
+    vas_state (dict str -> dict): VA name -> info, as returned by Component.getState()
+    """
+    for name, info in vas_state.items():
         if name in special_va_names:
             continue
-        print_vattribute(name, value, pretty)
+        print_vattribute(name, info, pretty)
 
-def print_metadata(component, pretty):
-    md = component.getMetadata()
+def print_metadata(md, pretty):
     if pretty:
         if not md:
             return
@@ -296,19 +330,25 @@ def print_metadata(component, pretty):
             print(u"%s\ttype:metadata\tvalue:%s" % (name, value))
 
 def print_attributes(component, pretty):
+    # Read all the VAs and metadata at once, as it's much faster than one by one
+    # .children is not used, and would need to transfer all the children
+    vas = [n for n in model.getVAs(component).keys() if n != "children"]
+    state = component.getState(vas)
+    # The value is missing if it couldn't be read
+    affects = state["vas"].get("affects", {}).get("value", [])
     if pretty:
         print u"Component '%s':" % component.name
         print u"\trole: %s" % component.role
-        print u"\taffects: " + ", ".join([u"'%s'" % n for n in component.affects.value])
+        print u"\taffects: " + ", ".join([u"'%s'" % n for n in affects])
     else:
         print u"name\tvalue:%s" % component.name
         print u"role\tvalue:%s" % component.role
-        print u"affects\tvalue:" + u"\t".join(component.affects.value)
+        print u"affects\tvalue:" + u"\t".join(affects)
     print_roattributes(component, pretty)
-    print_vattributes(component, pretty)
+    print_vattributes(state["vas"], pretty)
     print_data_flows(component, pretty)
     print_events(component, pretty)
-    print_metadata(component, pretty)
+    print_metadata(state["metadata"], pretty)
 
 def get_component(comp_name):
     """
@@ -746,6 +786,81 @@ def live_display(comp_name, df_name):
     finally:
         df.unsubscribe(new_image_wrapper)
 
+def get_containers():
+    """
+    return (dict str -> Proxy): container name -> container, for all the
+      containers of the back-end
+    """
+    names = {model.BACKEND_NAME}
+    for c in model.getComponents():
+        # Each container has its own socket, named after the container
+        sockname = os.path.basename(c._pyroUri.sockname or "")
+        if sockname.endswith(".ipc"):
+            names.add(urllib.unquote(sockname[:-4]))
+
+    return {n: model.getContainer(n, validate=False) for n in names}
+
+
+def print_call_stats(name, stats, pretty=True):
+    """
+    Print the statistics of the remote calls of one process
+    name (str): name of the process/container
+    stats (dict): statistics, as returned by model.getCallStats()
+    """
+    entries = sorted(stats["entries"], key=lambda e: e["time"], reverse=True)
+    bounds = stats["bounds"]
+    if pretty:
+        print u"%s (PID %s), %g s recorded%s:" % (name, stats.get("pid"),
+                   stats["end"] - stats["start"],
+                   "" if stats.get("enabled", True) else " (recording disabled)")
+        if not entries:
+            print u"\tno calls"
+            return
+        print u"\t%-40s %-8s %8s %9s %9s %9s %9s %9s %10s %10s" % (
+                   "object.method", "kind", "count", "total(s)", "mean(ms)",
+                   "p90(ms)", "p99(ms)", "max(ms)", "sent(B)", "recv(B)")
+        for e in entries:
+            p90 = _callstats.estimatePercentile(e["histogram"], bounds, 90)
+            p99 = _callstats.estimatePercentile(e["histogram"], bounds, 99)
+            print u"\t%-40s %-8s %8d %9.3f %9.3f %9.3f %9.3f %9.3f %10d %10d" % (
+                       "%s.%s" % (e["object"], e["method"]), e["kind"], e["count"],
+                       e["time"], e["time"] / e["count"] * 1e3, p90 * 1e3,
+                       p99 * 1e3, e["max"] * 1e3, e["sent"], e["received"])
+    else:
+        for e in entries:
+            print u"%s\t%s\t%s\t%s\t%d\t%d\t%g\t%g\t%g\t%d\t%d" % (
+                       name, e["kind"], e["object"], e["method"], e["count"],
+                       e["errors"], e["time"], e["min"], e["max"],
+                       e["sent"], e["received"])
+
+
+def call_stats(filename=None, output=None, pretty=True):
+    """
+    Print the statistics of the remote calls
+    filename (None or str): file containing the statistics (as saved by
+      model.saveCallStats() or by this function). If None, the statistics are
+      read from all the containers of the back-end.
+    output (None or str): if not None, file into which the statistics of the
+      back-end are saved (as JSON)
+    """
+    if filename is None:
+        allstats = {}
+        for n, cont in get_containers().items():
+            try:
+                allstats[n] = cont.getCallStats()
+            except Exception:
+                logging.warning("Failed to get the statistics of container %s", n)
+        if output is not None:
+            _callstats.saveCallStats(output, allstats)
+    else:
+        allstats = _callstats.loadCallStats(filename)
+        if "entries" in allstats:  # Statistics of just one process
+            allstats = {os.path.basename(filename): allstats}
+
+    for n, stats in sorted(allstats.items()):
+        print_call_stats(n, stats, pretty)
+
+
 def ensure_output_encoding():
     """
     Make sure the output encoding supports unicode
@@ -824,10 +939,18 @@ def main(args):
     dm_grp.add_argument("--output", "-o", dest="output",
                         help="name of the file where the image should be saved "
                         "after acquisition. The file format is derived from the extension "
-                        "(TIFF and HDF5 are supported).")
+                        "(TIFF and HDF5 are supported). With --stats, name of the "
+                        "JSON file where the statistics should be saved.")
     dm_grpe.add_argument("--live", dest="live", nargs="+",
                          metavar=("<component>", "data-flow"),
                          help="display and update an image on the screen (default data-flow is \"data\")")
+    dm_grpe.add_argument("--stats", dest="stats", const=True, default=False, nargs="?",
+                         metavar="file",
+                         help="display the statistics of the remote calls of each "
+                         "container of the back-end (only recorded if the "
+                         "environment variable %s was set when starting it). "
+                         "Optionally, a file of statistics to display, as saved by a "
+                         "program started with %s=<file>." % (_callstats.ENV_VAR, _callstats.ENV_VAR))
 
     options = parser.parse_args(args[1:])
 
@@ -866,7 +989,7 @@ def main(args):
         options.list, options.stop, options.move,
         options.position, options.reference,
         options.listprop, options.setattr, options.upmd,
-        options.acquire, options.live)):
+        options.acquire, options.live, options.stats)):
         logging.error("No action specified.")
         return 127
     if options.acquire is not None and options.output is None:
@@ -898,6 +1021,11 @@ def main(args):
                 scan()
             return 0
 
+        # reading a statistics file doesn't need the backend
+        if isinstance(options.stats, basestring):
+            call_stats(options.stats, pretty=not options.machine)
+            return 0
+
         # check if there is already a backend running
         if status == BACKEND_STOPPED:
             raise IOError("No running back-end")
@@ -954,6 +1082,8 @@ def main(args):
             else:
                 raise ValueError("Live command accepts only one data-flow")
             live_display(component, dataflow)
+        elif options.stats:
+            call_stats(output=options.output, pretty=not options.machine)
     except KeyboardInterrupt:
         logging.info("Interrupted before the end of the execution")
         return 1
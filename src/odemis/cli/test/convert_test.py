@@ -0,0 +1,128 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+Created on 19 Oct 2026
+
+@author: Éric Piel
+Testing class for convert.py of cli.
+
+Copyright © 2026 Delmic
+
+This file is part of Odemis.
+
+Odemis is free software: you can redistribute it and/or modify it under the terms 
+of the GNU General Public License version 2 as published by the Free Software 
+Foundation.
+
+Odemis is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; 
+without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR 
+PURPOSE. See the GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License along with 
+Odemis. If not, see http://www.gnu.org/licenses/.
+'''
+from __future__ import division
+
+import logging
+import numpy
+from odemis import model
+from odemis.cli import convert
+from odemis.dataio import hdf5, tiff
+import os
+import shutil
+import tempfile
+import unittest
+
+
+logging.getLogger().setLevel(logging.DEBUG)
+
+
+class TestConvertBatch(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.infns = []
+        for i in range(3):
+            fn = os.path.join(self.dir, "in%d.tiff" % i)
+            md = {model.MD_DESCRIPTION: "test %d" % i}
+            data = model.DataArray(numpy.full((20, 30), i, dtype=numpy.uint16), md)
+            tiff.export(fn, data)
+            self.infns.append(fn)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_expand_filenames(self):
+        """
+        Wildcards are expanded (in alphabetical order), other names are kept
+        """
+        fns = convert.expand_filenames([os.path.join(self.dir, "in*.tiff"), "foo.h5"])
+        self.assertEqual(fns, self.infns + ["foo.h5"])
+
+        # A non-existing file without wildcard is left to the conversion to fail
+        self.assertEqual(convert.expand_filenames(["bar.h5"]), ["bar.h5"])
+
+        with self.assertRaises(ValueError):
+            convert.expand_filenames([os.path.join(self.dir, "nothing*.tiff")])
+
+    def test_get_output_filename(self):
+        self.assertEqual(convert.get_output_filename("out/*.h5", "/data/in.ome.tiff"),
+                         "out/in.h5")
+        # The first file of a Serialized TIFF is named after the whole acquisition
+        self.assertEqual(convert.get_output_filename("out/*.h5", "/data/in.0.ome.tiff"),
+                         "out/in.h5")
+        self.assertEqual(convert.get_output_filename("out.h5", "/data/in.tiff"),
+                         "out.h5")
+
+    def test_convert_batch(self):
+        """
+        Convert multiple files, in parallel
+        """
+        outpat = os.path.join(self.dir, "*.h5")
+        convert.convert_batch(self.infns, outpat, jobs=2)
+
+        for i in range(3):
+            data = hdf5.read_data(os.path.join(self.dir, "in%d.h5" % i))
+            self.assertEqual(len(data), 1)
+            self.assertEqual(data[0].shape[-2:], (20, 30))
+            self.assertEqual(data[0].flat[0], i)
+
+    def test_output_collision(self):
+        """
+        Two input files with the same name would be converted to the same file
+        """
+        subdir = os.path.join(self.dir, "sub")
+        os.mkdir(subdir)
+        fn = os.path.join(subdir, "in0.tiff")
+        shutil.copy(self.infns[0], fn)
+
+        outpat = os.path.join(self.dir, "*.h5")
+        with self.assertRaises(ValueError):
+            convert.convert_batch([self.infns[0], fn], outpat)
+        # Nothing converted
+        self.assertFalse(os.path.exists(os.path.join(self.dir, "in0.h5")))
+
+        # No "*" => all in the same output file
+        with self.assertRaises(ValueError):
+            convert.convert_batch(self.infns, os.path.join(self.dir, "out.h5"))
+
+    def test_convert_batch_failure(self):
+        """
+        A file which fails to convert is reported, but doesn't stop the others
+        """
+        badfn = os.path.join(self.dir, "bad.tiff")
+        with open(badfn, "w") as f:
+            f.write("not a TIFF file")
+
+        outpat = os.path.join(self.dir, "*.h5")
+        with self.assertRaises(IOError) as cm:
+            convert.convert_batch([self.infns[0], badfn, self.infns[1]], outpat, jobs=2)
+        self.assertIn("1 files out of 3", str(cm.exception))
+
+        self.assertFalse(os.path.exists(os.path.join(self.dir, "bad.h5")))
+        for i in range(2):
+            self.assertTrue(os.path.exists(os.path.join(self.dir, "in%d.h5" % i)))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -17,11 +17,16 @@ You should have received a copy of the GNU General Public License along with Ode
 
 from __future__ import absolute_import, division
 
+from concurrent.futures import CancelledError
 import csv
 import logging
 import numpy
 from odemis import model
+from odemis.acq._futures import executeTask
 from odemis.util import spectrum
+import os
+import threading
+import time
 
 
 FORMAT = "CSV"
@@ -30,6 +35,124 @@ EXTENSIONS = [u".csv"]
 
 LOSSY = True  # because it only supports AR in phi/theta and spectrum in wavelength/intensity format export
 
+# Same line terminator as the csv module
+LINE_TERMINATOR = "\r\n"
+
+# Maximum number of values formatted at once when writing a table. The rows
+# are written by blocks, so that the whole text never has to be in memory.
+CHUNK_VALUES = 2 ** 16
+
+
+def _get_format(dtype):
+    """
+    return (str): the % format to write a value of the given type without
+      losing precision
+    """
+    dtype = numpy.dtype(dtype)
+    if dtype.kind == "f":
+        if dtype.itemsize <= 4:
+            return "%s"  # Converted to text beforehand, see _get_values()
+        return "%r"  # Shortest representation (as the csv module)
+    elif dtype.kind in "biu":
+        return "%d"
+    else:
+        return "%s"
+
+
+def _get_values(a):
+    """
+    a (ndarray): values to write
+    return (ndarray): values which can be formatted with _get_format()
+    """
+    if a.dtype.kind == "f" and a.dtype.itemsize <= 4:
+        # Once converted to float, 0.1 in float32 would become 0.100000001,
+        # while numpy knows the shortest representation for this precision.
+        return a.astype(str)
+    return a
+
+
+def _write_rows(fd, data, first_cols=(), delimiter=","):
+    """
+    Write a 2D array as lines of text, by blocks of rows
+    fd (File): file opened for writing
+    data (ndarray of shape N, M): values to write, one row per line
+    first_cols (list of ndarray of shape N): values to write at the beginning
+      of each row
+    delimiter (str): separator between two values of a row
+    """
+    first_cols = [numpy.asarray(c) for c in first_cols]
+    fmts = [_get_format(c.dtype) for c in first_cols] + [_get_format(data.dtype)] * data.shape[1]
+    row_fmt = delimiter.join(fmts) + LINE_TERMINATOR
+    nc = len(first_cols)
+    n = data.shape[0]
+    nrows = max(1, CHUNK_VALUES // len(fmts))
+    # All the values of a block are converted at once to basic Python types,
+    # and formatted with a single operation.
+    block = numpy.empty((min(n, nrows), len(fmts)), dtype=object)
+    for i in range(0, n, nrows):
+        j = min(n, i + nrows)
+        b = block[:j - i]
+        for k, c in enumerate(first_cols):
+            b[:, k] = _get_values(c[i:j])
+        b[:, nc:] = _get_values(data[i:j])
+        fd.write((row_fmt * (j - i)) % tuple(b.ravel()))
+
+
+def _get_spectrum_range(data):
+    """
+    data (model.DataArray): spectrum data, with the first dimension being the
+      wavelength
+    return (list of numbers, str): the wavelength of each index of the first
+      dimension, and its unit ("nm" or "px").
+    """
+    try:
+        spectrum_range = spectrum.get_wavelength_per_pixel(data)
+        return [s * 1e9 for s in spectrum_range], "nm"
+    except Exception:
+        # Calculate wavelength in pixels if not given
+        max_bw = data.shape[0] // 2
+        min_bw = (max_bw - data.shape[0]) + 1
+        return range(min_bw, max_bw + 1), "px"
+
+
+def _write_pixel_spectra(fd, data, future=None):
+    """
+    Write the spectrum of every pixel of a spectrum cube, one pixel per row
+    fd (File): file opened for writing
+    data (model.DataArray of shape C, Y, X): the spectrum cube
+    future (None or ProgressiveFuture): if provided, it's updated with the
+      progress, and the writing stops if it's cancelled.
+    raises:
+        CancelledError() if cancelled
+    """
+    spectrum_range, unit = _get_spectrum_range(data)
+    if unit == "px":
+        logging.info("Exporting spectra without wavelength information")
+    c, h, w = data.shape
+
+    csv_writer = csv.writer(fd)
+    first_row = ['x(px)', 'y(px)\wavelength(' + unit + ')'] + list(spectrum_range)
+    csv_writer.writerow(first_row)
+
+    # Write as many image lines at once as fit a block
+    nlines = max(1, CHUNK_VALUES // (w * (c + 2)))
+    xs = numpy.tile(numpy.arange(w), nlines)
+    startt = time.time()
+    for y in range(0, h, nlines):
+        if future is not None and future._export_must_stop.is_set():
+            raise CancelledError()
+        ye = min(h, y + nlines)
+        npx = (ye - y) * w
+        # C, Y, X -> Y * X, C
+        spectra = data[:, y:ye, :].reshape(c, npx).T
+        ys = numpy.arange(y, ye).repeat(w)
+        _write_rows(fd, spectra, (xs[:npx], ys))
+
+        if future is not None:
+            # Estimate the end based on the time spent so far
+            dur = time.time() - startt
+            future.set_progress(end=time.time() + dur / ye * (h - ye))
+
 
 def export(filename, data):
     '''
@@ -43,54 +166,37 @@ def export(filename, data):
         IOError in case the spectrum does not contain wavelength metadata.
     '''
     if data.metadata.get(model.MD_ACQ_TYPE, None) == model.MD_AT_SPECTRUM:
-        try:
-            spectrum_range, unit = spectrum.get_wavelength_per_pixel(data), "nm"
-            spectrum_range = [s * 1e9 for s in spectrum_range]
-        except Exception:
-            # Calculate wavelength in pixels if not given
-            max_bw = data.shape[0] // 2
-            min_bw = (max_bw - data.shape[0]) + 1
-            spectrum_range, unit = range(min_bw, max_bw + 1), "px"
+        spectrum_range, unit = _get_spectrum_range(data)
         if data.ndim == 1:
             logging.debug("Exporting spectrum data to CSV")
 
-            if unit == "nm":
-                # turn range to nm
-                spectrum_tuples = [(s, d) for s, d in zip(spectrum_range, data)]
-                headers = ['# wavelength (nm)', 'intensity']
-            else:
-                logging.info("Exporting spectrum without wavelength information")
-                spectrum_tuples = data.reshape(data.shape[0], 1)
-                headers = ['# intensity']
-
             with open(filename, 'w') as fd:
-                csv_writer = csv.writer(fd)
-                csv_writer.writerow(headers)
-                csv_writer.writerows(spectrum_tuples)
+                if unit == "nm":
+                    csv.writer(fd).writerow(['# wavelength (nm)', 'intensity'])
+                    _write_rows(fd, data.reshape(data.shape[0], 1), (spectrum_range,))
+                else:
+                    logging.info("Exporting spectrum without wavelength information")
+                    csv.writer(fd).writerow(['# intensity'])
+                    _write_rows(fd, data.reshape(data.shape[0], 1))
         elif data.ndim == 2:
             # FIXME: For now it handles the rest of 2d data as spectrum-line
             logging.debug("Exporting spectrum-line data to CSV")
 
-            # attach wavelength as first column
-            wavelength_lin = numpy.array(spectrum_range)
-            qz_masked = numpy.append(wavelength_lin.reshape(data.shape[0], 1), data, axis=1)
-            # attach distance as first row
+            # Data is written in the form of (Y+1, X+1), with the first row
+            # the distance from the origin, and the first column the wavelength
             line_length = data.shape[1] * data.metadata[model.MD_PIXEL_SIZE][1]
             distance_lin = numpy.linspace(0, line_length, data.shape[1])
-            distance_lin.shape = (1, distance_lin.shape[0])
-            distance_lin = numpy.append([[0]], distance_lin, axis=1)
-            qz_masked = numpy.append(distance_lin, qz_masked, axis=0)
-            data = model.DataArray(qz_masked, data.metadata)
-
-            # Data should be in the form of (Y+1, X+1), with the first row and column the
-            # distance_from_origin\wavelength
             with open(filename, 'w') as fd:
                 csv_writer = csv.writer(fd)
                 # Set the 'header' in the 0,0 element
-                first_row = ['wavelength(' + unit + ')\distance_from_origin(m)'] + [d for d in data[0, 1:]]
+                first_row = ['wavelength(' + unit + ')\distance_from_origin(m)'] + list(distance_lin)
                 csv_writer.writerow(first_row)
-                # dump the array
-                csv_writer.writerows(data[1:, :])
+                # dump the array, with the wavelength as first column
+                _write_rows(fd, data, (spectrum_range,))
+        elif data.ndim == 3:
+            logging.debug("Exporting spectrum cube data to CSV")
+            with open(filename, 'w') as fd:
+                _write_pixel_spectra(fd, data)
         else:
             raise IOError("Unknown type of data to be exported as CSV")
     elif data.metadata.get(model.MD_ACQ_TYPE, None) == model.MD_AT_AR:
@@ -102,4 +208,60 @@ def export(filename, data):
             first_row = ['theta\phi(rad)'] + [d for d in data[0, 1:]]
             csv_writer.writerow(first_row)
             # dump the array
-            csv_writer.writerows(data[1:, :])
+            _write_rows(fd, data[1:, :])
+
+
+def export_pixel_spectra(filename, data):
+    """
+    Write the spectrum of every pixel of a spectrum cube in a CSV file, one
+      pixel per row (x, y, then the intensity for each wavelength).
+      It runs in a separate thread.
+    filename (unicode): filename of the file to create (including path).
+    data (model.DataArray of shape C, Y, X, or C, 1, 1, Y, X): the spectrum cube.
+      If MD_WL_LIST or MD_WL_POLYNOMIAL is present, the wavelengths are written
+      in the first row.
+    return (ProgressiveFuture): to follow the progress, or cancel the export.
+      If cancelled, the partially written file is removed.
+    """
+    if data.ndim == 5:
+        if data.shape[1:3] != (1, 1):
+            raise ValueError("Cannot export spectrum data of shape %s" % (data.shape,))
+        data = data[:, 0, 0]
+    elif data.ndim != 3:
+        raise ValueError("Cannot export spectrum data of shape %s" % (data.shape,))
+
+    f = model.ProgressiveFuture()
+    f._export_must_stop = threading.Event()
+    f._export_done = threading.Event()
+    f.task_canceller = _cancel_export_pixel_spectra
+
+    export_thread = threading.Thread(target=executeTask,
+                                     name="CSV export",
+                                     args=(f, _do_export_pixel_spectra, f, filename, data))
+    export_thread.daemon = True
+    export_thread.start()
+    return f
+
+
+def _cancel_export_pixel_spectra(future):
+    future._export_must_stop.set()
+    # Do not return until the file is really removed (modulo 10s timeout)
+    future._export_done.wait(10)
+    return True
+
+
+def _do_export_pixel_spectra(future, filename, data):
+    """
+    The actual work of export_pixel_spectra()
+    raises:
+        CancelledError() if cancelled
+    """
+    try:
+        with open(filename, 'w') as fd:
+            _write_pixel_spectra(fd, data, future)
+    except CancelledError:
+        logging.debug("Export of %s cancelled, removing the file", filename)
+        os.remove(filename)
+        raise
+    finally:
+        future._export_done.set()
@@ -26,6 +26,7 @@ import h5py
 import logging
 import numpy
 from odemis import model
+from odemis.model import DataArrayShadow, AcquisitionData
 from odemis.util import spectrum, img, fluo
 import os
 import time
@@ -123,6 +124,18 @@ def _read_image_dataset(dataset):
      IOError: if it doesn't conform to the standard
      NotImplementedError: if the image uses so fancy standard features
     """
+    return model.DataArray(dataset[...], _read_image_md(dataset))
+
+def _read_image_md(dataset):
+    """
+    Check that a dataset respects the HDF5 image specification, without reading
+     the data.
+    returns (dict (MD_* -> Value)): the metadata defined by the format of the
+     image. If RGB, MD_DIMS indicates the order of the dimensions.
+    raises
+     IOError: if it doesn't conform to the standard
+     NotImplementedError: if the image uses so fancy standard features
+    """
     # check basic format
     if len(dataset.shape) < 2:
         raise IOError("Image has a shape of %s" % (dataset.shape,))
@@ -133,7 +146,7 @@ def _read_image_dataset(dataset):
     # conversion is almost entirely different depending on subclass
     subclass = dataset.attrs.get("IMAGE_SUBCLASS", "IMAGE_GRAYSCALE")
 
-    image = model.DataArray(dataset[...])
+    md = {}
     if subclass == "IMAGE_GRAYSCALE":
         pass
     elif subclass == "IMAGE_TRUECOLOR":
@@ -152,9 +165,9 @@ def _read_image_dataset(dataset):
 
         if il_mode == "INTERLACE_PLANE":
             # colour is first dim
-            image.metadata[model.MD_DIMS] = "CYX"
+            md[model.MD_DIMS] = "CYX"
         elif il_mode == "INTERLACE_PIXEL":
-            image.metadata[model.MD_DIMS] = "YXC"
+            md[model.MD_DIMS] = "YXC"
         else:
             raise NotImplementedError("Unable to handle images of subclass '%s'" % subclass)
 
@@ -167,7 +180,7 @@ def _read_image_dataset(dataset):
     if dorig != "UL":
         logging.warning("Image rotation %d not handled", dorig)
 
-    return image
+    return md
 
 def _add_image_info(group, dataset, image):
     """
@@ -483,13 +496,15 @@ def _read_image_info(group):
     return md
 
 
-def _parse_physical_data(pdgroup, da):
+def _count_physical_channels(pdgroup, shape):
     """
-    Parse the metadata found in PhysicalData, and cut the DataArray if necessary.
+    Find how many DataArrays the image must be separated into, based on the
+     metadata found in PhysicalData.
     pdgroup (HDF Group): the group "PhysicalData" associated to an image
-    da (DataArray): the DataArray that was obtained by reading the ImageData
-    returns (list of DataArrays): The same data, but broken into smaller 
-      DataArrays if necessary, and with additional metadata.
+    shape (tuple of int): the shape of the image
+    returns (int): the number of channels (ie, the length of the first
+     dimension) if the image must be separated per channel, or 1 if it must be
+     kept as one DataArray.
     """
     # The information in PhysicalData might be different for each channel (e.g.
     # fluorescence image). In this case, the DA must be separated into smaller
@@ -505,191 +520,191 @@ def _parse_physical_data(pdgroup, da):
 
     if n > 1:
         # need to separate it
-        if n != da.shape[0]:
+        if n != shape[0]:
             logging.warning("Image has %d channels and %d metadata, failed to map",
-                            da.shape[0], n)
-            das = [da]
-        else:
-            # list(da) does almost what we need, but metadata is shared
-            das = [model.DataArray(c, da.metadata.copy()) for c in da]
-    else:
-        das = [da]
+                            shape[0], n)
+            return 1
+        return int(n)
+    return 1
 
-    for i, d in enumerate(das):
-        md = d.metadata
+def _read_physical_metadata(pdgroup, i, md):
+    """
+    Parse the metadata found in PhysicalData for one channel.
+    pdgroup (HDF Group): the group "PhysicalData" associated to an image
+    i (0<=int): the index of the channel
+    md (dict): the metadata of the channel, which will be updated
+    """
+    try:
+        cd = pdgroup["ChannelDescription"][i]
+        md[model.MD_DESCRIPTION] = unicode(cd)
+    except (KeyError, IndexError):
+        # maybe Title is more informative... but it's not per channel
         try:
-            cd = pdgroup["ChannelDescription"][i]
-            md[model.MD_DESCRIPTION] = unicode(cd)
+            title = pdgroup["Title"][()]
+            md[model.MD_DESCRIPTION] = unicode(title)
         except (KeyError, IndexError):
-            # maybe Title is more informative... but it's not per channel
-            try:
-                title = pdgroup["Title"][()]
-                md[model.MD_DESCRIPTION] = unicode(title)
-            except (KeyError, IndexError):
-                pass
-
-        # MicroscopeMode helps us to find out the bandwidth of the wavelength
-        # and it's also a way to keep it stable, if saving the data again.
-        h_width = 1e-9 # 1 nm : default is to just almost keep the value
-        try:
-            mm = pdgroup["MicroscopeMode"][i]
-            if mm == MM_FLUORESCENCE:
-                h_width = 10e-9 # 10 nm => narrow band
-            if mm == MM_TRANSMISSION: # we set it for brightfield
-                h_width = 100e-9 # 100 nm => large band
-        except (KeyError, IndexError, ValueError):
             pass
 
-        try:
-            ds = pdgroup["ExcitationWavelength"]
-            state = _h5svi_get_state(ds)
-            if state and state[i] == ST_INVALID:
-                raise ValueError
-            xwl = float(ds[i])  # in m
-            md[model.MD_IN_WL] = (xwl - h_width, xwl + h_width)
-        except (TypeError, KeyError, IndexError, ValueError):
-            pass
+    # MicroscopeMode helps us to find out the bandwidth of the wavelength
+    # and it's also a way to keep it stable, if saving the data again.
+    h_width = 1e-9 # 1 nm : default is to just almost keep the value
+    try:
+        mm = pdgroup["MicroscopeMode"][i]
+        if mm == MM_FLUORESCENCE:
+            h_width = 10e-9 # 10 nm => narrow band
+        if mm == MM_TRANSMISSION: # we set it for brightfield
+            h_width = 100e-9 # 100 nm => large band
+    except (KeyError, IndexError, ValueError):
+        pass
 
-        try:
-            ds = pdgroup["EmissionWavelength"]
-            state = _h5svi_get_state(ds)
-            if state and state[i] == ST_INVALID:
-                raise ValueError
-            if isinstance(ds[i], basestring):
-                md[model.MD_OUT_WL] = ds[i]
-            elif len(ds.shape) == 1: # Only one value per channel
-                ewl = float(ds[i])  # in m
-                # In files saved with Odemis 2.2, MD_OUT_WL could be saved with
-                # more precision in C scale (now explicitly saved as tuple here)
-                if model.MD_OUT_WL not in md:
-                    md[model.MD_OUT_WL] = (ewl - h_width, ewl + h_width)
-            else: # full band for each channel
-                md[model.MD_OUT_WL] = tuple(ds[i])
-        except (TypeError, KeyError, IndexError, ValueError):
-            pass
+    try:
+        ds = pdgroup["ExcitationWavelength"]
+        state = _h5svi_get_state(ds)
+        if state and state[i] == ST_INVALID:
+            raise ValueError
+        xwl = float(ds[i])  # in m
+        md[model.MD_IN_WL] = (xwl - h_width, xwl + h_width)
+    except (TypeError, KeyError, IndexError, ValueError):
+        pass
 
-        try:
-            ds = pdgroup["Magnification"]
-            mag = float(ds[i])
-            state = _h5svi_get_state(ds)
-            if state and state[i] == ST_INVALID:
-                raise ValueError
-            md[model.MD_LENS_MAG] = mag
-        except (KeyError, IndexError, ValueError):
-            pass
+    try:
+        ds = pdgroup["EmissionWavelength"]
+        state = _h5svi_get_state(ds)
+        if state and state[i] == ST_INVALID:
+            raise ValueError
+        if isinstance(ds[i], basestring):
+            md[model.MD_OUT_WL] = ds[i]
+        elif len(ds.shape) == 1: # Only one value per channel
+            ewl = float(ds[i])  # in m
+            # In files saved with Odemis 2.2, MD_OUT_WL could be saved with
+            # more precision in C scale (now explicitly saved as tuple here)
+            if model.MD_OUT_WL not in md:
+                md[model.MD_OUT_WL] = (ewl - h_width, ewl + h_width)
+        else: # full band for each channel
+            md[model.MD_OUT_WL] = tuple(ds[i])
+    except (TypeError, KeyError, IndexError, ValueError):
+        pass
 
-        # Our extended metadata
-        try:
-            ds = pdgroup["Baseline"]
-            oft = float(ds[i])
-            state = _h5svi_get_state(ds)
-            if state and state[i] == ST_INVALID:
-                raise ValueError
-            md[model.MD_BASELINE] = oft
-        except (KeyError, IndexError, ValueError):
-            pass
+    try:
+        ds = pdgroup["Magnification"]
+        mag = float(ds[i])
+        state = _h5svi_get_state(ds)
+        if state and state[i] == ST_INVALID:
+            raise ValueError
+        md[model.MD_LENS_MAG] = mag
+    except (KeyError, IndexError, ValueError):
+        pass
 
-        try:
-            ds = pdgroup["IntegrationTime"]
-            it = float(ds[i]) # s
-            state = _h5svi_get_state(ds)
-            if state and state[i] == ST_INVALID:
-                raise ValueError
-            md[model.MD_EXP_TIME] = it
-        except (KeyError, IndexError, ValueError):
-            pass
+    # Our extended metadata
+    try:
+        ds = pdgroup["Baseline"]
+        oft = float(ds[i])
+        state = _h5svi_get_state(ds)
+        if state and state[i] == ST_INVALID:
+            raise ValueError
+        md[model.MD_BASELINE] = oft
+    except (KeyError, IndexError, ValueError):
+        pass
 
-        try:
-            ds = pdgroup["RefractiveIndexLensImmersionMedium"]
-            state = _h5svi_get_state(ds)
-            if state and state[i] in (ST_INVALID, ST_DEFAULT):
-                raise ValueError
-            ri = float(ds[i])  # ratio
-            md[model.MD_LENS_RI] = ri
-        except (KeyError, IndexError, ValueError):
-            pass
+    try:
+        ds = pdgroup["IntegrationTime"]
+        it = float(ds[i]) # s
+        state = _h5svi_get_state(ds)
+        if state and state[i] == ST_INVALID:
+            raise ValueError
+        md[model.MD_EXP_TIME] = it
+    except (KeyError, IndexError, ValueError):
+        pass
 
-        try:
-            ds = pdgroup["NumericalAperture"]
-            state = _h5svi_get_state(ds)
-            if state and state[i] in (ST_INVALID, ST_DEFAULT):
-                raise ValueError
-            na = float(ds[i])  # ratio
-            md[model.MD_LENS_NA] = na
-        except (KeyError, IndexError, ValueError):
-            pass
+    try:
+        ds = pdgroup["RefractiveIndexLensImmersionMedium"]
+        state = _h5svi_get_state(ds)
+        if state and state[i] in (ST_INVALID, ST_DEFAULT):
+            raise ValueError
+        ri = float(ds[i])  # ratio
+        md[model.MD_LENS_RI] = ri
+    except (KeyError, IndexError, ValueError):
+        pass
 
-        try:
-            ds = pdgroup["AccelerationVoltage"]
-            state = _h5svi_get_state(ds)
-            if state and state[i] in (ST_INVALID, ST_DEFAULT):
-                raise ValueError
-            evolt = float(ds[i])  # V
-            md[model.MD_EBEAM_VOLTAGE] = evolt
-        except (KeyError, IndexError, ValueError):
-            pass
+    try:
+        ds = pdgroup["NumericalAperture"]
+        state = _h5svi_get_state(ds)
+        if state and state[i] in (ST_INVALID, ST_DEFAULT):
+            raise ValueError
+        na = float(ds[i])  # ratio
+        md[model.MD_LENS_NA] = na
+    except (KeyError, IndexError, ValueError):
+        pass
 
-        try:
-            ds = pdgroup["EmissionCurrent"]
-            state = _h5svi_get_state(ds)
-            if state and state[i] in (ST_INVALID, ST_DEFAULT):
-                raise ValueError
-            ecurrent = float(ds[i])  # A
-            md[model.MD_EBEAM_CURRENT] = ecurrent
-        except (KeyError, IndexError, ValueError):
-            pass
+    try:
+        ds = pdgroup["AccelerationVoltage"]
+        state = _h5svi_get_state(ds)
+        if state and state[i] in (ST_INVALID, ST_DEFAULT):
+            raise ValueError
+        evolt = float(ds[i])  # V
+        md[model.MD_EBEAM_VOLTAGE] = evolt
+    except (KeyError, IndexError, ValueError):
+        pass
 
-        try:
-            ds = pdgroup["PolePosition"]
-            pp = tuple(ds[i]) # px
-            state = _h5svi_get_state(ds)
-            if state and state[i] == ST_INVALID:
-                raise ValueError
-            md[model.MD_AR_POLE] = pp
-        except (KeyError, IndexError, ValueError):
-            pass
+    try:
+        ds = pdgroup["EmissionCurrent"]
+        state = _h5svi_get_state(ds)
+        if state and state[i] in (ST_INVALID, ST_DEFAULT):
+            raise ValueError
+        ecurrent = float(ds[i])  # A
+        md[model.MD_EBEAM_CURRENT] = ecurrent
+    except (KeyError, IndexError, ValueError):
+        pass
 
-        try:
-            ds = pdgroup["XMax"]
-            xm = float(ds[i])  # in m
-            state = _h5svi_get_state(ds)
-            if state and state[i] == ST_INVALID:
-                raise ValueError
-            md[model.MD_AR_XMAX] = xm
-        except (KeyError, IndexError, ValueError):
-            pass
+    try:
+        ds = pdgroup["PolePosition"]
+        pp = tuple(ds[i]) # px
+        state = _h5svi_get_state(ds)
+        if state and state[i] == ST_INVALID:
+            raise ValueError
+        md[model.MD_AR_POLE] = pp
+    except (KeyError, IndexError, ValueError):
+        pass
 
-        try:
-            ds = pdgroup["HoleDiameter"]
-            hd = float(ds[i])  # in m
-            state = _h5svi_get_state(ds)
-            if state and state[i] == ST_INVALID:
-                raise ValueError
-            md[model.MD_AR_HOLE_DIAMETER] = hd
-        except (KeyError, IndexError, ValueError):
-            pass
+    try:
+        ds = pdgroup["XMax"]
+        xm = float(ds[i])  # in m
+        state = _h5svi_get_state(ds)
+        if state and state[i] == ST_INVALID:
+            raise ValueError
+        md[model.MD_AR_XMAX] = xm
+    except (KeyError, IndexError, ValueError):
+        pass
 
-        try:
-            ds = pdgroup["FocusDistance"]
-            fd = float(ds[i])  # in m
-            state = _h5svi_get_state(ds)
-            if state and state[i] == ST_INVALID:
-                raise ValueError
-            md[model.MD_AR_FOCUS_DISTANCE] = fd
-        except (KeyError, IndexError, ValueError):
-            pass
+    try:
+        ds = pdgroup["HoleDiameter"]
+        hd = float(ds[i])  # in m
+        state = _h5svi_get_state(ds)
+        if state and state[i] == ST_INVALID:
+            raise ValueError
+        md[model.MD_AR_HOLE_DIAMETER] = hd
+    except (KeyError, IndexError, ValueError):
+        pass
 
-        try:
-            ds = pdgroup["ParabolaF"]
-            pf = float(ds[i])
-            state = _h5svi_get_state(ds)
-            if state and state[i] == ST_INVALID:
-                raise ValueError
-            md[model.MD_AR_PARABOLA_F] = pf
-        except (KeyError, IndexError, ValueError):
-            pass
+    try:
+        ds = pdgroup["FocusDistance"]
+        fd = float(ds[i])  # in m
+        state = _h5svi_get_state(ds)
+        if state and state[i] == ST_INVALID:
+            raise ValueError
+        md[model.MD_AR_FOCUS_DISTANCE] = fd
+    except (KeyError, IndexError, ValueError):
+        pass
 
-    return das
+    try:
+        ds = pdgroup["ParabolaF"]
+        pf = float(ds[i])
+        state = _h5svi_get_state(ds)
+        if state and state[i] == ST_INVALID:
+            raise ValueError
+        md[model.MD_AR_PARABOLA_F] = pf
+    except (KeyError, IndexError, ValueError):
+        pass
 
 # Enums used in SVI HDF5
 # State: how "trustable" is the value
@@ -1219,7 +1234,18 @@ def _thumbFromHDF5(filename):
     return (list of model.DataArray)
     """
     f = h5py.File(filename, "r")
+    try:
+        return [das.getData() for das in _thumbShadowsFromHDF5(f)]
+    finally:
+        f.close()
 
+def _thumbShadowsFromHDF5(f):
+    """
+    Find the thumbnails in an HDF5 file, without reading their data.
+    Expects to find them as IMAGE in Preview/Image.
+    f (h5py.File): the root of the file
+    return (list of DataArrayShadowHDF5)
+    """
     thumbs = []
     # look for the Preview directory
     try:
@@ -1233,28 +1259,29 @@ def _thumbFromHDF5(filename):
         # an image? (== has the attribute CLASS: IMAGE)
         if isinstance(ds, h5py.Dataset) and ds.attrs.get("CLASS") == "IMAGE":
             try:
-                da = _read_image_dataset(ds)
+                md = _read_image_md(ds)
             except Exception:
                 logging.info("Skipping image '%s' which couldn't be read.", name)
                 continue
 
             if name == "Image":
                 try:
-                    da.metadata = _read_image_info(grp)
+                    md = _read_image_info(grp)
                 except Exception:
                     logging.debug("Failed to parse metadata of acquisition '%s'", name)
                     continue
 
-            thumbs.append(da)
+            thumbs.append(DataArrayShadowHDF5(ds, ds.shape, ds.dtype, md))
 
     return thumbs
 
-def _dataFromSVIHDF5(f):
+def _shadowsFromSVIHDF5(f):
     """
-    Read microscopy data from an HDF5 file using the SVI convention.
+    Find the microscopy data in an HDF5 file using the SVI convention, without
+    reading the data.
     Expects to find them as IMAGE in XXX/ImageData/Image + XXX/PhysicalData.
     f (h5py.File): the root of the file
-    return (list of model.DataArray)
+    return (list of DataArrayShadowHDF5)
     """
     data = []
 
@@ -1268,19 +1295,29 @@ def _dataFromSVIHDF5(f):
         except KeyError:
             continue # not conforming => try next object
 
-        # Read the raw data
+        # Check the format of the raw data
         try:
-            da = _read_image_dataset(image)
+            md = _read_image_md(image)
         except Exception:
             logging.exception("Failed to read data of acquisition '%s'", obj.name)
+            continue
 
         # TODO: read more metadata
         try:
-            da.metadata.update(_read_image_info(imagedata))
+            md.update(_read_image_info(imagedata))
         except Exception:
             logging.exception("Failed to parse metadata of acquisition '%s'", obj.name)
 
-        das = _parse_physical_data(physicaldata, da)
+        n = _count_physical_channels(physicaldata, image.shape)
+        if n > 1:
+            das = [DataArrayShadowHDF5(image, image.shape[1:], image.dtype,
+                                       md.copy(), channel=c)
+                   for c in range(n)]
+        else:
+            das = [DataArrayShadowHDF5(image, image.shape, image.dtype, md)]
+
+        for i, d in enumerate(das):
+            _read_physical_metadata(physicaldata, i, d.metadata)
         data.extend(das)
     return data
 
@@ -1291,13 +1328,23 @@ def _dataFromHDF5(filename):
     return (list of model.DataArray)
     """
     f = h5py.File(filename, "r")
+    try:
+        return [das.getData() for das in _shadowsFromHDF5(f)]
+    finally:
+        f.close()
 
+def _shadowsFromHDF5(f):
+    """
+    Find the microscopy data in an HDF5 file, without reading the data.
+    f (h5py.File): the root of the file
+    return (list of DataArrayShadowHDF5)
+    """
     # if follows SVI convention => use the special function
     # If it has at least one directory like XXX/SVIData => it follows SVI conventions
     for obj in f.values():
         if (isinstance(obj, h5py.Group) and
             isinstance(obj.get("SVIData"), h5py.Group)):
-            return _dataFromSVIHDF5(f)
+            return _shadowsFromSVIHDF5(f)
 
     data = []
     # go rough: return any dataset with numbers (and more than one element)
@@ -1311,10 +1358,11 @@ def _dataFromHDF5(filename):
                 return
             # TODO: if it's an image, open it as an image
             # TODO: try to get some metadata?
-            da = model.DataArray(obj[...])
+            das = DataArrayShadowHDF5(obj, obj.shape, obj.dtype)
         except Exception:
             logging.info("Skipping '%s' as it doesn't seem a correct data", name)
-        data.append(da)
+            return
+        data.append(das)
 
     f.visititems(addIfWorthy)
     return data
@@ -1430,3 +1478,67 @@ def read_thumbnail(filename):
 
     return _thumbFromHDF5(filename)
 
+
+def open_data(filename):
+    """
+    Opens an HDF5 file, and return an AcquisitionData instance. Only the
+     metadata is read, the data of each image is read when requested.
+    filename (unicode): path to the file
+    return (AcquisitionData): an opened file
+    raises:
+        IOError in case the file format is not as expected.
+    """
+    return AcquisitionDataHDF5(filename)
+
+
+class DataArrayShadowHDF5(DataArrayShadow):
+    """
+    This class implements the read of an image stored in an HDF5 dataset.
+    It has all the useful attributes of a DataArray, and the data is only read
+    when requested.
+    """
+
+    def __init__(self, dataset, shape, dtype, metadata=None, channel=None):
+        """
+        Constructor
+        dataset (h5py.Dataset): the dataset containing the image
+        shape (tuple of int): The shape of the corresponding DataArray
+        dtype (numpy.dtype): The data type
+        metadata (dict str->val): The metadata
+        channel (None or 0<=int): if the image is only one channel of the
+          dataset, the index of the channel (in the first dimension)
+        """
+        DataArrayShadow.__init__(self, shape, dtype, metadata)
+        self._dataset = dataset
+        self._channel = channel
+
+    def getData(self):
+        """
+        Fetches the whole data (at full resolution) of image.
+        return DataArray: the data, with its metadata
+        """
+        if self._channel is None:
+            image = self._dataset[...]
+        else:
+            image = self._dataset[self._channel]
+        return model.DataArray(image, metadata=self.metadata.copy())
+
+
+class AcquisitionDataHDF5(AcquisitionData):
+    """
+    Implements AcquisitionData for HDF5 files
+    """
+    def __init__(self, filename):
+        """
+        Constructor
+        filename (unicode): The name of the HDF5 file
+        """
+        try:
+            # Kept open as long as the data might be read
+            self._file = h5py.File(filename, "r")
+        except Exception as ex:
+            raise IOError("Failed to open HDF5 file %s: %s" % (filename, ex))
+        content = _shadowsFromHDF5(self._file)
+        thumbnails = _thumbShadowsFromHDF5(self._file)
+        AcquisitionData.__init__(self, tuple(content), tuple(thumbnails))
+
@@ -28,13 +28,15 @@ FORMAT = "Serialized TIFF"
 # list of file-name extensions possible, the first one is the default when saving a file
 EXTENSIONS = [u".0.ome.tiff"]
 
+CAN_COMPRESS_PARALLEL = True  # indicates the support for parallel compression
+
 # An almost identical OME-XML metadata block is inserted into the first IFD of
 # each constituent OME-TIFF file. This is for redundancy purposes: if only a
 # subset of the files are present, the metadata survives. Each of
 # the files in the set has identical metadata apart from the UUID, the unique
 # identifier of a file.
 
-def export(filename, data, thumbnail=None, compressed=True):
+def export(filename, data, thumbnail=None, compressed=True, parallel=None):
     '''
     Write a collection of multiple OME-TIFF files with the given images and 
     metadata
@@ -47,5 +49,8 @@ def export(filename, data, thumbnail=None, compressed=True):
       with last dimension of length 3 (RGB). If the exporter doesn't support it,
       it will be dropped silently.
     compressed (boolean): whether the file is compressed or not.
+    parallel (None or boolean): whether the images are compressed in parallel
+      (see tiff.export()).
     '''
-    tiff.export(filename, data, thumbnail, compressed, multiple_files=True)
+    tiff.export(filename, data, thumbnail, compressed, multiple_files=True,
+                parallel=parallel)
@@ -28,6 +28,7 @@ import numpy
 from odemis import model
 from odemis.dataio import csv
 import os
+import threading
 import unittest
 
 import csv as pycsv
@@ -156,6 +157,70 @@ class TestCSVIO(unittest.TestCase):
             raised = True
         self.assertFalse(raised, 'Failed to read csv file')
 
+    def testExportSpectrumLineContent(self):
+        """Check the values of a spectrum-line written by blocks"""
+        size = (1340, 6)
+        md = {model.MD_WL_LIST: numpy.linspace(536e-9, 650e-9, size[0]).tolist(),
+              model.MD_PIXEL_SIZE: (None, 4.2e-06),
+              model.MD_ACQ_TYPE: model.MD_AT_SPECTRUM}
+        data = model.DataArray(numpy.random.random(size), md)
+
+        csv.export(FILENAME, data)
+
+        rows = list(pycsv.reader(open(FILENAME, 'rb')))
+        self.assertEqual(len(rows), size[0] + 1)
+        self.assertEqual(len(rows[0]), size[1] + 1)
+        read_data = numpy.array(rows[1:], dtype=numpy.float)
+        numpy.testing.assert_array_equal(read_data[:, 1:], data)
+        numpy.testing.assert_allclose(read_data[:, 0], numpy.array(md[model.MD_WL_LIST]) * 1e9)
+
+    def testExportFloat32(self):
+        """Check float32 values are written with their shortest representation"""
+        md = {model.MD_ACQ_TYPE: model.MD_AT_SPECTRUM}
+        data = model.DataArray(numpy.array([0.1, 1e-8, 1 / 3], dtype=numpy.float32), md)
+
+        csv.export(FILENAME, data)
+
+        rows = list(pycsv.reader(open(FILENAME, 'rb')))
+        self.assertEqual([r[0] for r in rows[1:]], ["0.1", "1e-08", "0.33333334"])
+        read_data = numpy.array([r[0] for r in rows[1:]], dtype=numpy.float32)
+        numpy.testing.assert_array_equal(read_data, data)
+
+    def testExportPixelSpectra(self):
+        """Try exporting the spectrum of every pixel of a cube"""
+        size = (50, 1, 1, 20, 30)
+        md = {model.MD_WL_LIST: numpy.linspace(536e-9, 650e-9, size[0]).tolist(),
+              model.MD_ACQ_TYPE: model.MD_AT_SPECTRUM}
+        data = model.DataArray(numpy.random.randint(0, 4000, size).astype(numpy.uint16), md)
+
+        f = csv.export_pixel_spectra(FILENAME, data)
+        f.result(30)
+
+        rows = list(pycsv.reader(open(FILENAME, 'rb')))
+        self.assertEqual(len(rows), size[-1] * size[-2] + 1)
+        self.assertEqual(len(rows[0]), size[0] + 2)
+        # one row per pixel: x, y, spectrum
+        row = rows[1 + 7 * size[-1] + 4]
+        self.assertEqual(row[:2], ["4", "7"])
+        numpy.testing.assert_array_equal(numpy.array(row[2:], dtype=numpy.uint16),
+                                         data[:, 0, 0, 7, 4])
+
+    def testCancelPixelSpectra(self):
+        """Cancelling the export of every pixel spectrum removes the file"""
+        size = (1000, 1, 1, 256, 256)
+        md = {model.MD_ACQ_TYPE: model.MD_AT_SPECTRUM}
+        data = model.DataArray(numpy.zeros(size, numpy.uint16), md)
+
+        f = csv.export_pixel_spectra(FILENAME, data)
+        # Wait for the first lines to be written
+        written = threading.Event()
+        f.add_update_callback(lambda fut, s, e: fut.running() and written.set())
+        self.assertTrue(written.wait(10))
+        self.assertTrue(f.cancel())
+        self.assertTrue(f.cancelled())
+        # cancel() only returns once the export is over
+        self.assertFalse(os.path.exists(FILENAME))
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -715,6 +715,50 @@ class TestHDF5IO(unittest.TestCase):
         self.assertEqual(im.shape, tshape)
         self.assertEqual(im[0, 0].tolist(), [0, 255, 0])
 
+    def testOpenData(self):
+        """
+        Checks that opening the file gives the same data as reading it, but
+        only reads the data when requested.
+        """
+        size = (512, 256)
+        dtype = numpy.dtype("uint16")
+        ldata = []
+        for i, desc in enumerate(("blue dye", "green dye", "red dye")):
+            md = {model.MD_DESCRIPTION: desc,
+                  model.MD_ACQ_DATE: time.time(),
+                  model.MD_PIXEL_SIZE: (1e-6, 1e-6),  # m/px
+                  model.MD_POS: (13.7e-3, -30e-3),  # m
+                  model.MD_EXP_TIME: 1.2,  # s
+                  model.MD_IN_WL: (500e-9 + i * 50e-9, 520e-9 + i * 50e-9),  # m
+                  model.MD_OUT_WL: (650e-9, 660e-9),  # m
+                 }
+            a = model.DataArray(numpy.zeros(size[::-1], dtype), md)
+            a[i, i] = i + 1  # "watermark" it
+            ldata.append(a)
+
+        # thumbnail : small RGB completely green
+        tshape = (size[1] // 8, size[0] // 8, 3)
+        thumbnail = model.DataArray(numpy.zeros(tshape, numpy.uint8))
+        thumbnail[:, :, 1] += 255
+
+        hdf5.export(FILENAME, ldata, thumbnail)
+
+        rdata = hdf5.read_data(FILENAME)
+        acd = hdf5.open_data(FILENAME)
+        self.assertEqual(len(acd.content), len(rdata))
+        for das, im in zip(acd.content, rdata):
+            self.assertEqual(das.shape, im.shape)
+            self.assertEqual(das.dtype, im.dtype)
+            self.assertEqual(das.metadata, im.metadata)
+            da = das.getData()
+            numpy.testing.assert_array_equal(da, im)
+            self.assertEqual(da.metadata, im.metadata)
+
+        self.assertEqual(len(acd.thumbnails), 1)
+        self.assertEqual(acd.thumbnails[0].shape, tshape)
+        im = acd.thumbnails[0].getData()
+        self.assertEqual(im[0, 0].tolist(), [0, 255, 0])
+
     def testReadMDOutWlBands(self):
         """
         Checks that we hand MD_OUT_WL if it contains multiple bands.
@@ -25,6 +25,8 @@ from __future__ import division
 from PIL import Image
 import libtiff
 import logging
+import math
+import multiprocessing
 import numpy
 from numpy.polynomial import polynomial
 from odemis import model
@@ -1313,6 +1315,39 @@ class TestTiffIO(unittest.TestCase):
         self.assertEqual(full_image[-1][0], 4096)
         self.assertEqual(full_image[-1][-1], 4097)
 
+    def testExportParallelCompression(self):
+        """
+        Checks that the images compressed in parallel are identical to the ones
+        compressed by libtiff, for the standard and pyramidal formats
+        """
+        arr_grey = numpy.arange(300 * 517, dtype=numpy.uint16).reshape(300, 517)
+        arr_grey[100:120] = 6
+        arr_int = (arr_grey.astype(numpy.int32) - 20000).astype(numpy.int16)
+        arr_float = arr_grey.astype(numpy.float32) / 3
+        arr_rgb = numpy.zeros((281, 330, 3), dtype=numpy.uint8)
+        arr_rgb[:, :, 0] = numpy.arange(330) % 256
+        arr_rgb[50:, :, 2] = 255
+        ldata = [model.DataArray(arr_grey),
+                 model.DataArray(arr_int),
+                 model.DataArray(arr_float),
+                 model.DataArray(arr_rgb, {model.MD_DIMS: "YXC"})]
+
+        for pyramid in (False, True):
+            rdata = {}
+            for p in (True, False):
+                tiff.export(FILENAME, ldata, pyramid=pyramid, parallel=p)
+                rdata[p] = tiff.read_data(FILENAME)
+
+                if p and multiprocessing.cpu_count() > 1:
+                    im = libtiff.TIFF.open(FILENAME)
+                    self.assertEqual(im.GetField(T.TIFFTAG_COMPRESSION),
+                                     T.COMPRESSION_ADOBE_DEFLATE)
+                    im.close()
+
+            for rp, rs, orig in zip(rdata[True], rdata[False], ldata):
+                numpy.testing.assert_array_equal(rp, orig)
+                numpy.testing.assert_array_equal(rp, rs)
+
     def testExportMultiArrayPyramid(self):
         """
         Checks that we can export and read back the metadata and data of 1 SEM image,
@@ -1551,6 +1586,54 @@ class TestTiffIO(unittest.TestCase):
             # the image is not tiled
             rdata.content[0].getTile(0, 0, 0)
 
+    def testAcquisitionDataTIFFUncompressed(self):
+        """
+        Checks that uncompressed images are read directly from the file, and
+        identical to the ones read via libtiff
+        """
+        md = {model.MD_POS: (2e-6, 10e-6),
+              model.MD_PIXEL_SIZE: (1e-6, 1e-6)}
+        arr = numpy.arange(600 * 521, dtype=numpy.uint16).reshape(600, 521)
+        data = model.DataArray(arr, metadata=md)
+        md_rgb = dict(md)
+        md_rgb[model.MD_DIMS] = "YXC"
+        arr_rgb = numpy.zeros((300, 270, 3), dtype=numpy.uint8)
+        arr_rgb[:, :, 1] = numpy.arange(270) % 256
+        data_rgb = model.DataArray(arr_rgb, metadata=md_rgb)
+
+        for pyramid in (False, True):
+            tiff.export(FILENAME, [data, data_rgb], compressed=False, pyramid=pyramid)
+            rdata = tiff.open_data(FILENAME)
+            for das, orig in zip(rdata.content, (arr, arr_rgb)):
+                self.assertIsNotNone(das.tiff_info["layout"])
+                im = das.getData()
+                numpy.testing.assert_array_equal(im, orig)
+                # Modifying the data has no effect on the file
+                im[0, 0] = 12
+                numpy.testing.assert_array_equal(das.getData(), orig)
+
+                if not pyramid:
+                    continue
+                for zoom in range(das.maxzoom + 1):
+                    layout = das._getLayout(zoom)
+                    self.assertIsNotNone(layout)
+                    for ty in range(int(math.ceil(layout["shape"][0] / das.tile_shape[1]))):
+                        for tx in range(int(math.ceil(layout["shape"][1] / das.tile_shape[0]))):
+                            tile = das.getTile(tx, ty, zoom)
+                            # Compare to the tile read via libtiff
+                            das._layouts[zoom] = None
+                            tile_lt = das.getTile(tx, ty, zoom)
+                            das._layouts[zoom] = layout
+                            numpy.testing.assert_array_equal(tile, tile_lt)
+                            self.assertEqual(tile.metadata, tile_lt.metadata)
+
+        # Compressed images are read via libtiff
+        tiff.export(FILENAME, [data, data_rgb], compressed=True)
+        rdata = tiff.open_data(FILENAME)
+        for das, orig in zip(rdata.content, (arr, arr_rgb)):
+            self.assertIsNone(das.tiff_info["layout"])
+            numpy.testing.assert_array_equal(das.getData(), orig)
+
     def testAcquisitionDataTIFFLargerFile(self):
 
         def getSubData(dast, zoom, rect):
@@ -22,9 +22,12 @@ Odemis. If not, see http://www.gnu.org/licenses/.
 from __future__ import division
 
 import calendar
+import ctypes
+from concurrent.futures import ThreadPoolExecutor
 from libtiff import TIFF
 import logging
 import math
+import multiprocessing
 import numpy
 from odemis import model, util
 import odemis
@@ -36,6 +39,7 @@ import sys
 import time
 import uuid
 import threading
+import zlib
 from odemis.model import DataArrayShadow, AcquisitionData
 
 import libtiff.libtiff_ctypes as T  # for the constant names
@@ -64,8 +68,17 @@ EXTENSIONS = [u".ome.tiff", u".ome.tif", u".tiff", u".tif"]
 STIFF_SPLIT = ".0."  # pattern to replace with the "stiff" multiple file
 
 CAN_SAVE_PYRAMID = True # indicates the support for pyramidal export
+CAN_COMPRESS_PARALLEL = True  # indicates the support for parallel compression
 TILE_SIZE = 256 # Tile size of pyramidal images
 
+# Default value of the "parallel" argument of export().
+# If True, the compression is done with deflate, in parallel on all the CPUs,
+# for the images which support it (greyscale and RGB interleaved). Otherwise,
+# libtiff compresses the images with LZW, on a single CPU.
+# Disabled by default, so that the files stay compressed with LZW, as before.
+PARALLEL_COMPRESSION = False
+STRIP_SIZE = 256 * 1024  # bytes, approximate size of a (uncompressed) strip
+
 # We try to make it as much as possible looking like a normal (multi-page) TIFF,
 # with as much metadata as possible saved in the known TIFF tags. In addition,
 # we ensure it's compatible with OME-TIFF, which support much more metadata, and
@@ -228,6 +241,133 @@ def _isThumbnail(tfile):
 
     return False
 
+def _getChunkOffsets(tfile, tag, n):
+    """
+    Reads the position in the file of each strip or tile of the current image
+    tag (int): TIFFTAG_STRIPOFFSETS or TIFFTAG_TILEOFFSETS
+    n (int): number of strips or tiles
+    return (None or list of int): the offsets, or None if not available
+    """
+    # Note: TIFF.GetField() only returns the first offset. Since libtiff 4.0,
+    # offsets are always stored as 64 bits.
+    ptr = ctypes.POINTER(ctypes.c_uint64)()
+    r = T.libtiff.TIFFGetField(tfile, T.c_ttag_t(tag), ctypes.byref(ptr))
+    if not r or not ptr:
+        return None
+    return ptr[:n]
+
+def _getRawLayout(tfile, file_size):
+    """
+    Detects whether the pixel data of the current image is stored uncompressed,
+    in such a way that it can be directly mapped from the file to memory.
+    tfile (tiff handle): Handle for the TIFF file
+    file_size (int): size of the file in bytes
+    return (None or dict): None if the data must be read via libtiff. Otherwise:
+      'dtype' (numpy.dtype): type of the data
+      'shape' (tuple of int): shape of the image (YX or YXC)
+      'tile_shape' (None or tuple of int): shape of a tile (YX or YXC), or
+        None if the image is stored as strips following each other
+      'offsets' (list of int): position in the file of the whole image (strips),
+        or of each tile
+    """
+    comp = _GetFieldDefault(tfile, T.TIFFTAG_COMPRESSION, T.COMPRESSION_NONE)
+    if comp != T.COMPRESSION_NONE or tfile.IsByteSwapped():
+        return None
+
+    bits = _GetFieldDefault(tfile, T.TIFFTAG_BITSPERSAMPLE, 1)
+    samples_pp = _GetFieldDefault(tfile, T.TIFFTAG_SAMPLESPERPIXEL, 1)
+    planar = _GetFieldDefault(tfile, T.TIFFTAG_PLANARCONFIG, T.PLANARCONFIG_CONTIG)
+    depth = _GetFieldDefault(tfile, T.TIFFTAG_IMAGEDEPTH, 1)
+    if (bits % 8 or depth != 1 or
+        (samples_pp > 1 and planar != T.PLANARCONFIG_CONTIG)):
+        return None
+    try:
+        sample_format = tfile.GetField(T.TIFFTAG_SAMPLEFORMAT)
+        dtype = numpy.dtype(tfile.get_numpy_type(bits, sample_format))
+    except Exception:
+        return None
+
+    width = tfile.GetField(T.TIFFTAG_IMAGEWIDTH)
+    height = tfile.GetField(T.TIFFTAG_IMAGELENGTH)
+    shape = (height, width)
+    if samples_pp > 1:
+        shape += (samples_pp,)
+
+    if tfile.IsTiled():
+        tile_shape = (tfile.GetField(T.TIFFTAG_TILELENGTH),
+                      tfile.GetField(T.TIFFTAG_TILEWIDTH)) + shape[2:]
+        n = T.libtiff.TIFFNumberOfTiles(tfile).value
+        offsets = _getChunkOffsets(tfile, T.TIFFTAG_TILEOFFSETS, n)
+        chunk_nbytes = numpy.prod(tile_shape) * dtype.itemsize
+    else:
+        tile_shape = None
+        rows_per_strip = min(_GetFieldDefault(tfile, T.TIFFTAG_ROWSPERSTRIP, height), height)
+        n = T.libtiff.TIFFNumberOfStrips(tfile).value
+        offsets = _getChunkOffsets(tfile, T.TIFFTAG_STRIPOFFSETS, n)
+        chunk_nbytes = rows_per_strip * numpy.prod(shape[1:]) * dtype.itemsize
+        if offsets:
+            # Only if all the strips follow each other
+            if any(o != offsets[0] + i * chunk_nbytes for i, o in enumerate(offsets)):
+                return None
+            chunk_nbytes = numpy.prod(shape) * dtype.itemsize
+            offsets = offsets[:1]
+
+    if not offsets or max(offsets) + chunk_nbytes > file_size:
+        return None
+
+    return {"dtype": dtype, "shape": shape, "tile_shape": tile_shape,
+            "offsets": offsets}
+
+def _mapTile(filename, layout, x, y):
+    """
+    Get one tile of an image stored uncompressed, without copying it
+    filename (str): path to the TIFF file
+    layout (dict): as returned by _getRawLayout(), with tiles
+    x (0<=int): X index of the tile
+    y (0<=int): Y index of the tile
+    return (numpy.array): the tile, smaller than the standard tile shape if
+      the tile is on the border of the image
+    """
+    height, width = layout["shape"][:2]
+    tile_shape = layout["tile_shape"]
+    ntx = int(math.ceil(width / tile_shape[1]))
+    nty = int(math.ceil(height / tile_shape[0]))
+    if not (0 <= x < ntx and 0 <= y < nty):
+        raise ValueError("Invalid tile index %d, %d" % (x, y))
+
+    offset = layout["offsets"][y * ntx + x]
+    tile = _mapArray(filename, layout["dtype"], tile_shape, offset)
+    return tile[:height - y * tile_shape[0], :width - x * tile_shape[1]]
+
+def _mapImage(filename, layout):
+    """
+    Get a whole image stored uncompressed. If it's stored as strips, no copy
+    is done.
+    filename (str): path to the TIFF file
+    layout (dict): as returned by _getRawLayout()
+    return (numpy.array): the image
+    """
+    if layout["tile_shape"] is None:
+        return _mapArray(filename, layout["dtype"], layout["shape"],
+                         layout["offsets"][0])
+
+    im = numpy.empty(layout["shape"], layout["dtype"])
+    th, tw = layout["tile_shape"][:2]
+    for y in range(int(math.ceil(im.shape[0] / th))):
+        for x in range(int(math.ceil(im.shape[1] / tw))):
+            im[y * th:(y + 1) * th, x * tw:(x + 1) * tw] = _mapTile(filename, layout, x, y)
+    return im
+
+def _mapArray(filename, dtype, shape, offset):
+    """
+    Maps a part of a file to memory. The file is not modified, even if the
+    array is modified. Each call returns an independent array.
+    return (numpy.array): the array, backed by the file
+    """
+    mm = numpy.memmap(filename, dtype=dtype, mode="c", offset=offset, shape=shape)
+    # Return a standard array, so that slicing and computing on it don't create memmaps
+    return mm.view(numpy.ndarray)
+
 def _guessModelName(das):
     """
     Detect the model of the Delmic microscope from the type of images acquired
@@ -1402,7 +1542,7 @@ def _mergeCorrectionMetadata(da):
     return model.DataArray(da, md) # create a view
 
 def _saveAsMultiTiffLT(filename, ldata, thumbnail, compressed=True, multiple_files=False,
-                       file_index=None, uuid_list=None, pyramid=False):
+                       file_index=None, uuid_list=None, pyramid=False, parallel=False):
     """
     Saves a list of DataArray as a multiple-page TIFF file.
     filename (string): name of the file to save
@@ -1415,6 +1555,7 @@ def _saveAsMultiTiffLT(filename, ldata, thumbnail, compressed=True, multiple_fil
     uuid_list (list of str): list that contains all the file uuids
     pyramid (boolean): whether the file should be saved in the pyramid format or not.
       In this format, each image is saved along with different zoom levels
+    parallel (boolean): whether the compression is done in parallel (see write_image())
     """
     if multiple_files:
         # Add index
@@ -1561,7 +1702,8 @@ def _saveAsMultiTiffLT(filename, ldata, thumbnail, compressed=True, multiple_fil
                 c = None # libtiff doesn't support compression on these types
             else:
                 c = compression
-            write_image(f, data[i], write_rgb=write_rgb, compression=c, pyramid=pyramid)
+            write_image(f, data[i], write_rgb=write_rgb, compression=c, pyramid=pyramid,
+                        parallel=parallel)
 
 
 def _thumbsFromTIFF(filename):
@@ -1619,7 +1761,135 @@ def _ensure_fs_encoding(filename):
         return filename.encode(sys.getfilesystemencoding())
 
 
-def write_image(f, arr, compression=None, write_rgb=False, pyramid=False):
+def _canCompressParallel(arr, write_rgb):
+    """
+    Check whether an image can be written with _writeStripsParallel() and
+    _writeTilesParallel()
+    arr (numpy.array): the image to write
+    write_rgb (boolean): True if the image is RGB
+    return (boolean): True if the image layout is supported
+    """
+    if write_rgb:
+        # Only interleaved RGB(A) is supported
+        return arr.ndim == 3 and arr.shape[2] in (3, 4)
+    return arr.ndim == 2
+
+
+def _setImageTags(f, arr, write_rgb):
+    """
+    Set the tags describing the image layout, for an image compressed with
+      deflate.
+    f (libtiff file handle): Handle of a TIFF file
+    arr (numpy.array of shape YX or YXC): the image to write
+    write_rgb (boolean): True if the image is RGB
+    return (boolean): True if the horizontal predictor must be applied
+    """
+    if arr.dtype.kind == "f":
+        sample_format = T.SAMPLEFORMAT_IEEEFP
+    elif arr.dtype.kind in "ub":
+        sample_format = T.SAMPLEFORMAT_UINT
+    elif arr.dtype.kind == "i":
+        sample_format = T.SAMPLEFORMAT_INT
+    else:
+        raise NotImplementedError("Cannot write data of type %s" % (arr.dtype,))
+
+    f.SetField(T.TIFFTAG_COMPRESSION, T.COMPRESSION_ADOBE_DEFLATE)
+    # Same as libtiff does for LZW: the horizontal predictor improves a lot
+    # the compression of integer data
+    predictor = arr.dtype.kind in "ui"
+    if predictor:
+        f.SetField(T.TIFFTAG_PREDICTOR, T.PREDICTOR_HORIZONTAL)
+
+    f.SetField(T.TIFFTAG_BITSPERSAMPLE, arr.itemsize * 8)
+    f.SetField(T.TIFFTAG_SAMPLEFORMAT, sample_format)
+    f.SetField(T.TIFFTAG_ORIENTATION, T.ORIENTATION_TOPLEFT)
+    f.SetField(T.TIFFTAG_IMAGEWIDTH, arr.shape[1])
+    f.SetField(T.TIFFTAG_IMAGELENGTH, arr.shape[0])
+    f.SetField(T.TIFFTAG_PLANARCONFIG, T.PLANARCONFIG_CONTIG)
+    if write_rgb:
+        f.SetField(T.TIFFTAG_PHOTOMETRIC, T.PHOTOMETRIC_RGB)
+        f.SetField(T.TIFFTAG_SAMPLESPERPIXEL, arr.shape[2])
+        if arr.shape[2] == 4:
+            f.SetField(T.TIFFTAG_EXTRASAMPLES, [T.EXTRASAMPLE_UNASSALPHA], count=1)
+    else:
+        f.SetField(T.TIFFTAG_PHOTOMETRIC, T.PHOTOMETRIC_MINISBLACK)
+
+    return predictor
+
+
+def _compressChunk(chunk, predictor):
+    """
+    Compress a strip or a tile, as expected by the TIFF deflate compression.
+    It's called in separate threads, as zlib releases the GIL.
+    chunk (numpy.array of shape YX or YXC): the strip or tile
+    predictor (boolean): if True, applies the horizontal differencing first
+    return (str): the compressed data
+    """
+    if predictor:
+        # Each value (of each sample) is replaced by the difference with the
+        # previous value on the same row (wrapping around on overflow).
+        diff = chunk.copy()
+        diff[:, 1:] -= chunk[:, :-1]
+        chunk = diff
+    # On microscope images, level 1 compresses nearly as well as the default
+    # level (6), but is several times faster.
+    return zlib.compress(numpy.ascontiguousarray(chunk).data, 1)
+
+
+def _writeStripsParallel(f, arr, write_rgb):
+    """
+    Writes an image, compressed as deflate strips. Each strip is compressed
+    in parallel, and then written in order.
+    f (libtiff file handle): Handle of a TIFF file
+    arr (numpy.array of shape YX or YXC): the image to write
+    write_rgb (boolean): True if the image is RGB
+    """
+    predictor = _setImageTags(f, arr, write_rgb)
+    row_nbytes = arr.nbytes // arr.shape[0]
+    rows_per_strip = max(1, STRIP_SIZE // row_nbytes)
+    f.SetField(T.TIFFTAG_ROWSPERSTRIP, rows_per_strip)
+
+    strips = (arr[y:y + rows_per_strip] for y in range(0, arr.shape[0], rows_per_strip))
+    with ThreadPoolExecutor(max_workers=multiprocessing.cpu_count()) as executor:
+        cstrips = executor.map(lambda s: _compressChunk(s, predictor), strips)
+        for i, cs in enumerate(cstrips):
+            f.WriteRawStrip(i, cs, len(cs))
+    f.WriteDirectory()
+
+
+def _writeTilesParallel(f, arr, write_rgb):
+    """
+    Writes an image, compressed as deflate tiles of TILE_SIZE. Each tile is
+    compressed in parallel, and then written in order.
+    f (libtiff file handle): Handle of a TIFF file
+    arr (numpy.array of shape YX or YXC): the image to write
+    write_rgb (boolean): True if the image is RGB
+    """
+    predictor = _setImageTags(f, arr, write_rgb)
+    f.SetField(T.TIFFTAG_TILEWIDTH, TILE_SIZE)
+    f.SetField(T.TIFFTAG_TILELENGTH, TILE_SIZE)
+
+    def get_tiles():
+        # In the order of the tile index: row by row
+        height, width = arr.shape[0:2]
+        for y in range(0, height, TILE_SIZE):
+            for x in range(0, width, TILE_SIZE):
+                tile = arr[y:y + TILE_SIZE, x:x + TILE_SIZE]
+                if tile.shape[0:2] != (TILE_SIZE, TILE_SIZE):
+                    # Tiles on the edge are filled with 0's
+                    full_tile = numpy.zeros((TILE_SIZE, TILE_SIZE) + arr.shape[2:], dtype=arr.dtype)
+                    full_tile[:tile.shape[0], :tile.shape[1]] = tile
+                    tile = full_tile
+                yield tile
+
+    with ThreadPoolExecutor(max_workers=multiprocessing.cpu_count()) as executor:
+        ctiles = executor.map(lambda t: _compressChunk(t, predictor), get_tiles())
+        for i, ct in enumerate(ctiles):
+            T.libtiff.TIFFWriteRawTile(f, i, ct, len(ct))
+    f.WriteDirectory()
+
+
+def write_image(f, arr, compression=None, write_rgb=False, pyramid=False, parallel=False):
     """
     f (libtiff file handle): Handle of a TIFF file
     arr (DataArray): DataArray to be written to the file
@@ -1627,10 +1897,21 @@ def write_image(f, arr, compression=None, write_rgb=False, pyramid=False):
     write_rgb (boolean): True if the image is RGB, False if the image is grayscale
     pyramid (boolean): whether the file should be saved in the pyramid format or not.
       In this format, each image is saved along with different zoom levels
+    parallel (boolean): if True, and the image supports it, the image is
+      compressed with deflate, in parallel on all the CPUs, instead of the
+      given compression.
     """
+    # On a single CPU, libtiff LZW is faster
+    parallel = (compression is not None and parallel and
+                multiprocessing.cpu_count() > 1 and
+                _canCompressParallel(arr, write_rgb))
+
     # if not pyramid, just save the image in the TIFF file, and return
     if not pyramid:
-        f.write_image(arr, compression=compression, write_rgb=write_rgb)
+        if parallel:
+            _writeStripsParallel(f, arr, write_rgb)
+        else:
+            f.write_image(arr, compression=compression, write_rgb=write_rgb)
         return
 
     # generate the sizes of the zoom levels to be generated and saved
@@ -1643,7 +1924,10 @@ def write_image(f, arr, compression=None, write_rgb=False, pyramid=False):
         f.SetField(T.TIFFTAG_SUBIFD, [0] * len(resized_shapes), count=len(resized_shapes))
 
     # write the original image
-    f.write_tiles(arr, TILE_SIZE, TILE_SIZE, compression, write_rgb)
+    if parallel:
+        _writeTilesParallel(f, arr, write_rgb)
+    else:
+        f.write_tiles(arr, TILE_SIZE, TILE_SIZE, compression, write_rgb)
     # generate the rescaled images and write the tiled image
     for resized_shape in resized_shapes:
         # rescale the image
@@ -1652,10 +1936,14 @@ def write_image(f, arr, compression=None, write_rgb=False, pyramid=False):
         # Before writting the actual data, we set the special metadata
         f.SetField(T.TIFFTAG_SUBFILETYPE, T.FILETYPE_REDUCEDIMAGE)
         # write the tiled image to the TIFF file
-        f.write_tiles(subim, TILE_SIZE, TILE_SIZE, compression, write_rgb)
+        if parallel:
+            _writeTilesParallel(f, subim, write_rgb)
+        else:
+            f.write_tiles(subim, TILE_SIZE, TILE_SIZE, compression, write_rgb)
 
 
-def export(filename, data, thumbnail=None, compressed=True, multiple_files=False, pyramid=False):
+def export(filename, data, thumbnail=None, compressed=True, multiple_files=False, pyramid=False,
+           parallel=None):
     '''
     Write a TIFF file with the given image and metadata
     filename (unicode): filename of the file to create (including path)
@@ -1672,7 +1960,13 @@ def export(filename, data, thumbnail=None, compressed=True, multiple_files=False
     compressed (boolean): whether the file is compressed or not.
     multiple_files (boolean): whether the data is distributed across multiple
       files or not.
+    pyramid (boolean): whether the file should be saved in the pyramid format or not.
+    parallel (None or boolean): whether the images are compressed with deflate,
+      in parallel on all the CPUs. It's much faster on big images, but the
+      files are a little bigger. If None, PARALLEL_COMPRESSION is used.
     '''
+    if parallel is None:
+        parallel = PARALLEL_COMPRESSION
     filename = _ensure_fs_encoding(filename)
     if isinstance(data, list):
         if multiple_files:
@@ -1687,13 +1981,15 @@ def export(filename, data, thumbnail=None, compressed=True, multiple_files=False
             for i in xrange(nfiles):
                 # TODO: Take care of thumbnails
                 _saveAsMultiTiffLT(filename, data, None, compressed,
-                                   multiple_files, i, uuid_list, pyramid)
+                                   multiple_files, i, uuid_list, pyramid, parallel)
         else:
-            _saveAsMultiTiffLT(filename, data, thumbnail, compressed, pyramid=pyramid)
+            _saveAsMultiTiffLT(filename, data, thumbnail, compressed, pyramid=pyramid,
+                               parallel=parallel)
     else:
         # TODO should probably not enforce it: respect duck typing
         assert(isinstance(data, model.DataArray))
-        _saveAsMultiTiffLT(filename, [data], thumbnail, compressed, pyramid=pyramid)
+        _saveAsMultiTiffLT(filename, [data], thumbnail, compressed, pyramid=pyramid,
+                           parallel=parallel)
 
 
 def read_data(filename):
@@ -1805,8 +2101,18 @@ class DataArrayShadowTIFF(DataArrayShadow):
             'tiff_file' (handle): Handle of the tiff file
             'dir_index' (int): Index of the directory
             'lock' (threading.Lock): The lock that controls the access to the TIFF file
+            'filename' (str): Path to the TIFF file
+            'layout' (None or dict): If the image is uncompressed, its position in the file
         return (numpy.array): The image
         """
+        if tiff_info.get('layout'):
+            # Uncompressed => no need to go through libtiff (and no need to lock)
+            try:
+                return _mapImage(tiff_info['filename'], tiff_info['layout'])
+            except EnvironmentError:
+                logging.warning("Failed to map file %s, will read it via libtiff",
+                                tiff_info['filename'], exc_info=True)
+
         with tiff_info['lock']:
             tiff_info['handle'].SetDirectory(tiff_info['dir_index'])
             image = tiff_info['handle'].read_image()
@@ -1869,7 +2175,38 @@ class DataArrayShadowPyramidalTIFF(DataArrayShadowTIFF):
 
         tile_shape = (num_tcols, num_trows)
 
+        # zoom level -> raw layout of the image (or None if it must be read via libtiff)
+        if isinstance(tiff_info, dict):
+            self._layouts = {0: tiff_info.get('layout')}
+        else:
+            self._layouts = {}
+
         DataArrayShadow.__init__(self, shape, dtype, metadata, maxzoom, tile_shape)
+
+    def _getLayout(self, zoom):
+        """
+        Finds how the image at the given zoom level is stored in the file
+        zoom (0<=int): zoom level
+        return (None or dict): the raw layout, as returned by _getRawLayout(), or
+          None if the tiles must be read via libtiff.
+        """
+        try:
+            return self._layouts[zoom]
+        except KeyError:
+            pass
+
+        tiff_info = self.tiff_info
+        layout = None
+        if self._layouts.get(0) and 0 < zoom <= self.maxzoom:
+            file_size = os.path.getsize(tiff_info['filename'])
+            with tiff_info['lock']:
+                tiff_file = tiff_info['handle']
+                tiff_file.SetDirectory(tiff_info['dir_index'])
+                sub_ifds = tiff_file.GetField(T.TIFFTAG_SUBIFD)
+                tiff_file.SetSubDirectory(sub_ifds[zoom - 1])
+                layout = _getRawLayout(tiff_file, file_size)
+        self._layouts[zoom] = layout
+        return layout
     
     def getTile(self, x, y, zoom):
         '''
@@ -1887,6 +2224,16 @@ class DataArrayShadowPyramidalTIFF(DataArrayShadowTIFF):
         if type(tiff_info) is list:
             raise NotImplemented("Not implemented when DataArray has multiple pixelData")
 
+        layout = self._getLayout(zoom)
+        if layout:
+            # Uncompressed => directly use the data from the file
+            tile = _mapTile(tiff_info['filename'], layout, x, y)
+            tile = model.DataArray(tile, self.metadata.copy())
+            orig_pixel_size = self.metadata.get(model.MD_PIXEL_SIZE, (1, 1))
+            tile.metadata[model.MD_PIXEL_SIZE] = tuple(ps * 2 ** zoom for ps in orig_pixel_size)
+            tile.metadata[model.MD_POS] = get_tile_md_pos((x, y), self.tile_shape, tile, self)
+            return tile
+
         with tiff_info['lock']:
             tiff_file = tiff_info['handle']
             tiff_file.SetDirectory(tiff_info['dir_index'])
@@ -1942,7 +2289,7 @@ class AcquisitionDataTIFF(AcquisitionData):
         # iterates all the directories of the TIFF file
         for dir_index in AcquisitionDataTIFF._iterDirectories(tiff_file):
             AcquisitionDataTIFF._createDataArrayShadows(tiff_file, dir_index,
-                                                        self._lock, data, thumbnails)
+                                                        self._lock, data, thumbnails, filename)
 
         # If looks like OME TIFF, reconstruct >2D data and add metadata
         # It's OME TIFF, if it has a valid ome-tiff XML in the first T.TIFFTAG_IMAGEDESCRIPTION
@@ -1986,7 +2333,7 @@ class AcquisitionDataTIFF(AcquisitionData):
 
                     for dir_index in AcquisitionDataTIFF._iterDirectories(f_link):
                         AcquisitionDataTIFF._createDataArrayShadows(f_link, dir_index,
-                                self._lock, data, thumbnails)
+                                self._lock, data, thumbnails, uuid_path)
 
                     file_read.add(uuid_data)
 
@@ -2006,7 +2353,7 @@ class AcquisitionDataTIFF(AcquisitionData):
         AcquisitionData.__init__(self, tuple(content), tuple(thumbnails))
 
     @staticmethod
-    def _createDataArrayShadows(tfile, dir_index, lock, data_array_shadows, thumbnails):
+    def _createDataArrayShadows(tfile, dir_index, lock, data_array_shadows, thumbnails, filename=None):
         """
         Create the DataArrayShadows from the TIFF metadata for the current directory,
         and add them to the data_array_shadows and thumbnails lists
@@ -2017,6 +2364,8 @@ class AcquisitionDataTIFF(AcquisitionData):
             the images of the current TIFF file that are not thumbnails
         thumbnails: (list of DataArrayShadows): List of DataArrayShadows of the current TIFF file
             that are thumbnails
+        filename (None or str): Path to the TIFF file, used to read directly the
+            uncompressed images (without libtiff)
         """
         bits = tfile.GetField(T.TIFFTAG_BITSPERSAMPLE)
         sample_format = tfile.GetField(T.TIFFTAG_SAMPLEFORMAT)
@@ -2040,8 +2389,14 @@ class AcquisitionDataTIFF(AcquisitionData):
         # and it is not a part of DataArrayShadow class
         # It can also be a a list of tiff_info,
         # in case the DataArray has multiple pixelData (eg, when data has more than 2D).
-        # Add also the lock of the TIFF file
-        tiff_info = {'handle': tfile, 'dir_index': dir_index, 'lock': lock}
+        # Add also the lock of the TIFF file, and if the image is uncompressed,
+        # where to find it directly in the file.
+        if filename is not None:
+            layout = _getRawLayout(tfile, os.path.getsize(filename))
+        else:
+            layout = None
+        tiff_info = {'handle': tfile, 'dir_index': dir_index, 'lock': lock,
+                     'filename': filename, 'layout': layout}
         das = DataArrayShadowTIFF(tiff_info, shape, typ, md)
 
         if _isThumbnail(tfile):
@@ -35,6 +35,8 @@ MAXDEVNUM = 8
 
 HISTCHAN = 65536  # number of histogram channels
 TTREADMAX = 131072  # 128K event records
+T3HISTCHAN = 4096  # number of histogram channels in T3 mode (12 bits start-stop time)
+T3WRAPAROUND = 65536  # the sync counter of the T3 records is 16 bits
 
 MODE_HIST = 0
 MODE_T2 = 2
@@ -77,6 +79,16 @@ PHR800LVMAX = 2400  # mV
 
 HOLDOFFMAX = 210480  # ns
 
+# Number of T3 records which can be buffered between the reading from the
+# device and the histogramming (4 bytes each)
+T3BUFFER_SIZE = 2 ** 22
+# In streaming mode, how long the measurement keeps running after the end of
+# the acquisition, so that a new acquisition can start immediately (in s)
+STREAM_LINGER = 2
+# In streaming mode, how often to check whether the sync signal is present, when
+# it's missing (in s)
+SYNC_CHECK_PERIOD = 1
+
 
 class PHError(Exception):
     def __init__(self, errno, strerror, *args, **kwargs):
@@ -187,7 +199,7 @@ class PH300(model.Detector):
     """
 
     def __init__(self, name, role, device=None, children=None, daemon=None,
-                 disc_volt=None, zero_cross=None, **kwargs):
+                 disc_volt=None, zero_cross=None, streaming=False, **kwargs):
         """
         device (None or str): serial number (eg, 1020345) of the device to use
           or None if any device is fine.
@@ -195,6 +207,11 @@ class PH300(model.Detector):
          detector1 are valid) to the arguments.
         disc_volt (2 (0 <= float <= 0.8)): discriminator voltage for the APD 0 and 1 (in V)
         zero_cross (2 (0 <= float <= 2e-3)): zero cross voltage for the APD0 and 1 (in V)
+        streaming (bool): if True, the device is used in time-tagged (T3) mode.
+          The photon events are continuously read, and the histograms are
+          computed in software, for every dwell time. This avoids the overhead
+          of starting a new measurement for every dwell time, but the histogram
+          only has 4096 bins.
         """
         if children is None:
             children = {}
@@ -215,8 +232,13 @@ class PH300(model.Detector):
 
         # TODO: metadata for indicating the range? cf WL_LIST?
 
-        # TODO: do we need TTTR mode?
-        self.Initialise(MODE_HIST)
+        self._streaming = streaming
+        if streaming:
+            self.Initialise(MODE_T3)
+            # Records read from the device, waiting to be histogrammed
+            self._t3buffer = RecordRingBuffer(T3BUFFER_SIZE)
+        else:
+            self.Initialise(MODE_HIST)
         self._swVersion = self.GetLibraryVersion()
         self._metadata[model.MD_SW_VERSION] = self._swVersion
         mod, partnum, ver = self.GetHardwareInfo()
@@ -255,7 +277,10 @@ class PH300(model.Detector):
 
         # Indicate first dim is time and second dim is (useless) X (in reversed order)
         self._metadata[model.MD_DIMS] = "XT"
-        self._shape = (HISTCHAN, 1, 2**16) # Histogram is 32 bits, but only return 16 bits info
+        if streaming:
+            self._shape = (T3HISTCHAN, 1, 2**16)
+        else:
+            self._shape = (HISTCHAN, 1, 2**16) # Histogram is 32 bits, but only return 16 bits info
 
         # Set the CFD parameters (in mV)
         for i, (dv, zc) in enumerate(zip(disc_volt, zero_cross)):
@@ -496,6 +521,14 @@ class PH300(model.Detector):
         self._dll.PH_GetHistogram(self._idx, buf_ct, block)
         return buf
 
+    def GetFlags(self):
+        """
+        return (int): the status flags of the device (FLAG_*)
+        """
+        flags = c_int()
+        self._dll.PH_GetFlags(self._idx, byref(flags))
+        return flags.value
+
     def GetElapsedMeasTime(self):
         """
         return 0<=float: time since the measurement started (in s)
@@ -633,6 +666,10 @@ class PH300(model.Detector):
                 # Wait until we have a start (or terminate) message
                 self._acq_wait_start()
 
+                if self._streaming:
+                    self._acquire_stream()
+                    continue
+
                 # Keep acquiring
                 while True:
                     tacq = self.dwellTime.value
@@ -697,6 +734,108 @@ class PH300(model.Detector):
 
         logging.debug("Acquisition thread ended")
 
+    def _acquire_stream(self):
+        """
+        Acquires in streaming mode, until the acquisition is stopped for more
+          than STREAM_LINGER. The records are read by a separate thread, and
+          converted to histograms here.
+        raise StopIteration: if a terminate message was received
+        """
+        syncrate = self.GetCountRate(0)
+        if syncrate <= 0:
+            # Report the failure, and wait for the sync signal, as long as the
+            # acquisition is not stopped
+            logging.error("No sync signal received, cannot acquire in streaming mode")
+            self.state._set_value(HwError("No sync signal received, check the laser is on"),
+                                  force_write=True)
+            while syncrate <= 0:
+                if self._acq_should_stop(SYNC_CHECK_PERIOD):
+                    logging.debug("Acquisition stopped")
+                    return
+                syncrate = self.GetCountRate(0)
+            logging.info("Sync signal received again")
+            self.state._set_value(model.ST_RUNNING, force_write=True)
+
+        must_stop = threading.Event()
+        reader = threading.Thread(target=self._read_fifo, args=(must_stop,),
+                                  name="PicoHarp300 FIFO reader")
+        self._t3buffer.clear()
+        logging.debug("Starting new streaming acquisition with sync at %g Hz", syncrate)
+        self.StartMeas(ACQTMAX)
+        reader.start()
+        try:
+            active = True
+            tstop = None
+            histogrammer = None
+            while True:
+                try:
+                    msg = self._get_acq_msg(block=False)
+                except Queue.Empty:
+                    msg = None
+                if msg == "T":
+                    raise StopIteration()
+                elif msg == "E":
+                    active = False
+                    tstop = time.time()
+                elif msg == "S":
+                    # Restart the histograms from now on
+                    active = True
+                    histogrammer = None
+                    self._t3buffer.clear()
+
+                if not active and time.time() > tstop + STREAM_LINGER:
+                    logging.debug("Acquisition stopped")
+                    return
+                if self.CTCStatus():
+                    logging.info("Measurement ended after %g s, will restart it",
+                                 self.GetElapsedMeasTime())
+                    if active:
+                        self._genmsg.put("S")
+                    return
+
+                records = self._t3buffer.get(timeout=10e-3)
+                if not active or records.size == 0:
+                    continue
+
+                if histogrammer is None or self.dwellTime.value != tacq:
+                    tacq = self.dwellTime.value
+                    period = max(1, int(round(tacq * syncrate)))
+                    histogrammer = T3Histogrammer(period, T3HISTCHAN)
+                    tstart = time.time()
+                    nhist = 0
+                    md = self._metadata.copy()
+                    md[model.MD_DWELL_TIME] = period / syncrate
+
+                for h in histogrammer.add(records):
+                    hmd = md.copy()
+                    hmd[model.MD_ACQ_DATE] = tstart + nhist * period / syncrate
+                    nhist += 1
+                    self.data.notify(model.DataArray(h.reshape(1, -1), hmd))
+        finally:
+            must_stop.set()
+            reader.join(5)
+            self.StopMeas()
+
+    def _read_fifo(self, must_stop):
+        """
+        Continuously reads the records from the device, and stores them in the
+          buffer. Runs in its own thread, during the streaming acquisition.
+        must_stop (threading.Event): set when the reading should stop
+        """
+        try:
+            while not must_stop.is_set():
+                records = self.ReadFiFo(TTREADMAX - 1)
+                if records.size:
+                    if not self._t3buffer.put(records):
+                        logging.error("T3 buffer full, dropped %d records", records.size)
+                if records.size < TTREADMAX // 16:
+                    # Not much data => give time for more to come
+                    if self.GetFlags() & FLAG_FIFOFULL:
+                        logging.error("FIFO of the device overrun, some records are lost")
+                    time.sleep(1e-3)
+        except Exception:
+            logging.exception("Failure while reading the FIFO")
+
     @classmethod
     def scan(cls):
         """
@@ -721,6 +860,126 @@ class PH300(model.Detector):
         return dev
 
 
+class RecordRingBuffer(object):
+    """
+    Fixed-size FIFO of T3 records, to pass the records between the thread
+      reading the device and the thread computing the histograms.
+    It is thread-safe.
+    """
+
+    def __init__(self, size):
+        """
+        size (0<int): maximum number of records stored
+        """
+        self._buf = numpy.empty(size, dtype=numpy.uint32)
+        self._start = 0  # position of the first record
+        self._count = 0  # number of records stored
+        self._cond = threading.Condition()
+
+    def put(self, records):
+        """
+        Append records at the end of the buffer
+        records (ndarray of uint32): the records to add
+        return (bool): True if the records were added, False if there was not
+          enough space (and then nothing was added)
+        """
+        size = self._buf.size
+        n = records.size
+        with self._cond:
+            if self._count + n > size:
+                return False
+            end = (self._start + self._count) % size
+            # Copy in two parts if it wraps around
+            n1 = min(n, size - end)
+            self._buf[end:end + n1] = records[:n1]
+            self._buf[:n - n1] = records[n1:]
+            self._count += n
+            self._cond.notify()
+        return True
+
+    def get(self, timeout=None):
+        """
+        Take all the records stored
+        timeout (None or 0<float): maximum time to wait for records (in s)
+        return (ndarray of uint32): the records, in the order they were added.
+          It's empty if no record arrived before the timeout.
+        """
+        size = self._buf.size
+        with self._cond:
+            if self._count == 0:
+                self._cond.wait(timeout)
+            n1 = min(self._count, size - self._start)
+            records = numpy.concatenate((self._buf[self._start:self._start + n1],
+                                         self._buf[:self._count - n1]))
+            self._start = (self._start + self._count) % size
+            self._count = 0
+        return records
+
+    def clear(self):
+        """
+        Discard all the records stored
+        """
+        with self._cond:
+            self._start = 0
+            self._count = 0
+
+
+class T3Histogrammer(object):
+    """
+    Converts a stream of T3 records into histograms of the start-stop times of
+      the photons, one histogram per period of a fixed number of sync pulses.
+    """
+
+    def __init__(self, period, nchan):
+        """
+        period (0<int): number of sync pulses of each histogram
+        nchan (0<int): number of bins of the histogram
+        """
+        self.period = period
+        self.nchan = nchan
+        self._noverflows = 0  # number of sync counter overflows so far
+        self._start = None  # sync count of the beginning of the current period
+        self._hist = numpy.zeros(nchan, dtype=numpy.uint32)  # current histogram
+
+    def add(self, records):
+        """
+        Add records to the histograms
+        records (ndarray of uint32): the T3 records, in the order received
+        return (list of ndarrays of uint32 of shape nchan): the histograms of
+          the periods which are complete, in chronological order
+        """
+        if records.size == 0:
+            return []
+
+        # Each record is: channel (4 bits) | start-stop time (12 bits) | sync count (16 bits)
+        chan = records >> 28
+        dtime = (records >> 16) & 0xfff
+        special = (chan == 0xf)
+        # Special records with marker 0 indicate an overflow of the sync counter
+        overflow = special & ((dtime & 0xf) == 0)
+        noverflows = numpy.cumsum(overflow, dtype=numpy.int64) + self._noverflows
+        syncs = noverflows * T3WRAPAROUND + (records & 0xffff)
+        self._noverflows = int(noverflows[-1])
+        if self._start is None:
+            self._start = int(syncs[0])
+
+        # Index of the period of each photon, relative to the current period
+        photons = ~special
+        pidx = (syncs[photons] - self._start) // self.period
+        pdtime = numpy.minimum(dtime[photons], self.nchan - 1)
+        ncomplete = int((syncs[-1] - self._start) // self.period)
+
+        # Compute all the histograms in one go
+        hists = numpy.bincount(pidx * self.nchan + pdtime,
+                               minlength=(ncomplete + 1) * self.nchan)
+        hists = hists.astype(numpy.uint32).reshape(ncomplete + 1, self.nchan)
+        hists[0] += self._hist
+
+        self._hist = hists[ncomplete].copy()
+        self._start += ncomplete * self.period
+        return list(hists[:ncomplete])
+
+
 class PH300RawDetector(model.Detector):
     """
     Represents a raw detector (eg, APD) accessed via PicoQuant PicoHarp 300.
@@ -840,6 +1099,12 @@ class FakePHDLL(object):
         self._acq_end = None
         self._last_acq_dur = None  # s
 
+        # For the T3 mode
+        self._sync_rate = 40e6  # Hz
+        self._photon_rate = 20e3  # photons/s
+        self._fifo = numpy.empty((0,), dtype=numpy.uint32)  # records not yet read
+        self._last_read = None  # time of the last records generated
+
     def PH_OpenDevice(self, i, sn_str):
         if i == self._idx:
             sn_str.value = self._sn
@@ -868,7 +1133,10 @@ class FakePHDLL(object):
 
     def PH_GetCountRate(self, i, channel, p_rate):
         rate = _deref(p_rate, c_int)
-        rate.value = random.randint(0, 5000)
+        if self._mode == MODE_T3 and _val(channel) == 0:
+            rate.value = int(self._sync_rate)
+        else:
+            rate.value = random.randint(0, 5000)
 
     def PH_GetBaseResolution(self, i, p_resolution, p_binsteps):
         resolution = _deref(p_resolution, c_double)
@@ -909,6 +1177,8 @@ class FakePHDLL(object):
             raise PHError(-16, PHDLL.err_code[-16])
         self._acq_start = time.time()
         self._acq_end = self._acq_start + _val(tacq) * 1e-3
+        self._fifo = numpy.empty((0,), dtype=numpy.uint32)
+        self._last_read = self._acq_start
 
     def PH_StopMeas(self, i):
         if self._acq_start is not None:
@@ -923,6 +1193,57 @@ class FakePHDLL(object):
         else:
             ctcstatus.value = 1
 
+    def PH_GetFlags(self, i, p_flags):
+        flags = _deref(p_flags, c_int)
+        flags.value = 0
+
+    def _generate_t3_records(self, t0, t1):
+        """
+        Simulates the photons received between two times of the acquisition
+        t0, t1 (float): times since the beginning of the acquisition (in s)
+        return (ndarray of uint32): the T3 records, including the overflows
+        """
+        s0 = int(t0 * self._sync_rate)
+        s1 = int(t1 * self._sync_rate)
+        nphotons = numpy.random.poisson(self._photon_rate * (t1 - t0))
+        psyncs = numpy.random.randint(s0, max(s0 + 1, s1), nphotons).astype(numpy.int64)
+        # Exponential decay, of ~ 1 ns
+        dtime = numpy.random.exponential(1000 / (self._base_res * 2 ** self._bins), nphotons)
+        dtime = numpy.minimum(dtime, T3HISTCHAN - 1).astype(numpy.uint32)
+
+        first_ovf = max(1, int(math.ceil(s0 / T3WRAPAROUND))) * T3WRAPAROUND
+        osyncs = numpy.arange(first_ovf, s1, T3WRAPAROUND, dtype=numpy.int64)
+
+        # Channel 1 for the photons, special channel 15 with marker 0 for the overflows
+        precs = ((1 << 28) | (dtime << 16) | (psyncs % T3WRAPAROUND)).astype(numpy.uint32)
+        orecs = numpy.empty(osyncs.shape, dtype=numpy.uint32)
+        orecs[:] = 0xf << 28
+
+        # Sort by time, with the overflow placed before the photons of the same sync
+        syncs = numpy.concatenate((osyncs * 2, psyncs * 2 + 1))
+        records = numpy.concatenate((orecs, precs))
+        return records[numpy.argsort(syncs, kind="mergesort")]
+
+    def PH_ReadFiFo(self, i, p_buffer, count, p_nactual):
+        nactual = _deref(p_nactual, c_int)
+        count = _val(count)
+        if self._mode not in (MODE_T2, MODE_T3):
+            raise PHError(-18, PHDLL.err_code[-18])  # ERROR_INVALID_MODE
+
+        if self._acq_start is not None and self._fifo.size < count:
+            now = min(time.time(), self._acq_end)
+            records = self._generate_t3_records(self._last_read - self._acq_start,
+                                                now - self._acq_start)
+            self._last_read = now
+            self._fifo = numpy.concatenate((self._fifo, records))
+
+        n = min(count, self._fifo.size)
+        p = cast(p_buffer, POINTER(c_uint32))
+        ndbuffer = numpy.ctypeslib.as_array(p, (count,))
+        ndbuffer[:n] = self._fifo[:n]
+        self._fifo = self._fifo[n:]
+        nactual.value = n
+
     def PH_GetElapsedMeasTime(self, i, p_elapsed):
         elapsed = _deref(p_elapsed, c_double)
         if self._acq_start is None:
@@ -110,6 +110,9 @@ NI_AO_TRIG_AI_START1 = 19  # Trigger number for AI Start1 (= beginning of a comm
 ACQ_CMD_UPD = 1
 ACQ_CMD_TERM = 2
 
+# Number of scan arrays (ie, scanning settings) kept by the Scanner
+SCAN_ARRAY_CACHE_SIZE = 8
+
 # helper functions
 def get_best_dtype_for_acc(idtype, count):
     """
@@ -1082,38 +1085,51 @@ class SEMComedi(model.HwComponent):
     def _write_read_2d_pixel(self, wchannels, wranges, rchannels, rranges,
                              period, margin, osr, dpr, data):
         """
-        Implementation of write_read_2d_data_raw by reading the input data one
-          pixel at a time.
+        Implementation of write_read_2d_data_raw by reading the input data a
+          few pixels at a time (as many as fit in the buffer), each pixel
+          being written dpr times.
         """
+        nrchans = len(rchannels)
         rshape = (data.shape[0], data.shape[1] - margin)
 
         # allocate one full buffer per channel
         buf = []
         for c in rchannels:
             buf.append(numpy.empty(rshape, dtype=self._reader.dtype))
-        adtype = get_best_dtype_for_acc(self._reader.dtype, osr)
+        adtype = get_best_dtype_for_acc(self._reader.dtype, osr * dpr)
+
+        if self._scanner.newPosition.hasListeners():
+            # One pixel per command, so that each new position is notified
+            # precisely, at the beginning of the command.
+            maxpx = 1
+        else:
+            pixelsz = nrchans * osr * dpr * self._reader.dtype.itemsize
+            maxpx = max(1, self._max_bufsz // pixelsz)
 
         # TODO: as we do point per point, we could do the margin (=settle time)
         # shorter than a standard point
-        logging.debug("Reading one pixel at a time: %d samples/read every %g µs",
-                      dpr * osr * len(rchannels), period * 1e6)
-        wdata = numpy.empty((dpr, data.shape[2]), dtype=data.dtype) # just one pixel
-        # read one pixel at a time
-        for x, y in numpy.ndindex(data.shape[0], data.shape[1]):
-            wdata[:] = data[x, y, :] # copy the same pixel data * dpr
-            if y < margin:
-                ss = dpr
-            else:
-                ss = 0
-            islast = ((x + 1, y + 1) == data.shape)
-            rbuf = self._write_read_raw_one_cmd(wchannels, wranges, rchannels,
-                                    rranges, period / dpr, osr, wdata, ss,
-                                    rest=(islast and self._scanner.fast_park))
+        logging.debug("Reading up to %d pixels at a time: %d samples/pixel every %g µs",
+                      maxpx, dpr * osr * nrchans, period * 1e6)
+        for x in range(data.shape[0]):
+            y = 0
+            while y < data.shape[1]:
+                n = min(data.shape[1] - y, maxpx)
+                # duplicate each pixel dpr times
+                wdata = numpy.repeat(data[x, y:y + n, :], dpr, axis=0)
+                # the margin pixels are at the beginning of the line
+                ss = max(0, min(margin - y, n)) * dpr
+                islast = (x + 1 == data.shape[0] and y + n == data.shape[1])
+                rbuf = self._write_read_raw_one_cmd(wchannels, wranges, rchannels,
+                                        rranges, period / dpr, osr, wdata, ss,
+                                        rest=(islast and self._scanner.fast_park),
+                                        dpr=dpr)
+
+                # decimate into each buffer
+                for i, b in enumerate(buf):
+                    self._scan_raw_to_pixels(margin, osr * dpr, x, y,
+                                             rbuf[..., i], b, adtype)
+                y += n
 
-            # decimate into each buffer
-            for i, b in enumerate(buf):
-                self._scan_raw_to_pixel(rshape, margin, osr, dpr, x, y,
-                                        rbuf[..., i], b, adtype)
         return buf
 
     def _write_read_2d_subpixel(self, wchannels, wranges, rchannels, rranges,
@@ -1131,53 +1147,68 @@ class SEMComedi(model.HwComponent):
             buf.append(numpy.empty(rshape, dtype=self._reader.dtype))
         adtype = get_best_dtype_for_acc(self._reader.dtype, osr * dpr)
 
-        # even one pixel at a time is too big => cut in several scans
-        # Note: we could optimize slightly more by grouping dpr up to max_dpr
-        # but would make the code more complex and anyway it's already huge
-        # acquisitions.
+        # even one pixel at a time is too big => cut in several scans, each of
+        # them with as many duplications of the pixel as fit in the buffer.
+        maxd = max(1, self._max_bufsz // (nrchans * osr * self._reader.dtype.itemsize))
         logging.debug("Reading one sub-pixel at a time: %d samples/read every %g µs",
-                      osr * nrchans, (period / dpr) * 1e6)
-        px_rbuf = numpy.empty((dpr, nrchans), dtype=adtype) # intermediary sum for mean
+                      min(maxd, dpr) * osr * nrchans, (period / dpr) * 1e6)
+        px_acc = numpy.empty(nrchans, dtype=adtype) # intermediary sum for mean
         for x, y in numpy.ndindex(data.shape[0], data.shape[1]):
-            if y < margin:
-                ss = 1
-            else:
-                ss = 0
-            wdata = data[x, y].reshape(1, data.shape[2]) # add a "time" dimension == 1
-            for d in range(dpr):
-                islast = ((x + 1, y + 1, d + 1) == data.shape + (dpr,))
+            px_acc[:] = 0
+            d = 0
+            while d < dpr:
+                n = min(dpr - d, maxd)
+                wdata = numpy.repeat(data[x, y:y + 1, :], n, axis=0)
+                if y < margin or d > 0:
+                    # Margin, or same position as the previous command
+                    # => no newPosition
+                    ss = n
+                else:
+                    ss = 0
+                islast = ((x + 1, y + 1) == data.shape[:2] and d + n == dpr)
                 rbuf = self._write_read_raw_one_cmd(wchannels, wranges, rchannels,
                                         rranges, period / dpr, osr, wdata, ss,
-                                        rest=(islast and self._scanner.fast_park))
-                # decimate into intermediary buffer
-                px_rbuf[d] = numpy.sum(rbuf, axis=0, dtype=adtype)
+                                        rest=(islast and self._scanner.fast_park),
+                                        dpr=n)
+                # accumulate into intermediary buffer
+                px_acc += umath.add.reduce(rbuf, axis=0, dtype=adtype)
+                d += n
 
-            # decimate into each buffer
-            for i, b in enumerate(buf):
-                self._scan_raw_to_pixel(rshape, margin, osr, dpr, x, y,
-                                        px_rbuf[..., i], b, adtype)
+            if y >= margin:
+                for i, b in enumerate(buf):
+                    b[x, y - margin] = px_acc[i] / (osr * dpr)
 
         return buf
 
     @staticmethod
-    def _scan_raw_to_pixel(shape, margin, osr, dpr, x, y, data, oarray, adtype):
+    def _scan_raw_to_pixels(margin, spp, x, y, data, oarray, adtype):
         """
-        Converts acquired data for one pixel resulting into the pixel for the a 2D array
-        shape (2-tuple int): H,W dimension of the scanned image (margin not included)
+        Converts the data acquired for consecutive pixels of a line into the
+          pixels of a 2D array (averaging all the samples of each pixel)
         margin (int): amount of useless pixels at the beginning of each line
-        osr (int): over-sampling rate
-        dpr (int): duplication rate
-        x (int): x position of the pixel in the input array
-        y (int): y position of the pixel in the input array
-        data (1D ndarray): the raw data (including oversampling), of one channel
-        oarray (2D ndarray): the output array, already allocated, of shape self.shape
+        spp (int): number of samples per pixel (ie, osr * dpr)
+        x (int): line of the pixels in the input array
+        y (int): position in the line of the first pixel of the input array
+          (margin included)
+        data (1D ndarray): the raw data (including oversampling and duplication),
+          of one channel
+        oarray (2D ndarray): the output array, already allocated
+        adtype (dtype): intermediary type to use for the accumulator
         """
-        if y < margin:
+        px = data.reshape(-1, spp)
+        # skip the pixels of the margin
+        skip = max(0, margin - y)
+        px = px[skip:]
+        if px.shape[0] == 0:
             return
-        oarray[x, y - margin] = numpy.sum(data, dtype=adtype) / (osr * dpr)
+        start = y + skip - margin
+        acc = umath.add.reduce(px, axis=1, dtype=adtype)
+        umath.true_divide(acc, spp, out=oarray[x, start:start + px.shape[0]],
+                          casting='unsafe', subok=False)
 
     def _fake_write_read_raw_one_cmd(self, wchannels, wranges, rchannels, rranges,
-                                     period, osr, data, settling_samples, rest=False):
+                                     period, osr, data, settling_samples, rest=False,
+                                     dpr=1):
         """
         Imitates _write_read_raw_one_cmd() but works with the comedi_test driver,
           just read data.
@@ -1225,19 +1256,19 @@ class SEMComedi(model.HwComponent):
                     stop_arg=nrscans)
         start = time.time()
 
-        np_to_report = nwscans - settling_samples
+        np_to_report = (nwscans - settling_samples) // dpr
         shift_report = settling_samples
         if settling_samples == 0:  # indicate a new ebeam position
             self._scanner.newPosition.notify()
             np_to_report -= 1
-            shift_report += 1
+            shift_report += dpr
 
         # run the commands
         self._reader.run()
         self._writer.run()
         self._start_new_position_notifier(np_to_report,
                                           start + shift_report * period,
-                                          period)
+                                          period * dpr)
 
         timeout = expected_time * 1.10 + 0.1 # s   == expected time + 10% + 0.1s
         logging.debug("Waiting %g s for the acquisition to finish", timeout)
@@ -1251,7 +1282,8 @@ class SEMComedi(model.HwComponent):
         return rbuf
 
     def _write_read_raw_one_cmd(self, wchannels, wranges, rchannels, rranges,
-                                period, osr, data, settling_samples, rest=False):
+                                period, osr, data, settling_samples, rest=False,
+                                dpr=1):
         """
         write data on the given analog output channels and read synchronously
           on the given analog input channels in one command
@@ -1268,6 +1300,8 @@ class SEMComedi(model.HwComponent):
         settling_samples (int): number of first write samples used for the
           settling of the beam, and so don't need to trigger newPosition
         rest (boolean): if True, will add one more write to set to rest position
+        dpr (1 <= int): number of consecutive write samples at the same position.
+          newPosition is only triggered once for all of them.
         return (2D numpy.array with dtype=device type)
             the raw data read (first dimension is data.shape[0] * osr) for each
             channel (as second dimension).
@@ -1340,20 +1374,20 @@ class SEMComedi(model.HwComponent):
         comedi.internal_trigger(self._device, self._ai_subdevice, 0)
         start = time.time()
 
-        np_to_report = nwscans - settling_samples
+        np_to_report = (nwscans - settling_samples) // dpr
         shift_report = settling_samples
         if settling_samples == 0:
             # no margin => indicate a new ebeam position right now
             self._scanner.newPosition.notify()
             np_to_report -= 1
-            shift_report += 1
+            shift_report += dpr
 
         self._reader.run()
         if nwscans != 1:
             self._writer.run()
         self._start_new_position_notifier(np_to_report,
                                           start + shift_report * period,
-                                          period)
+                                          period * dpr)
 
         timeout = expected_time * 1.10 + 0.1 # s   == expected time + 10% + 0.1s
         logging.debug("Waiting %g s for the acquisition to finish", timeout)
@@ -2784,9 +2818,20 @@ class Scanner(model.Emitter):
         # the beam settling time or when put to rest.
         self.newPosition = model.Event()
 
-        self._prev_settings = [None, None, None, None] # resolution, scale, translation, margin
+        # LRU cache of the scan arrays:
+        # (resolution, scale, translation, margin) -> (array, ranges)
+        self._scan_cache = collections.OrderedDict()
+        # Spot pattern: translation -> index, raw positions, ranges
+        self._spot_pattern = None
         self._scan_array = None # last scan array computed
 
+        # list of (float, float) in px (same as translation): if not empty, the
+        # e-beam goes to each of these positions, one after another, instead of
+        # scanning the area defined by resolution, scale and translation. The
+        # data is then of shape 1 x N (N = number of positions). Combined with
+        # newPosition, it allows to synchronise another detector on each spot.
+        self.scanPath = model.ListVA([], unit="px", setter=self._setScanPath)
+
     def terminate(self):
         if self._scanning_mng:
             self.indicate_scan_state(False)
@@ -3118,18 +3163,85 @@ class Scanner(model.Emitter):
         # being exposed twice more than the others.
         margin = int(math.ceil(st / dwell_time - 0.01))
 
-        new_settings = [resolution, scale, translation, margin]
-        if self._prev_settings != new_settings:
+        if self.scanPath.value:
+            # Scan each position of the path, one after another
+            idx, rpos, ranges = self._spot_pattern
+            shape = (1, rpos.shape[0])
+            return (rpos.reshape(shape + (2,)), dwell_time, shape, 0,
+                    self._channels, ranges, osr, dpr)
+
+        if resolution == (1, 1) and margin == 0 and self._spot_pattern:
+            # If the spot is part of the pattern, it's just a slice of it
+            idx, rpos, ranges = self._spot_pattern
+            i = idx.get(tuple(translation))
+            if i is not None:
+                return (rpos[i], dwell_time, resolution[::-1],
+                        margin, self._channels, ranges, osr, dpr)
+
+        key = (tuple(resolution), tuple(scale), tuple(translation), margin)
+        try:
+            self._scan_array, self._ranges = self._scan_cache.pop(key)
+        except KeyError:
             # TODO: if only margin changes, just duplicate the margin columns
             # need to recompute the scanning array
             self._update_raw_scan_array(resolution[::-1], scale[::-1],
                                         translation[::-1], margin)
-
-            self._prev_settings = new_settings
+            # Protect the cached array from being modified by the callers
+            self._scan_array.flags.writeable = False
+            if len(self._scan_cache) >= SCAN_ARRAY_CACHE_SIZE:
+                self._scan_cache.popitem(last=False)  # drop the least recently used
+        self._scan_cache[key] = (self._scan_array, self._ranges)
 
         return (self._scan_array, dwell_time, resolution[::-1],
                 margin, self._channels, self._ranges, osr, dpr)
 
+    def _setScanPath(self, value):
+        # Convert all the positions now, so that the scan can start immediately
+        self.set_spot_pattern(value)
+        return value
+
+    def set_spot_pattern(self, positions):
+        """
+        Precompute the raw values of a list of spots, so that scanning them one
+          at a time (ie, with a resolution of 1x1 and the translation set to
+          each spot) doesn't need to compute any scan array. All the spots are
+          converted at once, and use the same ranges.
+        positions (None or list or array of 2 floats): the translation (X/Y, in px,
+          as .translation) of each spot. If None, the current pattern is removed.
+        raises ValueError: if a spot is outside of the scanning area
+        Note: it's not thread-safe with get_scan_data().
+        """
+        if positions is None or len(positions) == 0:
+            self._spot_pattern = None
+            return
+
+        trans = numpy.array(positions, dtype=numpy.double)[:, ::-1]  # Y/X
+        # Same computation as _update_raw_scan_array(), for a 1x1 shape: the
+        # position is only defined by the translation.
+        area_shape = self._shape[::-1]
+        volts = numpy.empty(trans.shape, dtype=numpy.double)
+        ranges = []
+        for i, lim in enumerate(self._limits):
+            center = (lim[0] + lim[1]) / 2
+            pxv = (lim[1] - lim[0]) / area_shape[i]  # V/px
+            volts[:, i] = center + trans[:, i] * pxv
+            vmin, vmax = volts[:, i].min(), volts[:, i].max()
+            if vmin < min(lim) or vmax > max(lim):
+                raise ValueError("Spot pattern goes outside of the scanning area")
+            ranges.append(comedi.find_range(self.parent._device,
+                                            self.parent._ao_subdevice,
+                                            self._channels[i], comedi.UNIT_volt,
+                                            vmin, vmax))
+
+        # Each spot is a scan array of shape 1x1 (x2 channels)
+        rpos = self.parent._array_from_phys(self.parent._ao_subdevice,
+                                            self._channels, ranges, volts)
+        rpos.shape = (len(positions), 1, 1, 2)
+        rpos.flags.writeable = False
+        idx = {tuple(p): i for i, p in enumerate(positions)}
+        logging.debug("Computed spot pattern of %d positions", len(idx))
+        self._spot_pattern = (idx, rpos, ranges)
+
     def _update_raw_scan_array(self, shape, scale, translation, margin):
         """
         Update the raw array of values to send to scan the 2D area.
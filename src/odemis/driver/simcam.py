@@ -277,6 +277,7 @@ class SimpleDataFlow(model.DataFlow):
     def synchronizedOn(self, event):
         if self._sync_event == event:
             return
+        prev_event = self._sync_event
         if self._sync_event:
             self._sync_event.unsubscribe(self)
             if not event:
@@ -285,7 +286,10 @@ class SimpleDataFlow(model.DataFlow):
         self._sync_event = event
         if self._sync_event:
             event.subscribe(self)
-            self._evtq = Queue.Queue()  # to be sure it's empty
+            # If it was already synchronised, the acquisition might be waiting
+            # on the queue, so keep the same one.
+            if not prev_event:
+                self._evtq = Queue.Queue()  # to be sure it's empty
 
     @oneway
     def onEvent(self):
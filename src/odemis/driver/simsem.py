@@ -199,6 +199,16 @@ class Scanner(model.Emitter):
 
         self.dwellTime = model.FloatContinuous(1e-06, (1e-06, 1000), unit="s")
 
+        # list of (float, float) in px (same as translation): if not empty, the
+        # e-beam goes to each of these positions, one after another, instead of
+        # scanning the area defined by resolution, scale and translation. The
+        # data is then of shape 1 x N (N = number of positions).
+        self.scanPath = model.ListVA([], unit="px", setter=self._setScanPath)
+
+        # event to allow another component to synchronize on the beginning of
+        # a pixel position. Only sent when scanning a scanPath.
+        self.newPosition = model.Event()
+
         # VAs to control the ebeam, purely fake
         self.probeCurrent = model.FloatEnumerated(1.3e-9,
                           {0.1e-9, 1.3e-9, 2.6e-9, 3.4e-9, 11.564e-9, 23e-9},
@@ -306,6 +316,18 @@ class Scanner(model.Emitter):
                 max(min(value[1], max_tran[1]), -max_tran[1]))
         return tran
 
+    def _setScanPath(self, value):
+        """
+        value (list of (float, float)): positions to scan (as translation)
+        returns the value accepted
+        raises ValueError: if a position is outside of the scanning area
+        """
+        hs = (self._shape[0] / 2, self._shape[1] / 2)
+        for p in value:
+            if not (-hs[0] <= p[0] <= hs[0] and -hs[1] <= p[1] <= hs[1]):
+                raise ValueError("Position %s is outside of the scanning area" % (p,))
+        return value
+
     def pixelToPhy(self, px_pos):
         """
         Converts a position in pixels to physical (at the current magnification)
@@ -440,6 +462,7 @@ class Detector(model.Detector):
             scale = scanner.scale.value
             res = scanner.resolution.value
             shi = scanner.shift.value
+            path = scanner.scanPath.value
 
             phy_pos = metadata.get(model.MD_POS, (0, 0))
             trans = scanner.pixelToPhy(pxs_pos)
@@ -450,13 +473,22 @@ class Detector(model.Detector):
             center = (shape[1] / 2 - shi[0] / pxs[0] - self.current_drift,
                       shape[0] / 2 - shi[1] / pxs[1] + self.current_drift)
 
-            lt = (center[0] + pxs_pos[0] - (res[0] / 2) * scale[0],
-                  center[1] + pxs_pos[1] - (res[1] / 2) * scale[1])
-            assert(lt[0] >= 0 and lt[1] >= 0)
-            # compute each row and column that will be included
-            coord = ([int(round(lt[0] + i * scale[0])) for i in range(res[0])],
-                     [int(round(lt[1] + i * scale[1])) for i in range(res[1])])
-            sim_img = self.fake_img[numpy.ix_(coord[1], coord[0])] # copy
+            if path:
+                # One point per position, as a 1 x N image
+                ppos = numpy.array(path, dtype=numpy.double)
+                px = numpy.round(center[0] + ppos[:, 0] - 0.5).astype(numpy.int)
+                py = numpy.round(center[1] + ppos[:, 1] - 0.5).astype(numpy.int)
+                px = numpy.clip(px, 0, shape[1] - 1)
+                py = numpy.clip(py, 0, shape[0] - 1)
+                sim_img = self.fake_img[py, px].reshape(1, len(path))  # copy
+            else:
+                lt = (center[0] + pxs_pos[0] - (res[0] / 2) * scale[0],
+                      center[1] + pxs_pos[1] - (res[1] / 2) * scale[1])
+                assert(lt[0] >= 0 and lt[1] >= 0)
+                # compute each row and column that will be included
+                coord = ([int(round(lt[0] + i * scale[0])) for i in range(res[0])],
+                         [int(round(lt[1] + i * scale[1])) for i in range(res[1])])
+                sim_img = self.fake_img[numpy.ix_(coord[1], coord[0])] # copy
 
             # reduce image depth if requested
             bpp = self.bpp.value
@@ -495,12 +527,23 @@ class Detector(model.Detector):
         the Dataflow.
         """
         try:
+            scanner = self.parent._scanner
             while not self._acquisition_must_stop.is_set():
-                dwelltime = self.parent._scanner.dwellTime.value
-                resolution = self.parent._scanner.resolution.value
-                duration = numpy.prod(resolution) * dwelltime
-                if self._acquisition_must_stop.wait(duration):
-                    break
+                dwelltime = scanner.dwellTime.value
+                npos = len(scanner.scanPath.value)
+                if npos:
+                    # Go to each position, and let the other detectors know
+                    for i in range(npos):
+                        scanner.newPosition.notify()
+                        if self._acquisition_must_stop.wait(dwelltime):
+                            break
+                    if self._acquisition_must_stop.is_set():
+                        break
+                else:
+                    resolution = scanner.resolution.value
+                    duration = numpy.prod(resolution) * dwelltime
+                    if self._acquisition_must_stop.wait(duration):
+                        break
                 callback(self._simulate_image())
         except Exception:
             logging.exception("Unexpected failure during image acquisition")
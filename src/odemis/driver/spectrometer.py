@@ -20,10 +20,12 @@ You should have received a copy of the GNU General Public License along with
 Odemis. If not, see http://www.gnu.org/licenses/.
 '''
 from __future__ import division
+import fractions
 from odemis import model
 from odemis.model import ComponentBase, DataFlowBase
 import logging
 import math
+import numpy
 
 # This is a class that represents a spectrometer (ie, a detector to acquire
 # a spectrum) by wrapping a DigitalCamera and a spectrograph (ie, actuator which
@@ -52,12 +54,15 @@ class CompositedSpectrometer(model.Detector):
        wavelength associated to each pixel.
     '''
 
-    def __init__(self, name, role, children, **kwargs):
+    def __init__(self, name, role, children, band=None, **kwargs):
         '''
         children (dict string->model.HwComponent): the children
             There must be exactly two children "spectrograph" and "detector". The
             first dimension of the CCD is supposed to be along the wavelength,
             with the first pixels representing the lowest wavelengths.
+        band (None or (0<=int, 0<int)): the first and last+1 lines of the
+          sensor which receive the light (in px, from the top). The other lines
+          are discarded. If None, all the lines of the sensor are used.
         Raise:
           ValueError: if the children are not compatible
         '''
@@ -104,17 +109,26 @@ class CompositedSpectrometer(model.Detector):
 
         # The resolution and binning are derived from the detector, but with
         # settings set so that there is only one horizontal line.
-
-        # TODO: give a init parameter or VA to specify a smaller window height
-        # than the entire CCD (some spectrometers have only noise on the top and
-        # bottom)
-        if dt.binning.range[1][1] < dt.resolution.range[1][1]:
-            # without software binning, we are stuck to the max binning
-            # TODO: support software binning by rolling up our own dataflow that
-            # does data merging
-            logging.info("Spectrometer %s will only use a %d px band of the %d "
-                         "px of the sensor", name, dt.binning.range[1][1],
-                         dt.resolution.range[1][1])
+        # If the hardware cannot bin the lines into one (ie, the vertical
+        # binning is bigger than the maximum hardware binning, or only part of
+        # the sensor is used), the lines are summed in software, before sending
+        # the data.
+        self._sensor_height = dt.resolution.range[1][1]
+        self._max_hw_binning = dt.binning.range[1][1]
+        if band is None:
+            band = (0, self._sensor_height)
+        band = tuple(band)
+        if not 0 <= band[0] < band[1] <= self._sensor_height:
+            raise ValueError("band must be within 0 -> %d, but got %s" %
+                             (self._sensor_height, band))
+        self._band = band
+        if band != (0, self._sensor_height):
+            logging.info("Spectrometer %s will only use lines %d -> %d of the "
+                         "sensor", name, band[0], band[1])
+        if dt.binning.range[1][1] < band[1] - band[0]:
+            logging.info("Spectrometer %s can use software binning, as the "
+                         "maximum binning is only %d px for a %d px band",
+                         name, dt.binning.range[1][1], band[1] - band[0])
 
         assert dt.resolution.range[0][1] == 1
         resolution = (dt.resolution.range[1][0], 1)  # max,1
@@ -124,8 +138,12 @@ class CompositedSpectrometer(model.Detector):
                                              setter=self._setResolution)
         # 2D binning is like a "small resolution"
         # Initial binning is minimum binning horizontally, and maximum vertically
-        self._binning = (1, min(dt.binning.range[1][1], dt.resolution.range[1][1]))
-        self.binning = model.ResolutionVA(self._binning, dt.binning.range,
+        # (within the hardware binning, so that it's the same as without
+        # software binning)
+        # Vertically, up to the whole band can be binned (in software).
+        self._binning = (1, min(dt.binning.range[1][1], band[1] - band[0]))
+        max_binning = (dt.binning.range[1][0], band[1] - band[0])
+        self.binning = model.ResolutionVA(self._binning, (dt.binning.range[0], max_binning),
                                           setter=self._setBinning)
 
         self._setBinning(self._binning) # will also update the resolution
@@ -220,13 +238,64 @@ class CompositedSpectrometer(model.Detector):
         return size
 
     def _applyBinning(self, b):
-        self._detector.binning.value = b
-        if self._detector.binning.value != b:
-            logging.error("Hw binning didn't follow requested binning %s", b)
+        hw_b = (b[0], self._getHwBinningY())
+        self._detector.binning.value = hw_b
+        if self._detector.binning.value != hw_b:
+            logging.error("Hw binning didn't follow requested binning %s", hw_b)
+
+    def _isSwBinning(self):
+        """
+        return (bool): True if the lines are summed in software, with the
+          current binning
+        """
+        return (self._band != (0, self._sensor_height) or
+                self._binning[1] > self._max_hw_binning)
+
+    def _getBinnedLines(self):
+        """
+        return (0<=int, 0<int): the first and last+1 lines of the sensor which
+          are summed in software, with the current binning. They are in the
+          middle of the band.
+        """
+        by = self._binning[1]
+        top = self._band[0] + (self._band[1] - self._band[0] - by) // 2
+        return top, top + by
+
+    def _getHwBinningY(self):
+        """
+        return (0<int): vertical binning to use on the detector, with the
+          current binning. When the lines are summed in software, it's reduced
+          so that the binned lines start and end exactly at a (hardware binned)
+          line.
+        """
+        by = self._binning[1]
+        if not self._isSwBinning():
+            return by  # All done by the hardware binning
+
+        top, bottom = self._getBinnedLines()
+        # Biggest binning which divides the lines, and is supported
+        g = int(fractions.gcd(by, top))
+        for hw_by in range(min(g, self._max_hw_binning), 0, -1):
+            if g % hw_by == 0:
+                return hw_by
+
+    def _getNumberHwLines(self):
+        """
+        return (0<int): number of lines to acquire from the detector, with
+          the current binning
+        """
+        if not self._isSwBinning():
+            return 1  # All done by the hardware binning
+        else:
+            # All the (binned) lines of the sensor, the useful ones are selected later
+            return self._sensor_height // self._getHwBinningY()
 
     def _applyResolution(self, res):
-        self._detector.resolution.value = res
-        assert self._detector.resolution.value[1] == 1
+        nlines = self._getNumberHwLines()
+        self._detector.resolution.value = (res[0], nlines)
+        if self._detector.resolution.value[1] != nlines:
+            logging.warning("Hw resolution didn't follow requested resolution %s",
+                            (res[0], nlines))
 
     def _applyCCDSettings(self):
         self._applyBinning(self.binning.value)
@@ -236,6 +305,48 @@ class CompositedSpectrometer(model.Detector):
         return self._detector.selfTest() and self._spectrograph.selfTest()
 
 
+def binVertically(data, band):
+    """
+    Sums all the lines of a CCD frame which are within the given band, so
+      that it becomes a (flat) spectrum. This is the software equivalent of
+      the vertical binning.
+    data (DataArray of shape YX): the frame, with MD_BINNING in the metadata
+      if it was binned by the hardware.
+    band ((0<=int, 0<int)): the first and last+1 lines of the sensor to sum.
+      The frame is assumed to contain all the lines of the sensor.
+    return (DataArray of shape 1X): the sum of the lines. For integer data,
+      the type is extended to 32 bits (if needed) to avoid overflows, and
+      MD_BPP is increased to fit the sum.
+    raise ValueError: if the band doesn't start and end at a binned line, as
+      then the lines cannot be exactly the ones of the band.
+    """
+    md = data.metadata.copy()
+    binning = md.get(model.MD_BINNING, (1, 1))
+    if band[0] % binning[1] or band[1] % binning[1]:
+        raise ValueError("Band %s is not aligned with the vertical binning %d" %
+                         (band, binning[1]))
+    top = band[0] // binning[1]
+    bottom = band[1] // binning[1]
+    lines = data[top:bottom]
+    if lines.shape[0] == 0:
+        logging.warning("No line of the data of shape %s is within the band %s",
+                        data.shape, band)
+        lines = data
+
+    if data.dtype.kind in "ui" and data.dtype.itemsize < 4:
+        dtype = numpy.dtype(data.dtype.kind + "4")
+    else:
+        dtype = data.dtype
+    spec = numpy.sum(lines, axis=0, dtype=dtype, keepdims=True)
+
+    md[model.MD_BINNING] = (binning[0], binning[1] * lines.shape[0])
+    if model.MD_BPP in md and dtype.kind in "ui":
+        # Each doubling of the number of lines needs one more bit
+        bpp = md[model.MD_BPP] + int(math.ceil(math.log(lines.shape[0], 2)))
+        md[model.MD_BPP] = min(bpp, dtype.itemsize * 8)
+    return model.DataArray(spec, md)
+
+
 class SpecDataFlow(model.DataFlow):
     def __init__(self, comp, ccddf):
         """
@@ -273,8 +384,7 @@ class SpecDataFlow(model.DataFlow):
         Get the new frame from the detector
         """
         if data.shape[0] != 1:
-            logging.warning("Shape of spectrometer data is %s, while first dim should be 1", data.shape)
-            # TODO: do software binning (= sum/mean over the first axis)
+            data = binVertically(data, self.component._getBinnedLines())
 
         # Check the metadata seems correct, and if not, recompute it on-the-fly
         md = self._beg_metadata
@@ -22,6 +22,7 @@ from __future__ import division
 
 import copy
 import logging
+import numpy
 from odemis import model
 from odemis.driver import picoquant
 import os
@@ -69,6 +70,103 @@ class TestPH300Static(unittest.TestCase):
         wrong_config["device"] = "NOTAGOODSN"
         self.assertRaises(Exception, picoquant.PH300, **wrong_config)
 
+    def test_ring_buffer(self):
+        buf = picoquant.RecordRingBuffer(10)
+        self.assertEqual(buf.get(timeout=0.01).size, 0)
+        self.assertTrue(buf.put(numpy.arange(6, dtype=numpy.uint32)))
+        self.assertFalse(buf.put(numpy.arange(6, dtype=numpy.uint32)))
+        numpy.testing.assert_array_equal(buf.get(), range(6))
+        # Wraps around the end of the buffer
+        self.assertTrue(buf.put(numpy.arange(10, 18, dtype=numpy.uint32)))
+        numpy.testing.assert_array_equal(buf.get(), range(10, 18))
+        buf.put(numpy.arange(3, dtype=numpy.uint32))
+        buf.clear()
+        self.assertEqual(buf.get(timeout=0.01).size, 0)
+
+    def test_t3_histogrammer(self):
+        def photon(sync, dtime):
+            return (1 << 28) | (dtime << 16) | sync
+        overflow = 0xf << 28
+        marker = (0xf << 28) | (1 << 16)  # marker 1 => not an overflow
+
+        hister = picoquant.T3Histogrammer(1000, 16)
+        records = numpy.array([photon(0, 3), photon(10, 3), marker,
+                               photon(999, 5), photon(1000, 1)], dtype=numpy.uint32)
+        hists = hister.add(records)
+        self.assertEqual(len(hists), 1)
+        self.assertEqual(hists[0][3], 2)
+        self.assertEqual(hists[0][5], 1)
+        self.assertEqual(hists[0].sum(), 3)
+
+        # After an overflow, the sync counter restarts at 0
+        records = numpy.array([photon(1500, 2), overflow, photon(0, 4),
+                               photon(1, 4)], dtype=numpy.uint32)
+        hists = hister.add(records)
+        # periods until sync 65000 are complete, with all but the first empty
+        self.assertEqual(len(hists), 64)
+        self.assertEqual(hists[0][1], 1)
+        self.assertEqual(hists[0][2], 1)
+        self.assertEqual(sum(h.sum() for h in hists[1:]), 0)
+
+    def test_fake_streaming(self):
+        sim_config = copy.deepcopy(CONFIG_PH)
+        sim_config["device"] = "fake"
+        sim_config["streaming"] = True
+        dev = picoquant.PH300(**sim_config)
+        try:
+            self.assertEqual(dev.shape[0], picoquant.T3HISTCHAN)
+            dt = 0.01  # s
+            dev.dwellTime.value = dt
+            exp_shape = dev.shape[-2::-1]
+
+            self._cnt = 0
+            self._lastdata = None
+            dev.data.subscribe(self._on_det)
+            time.sleep(1)
+            dev.data.unsubscribe(self._on_det)
+            # Should be ~100, but with a lot of margin
+            self.assertGreater(self._cnt, 50)
+            self.assertEqual(self._lastdata.shape, exp_shape)
+            self.assertAlmostEqual(self._lastdata.metadata[model.MD_DWELL_TIME], dt)
+            self.assertGreater(self._lastdata.sum(), 0)
+
+            # Immediately ready again
+            data = dev.data.get()
+            self.assertEqual(data.shape, exp_shape)
+        finally:
+            dev.terminate()
+
+    def test_fake_streaming_no_sync(self):
+        sim_config = copy.deepcopy(CONFIG_PH)
+        sim_config["device"] = "fake"
+        sim_config["streaming"] = True
+        dev = picoquant.PH300(**sim_config)
+        try:
+            dev.dwellTime.value = 0.01  # s
+            sync_rate = dev._dll._sync_rate
+            dev._dll._sync_rate = 0
+
+            # No sync => the failure is reported
+            self._cnt = 0
+            self._lastdata = None
+            dev.data.subscribe(self._on_det)
+            time.sleep(0.5)
+            self.assertEqual(self._cnt, 0)
+            self.assertIsInstance(dev.state.value, model.HwError)
+
+            # The acquisition starts as soon as the sync signal is back
+            dev._dll._sync_rate = sync_rate
+            time.sleep(picoquant.SYNC_CHECK_PERIOD + 1)
+            dev.data.unsubscribe(self._on_det)
+            self.assertGreater(self._cnt, 0)
+            self.assertEqual(dev.state.value, model.ST_RUNNING)
+        finally:
+            dev.terminate()
+
+    def _on_det(self, df, data):
+        self._cnt += 1
+        self._lastdata = data
+
 
 class TestPH300(unittest.TestCase):
     """
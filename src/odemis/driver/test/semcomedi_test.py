@@ -20,36 +20,75 @@ Odemis. If not, see http://www.gnu.org/licenses/.
 '''
 from __future__ import division
 from odemis import model
-from odemis.driver import semcomedi
 import Pyro4
-import comedi
 import copy
 import logging
 import numpy
 import os
 import pickle
+import subprocess
 import threading
 import time
 import unittest
 import gc
 
-
-# If you don't have a real DAQ comedi device, you can create one that can still
-# pass all the tests by doing this:
-# sudo modprobe comedi comedi_num_legacy_minors=4
-# sudo modprobe comedi_test
-# sudo chmod a+rw /dev/comedi0
-# sudo comedi_config /dev/comedi0 comedi_test 1000000,1000000
-#
-# Be aware that comedi_test might crash the system while running those tests (much
-# less likely with kernels >= 3.5).
+# The driver needs the comedi library (python-comedilib) as soon as it's imported
+try:
+    from odemis.driver import semcomedi
+except ImportError as ex:
+    raise unittest.SkipTest("Cannot test the semcomedi driver: %s" % (ex,))
 
 
 logging.getLogger().setLevel(logging.DEBUG)
-#comedi.comedi_loglevel(3)
+#semcomedi.comedi.loglevel(3)
 
 TEST_NOHW = (os.environ.get("TEST_NOHW", 0) != 0)  # Default to Hw testing
 
+# Without real DAQ board, the tests run on the fake device of the comedi_test
+# driver, which is also at /dev/comedi0. If there is no device, the test cases
+# which need one create it, by running (with sudo, which must not ask for a
+# password):
+# modprobe comedi comedi_num_legacy_minors=4
+# modprobe comedi_test
+# comedi_config /dev/comedi0 comedi_test 1000000,1000000
+# chmod a+rw /dev/comedi0
+# If it fails, these test cases are skipped.
+#
+# Be aware that comedi_test might crash the system while running those tests (much
+# less likely with kernels >= 3.5).
+COMEDI_DEVICE = "/dev/comedi0"
+SETUP_COMEDI_TEST = (["modprobe", "comedi", "comedi_num_legacy_minors=4"],
+                     ["modprobe", "comedi_test"],
+                     ["comedi_config", COMEDI_DEVICE, "comedi_test", "1000000,1000000"],
+                     ["chmod", "a+rw", COMEDI_DEVICE],
+                    )
+NO_DEVICE_MSG = ("No comedi device %s, and failed to create the fake one with the "
+                 "comedi_test driver" % (COMEDI_DEVICE,))
+_device_available = None  # Result of setup_comedi_test(), once it's been called
+
+
+def setup_comedi_test():
+    """
+    Ensure that there is a comedi device, by creating the fake one of the
+      comedi_test driver if there is no device.
+    return (bool): True if a device is available
+    """
+    global _device_available
+    if _device_available is None:
+        if os.path.exists(COMEDI_DEVICE):
+            _device_available = True
+        else:
+            logging.info("No comedi device, will create one with the comedi_test driver")
+            _device_available = True
+            for cmd in SETUP_COMEDI_TEST:
+                try:
+                    subprocess.check_call(["sudo", "-n"] + cmd)
+                except (OSError, subprocess.CalledProcessError) as ex:
+                    logging.warning("Failed to run \"%s\": %s", " ".join(cmd), ex)
+                    _device_available = False
+                    break
+    return _device_available
+
 # arguments used for the creation of basic components
 CONFIG_SED = {"name": "sed", "role": "sed", "channel":5, "limits": [-3, 3]}
 CONFIG_BSD = {"name": "bsd", "role": "bsd", "channel":6, "limits": [0.2, -0.1]}
@@ -57,15 +96,15 @@ CONFIG_CNT = {"name": "cnt", "role": "cnt", "source":0}
 CONFIG_SCANNER = {"name": "scanner", "role": "ebeam", "limits": [[-5, 5], [3, -3]],
                   "channels": [0, 1], "settle_time": 10e-6, "hfw_nomag": 10e-3,
                   "park": [8, 8]}
-CONFIG_SEM = {"name": "sem", "role": "sem", "device": "/dev/comedi0",
+CONFIG_SEM = {"name": "sem", "role": "sem", "device": COMEDI_DEVICE,
               "children": {"detector0": CONFIG_SED, "scanner": CONFIG_SCANNER}
               }
 
-CONFIG_SEM2 = {"name": "sem", "role": "sem", "device": "/dev/comedi0",
+CONFIG_SEM2 = {"name": "sem", "role": "sem", "device": COMEDI_DEVICE,
               "children": {"detector0": CONFIG_SED, "detector1": CONFIG_BSD, "scanner": CONFIG_SCANNER}
               }
 
-KWARGS_SEM_CNT = {"name": "sem", "role": "sem", "device": "/dev/comedi0",
+KWARGS_SEM_CNT = {"name": "sem", "role": "sem", "device": COMEDI_DEVICE,
               "children": {"detector0": CONFIG_SED, "counter0": CONFIG_CNT, "scanner": CONFIG_SCANNER}
               }
 
@@ -74,7 +113,13 @@ class TestSEMStatic(unittest.TestCase):
     """
     Tests which don't need a SEM component ready
     """
+    @classmethod
+    def setUpClass(cls):
+        cls.has_device = setup_comedi_test()
+
     def test_scan(self):
+        if not self.has_device:
+            self.skipTest(NO_DEVICE_MSG)
         devices = semcomedi.SEMComedi.scan()
         self.assertGreater(len(devices), 0)
 
@@ -93,6 +138,8 @@ class TestSEMStatic(unittest.TestCase):
         """
         Doesn't even try to acquire an image, just create and delete components
         """
+        if not self.has_device:
+            self.skipTest(NO_DEVICE_MSG)
         sem = semcomedi.SEMComedi(**CONFIG_SEM)
         self.assertEqual(len(sem.children.value), 2)
 
@@ -118,6 +165,8 @@ class TestSEMStatic(unittest.TestCase):
         self.assertRaises(Exception, semcomedi.SEMComedi, **wrong_config)
 
     def test_pickle(self):
+        if not self.has_device:
+            self.skipTest(NO_DEVICE_MSG)
         try:
             os.remove("test")
         except OSError:
@@ -156,6 +205,134 @@ class TestSEMStatic(unittest.TestCase):
             comp = diffx >= 0 # must be decreasing
         self.assertTrue(comp.all())
 
+    def test_scan_raw_to_pixels(self):
+        """
+        Test the _scan_raw_to_pixels static method of the SEMComedi
+        """
+        shape = (2, 5)
+        margin = 2
+        spp = 6  # osr * dpr
+        oarray = numpy.zeros(shape, dtype="int16")
+        adtype = numpy.int32
+        # each pixel has the values of its position (in samples) in the line
+        line = numpy.arange((shape[1] + margin) * spp, dtype="int16")
+        exp_line = line.reshape(-1, spp).mean(axis=1)[margin:]
+
+        # whole line at once
+        semcomedi.SEMComedi._scan_raw_to_pixels(margin, spp, 0, 0, line,
+                                                oarray, adtype)
+        numpy.testing.assert_array_equal(oarray[0], exp_line.astype("int16"))
+
+        # in batches of 3 pixels, first one only in the margin
+        for y in range(0, shape[1] + margin, 3):
+            data = line[y * spp:(y + 3) * spp]
+            semcomedi.SEMComedi._scan_raw_to_pixels(margin, spp, 1, y, data,
+                                                    oarray, adtype)
+        numpy.testing.assert_array_equal(oarray[1], oarray[0])
+
+    def _get_scan_data(self, shape, margin):
+        """
+        return (3D ndarray of uint16): the data to write, for a scan of the
+          given shape (without margin), in which the value written on the
+          first channel identifies each pixel.
+        """
+        data = numpy.zeros((shape[0], shape[1] + margin, 2), dtype=numpy.uint16)
+        for x, y in numpy.ndindex(data.shape[:2]):
+            data[x, y, 0] = x * 100 + y
+        return data
+
+    def test_write_read_2d_pixel(self):
+        """
+        Test _write_read_2d_pixel() reads as many pixels as fit in the buffer
+        """
+        margin, osr, dpr = 2, 2, 3
+        data = self._get_scan_data((2, 7), margin)
+        # 2 channels * osr * dpr * 2 bytes => 24 bytes/pixel => 4 pixels/read
+        sem = FakeSEMComedi(max_bufsz=24 * 4)
+        buf = sem._write_read_2d_pixel([0, 1], [0, 0], [0, 1], [0, 0], 10e-6,
+                                       margin, osr, dpr, data)
+
+        # 9 pixels per line => 4 + 4 + 1, the first read containing the margin
+        exp_cmds = [(4 * dpr, margin * dpr, dpr), (4 * dpr, 0, dpr), (1 * dpr, 0, dpr)]
+        self.assertEqual(sem.cmds, exp_cmds * data.shape[0])
+        self.assertEqual(len(buf), 2)
+        for b in buf:
+            self.assertEqual(b.shape, (2, 7))
+            numpy.testing.assert_array_equal(b, data[:, margin:, 0])
+
+    def test_write_read_2d_pixel_new_position(self):
+        """
+        Test _write_read_2d_pixel() reads one pixel at a time when newPosition
+          is listened to
+        """
+        margin, osr, dpr = 2, 2, 3
+        data = self._get_scan_data((2, 7), margin)
+        sem = FakeSEMComedi(max_bufsz=24 * 4)
+        sem._scanner.newPosition.subscribe(self)
+        buf = sem._write_read_2d_pixel([0, 1], [0, 0], [0, 1], [0, 0], 10e-6,
+                                       margin, osr, dpr, data)
+
+        exp_cmds = [(dpr, dpr, dpr)] * margin + [(dpr, 0, dpr)] * 7
+        self.assertEqual(sem.cmds, exp_cmds * data.shape[0])
+        for b in buf:
+            numpy.testing.assert_array_equal(b, data[:, margin:, 0])
+
+    def test_write_read_2d_subpixel(self):
+        """
+        Test _write_read_2d_subpixel() splits each pixel in as many duplications
+          as fit in the buffer
+        """
+        margin, osr, dpr = 1, 2, 5
+        data = self._get_scan_data((2, 3), margin)
+        # 2 channels * osr * 2 bytes => 8 bytes/duplication => 2 duplications/read
+        sem = FakeSEMComedi(max_bufsz=8 * 2)
+        buf = sem._write_read_2d_subpixel([0, 1], [0, 0], [0, 1], [0, 0], 10e-6,
+                                          margin, osr, dpr, data)
+
+        # 5 duplications => 2 + 2 + 1, only the first one at a new position
+        exp_cmds = [(2, 2, 2), (2, 2, 2), (1, 1, 1)] * margin
+        exp_cmds += [(2, 0, 2), (2, 2, 2), (1, 1, 1)] * 3
+        self.assertEqual(sem.cmds, exp_cmds * data.shape[0])
+        for b in buf:
+            numpy.testing.assert_array_equal(b, data[:, margin:, 0])
+
+    def onEvent(self):
+        # newPosition of the FakeSEMComedi
+        pass
+
+
+class FakeSEMComedi(object):
+    """
+    Imitates the parts of the SEMComedi used to convert the scans into pixels.
+    Its DAQ board reads back on every channel the value written on the first
+    channel, and records the reads requested.
+    """
+    _scan_raw_to_pixels = staticmethod(semcomedi.SEMComedi._scan_raw_to_pixels)
+    _write_read_2d_pixel = semcomedi.SEMComedi._write_read_2d_pixel.im_func
+    _write_read_2d_subpixel = semcomedi.SEMComedi._write_read_2d_subpixel.im_func
+
+    def __init__(self, max_bufsz):
+        """
+        max_bufsz (int): maximum size of a read, in bytes
+        """
+        self._max_bufsz = max_bufsz
+        self._reader = FakeObject(dtype=numpy.dtype(numpy.uint16))
+        self._scanner = FakeObject(newPosition=model.Event(), fast_park=False)
+        self.cmds = []  # (number of scans, settling samples, dpr) of each read
+
+    def _write_read_raw_one_cmd(self, wchannels, wranges, rchannels, rranges,
+                                period, osr, data, settling_samples, rest=False,
+                                dpr=1):
+        self.cmds.append((data.shape[0], settling_samples, dpr))
+        rbuf = numpy.repeat(data[:, 0:1], osr, axis=0)
+        return numpy.repeat(rbuf, len(rchannels), axis=1)
+
+
+class FakeObject(object):
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+
 #@unittest.skip("simple")
 class TestSEM(unittest.TestCase):
     """
@@ -163,6 +340,8 @@ class TestSEM(unittest.TestCase):
     """
     @classmethod
     def setUpClass(cls):
+        if not setup_comedi_test():
+            raise unittest.SkipTest(NO_DEVICE_MSG)
         cls.sem = semcomedi.SEMComedi(**CONFIG_SEM)
 
         for child in cls.sem.children.value:
@@ -353,6 +532,24 @@ class TestSEM(unittest.TestCase):
         self.assertGreaterEqual(duration, expected_duration, "Error execution took %f s, less than exposure time %d." % (duration, expected_duration))
         self.assertIn(model.MD_DWELL_TIME, im.metadata)
 
+    def test_long_dwell_time_multi_pixels(self):
+        """
+        a few pixels with long dwell time, which means it uses duplication rate
+        and reads several pixels per command.
+        """
+        self.scanner.resolution.value = (3, 2)
+        self.size = self.scanner.resolution.value
+        self.scanner.dwellTime.value = 5 # DPR should be 2
+        expected_duration = self.compute_expected_duration()
+
+        start = time.time()
+        im = self.sed.data.get()
+        duration = time.time() - start
+
+        self.assertEqual(im.shape, self.size[::-1])
+        self.assertGreaterEqual(duration, expected_duration, "Error execution took %f s, less than exposure time %d." % (duration, expected_duration))
+        self.assertIn(model.MD_DWELL_TIME, im.metadata)
+
     def test_very_long_dwell_time(self):
         """
         one pixel only, but long dwell time (> 30s), which means it uses
@@ -371,6 +568,105 @@ class TestSEM(unittest.TestCase):
         self.assertGreaterEqual(duration, expected_duration, "Error execution took %f s, less than exposure time %d." % (duration, expected_duration))
         self.assertIn(model.MD_DWELL_TIME, im.metadata)
 
+    def test_scan_cache(self):
+        """
+        Check the scan arrays are reused when going back to previous settings
+        """
+        self.scanner.resolution.value = (64, 32)
+        self.scanner.translation.value = (0, 0)
+        scan0 = self.scanner.get_scan_data(1)[0]
+        self.scanner.translation.value = (10, -5)
+        scan1 = self.scanner.get_scan_data(1)[0]
+        self.assertFalse((scan0 == scan1).all())
+
+        self.scanner.translation.value = (0, 0)
+        self.assertIs(self.scanner.get_scan_data(1)[0], scan0)
+        self.assertFalse(scan0.flags.writeable)
+
+        # the acquisition still works with a cached array
+        im = self.sed.data.get()
+        self.assertEqual(im.shape, (32, 64))
+
+    def test_scan_path(self):
+        """
+        Check the e-beam goes to each position of the scan path, and indicates
+        each of them
+        """
+        self.scanner.dwellTime.value = 0.01  # s
+        path = [(-100, -50), (0, 0), (100, 50), (20, 10)]
+        self.scanner.scanPath.value = path
+        self.events = 0
+        self.scanner.newPosition.subscribe(self)
+        try:
+            start = time.time()
+            im = self.sed.data.get()
+            duration = time.time() - start
+        finally:
+            self.scanner.newPosition.unsubscribe(self)
+            self.scanner.scanPath.value = []
+
+        self.assertEqual(im.shape, (1, len(path)))
+        self.assertGreaterEqual(duration, len(path) * 0.01)
+        self.assertGreaterEqual(self.events, len(path))
+
+        # Back to normal scanning
+        self.scanner.dwellTime.value = self.scanner.dwellTime.range[0]
+        im = self.sed.data.get()
+        self.assertEqual(im.shape, self.size[::-1])
+
+    def test_scan_path_long_dwell(self):
+        """
+        Check each position of the scan path is indicated only once, even when
+        the dwell time is too long to be written as one sample
+        """
+        # More than the longest write period => each spot is written multiple times
+        dt = self.sem._max_ao_period_ns * 1e-9 * 1.5
+        self.scanner.dwellTime.value = self.scanner.dwellTime.clip(dt)
+        path = [(-100, -50), (100, 50)]
+        self.scanner.scanPath.value = path
+        self.events = 0
+        self.scanner.newPosition.subscribe(self)
+        try:
+            im = self.sed.data.get()
+        finally:
+            self.scanner.newPosition.unsubscribe(self)
+            self.scanner.scanPath.value = []
+
+        self.assertEqual(im.shape, (1, len(path)))
+        self.assertEqual(self.events, len(path))
+
+    def test_spot_pattern(self):
+        """
+        Check that scanning spots of the pattern uses the precomputed positions
+        """
+        self.scanner.scale.value = (1, 1)
+        self.scanner.resolution.value = (1, 1)
+        trans = [(-100, -50), (0, 0), (100, 50)]
+        self.scanner.set_spot_pattern(trans)
+        try:
+            scans = []
+            for t in trans:
+                self.scanner.translation.value = t
+                scan = self.scanner.get_scan_data(1)[0]
+                self.assertEqual(scan.shape, (1, 1, 2))
+                scans.append(scan)
+                im = self.sed.data.get()
+                self.assertEqual(im.shape, (1, 1))
+            # X goes in the same direction as the translation
+            self.assertNotEqual(scans[0][0, 0, 1], scans[2][0, 0, 1])
+
+            # out of the pattern => computed as usual
+            self.scanner.translation.value = (5, 5)
+            self.assertEqual(self.scanner.get_scan_data(1)[0].shape, (1, 1, 2))
+
+            # The pattern can also be a numpy array, including empty
+            self.scanner.set_spot_pattern(numpy.array(trans, dtype=float))
+            self.scanner.translation.value = trans[0]
+            self.assertEqual(self.scanner.get_scan_data(1)[0].shape, (1, 1, 2))
+            self.scanner.set_spot_pattern(numpy.empty((0, 2)))
+        finally:
+            self.scanner.set_spot_pattern(None)
+            self.scanner.translation.value = (0, 0)
 
 #     @unittest.skip("too long")
     def test_acquire_long_short(self):
@@ -575,6 +871,8 @@ class TestSEM2(unittest.TestCase):
     """
     @classmethod
     def setUpClass(cls):
+        if not setup_comedi_test():
+            raise unittest.SkipTest(NO_DEVICE_MSG)
         cls.sem = semcomedi.SEMComedi(**CONFIG_SEM2)
 
         for child in cls.sem.children.value:
@@ -741,6 +1039,8 @@ class TestSEMCounter(unittest.TestCase):
     """
     @classmethod
     def setUpClass(cls):
+        if not setup_comedi_test():
+            raise unittest.SkipTest(NO_DEVICE_MSG)
         cls.sem = semcomedi.SEMComedi(**KWARGS_SEM_CNT)
 
         for child in cls.sem.children.value:
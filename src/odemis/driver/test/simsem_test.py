@@ -157,6 +157,39 @@ class TestSEM(unittest.TestCase):
         self.assertGreaterEqual(duration, expected_duration, "Error execution took %f s, less than exposure time %d." % (duration, expected_duration))
         self.assertIn(model.MD_DWELL_TIME, im.metadata)
 
+    def test_scan_path(self):
+        """
+        Check the e-beam goes to each position of the scan path, and indicates
+        each of them
+        """
+        self.scanner.dwellTime.value = 0.01  # s
+        path = [(-100, -50), (0, 0), (100, 50), (20, 10)]
+        self.scanner.scanPath.value = path
+        self.npos = 0
+        self.scanner.newPosition.subscribe(self)
+        try:
+            start = time.time()
+            im = self.sed.data.get()
+            duration = time.time() - start
+        finally:
+            self.scanner.newPosition.unsubscribe(self)
+            self.scanner.scanPath.value = []
+
+        self.assertEqual(im.shape, (1, len(path)))
+        self.assertGreaterEqual(duration, len(path) * 0.01)
+        self.assertGreaterEqual(self.npos, len(path))
+
+        # Back to normal scanning
+        self.scanner.dwellTime.value = self.scanner.dwellTime.range[0]
+        im = self.sed.data.get()
+        self.assertEqual(im.shape, self.size[::-1])
+
+    def onEvent(self):
+        """
+        Called by the SEM when a new position happens
+        """
+        self.npos += 1
+
     def test_acquire_8bpp(self):
         self.sed.bpp.value = 8
         self.scanner.dwellTime.value = 10e-6  # s
@@ -23,6 +23,7 @@ from __future__ import division
 
 import Queue
 import logging
+import numpy
 from odemis import model
 from odemis.driver import spectrometer, spectrapro, pvcam, andorcam2, andorshrk
 import os
@@ -136,6 +137,82 @@ class TestSimulated(unittest.TestCase):
         self.assertEqual(data.shape[0], 1)
         self.assertEqual(data.shape[-1::-1], self.spectrometer.resolution.value)
 
+    def test_band(self):
+        """
+        Check that only the lines of the band are used
+        """
+        height = self.detector.resolution.range[1][1]
+        band = (height // 2 - 20, height // 2 + 20)
+        spec_band = CLASS(children={"detector": self.detector,
+                                    "spectrograph": self.spectrograph},
+                          band=band, **SPEC_KWARGS)
+        try:
+            spec_band.exposureTime.value = 0.1  # s
+            spec_band.binning.value = (1, 8)
+            data = spec_band.data.get()
+            self.assertEqual(data.shape[0], 1)
+            self.assertEqual(data.shape[-1::-1], spec_band.resolution.value)
+            # Lines are summed in software, exactly as many as the binning
+            self.assertEqual(data.metadata[model.MD_BINNING], spec_band.binning.value)
+
+            # The whole band can be binned
+            spec_band.binning.value = (1, band[1] - band[0])
+            data = spec_band.data.get()
+            self.assertEqual(data.shape[0], 1)
+            self.assertEqual(data.metadata[model.MD_BINNING][1], band[1] - band[0])
+        finally:
+            spec_band.terminate()
+
+        # band must be within the sensor
+        with self.assertRaises(ValueError):
+            CLASS(children={"detector": self.detector,
+                            "spectrograph": self.spectrograph},
+                  band=(0, height + 1), **SPEC_KWARGS)
+
+
+class TestBinVertically(unittest.TestCase):
+    """
+    Test the software vertical binning
+    """
+
+    def test_simple(self):
+        data = model.DataArray(numpy.ones((16, 100), dtype=numpy.uint16),
+                               {model.MD_BINNING: (2, 4)})
+        data[:, 10] = 65535
+        spec = spectrometer.binVertically(data, (0, 64))
+        self.assertEqual(spec.shape, (1, 100))
+        self.assertEqual(spec.dtype, numpy.uint32)
+        self.assertEqual(spec[0, 0], 16)
+        self.assertEqual(spec[0, 10], 65535 * 16)
+        self.assertEqual(spec.metadata[model.MD_BINNING], (2, 64))
+        # The original metadata is not modified
+        self.assertEqual(data.metadata[model.MD_BINNING], (2, 4))
+
+        # Only the lines within the band
+        spec = spectrometer.binVertically(data, (8, 20))
+        self.assertEqual(spec[0, 0], 3)
+        self.assertEqual(spec.metadata[model.MD_BINNING], (2, 12))
+
+        # The band must match the binned lines
+        with self.assertRaises(ValueError):
+            spectrometer.binVertically(data, (8, 18))
+
+    def test_bpp(self):
+        data = model.DataArray(numpy.ones((16, 100), dtype=numpy.uint16),
+                               {model.MD_BPP: 12})
+        spec = spectrometer.binVertically(data, (0, 4))
+        self.assertEqual(spec.metadata[model.MD_BPP], 14)
+        spec = spectrometer.binVertically(data, (0, 5))
+        self.assertEqual(spec.metadata[model.MD_BPP], 15)
+        self.assertEqual(data.metadata[model.MD_BPP], 12)
+
+    def test_float(self):
+        data = model.DataArray(numpy.ones((10, 50), dtype=numpy.float64) / 2)
+        spec = spectrometer.binVertically(data, (0, 10))
+        self.assertEqual(spec.shape, (1, 50))
+        self.assertEqual(spec.dtype, numpy.float64)
+        self.assertEqual(spec[0, 0], 5)
+
 
 class TestSimulatedShamrock(TestSimulated):
     """
@@ -118,15 +118,22 @@ Graphical data is drawn using the following sequence of method calls:
 
             * draw()
 
-                * _draw_background()
+                * _render_images_layer() (only if the images or the view changed)
 
-                * _draw_merged_images
+                    * _draw_background()
 
-                   * for all but last image:
-                        * _draw_image()
+                    * _draw_merged_images
 
-                    * for last image:
-                        * _draw_image()
+                       * for all but last image:
+                            * _draw_image()
+
+                        * for last image:
+                            * _draw_image()
+
+                * _render_overlays_layer() (only if a cached world overlay or the view
+                  changed)
+
+                * draw() of each non-cached world overlay
 
             * Refresh/Update canvas
 
@@ -136,19 +143,21 @@ from __future__ import division
 
 from abc import ABCMeta, abstractmethod
 import cairo
+from collections import namedtuple
 from decorator import decorator
 import logging
 from odemis import util
 from odemis.gui import BLEND_DEFAULT, BLEND_SCREEN, BufferSizeEvent
 from odemis.gui.comp.overlay.base import WorldOverlay, ViewOverlay
 from odemis.gui.evt import EVT_KNOB_ROTATE, EVT_KNOB_PRESS
-from odemis.gui.util import call_in_wx_main
+from odemis.gui.util import call_in_wx_main, ignore_dead
 from odemis.gui.util.img import add_alpha_byte, apply_rotation, apply_shear, apply_flip, get_sub_img
 from odemis.util import intersect
 from odemis.gui.util.conversion import wxcol_to_frgb
 from odemis import model
 import os
 import sys
+import threading
 import wx
 
 from odemis.gui import img
@@ -160,6 +169,76 @@ CAN_DRAG = 1    # Content can be dragged
 CAN_FOCUS = 2   # Can adjust focus
 CAN_ZOOM = 4    # Can adjust scale
 
+# Everything needed to draw the images into the buffer. It allows to draw while
+# the canvas itself changes (ie, from a separate thread).
+ImagesState = namedtuple("ImagesState", ["images", "merge_ratio", "p_buffer_center", "scale",
+                                         "buffer_size"])
+
+
+class LayerRenderer(object):
+    """ Renders in a separate thread, so that the GUI thread is not blocked while big images are
+    being drawn.
+
+    Only the latest request matters: a request not yet started is replaced by a newer one, and
+    the rendering in progress is asked to stop.
+
+    """
+
+    def __init__(self, name):
+        self._cond = threading.Condition()
+        self._request = None  # (render, callback) to run next
+        self._must_stop = None  # threading.Event of the rendering in progress
+        self._terminated = False
+
+        self._thread = threading.Thread(target=self._run, name=name)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def submit(self, render, callback):
+        """ Schedule a rendering, and cancel the previous ones
+
+        :param render: (callable) Does the rendering. It receives a threading.Event, which is set
+            when the rendering is not needed anymore, and returns the result.
+        :param callback: (callable) Called with the result of the rendering, from the rendering
+            thread. It is not called if the rendering was cancelled.
+
+        """
+        with self._cond:
+            if self._must_stop is not None:
+                self._must_stop.set()
+            self._request = (render, callback)
+            self._cond.notify()
+
+    def terminate(self):
+        """ Cancel all the renderings and stop the thread """
+        with self._cond:
+            if self._must_stop is not None:
+                self._must_stop.set()
+            self._request = None
+            self._terminated = True
+            self._cond.notify()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while self._request is None and not self._terminated:
+                    self._cond.wait()
+                if self._terminated:
+                    return
+                render, callback = self._request
+                self._request = None
+                must_stop = threading.Event()
+                self._must_stop = must_stop
+
+            try:
+                result = render(must_stop)
+                if not must_stop.is_set():
+                    callback(result)
+            except Exception:
+                logging.exception("Failed to render")
+            # Don't keep a reference to the data while waiting
+            render = callback = result = None
+
 
 @decorator
 def ignore_if_disabled(f, self, *args, **kwargs):
@@ -583,20 +662,27 @@ class BufferedCanvas(wx.Panel):
 
         """
 
+        ctx.set_source(self._get_background_pattern())
+        ctx.paint()
+
+    def _get_background_pattern(self):
+        """ Create the Cairo pattern to draw the background with (cf `_draw_background`)
+
+        The pattern only depends on Cairo, so it can be used outside of the GUI thread.
+
+        :return: (cairo.Pattern)
+
+        """
+
         if self.background_brush == wx.BRUSHSTYLE_SOLID:
-            ctx.set_source_rgb(*wxcol_to_frgb(self.BackgroundColour))
-            ctx.paint()
-            return
+            return cairo.SolidPattern(*wxcol_to_frgb(self.BackgroundColour))
 
         surface = wxcairo.ImageSurfaceFromBitmap(self.background_img)
         surface.set_device_offset(self.background_offset[0], self.background_offset[1])
 
         pattern = cairo.SurfacePattern(surface)
         pattern.set_extend(cairo.EXTEND_REPEAT)
-        ctx.set_source(pattern)
-
-        ctx.rectangle(0, 0, self._bmp_buffer_size[0], self._bmp_buffer_size[1])
-        ctx.fill()
+        return pattern
 
     # END Buffer and drawing methods
 
@@ -785,6 +871,10 @@ class BitmapCanvas(BufferedCanvas):
     A canvas that can display multiple overlapping images at various position
     and scale, but it cannot be moved by the user.
     """
+
+    # If True, the images are drawn in a separate thread (cf draw())
+    threaded_rendering = False
+
     def __init__(self, *args, **kwargs):
         super(BitmapCanvas, self).__init__(*args, **kwargs)
 
@@ -796,9 +886,34 @@ class BitmapCanvas(BufferedCanvas):
         self.scale = 1.0  # px/m
         self.margins = (0, 0)
 
+        # The buffer is composed of layers, which are only rendered again when
+        # their content changes (cf draw()).
+        # Incremented every time the images are changed
+        self._images_version = 0
+        # cairo.ImageSurface with the background and the images, the parameters
+        # used to render it, and its (p_buffer_center, scale, buffer_size)
+        self._images_layer = None
+        self._images_layer_key = None
+        self._images_layer_view = None
+        # Parameters of the images layer being rendered in the background
+        self._images_render_key = None
+        self._renderer = None  # LayerRenderer, created on the first use
+        # cairo.ImageSurface with the cached world overlays, and the parameters
+        # used to render it
+        self._static_layer = None
+        self._static_layer_key = None
+
+        self.Bind(wx.EVT_WINDOW_DESTROY, self._on_destroy, source=self)
+
+    def _on_destroy(self, evt):
+        if self._renderer is not None:
+            self._renderer.terminate()
+        evt.Skip()
+
     def clear(self):
         """ Remove the images and clear the canvas """
         self.images = [None]
+        self._images_version += 1
         BufferedCanvas.clear(self)
 
     def set_images(self, im_args):
@@ -873,10 +988,25 @@ class BitmapCanvas(BufferedCanvas):
                 images.append(im)
 
         self.images = images
+        self._images_version += 1
 
     def draw(self, interpolate_data=False):
         """ Draw the images and overlays into the buffer
 
+        The buffer is composed of three layers:
+
+        * the background and the merged images,
+        * the world overlays which are `cached`,
+        * the other world overlays.
+
+        The first two layers are kept as Cairo surfaces, and are only rendered again when their
+        content or the view changes. So, for instance, while a selection is being dragged, only
+        the (non-cached) selection overlay is drawn again, and the images are not merged again.
+
+        If `threaded_rendering` is True, the images layer is rendered in a separate thread, and
+        the buffer is drawn again once it is ready. In the meantime, the previous images layer
+        is shown, moved and scaled to the current view.
+
         In between the draw calls the Cairo context gets its transformation matrix reset,
         to prevent the accidental accumulation of transformations.
 
@@ -890,21 +1020,155 @@ class BitmapCanvas(BufferedCanvas):
 
         ctx = wxcairo.ContextFromDC(self._dc_buffer)
 
-        self._draw_background(ctx)
-        ctx.identity_matrix()  # Reset the transformation matrix
+        state = self._get_images_state()
+        view_key = (state.p_buffer_center, state.scale, state.buffer_size)
 
-        self._draw_merged_images(ctx, interpolate_data)
-        ctx.identity_matrix()  # Reset the transformation matrix
+        images_key = view_key + (self._images_version, state.merge_ratio, interpolate_data,
+                                 self.background_brush, self.background_offset,
+                                 self.BackgroundColour.Get())
+        if self._images_layer_key != images_key:
+            if self.threaded_rendering:
+                if self._images_render_key != images_key:
+                    self._request_images_layer(images_key, state, interpolate_data)
+            else:
+                self._images_layer = self._render_images_layer(state,
+                                                               self._get_background_pattern(),
+                                                               interpolate_data)
+                self._images_layer_key = images_key
+                self._images_layer_view = view_key
+
+        self._paint_images_layer(ctx, view_key)
 
         # Remember that the device context being passed belongs to the *buffer* and the view
         # overlays are drawn in the `on_paint` method where the buffer is blitted to the device
         # context.
+        static_ols = [o for o in self.world_overlays if o.cached]
+        if static_ols:
+            static_key = view_key + tuple((id(o), o.show) for o in static_ols)
+            if self._static_layer_key != static_key or any(o.redraw_needed for o in static_ols):
+                self._static_layer = self._render_overlays_layer(static_ols)
+                self._static_layer_key = static_key
+            ctx.set_source_surface(self._static_layer, 0, 0)
+            ctx.paint()
+        else:
+            self._static_layer = None
+            self._static_layer_key = None
+
         for o in self.world_overlays:
+            if not o.cached:
+                ctx.save()
+                o.draw(ctx, self.p_buffer_center, self.scale)
+                ctx.restore()
+
+    def _get_images_state(self):
+        """ Return the current ImagesState of the canvas """
+        return ImagesState(self.images, self.merge_ratio, self.p_buffer_center, self.scale,
+                           self._bmp_buffer_size)
+
+    def _render_images_layer(self, state, background, interpolate_data=False, must_stop=None):
+        """ Render the background and the images into a new surface
+
+        It only uses Cairo, so it can be called from any thread.
+
+        :param state: (ImagesState) the images and the buffer to render
+        :param background: (cairo.Pattern) the background (cf `_get_background_pattern`)
+        :param interpolate_data: (boolean) Apply interpolation if True
+        :param must_stop: (None or threading.Event) If set, the rendering is stopped early
+        :return: (cairo.ImageSurface) surface of the size of the buffer
+
+        """
+        surface = cairo.ImageSurface(cairo.FORMAT_RGB24, *state.buffer_size)
+        ctx = cairo.Context(surface)
+
+        ctx.set_source(background)
+        ctx.paint()
+
+        self._draw_merged_images(ctx, interpolate_data, state, must_stop)
+        return surface
+
+    def _request_images_layer(self, key, state, interpolate_data):
+        """ Start rendering the images layer in the background
+
+        The previous rendering in progress, if any, is cancelled.
+
+        """
+        if self._renderer is None:
+            self._renderer = LayerRenderer("Canvas rendering %s" % (id(self),))
+
+        self._images_render_key = key
+        background = self._get_background_pattern()
+        view = (state.p_buffer_center, state.scale, state.buffer_size)
+
+        def render(must_stop):
+            return self._render_images_layer(state, background, interpolate_data, must_stop)
+
+        def on_rendered(surface):
+            self._on_images_layer_rendered(key, view, surface)
+
+        self._renderer.submit(render, on_rendered)
+
+    @call_in_wx_main
+    @ignore_dead
+    def _on_images_layer_rendered(self, key, view, surface):
+        """ Use the newly rendered images layer, and update the buffer """
+        if key != self._images_render_key:
+            return  # A newer rendering has been requested in the meantime
+
+        self._images_render_key = None
+        self._images_layer = surface
+        self._images_layer_key = key
+        self._images_layer_view = view
+        self.update_drawing()
+
+    def _paint_images_layer(self, ctx, view):
+        """ Paint the images layer onto the buffer
+
+        If the layer was rendered for another view (because the rendering of the new one is still
+        in progress), it's moved and scaled accordingly.
+
+        :param ctx: (cairo.Context) the context of the buffer
+        :param view: (tuple) current center (float, float), scale (float) and size (int, int)
+            of the buffer
+
+        """
+        if self._images_layer is None:
+            self._draw_background(ctx)
+            return
+
+        ctx.save()
+        if self._images_layer_view == view:
+            ctx.set_operator(cairo.OPERATOR_SOURCE)
+        else:
+            self._draw_background(ctx)
+            l_center, l_scale, l_size = self._images_layer_view
+            center, scale, size = view
+            ctx.translate(size[0] // 2 + (l_center[0] - center[0]) * scale,
+                          size[1] // 2 - (l_center[1] - center[1]) * scale)
+            ctx.scale(scale / l_scale, scale / l_scale)
+            ctx.translate(-(l_size[0] // 2), -(l_size[1] // 2))
+
+        ctx.set_source_surface(self._images_layer, 0, 0)
+        ctx.paint()
+        ctx.restore()
+
+    def _render_overlays_layer(self, overlays):
+        """ Render world overlays into a new transparent surface
+
+        :param overlays: (list of WorldOverlay) the overlays to draw
+        :return: (cairo.ImageSurface) surface of the size of the buffer
+
+        """
+        surface = cairo.ImageSurface(cairo.FORMAT_ARGB32, *self._bmp_buffer_size)
+        ctx = cairo.Context(surface)
+
+        for o in overlays:
             ctx.save()
             o.draw(ctx, self.p_buffer_center, self.scale)
             ctx.restore()
+            o.redraw_needed = False
+        return surface
 
-    def _draw_merged_images(self, ctx, interpolate_data=False):
+    def _draw_merged_images(self, ctx, interpolate_data=False, state=None, must_stop=None):
         """ Draw the images on the DC buffer, centred around their _dc_center, with their own
         scale and an opacity of "mergeratio" for im1.
 
@@ -914,6 +1178,9 @@ class BitmapCanvas(BufferedCanvas):
         without transparency
 
         :param interpolate_data: (boolean) Apply interpolation if True
+        :param state: (None or ImagesState) the images and the buffer to draw. If None, the
+            current ones of the canvas are used.
+        :param must_stop: (None or threading.Event) If set, the drawing is stopped early
 
         :return: (int) Frames per second
 
@@ -926,7 +1193,10 @@ class BitmapCanvas(BufferedCanvas):
         # Checking images == [None] caused a FutureWarning from Numpy, because in the future it
         # will do a element-by element comparison. (Or at least value == None will, it might have
         # been a false positive). Instead, when working with NDArrays, use `value is None`
-        if not self.images or all(i is None for i in self.images):
+        if state is None:
+            state = self._get_images_state()
+
+        if not state.images or all(i is None for i in state.images):
             return
 
         # The idea:
@@ -938,11 +1208,15 @@ class BitmapCanvas(BufferedCanvas):
         # * display the last image (SEM => expected smaller), with the given
         #   mergeratio (or 1 if it's the only one)
 
-        images = [im for im in self.images if im is not None]
+        images = [im for im in state.images if im is not None]
 
         if images:
             n = len(images)
             for i, im in enumerate(images):
+                if must_stop is not None and must_stop.is_set():
+                    logging.debug("Stopping drawing of the images")
+                    return
+
                 if isinstance(im, tuple):
                     first_tile = im[0][0]
                     md = first_tile.metadata
@@ -958,7 +1232,7 @@ class BitmapCanvas(BufferedCanvas):
                     if n == 1:
                         merge_ratio = 1.0
                     else:
-                        merge_ratio = self.merge_ratio
+                        merge_ratio = state.merge_ratio
                 else:
                     merge_ratio = 1 - i / n
 
@@ -973,7 +1247,8 @@ class BitmapCanvas(BufferedCanvas):
                         shear=md['dc_shear'],
                         flip=md['dc_flip'],
                         blend_mode=md['blend_mode'],
-                        interpolate_data=interpolate_data
+                        interpolate_data=interpolate_data,
+                        state=state
                     )
                 else:
                     self._draw_image(
@@ -986,12 +1261,13 @@ class BitmapCanvas(BufferedCanvas):
                         shear=im.metadata['dc_shear'],
                         flip=im.metadata['dc_flip'],
                         blend_mode=im.metadata['blend_mode'],
-                        interpolate_data=interpolate_data
+                        interpolate_data=interpolate_data,
+                        state=state
                     )
 
     def _draw_tiles(self, ctx, tiles, p_im_center, opacity=1.0,
                     im_scale=(1.0, 1.0), rotation=None, shear=None, flip=None,
-                    blend_mode=BLEND_DEFAULT, interpolate_data=False):
+                    blend_mode=BLEND_DEFAULT, interpolate_data=False, state=None):
 
         """ Draw the given tiles to the Cairo context. It is very similar to _draw_image,
         but this function draw a tuple of tuple of tiles instead of a full image.
@@ -1008,8 +1284,13 @@ class BitmapCanvas(BufferedCanvas):
         :param flip: (wx.HORIZONTAL | wx.VERTICAL) If and how to flip the image
         :param blend_mode: (int) Graphical blending type used for transparency
         :param interpolate_data: (boolean) Apply interpolation if True
+        :param state: (None or ImagesState) the buffer to draw on. If None, the current one of the
+            canvas is used.
 
         """
+        if state is None:
+            state = self._get_images_state()
+
         first_tile = tiles[0][0]
         ftmd = first_tile.metadata
 
@@ -1021,7 +1302,7 @@ class BitmapCanvas(BufferedCanvas):
         # calculates the shape of the image composed from the tiles
         im_shape = util.img.getTilesSize(tiles)
         # Determine the rectangle the image would occupy in the buffer
-        b_im_rect = self._calc_img_buffer_rect(im_shape[:2], im_scale, p_im_center)
+        b_im_rect = self._calc_img_buffer_rect(im_shape[:2], im_scale, p_im_center, state)
 
         # To small to see, so no need to draw
         if b_im_rect[2] < 1 or b_im_rect[3] < 1:
@@ -1030,7 +1311,7 @@ class BitmapCanvas(BufferedCanvas):
             return
 
         # Get the intersection with the actual buffer
-        buffer_rect = (0, 0) + self._bmp_buffer_size
+        buffer_rect = (0, 0) + state.buffer_size
 
         intersection = intersect(buffer_rect, b_im_rect)
 
@@ -1047,7 +1328,7 @@ class BitmapCanvas(BufferedCanvas):
         apply_flip(ctx, flip, b_im_rect)
 
         scale_x, scale_y = im_scale
-        total_scale = total_scale_x, total_scale_y = (scale_x * self.scale, scale_y * self.scale)
+        total_scale = total_scale_x, total_scale_y = (scale_x * state.scale, scale_y * state.scale)
 
         # in case of small floating errors
         if abs(total_scale_x - 1) < 1e-8 or abs(total_scale_y - 1) < 1e-8:
@@ -1112,7 +1393,7 @@ class BitmapCanvas(BufferedCanvas):
 
     def _draw_image(self, ctx, im_data, p_im_center, opacity=1.0,
                     im_scale=(1.0, 1.0), rotation=None, shear=None, flip=None,
-                    blend_mode=BLEND_DEFAULT, interpolate_data=False):
+                    blend_mode=BLEND_DEFAULT, interpolate_data=False, state=None):
         """ Draw the given image to the Cairo context
 
         The buffer is considered to have it's 0,0 origin at the top left
@@ -1127,8 +1408,12 @@ class BitmapCanvas(BufferedCanvas):
         :param flip: (wx.HORIZONTAL | wx.VERTICAL) If and how to flip the image
         :param blend_mode: (int) Graphical blending type used for transparency
         :param interpolate_data: (boolean) Apply interpolation if True
+        :param state: (None or ImagesState) the buffer to draw on. If None, the current one of the
+            canvas is used.
 
         """
+        if state is None:
+            state = self._get_images_state()
 
         # Fully transparent image does not need to be drawn
         if opacity < 1e-8:
@@ -1136,7 +1421,7 @@ class BitmapCanvas(BufferedCanvas):
             return
 
         # Determine the rectangle the image would occupy in the buffer
-        b_im_rect = self._calc_img_buffer_rect(im_data.shape[:2], im_scale, p_im_center)
+        b_im_rect = self._calc_img_buffer_rect(im_data.shape[:2], im_scale, p_im_center, state)
         # logging.debug("Image on buffer %s", b_im_rect)
 
         # To small to see, so no need to draw
@@ -1146,7 +1431,7 @@ class BitmapCanvas(BufferedCanvas):
             return
 
         # Get the intersection with the actual buffer
-        buffer_rect = (0, 0) + self._bmp_buffer_size
+        buffer_rect = (0, 0) + state.buffer_size
 
         intersection = intersect(buffer_rect, b_im_rect)
 
@@ -1168,7 +1453,7 @@ class BitmapCanvas(BufferedCanvas):
         # logging.debug("Total scale: %s x %s = %s", im_scale, self.scale, total_scale)
 
         scale_x, scale_y = im_scale
-        total_scale = total_scale_x, total_scale_y = (scale_x * self.scale, scale_y * self.scale)
+        total_scale = total_scale_x, total_scale_y = (scale_x * state.scale, scale_y * state.scale)
 
         # in case of small floating errors
         if abs(total_scale_x - 1) < 1e-8 or abs(total_scale_y - 1) < 1e-8:
@@ -1235,7 +1520,7 @@ class BitmapCanvas(BufferedCanvas):
         # Restore the cached transformation matrix
         ctx.restore()
 
-    def _calc_img_buffer_rect(self, im_shape, im_scale, p_im_center):
+    def _calc_img_buffer_rect(self, im_shape, im_scale, p_im_center, state=None):
         """ Compute the rectangle containing the image in buffer coordinates
 
         The (top, left) value are relative to the 0,0 top left of the buffer.
@@ -1243,10 +1528,14 @@ class BitmapCanvas(BufferedCanvas):
         :param im_shape: (int, int) x and y shape of the image
         :param im_scale: (float, float) The x and y scales of the image
         :param p_im_center: (float, float) The center of the image in physical coordinates
+        :param state: (None or ImagesState) the buffer containing the image. If None, the
+            current one of the canvas is used.
 
         :return: (float, float, float, float) top, left, width, height
 
         """
+        if state is None:
+            state = self._get_images_state()
 
         # There are two scales:
         # * the scale of the image (dependent on the size of what the image
@@ -1263,10 +1552,12 @@ class BitmapCanvas(BufferedCanvas):
                      p_im_center[1] + (scaled_im_size[1] / 2))
 
         # Translate to buffer coordinates (remember, buffer is world + scale)
-        b_topleft = self.phys_to_buffer(p_topleft, self.get_half_buffer_size())
+        b_half_size = (state.buffer_size[0] // 2, state.buffer_size[1] // 2)
+        b_topleft = self.phys_to_buffer_pos(p_topleft, state.p_buffer_center, state.scale,
+                                            b_half_size)
         # Adjust the size to the buffer scale (on top of the earlier image
         # scale)
-        final_size = (scaled_im_size[0] * self.scale, scaled_im_size[1] * self.scale)
+        final_size = (scaled_im_size[0] * state.scale, scaled_im_size[1] * state.scale)
 
         return b_topleft + final_size
 
@@ -35,7 +35,7 @@ from odemis.gui.comp.canvas import CAN_ZOOM, CAN_DRAG, CAN_FOCUS, BitmapCanvas
 from odemis.gui.comp.overlay.view import HistoryOverlay, PointSelectOverlay, MarkingLineOverlay, CurveOverlay
 from odemis.gui.util import wxlimit_invocation, ignore_dead, img, \
     call_in_wx_main
-from odemis.gui.util.img import format_rgba_darray
+from odemis.gui.util.img import format_rgba_darray, BGRAImageCache
 from odemis.model import VigilantAttributeBase
 from odemis.util import units
 import time
@@ -77,6 +77,12 @@ class DblMicroscopeCanvas(canvas.DraggableCanvas):
       this flag).
     """
 
+    # BGRA version of the images displayed, shared by all the canvases
+    _bgra_cache = BGRAImageCache()
+
+    # Merging the images of many streams can be slow: don't block the GUI
+    threaded_rendering = True
+
     def __init__(self, *args, **kwargs):
         canvas.DraggableCanvas.__init__(self, *args, **kwargs)
 
@@ -121,8 +127,16 @@ class DblMicroscopeCanvas(canvas.DraggableCanvas):
 
         self.focus_timer = None
 
-        # Simple image caching dictionary {obj_id: rgb image}
-        self.images_cache = {}
+        # The RGB images currently displayed, each of them holds a reference
+        # to its BGRA version in the shared cache.
+        self.images_cache = []
+
+    def _on_destroy(self, evt):
+        # Release the images, so that the shared cache doesn't keep them
+        for im in self.images_cache:
+            self._bgra_cache.release(im)
+        self.images_cache = []
+        super(DblMicroscopeCanvas, self)._on_destroy(evt)
 
     # Ability manipulation
 
@@ -425,26 +439,24 @@ class DblMicroscopeCanvas(canvas.DraggableCanvas):
 
         # add the images in order
         ims = []
-        im_cache = {}
-        images_cache = {}
-        for rgbim, blend_mode, name, _ in images:
+        im_cache = []
+        for rgbim, blend_mode, name, s in images:
+            ostream = s.stream if isinstance(s, DataProjection) else s
             if isinstance(rgbim, tuple): # tuple of tuple of tiles
                 if len(rgbim) == 0 or len(rgbim[0]) == 0:
                     continue
                 first_tile = rgbim[0][0]
                 md = first_tile.metadata
+                ostream.recordLatency("display", first_tile)
                 new_array = []
                 for tile_column in rgbim:
                     new_array_col = []
                     for tile in tile_column:
-                        tile_id = id(tile)
-                        if tile_id in self.images_cache:
-                            rgba_tile = self.images_cache[tile_id]
-                        else:
-                            rgba_tile = format_rgba_darray(tile)
-                        images_cache[tile_id] = rgba_tile
+                        # The BGRA tile is shared with the other canvases
+                        # => use a new view on it to attach the metadata
+                        rgba_tile = model.DataArray(self._bgra_cache.acquire(tile), md)
+                        im_cache.append(tile)
                         new_array_col.append(rgba_tile)
-                        rgba_tile.metadata = md
                     new_array.append(tuple(new_array_col))
                 # creates a 2D tuple with the converted tiles
                 rgba_im = tuple(new_array)
@@ -455,41 +467,33 @@ class DblMicroscopeCanvas(canvas.DraggableCanvas):
                 pos = util.img.getCenterOfTiles(rgba_im, tiles_merged_shape)
             else:
                 # Get converted RGBA image from cache, or create it and cache it
-                # On large images it costs 100 ms (per image and per canvas)
-                im_id = id(rgbim)
-                if im_id in self.images_cache:
-                    rgba_im = self.images_cache[im_id]
-                else:
-                    rgba_im = format_rgba_darray(rgbim)
-                im_cache[im_id] = rgba_im
+                # The cache is shared between all the canvases, so that an
+                # image shown in several views is only converted once.
+                rgba_im = self._bgra_cache.acquire(rgbim)
+                im_cache.append(rgbim)
 
                 md = rgbim.metadata
                 pos = md[model.MD_POS]
+                ostream.recordLatency("display", rgbim)
 
             scale = md[model.MD_PIXEL_SIZE]
             rot = md.get(model.MD_ROTATION, 0)
             shear = md.get(model.MD_SHEAR, 0)
             flip = md.get(model.MD_FLIP, 0)
 
-            # Replace the old cache, so the obsolete RGBA images can be garbage collected
-            self.images_cache = im_cache
-
             keepalpha = False
             ims.append((rgba_im, pos, scale, keepalpha, rot, shear, flip, blend_mode, name))
 
+        # Release the previous images (after acquiring the new ones, so that the
+        # images still displayed are not converted again), so the obsolete RGBA
+        # images can be garbage collected
+        for im in self.images_cache:
+            self._bgra_cache.release(im)
+        self.images_cache = im_cache
+
         # TODO: Canvas needs to accept the NDArray (+ specific attributes recorded separately).
         self.set_images(ims)
 
-        # For debug only:
-        # if images:
-        #     self._lastest_datetime = max(im[0].metadata.get(model.MD_ACQ_DATE, 0) for im in images)
-        # else:
-        #     self._lastest_datetime = 0
-
-        # if self._lastest_datetime > 0:
-        #     logging.debug("Updated canvas list %g s after acquisition",
-        #                   time.time() - self._lastest_datetime)
-
         self.merge_ratio = self.microscope_view.stream_tree.kwargs.get("merge", 0.5)
 
     # FIXME: it shouldn't need to ignore deads, as the subscription should go
@@ -967,9 +971,42 @@ class DblMicroscopeCanvas(canvas.DraggableCanvas):
             except ZeroDivisionError:
                 self._fps_ol.labels[0].text = u"∞ fps"
             self._last_frame_update = now
+
+            # One label per stream with the statistics of its dataflow
+            lines = self._get_dataflow_stats_text()
+            for i, l in enumerate(lines, 1):
+                if i < len(self._fps_ol.labels):
+                    self._fps_ol.labels[i].text = l
+                else:
+                    self._fps_ol.add_label(l, pos=(0, 16 * i))
+            for label in self._fps_ol.labels[len(lines) + 1:]:
+                label.text = u""
         else:
             super(DblMicroscopeCanvas, self).draw(interpolate_data=interpolate_data)
 
+    def _get_dataflow_stats_text(self):
+        """
+        return (list of unicode): for each stream with a dataflow, a line
+          summarising its statistics (frame rate, dropped frames and latency
+          at each stage)
+        """
+        if self.microscope_view is None:
+            return []
+
+        lines = []
+        for s in self.microscope_view.stream_tree.getStreams():
+            ostream = s.stream if isinstance(s, DataProjection) else s
+            stats = ostream.getDataFlowStats()
+            if not stats:
+                continue
+            lat = stats["latency"]
+            lat_txt = u", ".join(u"%s %s" % (st, units.readable_str(lat[st][0], "s", sig=2))
+                                 for st in model.DATAFLOW_STAGES if st in lat)
+            lines.append(u"%s: %s fps, %d dropped, latency: %s" %
+                         (s.name.value, units.readable_str(stats["rate"], sig=3),
+                          stats["dropped"], lat_txt))
+        return lines
+
     # TODO: just return best scale and center? And let the caller do what it wants?
     # It would allow to decide how to redraw depending if it's on size event or more high level.
     def fit_to_content(self, recenter=False):
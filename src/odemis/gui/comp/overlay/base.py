@@ -35,6 +35,7 @@ from __future__ import division
 import cairo
 import logging
 import math
+import numpy
 import wx
 from abc import ABCMeta, abstractmethod
 
@@ -45,6 +46,43 @@ from odemis.gui import EVT_BUFFER_SIZE
 from odemis.model import TupleVA
 
 
+def cull_and_decimate(positions, area, cell, groups=None):
+    """ Select the positions which are visible and distinguishable
+
+    Used to limit the number of markers to draw: the positions outside of the
+    area are dropped, and within each square cell of the area only one
+    position is kept (the one with the highest index).
+
+    :param positions: (ndarray of shape Nx2) positions in px (view or buffer coordinates)
+    :param area: (4 floats) left, top, right, bottom of the visible area, in px
+    :param cell: (0<float) size of the cells, in px
+    :param groups: (None or ndarray of N 0<=ints) if provided, only the positions of the
+        same group are merged together (eg, markers of the same size)
+
+    :return: (ndarray of ints) the indices of the positions to draw, in increasing order
+
+    """
+
+    l, t, r, b = area
+    x, y = positions[:, 0], positions[:, 1]
+    idx = numpy.flatnonzero((l <= x) & (x <= r) & (t <= y) & (y <= b))
+    if idx.size == 0:
+        return idx
+
+    # Index of the cell of each (visible) position
+    ncx = int((r - l) // cell) + 1
+    ncy = int((b - t) // cell) + 1
+    cx = ((x[idx] - l) // cell).astype(numpy.int64)
+    cy = ((y[idx] - t) // cell).astype(numpy.int64)
+    keys = cx + cy * ncx
+    if groups is not None:
+        keys += groups[idx].astype(numpy.int64) * (ncx * ncy)
+
+    # numpy.unique() returns the first occurrence => look from the end
+    _, ridx = numpy.unique(keys[::-1], return_index=True)
+    return numpy.sort(idx[idx.size - 1 - ridx])
+
+
 class Label(object):
     """ Small helper class that stores label properties """
 
@@ -1092,12 +1130,44 @@ class ViewOverlay(Overlay):
 
 class WorldOverlay(Overlay):
     """ This class displays an overlay on the buffer.
-    It's updated only every time the entire buffer is redrawn."""
+    It's updated only every time the entire buffer is redrawn.
+
+    By default, the overlay is drawn again at every update of the buffer. If the
+    overlay only changes on specific events (and not, for instance, at every
+    mouse move), it can set `cached` to True. Then the canvas keeps its rendering
+    and only draws it again when the view changes, or after `request_redraw` has
+    been called. To update the canvas immediately instead (eg, while dragging),
+    set `redraw_needed` to True before calling `update_drawing` of the canvas.
+    """
+
+    cached = False
 
     def __init__(self, *args, **kwargs):
         super(WorldOverlay, self).__init__(*args, **kwargs)
         self.cnvs.Bind(EVT_BUFFER_SIZE, self.on_buffer_size)
         self.offset_b = Vec(self.cnvs.get_half_buffer_size())
+        # Whether the cached rendering of the overlay is out of date
+        self.redraw_needed = True
+
+    def request_redraw(self):
+        """ Indicate that the overlay has changed and schedule an update of the canvas
+
+        This method can be called from any thread.
+
+        """
+        self.redraw_needed = True
+        wx.CallAfter(self.cnvs.request_drawing_update)
+
+    def activate(self):
+        super(WorldOverlay, self).activate()
+        # The rendering may depend on whether the overlay is active
+        if self.cached:
+            self.request_redraw()
+
+    def deactivate(self):
+        super(WorldOverlay, self).deactivate()
+        if self.cached:
+            self.request_redraw()
 
     def on_buffer_size(self, _):
         self.offset_b = Vec(self.cnvs.get_half_buffer_size())
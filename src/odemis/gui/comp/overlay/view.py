@@ -1334,14 +1334,26 @@ class PointSelectOverlay(base.ViewOverlay):
 class HistoryOverlay(base.ViewOverlay):
     """ Display rectangles on locations that the microscope was previously positioned at """
 
+    # Markers of the same size closer than this distance (in px) are drawn only once
+    MARKER_MIN_DIST = 2
+
     def __init__(self, cnvs, history_list_va):
         base.ViewOverlay.__init__(self, cnvs)
 
         self.trail_colour = conversion.hex_to_frgb(gui.FG_COLOUR_HIGHLIGHT)
         self.pos_colour = conversion.hex_to_frgb(gui.FG_COLOUR_EDIT)
         self.fade = True  # Fade older positions in the history list
+        # Keep the markers rendered, and only redraw them when the view or the
+        # history changes
+        self.cache_layer = True
+        self._layer = None  # cairo.ImageSurface with the markers drawn
+        self._layer_key = None  # settings used to draw the layer
+        self._history_version = 0  # increased every time the history changes
+
+        # The history, as numpy arrays: centers (Nx2) and sizes (N, NaN if unknown)
+        self._history_arr = (numpy.empty((0, 2)), numpy.empty((0,)))
         self.history = history_list_va  # ListVA  of (center, size) tuples
-        self.history.subscribe(self._on_history_update)
+        self.history.subscribe(self._on_history_update, init=True)
 
     def __str__(self):
         return "History (%d): \n" % len(self) + "\n".join([str(h) for h in self.history.value[-5:]])
@@ -1360,9 +1372,54 @@ class HistoryOverlay(base.ViewOverlay):
 
     # TODO: might need rate limiter (but normally stage position is changed rarely)
     # TODO: Make the update of the canvas image the responsibility of the viewport
-    def _on_history_update(self, _):
+    def _on_history_update(self, history):
+        centers = numpy.array([c for c, s in history], dtype=numpy.float64).reshape(-1, 2)
+        sizes = numpy.array([s[0] if s else numpy.nan for c, s in history], dtype=numpy.float64)
+        self._history_arr = (centers, sizes)
+        self._history_version += 1
         wx.CallAfter(self.cnvs.request_drawing_update)
 
+    def _get_markers(self, thumbnail):
+        """ Compute the markers to draw, dropping the ones not visible or hidden by others
+
+        thumbnail (bool): if True, the markers are computed for the thumbnail
+
+        return:
+            indices (ndarray of N ints): index of each marker in the history
+            v_centers (ndarray of shape Nx2): center of each marker in view coordinates
+            sizes (ndarray of N ints): size of each marker (in px)
+
+        """
+
+        centers, p_sizes = self._history_arr
+        # Same as phys_to_view(), for all the positions at once
+        offset = self.cnvs.get_half_buffer_size()
+        p_buffer_center = self.cnvs.p_buffer_center
+        cscale = self.cnvs.scale
+        margins = self.cnvs.margins
+        v_centers = numpy.empty_like(centers)
+        v_centers[:, 0] = numpy.round((centers[:, 0] - p_buffer_center[0]) * cscale
+                                      + offset[0]) - margins[0]
+        v_centers[:, 1] = numpy.round(-(centers[:, 1] - p_buffer_center[1]) * cscale
+                                      + offset[1]) - margins[1]
+
+        if thumbnail:
+            sizes = numpy.full(p_sizes.shape, 2, dtype=numpy.int64)
+        else:
+            with numpy.errstate(invalid="ignore"):
+                sizes = numpy.floor(p_sizes * cscale)
+                # Prevent the marker from becoming too small
+                sizes[sizes < 2] = 3
+            sizes[numpy.isnan(p_sizes)] = 5
+            sizes = sizes.astype(numpy.int64)
+
+        # Any marker partly in the view is visible
+        vsize = self.cnvs.ClientSize
+        msize = sizes.max() if sizes.size else 0
+        area = (-msize, -msize, vsize[0] + msize, vsize[1] + msize)
+        indices = base.cull_and_decimate(v_centers, area, self.MARKER_MIN_DIST, sizes)
+        return indices, v_centers[indices], sizes[indices]
+
     def draw(self, ctx, scale=None, shift=None):
         """
         scale (0<float): ratio between the canvas pixel size and the pixel size
@@ -1372,33 +1429,42 @@ class HistoryOverlay(base.ViewOverlay):
           it is scaled
         """
 
+        if scale or not self.cache_layer:
+            self._draw_markers(ctx, scale, shift)
+            return
+
+        vsize = tuple(self.cnvs.ClientSize)
+        key = (self._history_version, tuple(self.cnvs.p_buffer_center),
+               self.cnvs.scale, tuple(self.cnvs.margins), vsize)
+        if self._layer is None or self._layer_key != key:
+            layer = cairo.ImageSurface(cairo.FORMAT_ARGB32, max(1, vsize[0]), max(1, vsize[1]))
+            self._draw_markers(cairo.Context(layer))
+            self._layer = layer
+            self._layer_key = key
+
+        ctx.set_source_surface(self._layer, 0, 0)
+        ctx.paint()
+
+    def _draw_markers(self, ctx, scale=None, shift=None):
+        """ Draw all the markers of the history (cf draw()) """
+
         ctx.set_line_width(1)
-        offset = self.cnvs.get_half_buffer_size()
+        n = len(self._history_arr[1])
+        indices, v_centers, sizes = self._get_markers(bool(scale))
 
-        for i, (p_center, p_size) in enumerate(self.history.value):
-            alpha = (i + 1) * (0.8 / len(self.history.value)) + 0.2 if self.fade else 1.0
-            v_center = self.cnvs.phys_to_view(p_center, offset)
+        for i, v_center, size in zip(indices, v_centers, sizes):
+            alpha = (i + 1) * (0.8 / n) + 0.2 if self.fade else 1.0
 
             if scale:
                 v_center = (shift[0] + v_center[0] * scale,
                             shift[1] + v_center[1] * scale)
-                marker_size = (2, 2)
-            elif p_size:
-                marker_size = (int(p_size[0] * self.cnvs.scale),
-                               int(p_size[0] * self.cnvs.scale))
-
-                # Prevent the marker from becoming too small
-                if marker_size[0] < 2 or marker_size[1] < 2:
-                    marker_size = (3, 3)
-            else:
-                marker_size = (5, 5)
 
-            if i < len(self.history.value) - 1:
+            if i < n - 1:
                 colour = self.trail_colour
             else:
                 colour = self.pos_colour
 
-            self._draw_rect(ctx, v_center, marker_size, colour, alpha)
+            self._draw_rect(ctx, v_center, (size, size), colour, alpha)
 
     @staticmethod
     def _draw_rect(ctx, v_center, v_size, colour, alpha):
@@ -26,10 +26,12 @@ from __future__ import division
 import cairo
 import logging
 import math
+import numpy
 from odemis import model, util
 from odemis.acq.stream import UNDEFINED_ROI
 from odemis.gui.comp.overlay.base import Vec, WorldOverlay, SelectionMixin, DragMixin, \
-    PixelDataMixin, SEL_MODE_EDIT, SEL_MODE_CREATE, EDIT_MODE_BOX, EDIT_MODE_POINT, SpotModeBase
+    PixelDataMixin, SEL_MODE_EDIT, SEL_MODE_CREATE, EDIT_MODE_BOX, EDIT_MODE_POINT, SpotModeBase, \
+    cull_and_decimate
 from odemis.gui.util.raster import rasterize_line
 from odemis.util import clip_line
 import wx
@@ -506,6 +508,8 @@ class BoxOverlay(WorldOverlay):
     Currently used only for the scan stage limits
     """
 
+    cached = True
+
     def __init__(self, cnvs):
         WorldOverlay.__init__(self, cnvs)
 
@@ -521,7 +525,7 @@ class BoxOverlay(WorldOverlay):
         """ Set the dimensions of the rectangle """
         # Connect the provided VA to the overlay
         self.roi = util.normalize_rect(roi)
-        wx.CallAfter(self.cnvs.request_drawing_update)
+        self.request_redraw()
 
     def draw(self, ctx, shift=(0, 0), scale=1.0):
         """ Draw the selection as a rectangle and the repetition inside of that """
@@ -985,6 +989,8 @@ class SpectrumLineSelectOverlay(LineSelectOverlay, PixelDataMixin):
 class PixelSelectOverlay(WorldOverlay, PixelDataMixin, DragMixin):
     """ Selection overlay that allows the selection of a pixel in a data set """
 
+    cached = True
+
     def __init__(self, cnvs):
         WorldOverlay.__init__(self, cnvs)
         PixelDataMixin.__init__(self)
@@ -1010,20 +1016,21 @@ class PixelSelectOverlay(WorldOverlay, PixelDataMixin, DragMixin):
         self._selected_width_va.subscribe(self._on_width, init=False)
 
     def _on_selection(self, _):
-        """ Update the overlay when it's active and the line changes """
-        if self.active:
-            wx.CallAfter(self.cnvs.request_drawing_update)
+        """ Update the overlay when the selected pixel changes """
+        self.request_redraw()
 
     def _on_width(self, _):
-        """ Update the overlay when it's active and the line width changes """
-        if self.active:
-            wx.CallAfter(self.cnvs.request_drawing_update)
+        """ Update the overlay when the selection width changes """
+        self.request_redraw()
+
+    def set_data_properties(self, mpp, physical_center, resolution):
+        PixelDataMixin.set_data_properties(self, mpp, physical_center, resolution)
+        self.request_redraw()
 
     def deactivate(self):
         """ Clear the hover pixel when the overlay is deactivated """
         self._pixel_pos = None
         WorldOverlay.deactivate(self)
-        wx.CallAfter(self.cnvs.request_drawing_update)
 
     # Event handlers
 
@@ -1031,7 +1038,7 @@ class PixelSelectOverlay(WorldOverlay, PixelDataMixin, DragMixin):
 
         if self.active:
             self._pixel_pos = None
-            wx.CallAfter(self.cnvs.request_drawing_update)
+            self.request_redraw()
 
         WorldOverlay.on_leave(self, evt)
 
@@ -1054,6 +1061,7 @@ class PixelSelectOverlay(WorldOverlay, PixelDataMixin, DragMixin):
                     if self.is_over_pixel_data() and self.left_dragging:
                         self._selected_pixel_va.value = self._pixel_pos
                         logging.debug("Pixel %s selected", self._selected_pixel_va.value)
+                    self.redraw_needed = True
                     self.cnvs.update_drawing()
             else:
                 self.cnvs.reset_dynamic_cursor()
@@ -1074,6 +1082,7 @@ class PixelSelectOverlay(WorldOverlay, PixelDataMixin, DragMixin):
             if self._pixel_pos and self.is_over_pixel_data():
                 if self._selected_pixel_va.value != self._pixel_pos:
                     self._selected_pixel_va.value = self._pixel_pos
+                    self.redraw_needed = True
                     self.cnvs.update_drawing()
                     logging.debug("Pixel %s selected", self._selected_pixel_va.value)
             DragMixin._on_left_up(self, evt)
@@ -1140,6 +1149,8 @@ class PointsOverlay(WorldOverlay):
     MAX_DOT_RADIUS = 25.5
     MIN_DOT_RADIUS = 3.5
 
+    cached = True
+
     def __init__(self, cnvs):
         WorldOverlay.__init__(self, cnvs)
 
@@ -1147,6 +1158,9 @@ class PointsOverlay(WorldOverlay):
         self.point = None
         # The possible choices for point as a physical coordinates
         self.choices = set()
+        # Same as choices, but as a list and as an array (Nx2), in the same order
+        self._choices_list = []
+        self._choices_arr = numpy.empty((0, 2))
 
         self.min_dist = None
 
@@ -1174,9 +1188,11 @@ class PointsOverlay(WorldOverlay):
             self.cnvs.microscope_view.mpp.subscribe(self._on_mpp, init=True)
         else:
             self.cnvs.microscope_view.mpp.unsubscribe(self._on_mpp)
+        self.request_redraw()
 
     def _on_point_selected(self, _):
         """ Update the overlay when a point has been selected """
+        self.redraw_needed = True
         self.cnvs.repaint()
 
     def _on_mpp(self, mpp):
@@ -1184,6 +1200,7 @@ class PointsOverlay(WorldOverlay):
         (i.e. when the zoom level of the canvas changes)
         """
         self.dot_size = max(min(self.MAX_DOT_RADIUS, self.min_dist / mpp), self.MIN_DOT_RADIUS)
+        self.request_redraw()
 
     # Event Handlers
 
@@ -1194,10 +1211,12 @@ class PointsOverlay(WorldOverlay):
             if self.cursor_over_point and not self.cnvs.was_dragged:
                 self.point.value = self.cursor_over_point
                 logging.debug("Point %s selected", self.point.value)
+                self.redraw_needed = True
                 self.cnvs.update_drawing()
             elif self.cnvs.was_dragged:
                 self.cursor_over_point = None
                 self.b_hover_box = None
+                self.request_redraw()
 
         WorldOverlay.on_left_up(self, evt)
 
@@ -1206,6 +1225,7 @@ class PointsOverlay(WorldOverlay):
         if self.active:
             self.cursor_over_point = None
             self.b_hover_box = None
+            self.request_redraw()
 
         WorldOverlay.on_wheel(self, evt)
 
@@ -1219,19 +1239,20 @@ class PointsOverlay(WorldOverlay):
 
                 b_hover_box = None
 
-                for p_pos in self.choices:
-                    b_box_x, b_box_y = self.cnvs.phys_to_buffer(p_pos, offset)
-
-                    if abs(b_box_x - b_x) <= self.dot_size and abs(b_box_y - b_y) <= self.dot_size:
-                        # Calculate box in buffer coordinates
-                        b_hover_box = (b_box_x - self.dot_size,
-                                       b_box_y - self.dot_size,
-                                       b_box_x + self.dot_size,
-                                       b_box_y + self.dot_size)
-                        break
+                b_pos = self._choices_to_buffer(offset)
+                hover = numpy.flatnonzero((abs(b_pos[:, 0] - b_x) <= self.dot_size) &
+                                          (abs(b_pos[:, 1] - b_y) <= self.dot_size))
+                if hover.size:
+                    b_box_x, b_box_y = b_pos[hover[0]]
+                    # Calculate box in buffer coordinates
+                    b_hover_box = (b_box_x - self.dot_size,
+                                   b_box_y - self.dot_size,
+                                   b_box_x + self.dot_size,
+                                   b_box_y + self.dot_size)
 
                 if self.b_hover_box != b_hover_box:
                     self.b_hover_box = b_hover_box
+                    self.redraw_needed = True
                     self.cnvs.repaint()
 
             if self.cursor_over_point:
@@ -1260,8 +1281,23 @@ class PointsOverlay(WorldOverlay):
             min_dist = 100e-9  # m
 
         self.choices = frozenset(choices)
+        self._choices_list = list(self.choices)
+        self._choices_arr = numpy.array(self._choices_list, dtype=numpy.float64).reshape(-1, 2)
         self.min_dist = min_dist / 2  # radius
 
+    def _choices_to_buffer(self, offset):
+        """ Convert all the choices to buffer coordinates (cf phys_to_buffer())
+
+        offset (int, int): the offset to apply to the buffer coordinates
+        return (ndarray of shape Nx2): the positions in the same order as _choices_list
+        """
+        p_buffer_center = self.cnvs.p_buffer_center
+        scale = self.cnvs.scale
+        b_pos = numpy.empty_like(self._choices_arr)
+        b_pos[:, 0] = numpy.round((self._choices_arr[:, 0] - p_buffer_center[0]) * scale + offset[0])
+        b_pos[:, 1] = numpy.round(-(self._choices_arr[:, 1] - p_buffer_center[1]) * scale + offset[1])
+        return b_pos
+
     def draw(self, ctx, shift=(0, 0), scale=1.0):
 
         if not self.choices or not self.active:
@@ -1273,8 +1309,22 @@ class PointsOverlay(WorldOverlay):
         p_cursor_over = None
         offset = self.cnvs.get_half_buffer_size()
 
-        for p_pos in self.choices:
-            b_x, b_y = self.cnvs.phys_to_buffer(p_pos, offset)
+        # Only draw the points which are visible, and not hidden by another point
+        b_pos = self._choices_to_buffer(offset)
+        ds = self.dot_size
+        area = (-ds, -ds, offset[0] * 2 + ds, offset[1] * 2 + ds)
+        indices = cull_and_decimate(b_pos, area, ds)
+        # The selected and hovered points are always drawn
+        if self.point.value in self.choices:
+            indices = numpy.union1d(indices, [self._choices_list.index(self.point.value)])
+        if self.b_hover_box:
+            hover = numpy.flatnonzero((b_l <= b_pos[:, 0]) & (b_pos[:, 0] <= b_r) &
+                                      (b_t <= b_pos[:, 1]) & (b_pos[:, 1] <= b_b))
+            indices = numpy.union1d(indices, hover)
+
+        for i in indices:
+            p_pos = self._choices_list[i]
+            b_x, b_y = b_pos[i]
 
             ctx.new_sub_path()
             ctx.arc(b_x, b_y, self.dot_size, 0, 2 * math.pi)
@@ -1314,6 +1364,8 @@ class PointsOverlay(WorldOverlay):
 class MirrorArcOverlay(WorldOverlay, DragMixin):
     """ Overlay showing a mirror arc that the user can position over a mirror camera feed """
 
+    cached = True
+
     def __init__(self, cnvs):
         WorldOverlay.__init__(self, cnvs)
         DragMixin.__init__(self)
@@ -1365,15 +1417,20 @@ class MirrorArcOverlay(WorldOverlay, DragMixin):
         # The distance from the symmetry line  of the parabola to the center of the hole
         self.hole_y = (parabola_f * 2)
 
-        self.cnvs.request_drawing_update()
+        self.request_redraw()
 
     def set_hole_position(self, hole_pos_va):
         """
         Set the VA containing the coordinates of the center of the mirror
          (in physical coordinates)
         """
+        self.hole_pos_va.unsubscribe(self._on_hole_pos)
         self.hole_pos_va = hole_pos_va
-        self.cnvs.request_drawing_update()
+        self.hole_pos_va.subscribe(self._on_hole_pos, init=True)
+
+    def _on_hole_pos(self, _):
+        """ Update the overlay when the hole moves """
+        self.request_redraw()
 
     def on_left_down(self, evt):
         if self.active:
@@ -1402,6 +1459,7 @@ class MirrorArcOverlay(WorldOverlay, DragMixin):
             hole_pos_p = Vec(self.hole_pos_va.value) + Vec(d)
             self.hole_pos_va.value = (hole_pos_p.x, hole_pos_p.y)
             self.clear_drag()
+            self.redraw_needed = True
             self.cnvs.update_drawing()
             self.cnvs.reset_dynamic_cursor()
         else:
@@ -1410,6 +1468,7 @@ class MirrorArcOverlay(WorldOverlay, DragMixin):
     def on_motion(self, evt):
         if self.active and self.left_dragging:
             DragMixin._on_motion(self, evt)
+            self.redraw_needed = True
             self.cnvs.update_drawing()
         else:
             WorldOverlay.on_motion(self, evt)
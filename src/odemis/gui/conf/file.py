@@ -31,6 +31,7 @@ from odemis.acq.align import delphi
 from odemis.gui.util import get_picture_folder, get_home_folder
 
 CONF_PATH = os.path.join(get_home_folder(), u".config/odemis")
+PREVIEW_CACHE_PATH = os.path.join(get_home_folder(), u".cache/odemis/preview")
 ACQUI_PATH = get_picture_folder()
 
 
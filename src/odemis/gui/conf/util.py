@@ -48,6 +48,10 @@ import odemis.gui.conf as guiconf
 import odemis.util.units as utun
 
 
+# Marker for a value to be read from the VA (as None is a valid value)
+_READ_VALUE = object()
+
+
 def resolution_from_range(comp, va, conf, init=None):
     """ Construct a list of resolutions depending on range values
 
@@ -369,7 +373,7 @@ def bind_setting_context_menu(settings_entry):
     settings_entry.lbl_ctrl.Bind(wx.EVT_CONTEXT_MENU, show_reset_menu)
 
 
-def process_setting_metadata(hw_comp, setting_va, conf):
+def process_setting_metadata(hw_comp, setting_va, conf, value=_READ_VALUE):
     """ Process and return metadata belonging to the given VA
 
     Values will be built from the value of the VA, its properties and the provided configuration.
@@ -378,6 +382,7 @@ def process_setting_metadata(hw_comp, setting_va, conf):
         hw_comp (Component): Hardware component to which the VA belongs
         setting_va (VigilantAttribute): The VA containing the value of the setting
         conf (dict): A dictionary containing various configuration values for the setting
+        value (object): The current value of the VA. If not provided, it's read from the VA.
 
     Returns:
         (minimum value, maximum value, choices, unit)
@@ -407,9 +412,12 @@ def process_setting_metadata(hw_comp, setting_va, conf):
     except (AttributeError, NotApplicableError):
         pass
 
+    if value is _READ_VALUE:
+        value = setting_va.value
+
     # Ensure the range encompasses the current value
     if None not in (minv, maxv):
-        val = setting_va.value
+        val = value
         if isinstance(val, numbers.Real):
             minv, maxv = min(minv, val), max(maxv, val)
 
@@ -444,12 +452,12 @@ def process_setting_metadata(hw_comp, setting_va, conf):
             choices = set(c for c in choices if minv <= c <= maxv)
 
     # Ensure the choices contain the current value
-    if choices is not None and setting_va.value not in choices:
-        logging.info("Current value %s not in choices %s", setting_va.value, choices)
+    if choices is not None and value not in choices:
+        logging.info("Current value %s not in choices %s", value, choices)
         if isinstance(choices, set):
-            choices.add(setting_va.value)
+            choices.add(value)
         elif isinstance(choices, dict):
-            choices[setting_va.value] = unicode(setting_va.value)
+            choices[value] = unicode(value)
         else:
             logging.warning("Don't know how to extend choices of type %s", type(choices))
 
@@ -608,7 +616,8 @@ def label_to_human(camel_label):
     return re.sub(r"([A-Z])", r" \1", camel_label).capitalize()
 
 
-def create_setting_entry(container, name, va, hw_comp, conf=None, change_callback=None):
+def create_setting_entry(container, name, va, hw_comp, conf=None, change_callback=None,
+                         va_state=None):
     """ Determine what type on control to use for a setting and have the container create it
 
     Args:
@@ -618,6 +627,8 @@ def create_setting_entry(container, name, va, hw_comp, conf=None, change_callbac
         hw_comp (Component): The hardware component to which the setting belongs
         conf ({} or None): The optional configuration options for the control
         change_callback (callable): Callable to bind to the control's change event
+        va_state (None or dict): The state of the VA, as returned by
+            Component.getState(), to avoid reading again the current value
 
     Returns:
         SettingEntry
@@ -629,8 +640,14 @@ def create_setting_entry(container, name, va, hw_comp, conf=None, change_callbac
     # If no conf provided, set it to an empty dictionary
     conf = conf or {}
 
+    # The current value, only used to create the control
+    if va_state and "value" in va_state:
+        val = va_state["value"]
+    else:
+        val = va.value
+
     # Get the range and choices
-    min_val, max_val, choices, unit = process_setting_metadata(hw_comp, va, conf)
+    min_val, max_val, choices, unit = process_setting_metadata(hw_comp, va, conf, val)
     # Format the provided choices
     choices_formatted, choices_si_prefix = format_choices(choices)
     # Determine the control type to use, either from config or some 'smart' default
@@ -649,7 +666,7 @@ def create_setting_entry(container, name, va, hw_comp, conf=None, change_callbac
     logging.debug("Adding VA %s", label_text)
     # Create the needed wxPython controls
     if control_type == odemis.gui.CONTROL_READONLY:
-        val = va.value  # only format if it's a number
+        # only format if it's a number
         accuracy = conf.get('accuracy', 3)
         val_str = readable_str(val, unit, sig=accuracy)
         lbl_ctrl, value_ctrl = container.add_readonly_field(label_text, val_str)
@@ -659,7 +676,7 @@ def create_setting_entry(container, name, va, hw_comp, conf=None, change_callbac
                                      va_2_ctrl=value_formatter)
 
     elif control_type == odemis.gui.CONTROL_TEXT:
-        val = va.value  # only format if it's a number
+        # only format if it's a number
         accuracy = conf.get('accuracy', 3)
         val_str = readable_str(val, unit, sig=accuracy)
         lbl_ctrl, value_ctrl = container.add_text_field(label_text, val_str)
@@ -670,7 +687,6 @@ def create_setting_entry(container, name, va, hw_comp, conf=None, change_callbac
                                      events=wx.EVT_TEXT_ENTER)
 
     elif control_type in (odemis.gui.CONTROL_SAVE_FILE, odemis.gui.CONTROL_OPEN_FILE):
-        val = va.value
         if not val:
             config = guiconf.get_acqui_conf()
             val = config.last_path
@@ -707,7 +723,7 @@ def create_setting_entry(container, name, va, hw_comp, conf=None, change_callbac
                 factory = container.add_float_slider
         else:
             # guess from value(s)
-            known_values = [va.value, min_val, max_val]
+            known_values = [val, min_val, max_val]
             if choices is not None:
                 known_values.extend(list(choices))
             if any(isinstance(v, float) for v in known_values):
@@ -729,7 +745,7 @@ def create_setting_entry(container, name, va, hw_comp, conf=None, change_callbac
             'accuracy': conf.get('accuracy', 4),
         }
 
-        lbl_ctrl, value_ctrl = factory(label_text, va.value, ctrl_conf)
+        lbl_ctrl, value_ctrl = factory(label_text, val, ctrl_conf)
         setting_entry = SettingEntry(name=name, va=va, hw_comp=hw_comp,
                                      lbl_ctrl=lbl_ctrl, value_ctrl=value_ctrl,
                                      events=update_event)
@@ -784,7 +800,7 @@ def create_setting_entry(container, name, va, hw_comp, conf=None, change_callbac
     elif control_type == odemis.gui.CONTROL_CHECK:
         # Only supports boolean VAs
 
-        lbl_ctrl, value_ctrl = container.add_checkbox_control(label_text, value=va.value)
+        lbl_ctrl, value_ctrl = container.add_checkbox_control(label_text, value=val)
 
         setting_entry = SettingEntry(name=name, va=va, hw_comp=hw_comp,
                                      lbl_ctrl=lbl_ctrl, value_ctrl=value_ctrl,
@@ -47,6 +47,7 @@ from odemis.gui.util import img, get_picture_folder, call_in_wx_main, \
 from odemis.gui.util.widgets import ProgressiveFutureConnector, EllipsisAnimator
 from odemis.gui.win.acquisition import AcquisitionDialog, \
     ShowAcquisitionFileDialog
+from odemis.util import dataio as udataio
 from odemis.util import units
 from odemis.util.img import mergeTiles
 import os
@@ -222,7 +223,7 @@ class SnapshotController(object):
                                  timeout=3
                                  )
             # record everything to a file
-            exporter.export(filepath, raw_images, thumbnail)
+            udataio.save_acquisition(exporter, filepath, raw_images, thumbnail)
 
             logging.info("Snapshot saved as file '%s'.", filepath)
         except Exception:
@@ -714,7 +715,7 @@ class SparcAcquiController(object):
         if data:
             filename = self.filename.value
             exporter = dataio.get_converter(self.conf.last_format)
-            exporter.export(filename, data, thumb)
+            udataio.save_acquisition(exporter, filename, data, thumb)
             logging.info(u"Acquisition saved as file '%s'.", filename)
         else:
             logging.debug("Not saving into file '%s' as there is no data", filename)
@@ -23,13 +23,16 @@ This file is part of Odemis.
 from __future__ import division
 
 from collections import OrderedDict
+from concurrent import futures
+from concurrent.futures import CancelledError
 import logging
 from odemis.util import dataio as udataio
 from odemis.dataio import get_converter
 from odemis.gui.comp import popup
 from odemis.gui.conf import get_acqui_conf
 from odemis.gui.util import call_in_wx_main, formats_to_wildcards
-from odemis.gui.util.img import ar_to_export_data, spectrum_to_export_data, images_to_export_data, line_to_export_data
+from odemis.gui.util.img import ar_to_export_data, spectrum_to_export_data, images_to_export_data, line_to_export_data, \
+    spectrum_cube_to_export_data
 import os
 import time
 import wx
@@ -37,6 +40,7 @@ import wx
 
 PR_PREFIX = "Print-ready"
 PP_PREFIX = "Post-processing"
+PX_PREFIX = "All pixel spectra"
 
 # Dict str -> (tuple of str, tuple of str):
 #   export type -> possible exporters for PR, possible exporters for PP
@@ -45,6 +49,10 @@ EXPORTERS = {"spatial": (("PNG", "TIFF"), ("Serialized TIFF",)),
              "spectrum": (("PNG", "TIFF"), ("CSV",)),
              "spectrum-line": (("PNG", "TIFF"), ("CSV",))}
 
+# Dict str -> tuple of str:
+#   export type -> possible exporters for the spectrum of every pixel of the cube
+PX_EXPORTERS = {"spectrum": ("CSV",)}
+
 
 class ExportController(object):
     """
@@ -150,6 +158,10 @@ class ExportController(object):
         :param export_format: (str) the format name
         :param export_type: (str) spatial, AR, spectrum or spectrum-line
         """
+        if export_format.startswith(PX_PREFIX + " "):
+            self.export_pixel_spectra(filepath, export_format[len(PX_PREFIX) + 1:])
+            return
+
         try:
             exporter = get_converter(export_format)
             raw = export_format in EXPORTERS[export_type][1]
@@ -179,6 +191,58 @@ class ExportController(object):
         except Exception:
             logging.exception("Failed to export a %s view as %s", export_type, export_format)
 
+    def export_pixel_spectra(self, filepath, export_format):
+        """ Export the spectrum of every pixel of the spectrum cube displayed
+        in the focused view, while showing the progress.
+        Must be run in GUI main thread.
+
+        :param filepath: (str) full path to the destination file
+        :param export_format: (str) the format name
+        """
+        try:
+            exporter = get_converter(export_format)
+            self._conf.last_export_path = os.path.dirname(filepath)
+
+            vp = self.get_viewport_by_view(self._data_model.focussedView.value)
+            exported_data = spectrum_cube_to_export_data(vp.stream)
+            f = exporter.export_pixel_spectra(filepath, exported_data)
+        except Exception:
+            logging.exception("Failed to export all pixel spectra as %s", export_format)
+            return
+
+        dlg = wx.ProgressDialog("Exporting all pixel spectra",
+                                "The spectrum of every pixel is being exported to %s." % (filepath,),
+                                maximum=100,
+                                parent=self._main_frame,
+                                style=wx.PD_CAN_ABORT | wx.PD_APP_MODAL |
+                                      wx.PD_ELAPSED_TIME | wx.PD_REMAINING_TIME)
+        try:
+            while not f.done():
+                start, end = f.get_progress()
+                ratio = (time.time() - start) / max(end - start, 1e-3)
+                keep_going, _ = dlg.Update(int(min(max(ratio, 0), 0.99) * 100))
+                if not keep_going:
+                    f.cancel()
+                    break
+                futures.wait([f], timeout=0.1)
+        finally:
+            dlg.Destroy()
+
+        try:
+            f.result()
+        except CancelledError:
+            logging.info("Export of all pixel spectra into file '%s' cancelled", filepath)
+            return
+        except Exception:
+            logging.exception("Failed to export all pixel spectra as %s", export_format)
+            return
+
+        popup.show_message(self._main_frame,
+                           "Exported in %s" % (filepath,),
+                           timeout=3
+                           )
+        logging.info("Exported all pixel spectra into file '%s'.", filepath)
+
     def get_export_type(self, view):
         """
         Based on the given view gives the corresponding export type
@@ -351,6 +415,11 @@ class ExportController(object):
         for format_data in pp_formats:
             exporter = get_converter(format_data)
             export_formats[exporter.FORMAT] = (PP_PREFIX + " " + exporter.FORMAT, exporter.EXTENSIONS)
+        # Finally, the formats to export the spectrum of every pixel
+        for format_data in PX_EXPORTERS.get(export_type, ()):
+            exporter = get_converter(format_data)
+            px_format = PX_PREFIX + " " + exporter.FORMAT
+            export_formats[px_format] = (px_format, exporter.EXTENSIONS)
 
         if not export_formats:
             logging.error("No file converter found!")
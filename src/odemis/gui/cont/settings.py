@@ -115,13 +115,14 @@ class SettingsController(object):
         self.entries.append(ne)
         return ne
 
-    def add_setting_entry(self, name, va, hw_comp, conf=None):
+    def add_setting_entry(self, name, va, hw_comp, conf=None, va_state=None):
         """ Add a name/value pair to the settings panel.
 
         :param name: (string): name of the value
         :param va: (VigilantAttribute)
         :param hw_comp: (Component): the component that contains this VigilantAttribute
         :param conf: ({}): Configuration items that may override default settings
+        :param va_state: (None or dict): The state of the VA, as returned by Component.getState()
 
         """
 
@@ -130,7 +131,8 @@ class SettingsController(object):
         # Remove any 'empty panel' warning
         self.panel.clear_default_message()
 
-        ne = create_setting_entry(self.panel, name, va, hw_comp, conf, self.on_setting_changed)
+        ne = create_setting_entry(self.panel, name, va, hw_comp, conf, self.on_setting_changed,
+                                  va_state)
         self.entries.append(ne)
 
         if self.highlight_change:
@@ -401,18 +403,25 @@ class SettingsBarController(object):
 
         # Re-order the VAs of the component in the same order as in the config
         vas_names = util.sorted_according_to(vas_comp.keys(), vas_config.keys())
+        vas_names = [n for n in vas_names if n not in hidden]
+
+        # Read all the VAs at once, which is much faster than one by one
+        try:
+            vas_state = hw_comp.getState(vas_names)["vas"]
+        except Exception:
+            logging.exception("Failed to read the state of %s", hw_comp.name)
+            vas_state = {}
 
         for name in vas_names:
             try:
-                if name in hidden:
-                    continue
-                elif name in vas_config:
+                if name in vas_config:
                     va_conf = vas_config[name]
                 else:
                     logging.debug("No config found for %s: %s", hw_comp.role, name)
                     va_conf = None
                 va = vas_comp[name]
-                setting_controller.add_setting_entry(name, va, hw_comp, va_conf)
+                setting_controller.add_setting_entry(name, va, hw_comp, va_conf,
+                                                     vas_state.get(name))
             except TypeError:
                 msg = "Error adding %s setting for: %s"
                 logging.exception(msg, hw_comp.name, name)
@@ -32,6 +32,7 @@ import math
 import numpy
 from odemis import dataio, model
 from odemis.acq import calibration
+from odemis.acq._futures import executeTask
 from odemis.acq.align import AutoFocus, AutoFocusSpectrometer
 from odemis.acq.stream import OpticalStream, SpectrumStream, CLStream, EMStream, \
     ARStream, CLSettingsStream, ARSettingsStream, MonochromatorSettingsStream, RGBCameraStream, BrightfieldStream, RGBStream
@@ -43,16 +44,20 @@ from odemis.gui.comp.viewport import MicroscopeViewport, AngularResolvedViewport
     PlotViewport, SpatialSpectrumViewport
 from odemis.gui.conf import get_acqui_conf
 from odemis.gui.conf.data import get_local_vas, get_stream_settings_config
+from odemis.gui.conf.file import PREVIEW_CACHE_PATH
 from odemis.gui.cont import settings, tools
 from odemis.gui.cont.actuators import ActuatorController
 from odemis.gui.cont.microscope import SecomStateController, DelphiStateController
 from odemis.gui.cont.streams import StreamController
 from odemis.gui.util import call_in_wx_main
 from odemis.gui.util.widgets import ProgressiveFutureConnector, AxisConnector
-from odemis.util import units
-from odemis.util.dataio import data_to_static_streams, open_acquisition
+from odemis.gui.win.browser import AcquisitionBrowserDialog
+from odemis.util import units, preview
+from odemis.util.dataio import data_to_static_streams, open_acquisition, \
+    data_to_static_streams_iter
 import os.path
 import pkg_resources
+import threading
 import wx
 # IMPORTANT: wx.html needs to be imported for the HTMLWindow defined in the XRC
 # file to be correctly identified. See: http://trac.wxwidgets.org/ticket/3626
@@ -1338,6 +1343,11 @@ class AnalysisTab(Tab):
         tab_data = guimod.AnalysisGUIData(main_data)
         super(AnalysisTab, self).__init__(name, button, panel, main_frame, tab_data)
 
+        # ProgressiveFuture of the file being loaded (or None)
+        self._load_future = None
+        # Previews of the acquisition files (created when first needed)
+        self._preview_cache = None
+
         # Connect viewports
         viewports = panel.pnl_inspection_grid.viewports
         # Viewport type checking to avoid mismatches
@@ -1459,6 +1469,14 @@ class AnalysisTab(Tab):
             config = get_acqui_conf()
             path = config.last_path
 
+        # First propose the acquisitions of the directory, with their previews
+        ret, filename = self._browse_acquisitions(path)
+        if ret == wx.ID_OK:
+            self.load_data(filename)
+            return True
+        elif ret == wx.ID_CANCEL:
+            return False
+
         wildcards, formats = guiutil.formats_to_wildcards(formats_to_ext, include_all=True)
         dialog = wx.FileDialog(self.panel,
                                message="Choose a file to load",
@@ -1481,12 +1499,135 @@ class AnalysisTab(Tab):
         self.load_data(filename, fmt)
         return True
 
+    def _browse_acquisitions(self, path):
+        """
+        Let the user pick one of the acquisition files of a directory, by
+          showing their thumbnails
+        path (unicode): the directory containing the acquisition files
+        return (int, unicode or None): wx.ID_OK and the selected file,
+          wx.ID_CANCEL if the user cancelled, or wx.ID_OPEN if the standard
+          file dialog should be used (eg, because there is no acquisition in
+          the directory).
+        """
+        try:
+            if self._preview_cache is None:
+                self._preview_cache = preview.PreviewCache(PREVIEW_CACHE_PATH)
+            dialog = AcquisitionBrowserDialog(self.panel, self._preview_cache, path)
+        except Exception:
+            logging.exception("Failed to browse the acquisitions of %s", path)
+            return wx.ID_OPEN, None
+
+        try:
+            if dialog.is_empty():
+                return wx.ID_OPEN, None
+            ret = dialog.ShowModal()
+            return ret, dialog.path
+        finally:
+            dialog.Destroy()
+
     def on_file_open_button(self, _):
         self.select_acq_file()
 
     def load_data(self, filename, fmt=None):
+        """
+        Open a file and display its content. The file is read in a separate
+          thread, and the streams are shown as soon as they are created, the
+          quickest ones first (cf data_to_static_streams_iter()).
+        filename (str): Name of the file to open
+        fmt (str or None): format of the file, or None to guess from the name
+        returns (ProgressiveFuture): to follow the loading. Its result is the
+          list of streams created.
+        """
+        self._cancel_loading()
+
+        f = model.ProgressiveFuture()
+        f.task_canceller = self._cancel_load_data
+        f._load_must_stop = threading.Event()
+        self._load_future = f
+
+        load_thread = threading.Thread(target=executeTask,
+                                       name="Analysis file loading",
+                                       args=(f, self._do_load_data, f, filename, fmt))
+        load_thread.daemon = True
+        load_thread.start()
+        f.add_done_callback(self._on_load_data_done)
+        return f
+
+    def _on_load_data_done(self, future):
+        try:
+            future.result()
+        except CancelledError:
+            logging.debug("Loading of the file cancelled")
+        except Exception as ex:
+            logging.exception("Failed to load the file")
+            self._show_load_error("Failed to open the file:\n\n%s" % (ex,))
+
+    @call_in_wx_main
+    def _show_load_error(self, msg):
+        """
+        Tell the user that (part of) the file couldn't be loaded
+        msg (str): description of the failure
+        """
+        dlg = wx.MessageDialog(self.main_frame, msg, "File loading failed",
+                               wx.OK | wx.ICON_WARNING)
+        dlg.ShowModal()
+        dlg.Destroy()
+
+    def _cancel_load_data(self, future):
+        """
+        Canceller of the load_data() future
+        """
+        future._load_must_stop.set()
+        return True
+
+    def _cancel_loading(self):
+        """
+        Stop the loading of the previous file (if it's still going on)
+        """
+        f = self._load_future
+        if f is not None and not f.done():
+            logging.debug("Cancelling the loading of the previous file")
+            f.cancel()
+        self._load_future = None
+
+    def _do_load_data(self, future, filename, fmt):
+        """
+        Opens the file and creates the streams, while pushing them to the GUI
+        future (ProgressiveFuture): the future of load_data()
+        returns (list of Stream): all the streams created
+        raises:
+            CancelledError() if cancelled
+        """
+        logging.debug("Opening file %s", filename)
+        # Pyramidal data is not read at this point, only the metadata
         data = open_acquisition(filename, fmt)
-        self.display_new_data(filename, data)
+        if future._load_must_stop.is_set():
+            raise CancelledError()
+
+        self._reset_display(filename, data, future)
+
+        # Load as much as possible, and report the data which failed at the end
+        failures = []
+
+        def on_error(das, ex):
+            logging.warning("Failed to create a stream for the data of shape %s",
+                            das[0].shape, exc_info=True)
+            names = [d.metadata.get(model.MD_DESCRIPTION, "Data of shape %s" % (d.shape,))
+                     for d in das]
+            failures.append("%s: %s" % (", ".join(names), ex))
+
+        streams = []
+        for sts in data_to_static_streams_iter(data, on_error=on_error):
+            if future._load_must_stop.is_set():
+                raise CancelledError()
+            self._add_streams(sts, future)
+            streams.extend(sts)
+
+        logging.debug("Loaded %d streams from %s", len(streams), filename)
+        if failures and not future._load_must_stop.is_set():
+            self._show_load_error("Some data of the file could not be displayed:\n\n%s" %
+                                  ("\n".join(failures),))
+        return streams
 
     @call_in_wx_main
     def display_new_data(self, filename, data):
@@ -1498,6 +1639,28 @@ class AnalysisTab(Tab):
         data (list of DataArray(Shadow)): List of data to display.
           Should contain at least one array
         """
+        self._cancel_loading()
+        self._reset_display(filename, data)
+        if filename is None:
+            return
+
+        # Create streams from data
+        streams = data_to_static_streams(data)
+        self._add_streams(streams)
+
+    @call_in_wx_main
+    def _reset_display(self, filename, data, future=None):
+        """
+        Removes all the current streams, and prepares the display of new data
+        filename (str or None): Name of the file containing the data.
+          If None, just the current data will be closed.
+        data (list of DataArray(Shadow)): List of data which will be displayed.
+          Only their metadata is used.
+        future (Future or None): if the loading is cancelled, nothing is done
+        """
+        if future is not None and future.cancelled():
+            return
+
         # Remove all the previous streams
         self._stream_bar_controller.clear()
         # Clear any old plots
@@ -1508,6 +1671,10 @@ class AnalysisTab(Tab):
         # Reset tool, layout and visible views
         self.tab_data_model.tool.value = guimod.TOOL_NONE
         self.tab_data_model.viewLayout.value = guimod.VIEW_LAYOUT_22
+        self.tab_data_model.visible_views.value = list(self._def_views)
+        self.tb.enable_button(tools.TOOL_POINT, False)
+        self.tb.enable_button(tools.TOOL_LINE, False)
+        self._settings_controller.show_calibration_panel(False, False)
 
         if filename is None:
             return
@@ -1516,8 +1683,6 @@ class AnalysisTab(Tab):
         # streams are removed. That seems to incur extra time => Make sure every
         # stream entry is deleted fast.
 
-        new_visible_views = list(self._def_views)  # Use a copy
-
         # Create a new file info model object
         fi = guimod.FileInfo(filename)
 
@@ -1537,17 +1702,30 @@ class AnalysisTab(Tab):
             fi.metadata[model.MD_ACQ_DATE] = max(acq_dates)
         self.tab_data_model.acq_fileinfo.value = fi
 
-        # Create streams from data
-        streams = data_to_static_streams(data)
+    @call_in_wx_main
+    def _add_streams(self, streams, future=None):
+        """
+        Display new streams, in addition to the ones already present
+        streams (list of Stream): the streams to add
+        future (Future or None): if the loading is cancelled, nothing is done
+        """
+        if future is not None and future.cancelled():
+            return
 
         # Spectrum and AR streams are, for now, considered mutually exclusive
         spec_streams = [s for s in streams if isinstance(s, acqstream.SpectrumStream)]
         ar_streams = [s for s in streams if isinstance(s, acqstream.ARStream)]
+        all_streams = self.tab_data_model.streams.value + streams
+        has_spec = any(isinstance(s, acqstream.SpectrumStream) for s in all_streams)
+        has_ar = any(isinstance(s, acqstream.ARStream) for s in all_streams)
+
+        new_visible_views = list(self._def_views)  # Use a copy
 
         # TODO: Move viewport related code to ViewPortController
         # TODO: to support multiple (types of) streams (eg, AR+Spec+Spec), do
         # this every time the streams are hidden/displayed.
-        if spec_streams:
+        if spec_streams and not any(isinstance(s, acqstream.SpectrumStream)
+                                    for s in self.tab_data_model.streams.value):
             # ########### Track pixel and line selection
 
             # FIXME: This temporary "fix" only binds the first spectrum stream to the pixel and
@@ -1588,18 +1766,7 @@ class AnalysisTab(Tab):
                 spec_stream.selected_pixel.subscribe(self._on_pixel_select, init=True)
                 spec_stream.selected_line.subscribe(self._on_line_select, init=True)
 
-            # ########### Combined views and spectrum view visible
-
-            new_visible_views[0:2] = self._def_views[2:4]  # Combined
-            new_visible_views[2] = self.panel.vp_spatialspec.microscope_view
-            new_visible_views[3] = self.panel.vp_inspection_plot.microscope_view
-
-            # ########### Update tool menu
-
-            self.tb.enable_button(tools.TOOL_POINT, True)
-            self.tb.enable_button(tools.TOOL_LINE, True)
-
-        elif ar_streams:
+        if ar_streams and not has_spec:
 
             # ########### Track point selection
 
@@ -1611,6 +1778,18 @@ class AnalysisTab(Tab):
 
                 ar_stream.point.subscribe(self._on_point_select, init=True)
 
+        if has_spec:
+            # ########### Combined views and spectrum view visible
+
+            new_visible_views[0:2] = self._def_views[2:4]  # Combined
+            new_visible_views[2] = self.panel.vp_spatialspec.microscope_view
+            new_visible_views[3] = self.panel.vp_inspection_plot.microscope_view
+
+            # ########### Update tool menu
+
+            self.tb.enable_button(tools.TOOL_POINT, True)
+            self.tb.enable_button(tools.TOOL_LINE, True)
+        elif has_ar:
             # ########### Combined views and Angular view visible
 
             new_visible_views[0] = self._def_views[1] # SEM only
@@ -1628,7 +1807,7 @@ class AnalysisTab(Tab):
             self.tb.enable_button(tools.TOOL_LINE, False)
 
         # Only show the panels that fit the current streams
-        self._settings_controller.show_calibration_panel(len(ar_streams) > 0, len(spec_streams) > 0)
+        self._settings_controller.show_calibration_panel(has_ar, has_spec)
 
         # Load the Streams and their data into the model and views
         for s in streams:
@@ -23,13 +23,17 @@ Odemis. If not, see http://www.gnu.org/licenses/.
 """
 from __future__ import division
 
+import functools
 import logging
 import numpy
 from odemis import model
 from odemis.acq.stream import RGBStream
 from odemis.dataio import tiff
 from odemis.gui import test
-from odemis.gui.comp.canvas import BufferedCanvas
+from odemis.gui.comp.canvas import BufferedCanvas, LayerRenderer
+from odemis.gui.comp.overlay.world import BoxOverlay, PixelSelectOverlay
+import threading
+import time
 import unittest
 import wx
 
@@ -56,6 +60,44 @@ def get_image_from_buffer(canvas):
     return wx.ImageFromBitmap(result_bmp)
 
 
+class TestLayerRenderer(unittest.TestCase):
+
+    def test_only_latest(self):
+        """
+        Check only the result of the latest request is received
+        """
+        results = []
+        done = threading.Event()
+
+        def render(val, must_stop):
+            # Slow rendering, which can be stopped
+            for i in range(10):
+                if must_stop.is_set():
+                    return None
+                time.sleep(0.01)
+            return val
+
+        def callback(res):
+            results.append(res)
+            done.set()
+
+        renderer = LayerRenderer("test")
+        try:
+            for i in range(5):
+                renderer.submit(functools.partial(render, i), callback)
+            self.assertTrue(done.wait(5))
+            time.sleep(0.2)
+            self.assertEqual(results, [4])
+
+            # Once terminated, nothing is rendered anymore
+            renderer.terminate()
+            renderer.submit(functools.partial(render, 5), callback)
+            time.sleep(0.2)
+            self.assertEqual(results, [4])
+        finally:
+            renderer.terminate()
+
+
 class TestDblMicroscopeCanvas(test.GuiTestCase):
     frame_class = test.test_gui.xrccanvas_frame
 
@@ -173,6 +215,74 @@ class TestDblMicroscopeCanvas(test.GuiTestCase):
                       result_im.Height // 2 - 200 + shift[1])
         self.assertEqual(px2, (0, 0, 255))
 
+    # @unittest.skip("simple")
+    def test_cached_layers(self):
+        """
+        Check the images and the cached overlays are only rendered when needed
+        """
+        self.view.show_crosshair.value = False
+        im1 = model.DataArray(numpy.zeros((11, 11, 3), dtype="uint8"))
+        im1[5, 5] = [255, 0, 0]
+        im1.metadata[model.MD_PIXEL_SIZE] = (1e-5, 1e-5)
+        im1.metadata[model.MD_POS] = (0, 0)
+        im1.metadata[model.MD_DIMS] = "YXC"
+        stream1 = RGBStream("s1", im1)
+        self.view.addStream(stream1)
+        test.gui_loop(0.5)
+
+        box_ol = BoxOverlay(self.canvas)
+        self.canvas.add_world_overlay(box_ol)
+        self.canvas.update_drawing()
+        images_layer = self.canvas._images_layer
+        static_layer = self.canvas._static_layer
+        self.assertIsNotNone(images_layer)
+        self.assertIsNotNone(static_layer)
+        self.assertFalse(box_ol.redraw_needed)
+
+        # Nothing changed => the same layers are used
+        self.canvas.update_drawing()
+        self.assertIs(self.canvas._images_layer, images_layer)
+        self.assertIs(self.canvas._static_layer, static_layer)
+
+        # Only the overlay changed
+        box_ol.set_dimensions((-10e-6, -10e-6, 10e-6, 10e-6))
+        self.canvas.update_drawing()
+        self.assertIs(self.canvas._images_layer, images_layer)
+        self.assertIsNot(self.canvas._static_layer, static_layer)
+
+        # The view changed => everything is rendered again
+        static_layer = self.canvas._static_layer
+        self.view.mpp.value *= 2
+        test.gui_loop(0.5)
+        self.assertIsNot(self.canvas._images_layer, images_layer)
+        self.assertIsNot(self.canvas._static_layer, static_layer)
+
+        self.canvas.remove_world_overlay(box_ol)
+        self.canvas.update_drawing()
+        self.assertIsNone(self.canvas._static_layer)
+
+    # @unittest.skip("simple")
+    def test_cached_pixel_overlay(self):
+        """
+        Check the pixel selection overlay is rendered again when the selection changes
+        """
+        pixel_ol = PixelSelectOverlay(self.canvas)
+        self.canvas.add_world_overlay(pixel_ol)
+        pixel_ol.set_data_properties(1e-05, (0.0, 0.0), (17, 19))
+        pixel_ol.connect_selection(model.TupleVA((8, 8)), model.IntVA(1))
+        test.gui_loop(0.5)
+        static_layer = self.canvas._static_layer
+        self.assertIsNotNone(static_layer)
+        self.assertFalse(pixel_ol.redraw_needed)
+
+        pixel_ol._selected_pixel_va.value = (2, 3)
+        self.assertTrue(pixel_ol.redraw_needed)
+        test.gui_loop(0.5)
+        self.assertIsNot(self.canvas._static_layer, static_layer)
+        self.assertFalse(pixel_ol.redraw_needed)
+
+        self.canvas.remove_world_overlay(pixel_ol)
+
     # @unittest.skip("simple")
     def test_basic_move(self):
         mpp = 0.00001
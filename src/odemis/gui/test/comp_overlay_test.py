@@ -27,6 +27,7 @@ import logging
 import math
 import numpy
 from odemis import model
+from odemis.gui.comp.overlay.base import cull_and_decimate
 from odemis.gui.comp.overlay import view as vol
 from odemis.gui.comp.overlay import world as wol
 from odemis.gui.cont.tools import TOOL_LINE
@@ -421,6 +422,19 @@ class OverlayTestCase(test.GuiTestCase):
 
         test.gui_loop()
 
+    def test_cull_and_decimate(self):
+        pos = numpy.array([(0, 0), (0.5, 0.5), (10, 10), (100, 100), (-5, 3), (1, 1)])
+        # Out of the area => dropped, and in the same cell => only the latest kept
+        idx = cull_and_decimate(pos, (0, 0, 50, 50), 2)
+        numpy.testing.assert_array_equal(idx, [2, 5])
+
+        # Different groups are never merged
+        idx = cull_and_decimate(pos, (0, 0, 50, 50), 2, numpy.array([1, 2, 1, 1, 1, 1]))
+        numpy.testing.assert_array_equal(idx, [1, 2, 5])
+
+        idx = cull_and_decimate(numpy.empty((0, 2)), (0, 0, 50, 50), 2)
+        self.assertEqual(len(idx), 0)
+
     # END View overlay test cases
 
     # World overlay test cases
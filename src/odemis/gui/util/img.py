@@ -25,15 +25,20 @@ Odemis. If not, see http://www.gnu.org/licenses/.
 from __future__ import division
 
 import cairo
+from concurrent.futures import ThreadPoolExecutor
+import cv2
 import logging
 import math
+import multiprocessing
 import numpy
 from odemis import model
 from odemis.acq.stream import DataProjection
 from odemis.gui import BLEND_SCREEN, BLEND_DEFAULT
 from odemis.gui.comp.overlay.base import Label
 from odemis.util import intersect, fluo, conversion, polar, img, units
+import threading
 import time
+import weakref
 import wx
 
 import odemis.acq.stream as acqstream
@@ -79,15 +84,13 @@ def format_rgba_darray(im_darray, alpha=None):
     return (DataArray or tuple of tuple of DataArray): The return type is the same of im_darray
     """
     if im_darray.shape[-1] == 3:
-        h, w, _ = im_darray.shape
-        rgba_shape = (h, w, 4)
-        rgba = numpy.empty(rgba_shape, dtype=numpy.uint8)
-        # Copy the data over with bytes 0 and 2 being swapped (RGB becomes BGR through the -1)
-        rgba[:, :, 0:3] = im_darray[:, :, ::-1]
-        if alpha is not None:
+        # Swap R and B, and add an opaque alpha channel, in one pass.
+        # Note: OpenCV doesn't accept non-contiguous arrays
+        rgb = numpy.ascontiguousarray(im_darray, dtype=numpy.uint8).view(numpy.ndarray)
+        rgba = cv2.cvtColor(rgb, cv2.COLOR_RGB2BGRA)
+        if alpha is not None and alpha != 255:
             rgba[:, :, 3] = alpha
-            if alpha != 255:
-                rgba = scale_to_alpha(rgba)
+            rgba = scale_to_alpha(rgba)
         new_darray = model.DataArray(rgba)
 
         return new_darray
@@ -98,11 +101,8 @@ def format_rgba_darray(im_darray, alpha=None):
                 logging.warning("Trying to convert to BGRA an array already in BGRA")
                 return im_darray
 
-        rgba = numpy.empty(im_darray.shape, dtype=numpy.uint8)
-        rgba[:, :, 0] = im_darray[:, :, 2]
-        rgba[:, :, 1] = im_darray[:, :, 1]
-        rgba[:, :, 2] = im_darray[:, :, 0]
-        rgba[:, :, 3] = im_darray[:, :, 3]
+        rgba = numpy.ascontiguousarray(im_darray, dtype=numpy.uint8).view(numpy.ndarray)
+        rgba = cv2.cvtColor(rgba, cv2.COLOR_RGBA2BGRA)
         new_darray = model.DataArray(rgba)
         new_darray.metadata['byteswapped'] = True
         return new_darray
@@ -110,6 +110,66 @@ def format_rgba_darray(im_darray, alpha=None):
         raise ValueError("Unsupported colour depth!")
 
 
+class BGRAImageCache(object):
+    """
+    Cache of the images converted to BGRA (as needed by Cairo), which can be
+    shared by several users (eg, canvases). Whatever the number of users, an
+    image is only converted once. Each user must release the images it doesn't
+    need anymore. Once no user needs an image, it's dropped from the cache.
+    The original images are only weakly referenced, so an image which is not
+    used anywhere else is also dropped, even if a user forgot to release it.
+    """
+
+    def __init__(self):
+        # id of the original image -> [weak reference to the original image,
+        #                              BGRA image, reference count]
+        # The entry is removed as soon as the original image is deleted, so
+        # the id cannot be reused while in the cache.
+        self._cache = {}
+        # Reentrant, as the garbage collector can remove an entry at any time
+        self._lock = threading.RLock()
+
+    def _on_image_deleted(self, ref):
+        with self._lock:
+            for k, entry in list(self._cache.items()):
+                if entry[0] is ref:
+                    del self._cache[k]
+                    break
+
+    def acquire(self, im):
+        """
+        Get the BGRA version of an image, and increase its reference count.
+        im (DataArray of shape YX3 or YX4): the RGB(A) image
+        return (DataArray of shape YX4): the BGRA image, which must not be modified
+        """
+        with self._lock:
+            entry = self._cache.get(id(im))
+            if entry is None:
+                ref = weakref.ref(im, self._on_image_deleted)
+                entry = [ref, format_rgba_darray(im), 0]
+                self._cache[id(im)] = entry
+            entry[2] += 1
+            return entry[1]
+
+    def release(self, im):
+        """
+        Decrease the reference count of an image. If no one references it anymore,
+        it's removed from the cache.
+        im (DataArray): the original image, as passed to acquire()
+        """
+        with self._lock:
+            entry = self._cache.get(id(im))
+            if entry is None:
+                logging.warning("Trying to release image %s not in the cache", id(im))
+                return
+            entry[2] -= 1
+            if entry[2] <= 0:
+                del self._cache[id(im)]
+
+    def __len__(self):
+        return len(self._cache)
+
+
 def min_type(data):
     """Find the minimum type code needed to represent the elements in `data`.
     """
@@ -692,6 +752,119 @@ def draw_image(ctx, im_data, p_im_center, buffer_center, buffer_scale,
     ctx.restore()
 
 
+def _get_image_transform(b_im_rect, total_scale, rotation=None, shear=None, flip=None):
+    """
+    Compute the affine transformation from the image pixels to the buffer, as
+      applied to the Cairo context by draw_image()
+    b_im_rect (float, float, float, float): top, left, width, height rectangle
+      containing the image in buffer coordinates
+    total_scale (float, float): size of an image pixel in buffer pixels
+    rotation, shear, flip: cf draw_image()
+    return (ndarray of shape 3x3): the transformation matrix, in homogeneous
+      coordinates
+    """
+    x, y, w, h = b_im_rect
+
+    def around_center(m):
+        """ Apply the transformation m around the center of the image """
+        c = (x + w / 2, y + h / 2)
+        tr = numpy.array([[1, 0, c[0]], [0, 1, c[1]], [0, 0, 1]])
+        tr_back = numpy.array([[1, 0, -c[0]], [0, 1, -c[1]], [0, 0, 1]])
+        return tr.dot(m).dot(tr_back)
+
+    mat = numpy.identity(3)
+    # Same conditions as apply_rotation(), apply_shear() and apply_flip()
+    if rotation is not None and abs(rotation) >= 0.008:  # > 0.5°
+        cos, sin = math.cos(-rotation), math.sin(-rotation)
+        mat = mat.dot(around_center(numpy.array([[cos, -sin, 0], [sin, cos, 0], [0, 0, 1]])))
+
+    if shear is not None and abs(shear) >= 0.0005:
+        mat = mat.dot(around_center(numpy.array([[1, 0, 0], [shear, 1, 0], [0, 0, 1]])))
+
+    if flip:
+        fx = -1 if flip & wx.HORIZONTAL == wx.HORIZONTAL else 1
+        fy = -1 if flip & wx.VERTICAL == wx.VERTICAL else 1
+        mat = mat.dot(around_center(numpy.array([[fx, 0, 0], [0, fy, 0], [0, 0, 1]])))
+
+    # Move to the top-left of the image, and scale
+    return mat.dot(numpy.array([[total_scale[0], 0, x], [0, total_scale[1], y], [0, 0, 1]]))
+
+
+# dtypes which can be directly resampled by OpenCV
+_CV_WARP_DTYPES = {numpy.dtype(numpy.uint8), numpy.dtype(numpy.uint16), numpy.dtype(numpy.int16),
+                   numpy.dtype(numpy.float32), numpy.dtype(numpy.float64)}
+
+
+def warp_image(im_data, p_im_center, buffer_center, buffer_scale, buffer_size,
+               im_scale=(1.0, 1.0), rotation=None, shear=None, flip=None,
+               interpolate_data=False, out=None):
+    """ Resample the given image into the buffer, keeping the original values
+
+    The image is placed exactly as draw_image() does, but instead of drawing
+    it with Cairo (which only supports 8-bit RGB), it is resampled with an
+    affine transformation, in the original data type.
+
+    im_data (DataArray of shape YX or YXC): Image to resample
+    p_im_center (2-tuple float)
+    buffer_center (float, float): The buffer center
+    buffer_scale (float, float): The buffer scale
+    buffer_size (int, int): The buffer size
+    im_scale (float, float)
+    rotation (float): Clock-wise rotation around the image center in radians
+    shear (float): Horizontal shearing of the image data (around it's center)
+    flip (wx.HORIZONTAL | wx.VERTICAL): If and how to flip the image
+    interpolate_data (boolean): use a bilinear interpolation if True, otherwise
+      the nearest pixel.
+    out (None or ndarray): array of shape (buffer_size[1], buffer_size[0]) +
+      im_data.shape[2:] where to write the result. It must be filled with 0's.
+      If None, a new array with the same dtype as im_data is created.
+    return (ndarray): the buffer containing the image. The parts which are not
+      covered by the image are 0. If out is provided, it's the same array.
+    """
+    if out is None:
+        out = numpy.zeros((buffer_size[1], buffer_size[0]) + im_data.shape[2:], dtype=im_data.dtype)
+
+    # Determine the rectangle the image would occupy in the buffer
+    b_im_rect = calc_img_buffer_rect(im_data, im_scale, p_im_center, buffer_center, buffer_scale, buffer_size)
+
+    # To small to see, or outside of the buffer, so no need to draw
+    if (b_im_rect[2] < 1 or b_im_rect[3] < 1 or
+        not intersect((0, 0) + tuple(buffer_size), b_im_rect)):
+        logging.debug("Skipping warp: image not visible")
+        return out
+
+    total_scale = im_scale[0] / buffer_scale[0], im_scale[1] / buffer_scale[1]
+    mat = _get_image_transform(b_im_rect, total_scale, rotation, shear, flip)
+    # Cairo places the center of the pixels at +0.5, while OpenCV places it at
+    # the integer coordinates.
+    half_px = numpy.array([[1, 0, 0.5], [0, 1, 0.5], [0, 0, 1]])
+    half_px_back = numpy.array([[1, 0, -0.5], [0, 1, -0.5], [0, 0, 1]])
+    mat = half_px_back.dot(mat).dot(half_px)
+
+    if interpolate_data:
+        cv_interp = cv2.INTER_LINEAR
+    else:
+        cv_interp = cv2.INTER_NEAREST
+
+    src = numpy.ascontiguousarray(im_data).view(numpy.ndarray)
+    if src.dtype not in _CV_WARP_DTYPES:
+        # Exact as long as the values fit in the mantissa (ie, < 2**53)
+        src = src.astype(numpy.float64)
+
+    dsize = (int(buffer_size[0]), int(buffer_size[1]))
+    if out.dtype == src.dtype and out.flags.c_contiguous:
+        cv2.warpAffine(src, mat[:2], dsize, dst=out,
+                       flags=cv_interp, borderMode=cv2.BORDER_CONSTANT, borderValue=0)
+    else:
+        warped = cv2.warpAffine(src, mat[:2], dsize,
+                                flags=cv_interp, borderMode=cv2.BORDER_CONSTANT, borderValue=0)
+        if numpy.issubdtype(out.dtype, numpy.integer) and warped.dtype.kind == "f":
+            numpy.rint(warped, out=warped)
+        out[...] = warped
+
+    return out
+
+
 def calculate_raw_ar(data, bg_data):
     """
     Project the AR data to equirectangular
@@ -1128,6 +1301,25 @@ def bar_plot(ctx, data, data_width, range_x, data_height, range_y, client_size,
     ctx.fill()
 
 
+def spectrum_cube_to_export_data(stream):
+    """
+    Creates the raw representation of the whole spectrum cube, to export the
+      spectrum of every pixel
+
+    stream (SpectrumStream): spectrum stream
+
+    returns (model.DataArray of shape C, Y, X)
+    """
+    cube = stream.get_spectrum_cube()
+    spectrum_range, unit = stream.get_spectrum_range()
+
+    md = cube.metadata.copy()
+    if unit == "m":
+        md[model.MD_WL_LIST] = spectrum_range
+    md[model.MD_ACQ_TYPE] = model.MD_AT_SPECTRUM
+    return model.DataArray(cube, md)
+
+
 def spectrum_to_export_data(stream, raw):
     """
     Creates either raw or WYSIWYG representation for the spectrum data plot
@@ -1360,20 +1552,37 @@ def line_to_export_data(stream, raw):
         return line_img
 
 
+def get_export_legend_height(n, width):
+    """
+    n (int): number of streams in the legend
+    width (int): width of the legend (in px)
+    return (int): the height (in px) of the legend drawn by draw_export_legend()
+    """
+    return n * int(width * SUB_LAYER) + int(width * MAIN_LAYER)
+
+
 def draw_export_legend(images, buffer_size, buffer_scale,
-                       hfw, date, stream=None, logo=None):
+                       hfw, date, stream=None, logo=None, out=None):
     """
     Draws legend to be attached to the exported image
     stream (None or Stream): if provided, the text corresponding to this stream
       will be indicated by a bullet before the name
+    out (None or ndarray of 3 dims Y,X,4 of uint8): C-contiguous array where to
+      draw the legend. Its shape must be (get_export_legend_height(), buffer_size[0], 4).
+      If None, a new array is created.
     return (ndarray of 3 dims Y,X,4) : the legend in RGB
     """
     # TODO: get a "raw" parameter to know whether to display in RGB or greyscale
     # TODO: get a better argument (name) than "stream"
 
     n = len(images)
-    full_shape = (n * int(buffer_size[0] * SUB_LAYER) + int(buffer_size[0] * MAIN_LAYER), buffer_size[0], 4)
-    legend_rgb = numpy.zeros(full_shape, dtype=numpy.uint8)
+    full_shape = (get_export_legend_height(n, buffer_size[0]), buffer_size[0], 4)
+    if out is None:
+        legend_rgb = numpy.zeros(full_shape, dtype=numpy.uint8)
+    else:
+        if out.shape != full_shape:
+            raise ValueError("Legend array of shape %s, while expected %s" % (out.shape, full_shape))
+        legend_rgb = out
     legend_surface = cairo.ImageSurface.create_for_data(
                         legend_rgb, cairo.FORMAT_ARGB32,
                         legend_rgb.shape[1], legend_rgb.shape[0])
@@ -1609,7 +1818,6 @@ def get_ordered_images(streams, raw=False):
             else:
                 data_raw = s.raw[0]
 
-            # Pretend to be RGB for the drawing by cairo
             if numpy.can_cast(im_min_type, min_type(data_raw)):
                 im_min_type = min_type(data_raw)
 
@@ -1621,8 +1829,9 @@ def get_ordered_images(streams, raw=False):
                     logging.warning("Doesn't know how to export data of %s spatial raw", s.name.value)
                     continue
 
-            # Split the bits in R,G,B,A
-            data = _pack_data_into_rgba(data_raw)
+            # The data is used as-is. Just make sure the metadata of the stream
+            # will not be modified when adding the drawing information.
+            data = model.DataArray(data_raw, data_raw.metadata.copy())
 
         if isinstance(s.raw, tuple):  # s.raw has tiles
             md = s.raw[0][0].metadata
@@ -1686,7 +1895,10 @@ def convert_streams_to_images(streams, raw=False):
     # add the images in order
     ims = []
     for rgbim, blend_mode, stream, md in images:
-        rgba_im = format_rgba_darray(rgbim)
+        if raw:
+            rgba_im = rgbim  # Raw data is not converted
+        else:
+            rgba_im = format_rgba_darray(rgbim)
         keepalpha = False
         date = rgbim.metadata.get(model.MD_ACQ_DATE, None)
         scale = rgbim.metadata[model.MD_PIXEL_SIZE]
@@ -1781,13 +1993,6 @@ def images_to_export_data(streams, view_hfw, view_pos,
     if not images:
         raise LookupError("There is no stream data to be exported")
 
-    if interpolate_data and im_min_type != numpy.uint8:
-        # TODO: make interpolation work also with 16 bits and higher data type
-        # For now, as Cairo is convinced it's RGB, it computes wrong data.
-        # cf util.img.rescale_hq() before casting to RGB?
-        logging.debug("Disabling interpolation as data is not 8 bits")
-        interpolate_data = False
-
     # Find min pixel size
     min_pxs = min(im.metadata['dc_scale'] for im in images)
 
@@ -1847,62 +2052,85 @@ def images_to_export_data(streams, view_hfw, view_pos,
 
     # The list of images to export
     data_to_export = []
-
     n = len(images)
-    for i, im in enumerate(images):
-        if raw or i == 0:  # when print-ready, share the surface to draw
-            # Make surface based on the maximum resolution
-            data_to_draw = numpy.zeros((buffer_size[1], buffer_size[0], 4), dtype=numpy.uint8)
-            surface = cairo.ImageSurface.create_for_data(
-                data_to_draw, cairo.FORMAT_ARGB32, buffer_size[0], buffer_size[1])
-            ctx = cairo.Context(surface)
-
-        if im.metadata['blend_mode'] == BLEND_SCREEN or raw:
-            # No transparency in case of "raw" export
-            merge_ratio = 1.0
-        elif i == n - 1: # last image
-            if n == 1:
-                merge_ratio = 1.0
-            else:
-                merge_ratio = draw_merge_ratio
-        else:
-            merge_ratio = 1 - i / n
+    legend_h = get_export_legend_height(n, buffer_size[0])
 
-        draw_image(
-            ctx,
-            im,
-            im.metadata['dc_center'],
-            buffer_center,
-            buffer_scale,
-            buffer_size,
-            merge_ratio,
-            im_scale=im.metadata['dc_scale'],
-            rotation=im.metadata['dc_rotation'],
-            shear=im.metadata['dc_shear'],
-            flip=im.metadata['dc_flip'],
-            blend_mode=im.metadata['blend_mode'],
-            interpolate_data=interpolate_data
-        )
-
-        # Create legend for each raw image
-        if raw:
+    if raw:
+        # Each stream is exported as a separate image, in its original data
+        # type. The data is directly resampled (instead of being drawn with
+        # Cairo), which is independent for every stream, so it's done in parallel.
+        # Each image is written in an array large enough to also contain the legend.
+        ldata = [numpy.zeros((buffer_size[1] + legend_h, buffer_size[0]), dtype=im_min_type)
+                 for im in images]
+        with ThreadPoolExecutor(max_workers=multiprocessing.cpu_count()) as executor:
+            futs = []
+            for im, data in zip(images, ldata):
+                f = executor.submit(warp_image,
+                                    im,
+                                    im.metadata['dc_center'],
+                                    buffer_center,
+                                    buffer_scale,
+                                    buffer_size,
+                                    im_scale=im.metadata['dc_scale'],
+                                    rotation=im.metadata['dc_rotation'],
+                                    shear=im.metadata['dc_shear'],
+                                    flip=im.metadata['dc_flip'],
+                                    interpolate_data=interpolate_data,
+                                    out=data[:buffer_size[1]])
+                futs.append(f)
+            for f in futs:
+                f.result()  # To raise any exception
+
+        # Create legend for each raw image (drawn with Cairo, so one at a time)
+        for im, data in zip(images, ldata):
             legend_rgb = draw_export_legend(images, buffer_size, buffer_scale,
                                             view_hfw[0], im.metadata['date'],
                                             im.metadata['stream'], logo)
-
-            new_data_to_draw = _unpack_raw_data(data_to_draw, im_min_type)
-            legend_as_raw = _adapt_rgb_to_raw(legend_rgb, new_data_to_draw)
-            data_with_legend = numpy.append(new_data_to_draw, legend_as_raw, axis=0)
+            _adapt_rgb_to_raw(legend_rgb, data[:buffer_size[1]], out=data[buffer_size[1]:])
 
             md = {model.MD_DESCRIPTION: im.metadata['name']}
-            data_to_export.append(model.DataArray(data_with_legend, md))
+            data_to_export.append(model.DataArray(data, md))
+    else:
+        # All the images are blended into one RGB image, followed by the legend
+        data_with_legend = numpy.zeros((buffer_size[1] + legend_h, buffer_size[0], 4), dtype=numpy.uint8)
+        data_to_draw = data_with_legend[:buffer_size[1]]  # Contiguous view
+        surface = cairo.ImageSurface.create_for_data(
+            data_to_draw, cairo.FORMAT_ARGB32, buffer_size[0], buffer_size[1])
+        ctx = cairo.Context(surface)
 
-    # Create legend for print-ready
-    if not raw:
+        for i, im in enumerate(images):
+            if im.metadata['blend_mode'] == BLEND_SCREEN:
+                merge_ratio = 1.0
+            elif i == n - 1:  # last image
+                if n == 1:
+                    merge_ratio = 1.0
+                else:
+                    merge_ratio = draw_merge_ratio
+            else:
+                merge_ratio = 1 - i / n
+
+            draw_image(
+                ctx,
+                im,
+                im.metadata['dc_center'],
+                buffer_center,
+                buffer_scale,
+                buffer_size,
+                merge_ratio,
+                im_scale=im.metadata['dc_scale'],
+                rotation=im.metadata['dc_rotation'],
+                shear=im.metadata['dc_shear'],
+                flip=im.metadata['dc_flip'],
+                blend_mode=im.metadata['blend_mode'],
+                interpolate_data=interpolate_data
+            )
+        surface.flush()
+
+        # Create legend for print-ready
         date = max(im.metadata['date'] for im in images)
-        legend_rgb = draw_export_legend(images, buffer_size, buffer_scale,
-                                        view_hfw[0], date, logo=logo)
-        data_with_legend = numpy.append(data_to_draw, legend_rgb, axis=0)
+        draw_export_legend(images, buffer_size, buffer_scale,
+                           view_hfw[0], date, logo=logo,
+                           out=data_with_legend[buffer_size[1]:])
         data_with_legend[:, :, [2, 0]] = data_with_legend[:, :, [0, 2]]
         md = {model.MD_DIMS: 'YXC'}
         data_to_export.append(model.DataArray(data_with_legend, md))
@@ -1910,53 +2138,28 @@ def images_to_export_data(streams, view_hfw, view_pos,
     return data_to_export
 
 
-def _adapt_rgb_to_raw(imrgb, data_raw):
+def _adapt_rgb_to_raw(imrgb, data_raw, out=None):
     """
     imrgb (ndarray Y,X,4): RGB image to convert to a greyscale
     data_raw (DataArray): Raw image (to know the dtype and min/max)
+    out (None or ndarray Y,X): array where to store the result. It must have
+      the same dtype as data_raw. If None, a new array is created.
     return (ndarray Y,X)
     """
     dtype = data_raw.dtype.type
     blkval = numpy.min(data_raw)
     a = (numpy.max(data_raw) - blkval) / 255
-    im_as_raw = imrgb[:, :, 0].astype(dtype)
+    if out is None:
+        im_as_raw = imrgb[:, :, 0].astype(dtype)
+    else:
+        im_as_raw = out
+        im_as_raw[...] = imrgb[:, :, 0]
     numpy.multiply(im_as_raw, a, out=im_as_raw, casting="unsafe")
     im_as_raw += dtype(blkval)
 
     return im_as_raw
 
 
-def _pack_data_into_rgba(data_raw):
-    """
-    Convert a "raw" data (as in "greyscale") into data pretending to be RGBA 8-bit
-    data_raw (ndarray Y,X)
-    return (ndrarray Y,X,4)
-    """
-    data = numpy.empty((data_raw.shape[0], data_raw.shape[1], 4), dtype=numpy.uint8)
-    # TODO: why in this order?? due to RGBA -> BGRA after?
-    data[:, :, 0] = numpy.right_shift(data_raw[:, :], 8) & 255
-    data[:, :, 1] = data_raw[:, :] & 255
-    data[:, :, 2] = numpy.right_shift(data_raw[:, :], 16) & 255
-    data[:, :, 3] = numpy.right_shift(data_raw[:, :], 24) & 255
-    return model.DataArray(data, data_raw.metadata)
-
-
-def _unpack_raw_data(imrgb, dtype):
-    """
-    Convert back the "raw" (as in "greyscale with lots of bits") data from data
-      pretending to be RGBA 8-bit
-
-    imrgb (ndarray Y,X,4)
-    dtype: type of the output data (should be some uint <= 64 bits)
-    return (ndrarray Y,X)
-    """
-    imraw = (numpy.left_shift(imrgb[:, :, 2], 8, dtype=numpy.uint32)
-             | imrgb[:, :, 1]
-             | numpy.left_shift(imrgb[:, :, 0], 16, dtype=numpy.uint32)
-             | numpy.left_shift(imrgb[:, :, 3], 24, dtype=numpy.uint32))
-    return imraw.astype(dtype)
-
-
 def add_alpha_byte(im_darray, alpha=255):
     # if im_darray is a tuple of tuple of tiles, return a tuple of tuple of processed tiles
     if isinstance(im_darray, tuple):
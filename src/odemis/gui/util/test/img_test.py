@@ -23,6 +23,7 @@ from __future__ import division
 
 import cairo
 import logging
+import math
 import numpy
 import os
 import time
@@ -107,6 +108,34 @@ class TestRGBA(unittest.TestCase):
         self.assertTrue((bgraim[1, 1] == [200, 100, 1, 255]).all())
         self.assertTrue((bgraim[2, 2] == [200, 100, 1, 0]).all())
 
+    def test_bgra_cache(self):
+        rgbim = model.DataArray(numpy.zeros((32, 64, 3), dtype=numpy.uint8))
+        rgbim[:, :, 0] = 1
+        rgbim[:, :, 2] = 200
+        rgbim2 = model.DataArray(numpy.zeros((16, 8, 3), dtype=numpy.uint8))
+
+        cache = img.BGRAImageCache()
+        # Two users of the same image => only converted once
+        bgraim = cache.acquire(rgbim)
+        self.assertTrue((bgraim[1, 1] == [200, 0, 1, 255]).all())
+        self.assertIs(cache.acquire(rgbim), bgraim)
+        cache.acquire(rgbim2)
+        self.assertEqual(len(cache), 2)
+
+        cache.release(rgbim)
+        self.assertEqual(len(cache), 2)
+        cache.release(rgbim)
+        self.assertEqual(len(cache), 1)
+
+        # Once released, it's converted again
+        bgraim_new = cache.acquire(rgbim)
+        self.assertIsNot(bgraim_new, bgraim)
+        numpy.testing.assert_array_equal(bgraim_new, bgraim)
+
+        # Once the original image is deleted, it's dropped, even if not released
+        del rgbim, rgbim2
+        self.assertEqual(len(cache), 0)
+
 
 class TestARExport(unittest.TestCase):
 
@@ -382,6 +411,51 @@ class TestSpectrumLineExport(unittest.TestCase):
             pass
 
 
+class TestWarpImage(unittest.TestCase):
+
+    def setUp(self):
+        data = numpy.arange(12, dtype=numpy.uint16).reshape(3, 4) * 1000 + 1
+        self.image = model.DataArray(data)
+
+    def test_simple(self):
+        """
+        The values are kept and placed like draw_image() would
+        """
+        out = img.warp_image(self.image, (0, 0), (0, 0), (1, 1), (10, 10))
+        self.assertEqual(out.shape, (10, 10))
+        self.assertEqual(out.dtype, numpy.uint16)
+        numpy.testing.assert_array_equal(out[3:6, 3:7], self.image)
+        self.assertEqual(numpy.count_nonzero(out), self.image.size)
+
+        # Zoom x2
+        out = img.warp_image(self.image, (0, 0), (0, 0), (0.5, 0.5), (10, 10))
+        numpy.testing.assert_array_equal(out[2:8, 1:9], self.image.repeat(2, 0).repeat(2, 1))
+        self.assertEqual(numpy.count_nonzero(out), self.image.size * 4)
+
+        # Outside of the buffer => empty
+        out = img.warp_image(self.image, (100, 100), (0, 0), (1, 1), (10, 10))
+        self.assertEqual(numpy.count_nonzero(out), 0)
+
+    def test_transform(self):
+        out = img.warp_image(self.image, (0, 0), (0, 0), (1, 1), (10, 10), flip=wx.HORIZONTAL)
+        numpy.testing.assert_array_equal(out[3:6, 3:7], self.image[:, ::-1])
+
+        out = img.warp_image(self.image, (0, 0), (0, 0), (1, 1), (10, 10), rotation=math.pi / 2)
+        numpy.testing.assert_array_equal(out[3:7, 3:6], numpy.rot90(self.image))
+        self.assertEqual(numpy.count_nonzero(out), self.image.size)
+
+    def test_out(self):
+        """
+        Data types not supported directly by OpenCV, and pre-allocated output
+        """
+        im = model.DataArray(self.image.astype(numpy.uint32) * 100000)
+        out = numpy.zeros((12, 10), dtype=numpy.uint32)
+        ret = img.warp_image(im, (0, 0), (0, 0), (1, 1), (10, 10), out=out[:10])
+        self.assertEqual(ret.dtype, numpy.uint32)
+        numpy.testing.assert_array_equal(out[3:6, 3:7], im)
+        self.assertEqual(numpy.count_nonzero(out[10:]), 0)
+
+
 class TestSpatialExport(unittest.TestCase):
 
     def setUp(self):
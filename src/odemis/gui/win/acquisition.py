@@ -38,6 +38,7 @@ from odemis.gui.main_xrc import xrcfr_acq
 from odemis.gui.util import call_in_wx_main, formats_to_wildcards, \
     wxlimit_invocation
 from odemis.gui.util.widgets import ProgressiveFutureConnector
+from odemis.util import dataio as udataio
 from odemis.util import units
 import os.path
 import time
@@ -522,7 +523,7 @@ class AcquisitionDialog(xrcfr_acq):
             thumb = acq.computeThumbnail(self._view.stream_tree, future)
             filename = self.filename.value
             exporter = dataio.get_converter(self.conf.last_format)
-            exporter.export(filename, data, thumb)
+            udataio.save_acquisition(exporter, filename, data, thumb)
             logging.info("Acquisition saved as file '%s'.", filename)
             # Allow to see the acquisition
             self.btn_secom_acquire.SetLabel("VIEW")
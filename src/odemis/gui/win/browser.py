@@ -0,0 +1,174 @@
+# -*- coding: utf-8 -*-
+"""
+Created on 19 Oct 2026
+
+@author: Éric Piel
+
+Copyright © 2026 Éric Piel, Delmic
+
+This file is part of Odemis.
+
+Odemis is free software: you can redistribute it and/or modify it under the terms of the GNU
+General Public License version 2 as published by the Free Software Foundation.
+
+Odemis is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even
+the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU General
+Public License for more details.
+
+You should have received a copy of the GNU General Public License along with Odemis. If not,
+see http://www.gnu.org/licenses/.
+
+"""
+
+from __future__ import division
+
+import logging
+from odemis.gui.util import wxlimit_invocation
+from odemis.gui.util.img import NDImage2wxImage, wxImageScaleKeepRatio
+from odemis.util import preview
+import os
+import time
+import wx
+
+
+class AcquisitionBrowserDialog(wx.Dialog):
+    """
+    Dialog to select an acquisition file among the ones of a directory, by
+    looking at their thumbnails. The previews come from a PreviewCache, which is
+    filled in the background while the dialog is shown, so that browsing a
+    directory already indexed is instant.
+    ShowModal() returns wx.ID_OK if a file was selected (see .path), wx.ID_OPEN
+    if the user wants to pick a file with the standard file dialog, or
+    wx.ID_CANCEL.
+    """
+    thumbnail_size = (160, 120)  # px
+
+    def __init__(self, parent, cache, directory):
+        """
+        cache (PreviewCache): the cache of the previews
+        directory (unicode): the directory containing the acquisition files
+        """
+        wx.Dialog.__init__(self, parent, wx.ID_ANY, title="Choose a file to load",
+                           size=(800, 600),
+                           style=wx.DEFAULT_DIALOG_STYLE | wx.RESIZE_BORDER)
+
+        self.path = None  # The file selected
+        self._cache = cache
+        self._directory = directory
+        self._index_future = None
+        self._files = preview.list_acquisition_files(directory)
+        self._summaries = {}  # index of the file -> summary
+        self._pending = set(range(len(self._files)))  # indices of the files without preview
+
+        sizer = wx.BoxSizer(wx.VERTICAL)
+
+        self._list = wx.ListCtrl(self, style=wx.LC_ICON | wx.LC_SINGLE_SEL | wx.LC_AUTOARRANGE)
+        self._images = wx.ImageList(*self.thumbnail_size)
+        # The first image is for the files without thumbnail (yet)
+        self._images.Add(wx.EmptyImage(*self.thumbnail_size).ConvertToBitmap())
+        self._list.AssignImageList(self._images, wx.IMAGE_LIST_NORMAL)
+        for i, fn in enumerate(self._files):
+            self._list.InsertImageStringItem(i, os.path.basename(fn), 0)
+        self._list.Bind(wx.EVT_LIST_ITEM_SELECTED, self._on_item_selected)
+        self._list.Bind(wx.EVT_LIST_ITEM_ACTIVATED, self._on_item_activated)
+        sizer.Add(self._list, 1, wx.EXPAND | wx.ALL, 5)
+
+        # Summary of the content of the selected file
+        self._txt_summary = wx.StaticText(self, wx.ID_ANY, "")
+        sizer.Add(self._txt_summary, 0, wx.EXPAND | wx.ALL, 5)
+
+        btnsizer = wx.BoxSizer(wx.HORIZONTAL)
+        btn = wx.Button(self, wx.ID_OPEN, label="Other file...")
+        btn.Bind(wx.EVT_BUTTON, self._on_other_file)
+        btnsizer.Add(btn, 0, wx.ALL, 5)
+        btnsizer.AddStretchSpacer()
+        btn = wx.Button(self, wx.ID_CANCEL)
+        btnsizer.Add(btn, 0, wx.ALL, 5)
+        self._btn_ok = wx.Button(self, wx.ID_OK, label="Open")
+        self._btn_ok.SetDefault()
+        self._btn_ok.Enable(False)
+        btnsizer.Add(self._btn_ok, 0, wx.ALL, 5)
+        sizer.Add(btnsizer, 0, wx.EXPAND | wx.ALL, 5)
+
+        self.SetSizer(sizer)
+        self.CentreOnParent()
+
+        # Show straight away the previews already in the cache
+        self._update_previews()
+
+    def is_empty(self):
+        """
+        return (bool): True if the directory contains no acquisition file
+        """
+        return not self._files
+
+    def ShowModal(self):
+        # Index the files not yet in the cache, while the user is browsing
+        self._index_future = preview.index_directory(self._cache, self._directory)
+        self._index_future.add_update_callback(self._on_index_progress)
+        self._index_future.add_done_callback(self._on_index_progress)
+        try:
+            return wx.Dialog.ShowModal(self)
+        finally:
+            # The indexing would slow down the loading of the file
+            self._index_future.cancel()
+
+    def _on_index_progress(self, future, start=None, end=None):
+        self._update_previews()
+
+    @wxlimit_invocation(0.5)
+    def _update_previews(self):
+        """
+        Show the previews of the files which were added to the cache
+        """
+        for i in sorted(self._pending):
+            fn = self._files[i]
+            if fn not in self._cache:
+                continue
+            self._pending.discard(i)
+            try:
+                thumb, summary = self._cache.get(fn)
+            except Exception:
+                logging.info("Failed to read the preview of %s", fn, exc_info=True)
+                continue
+
+            self._summaries[i] = summary
+            if thumb is not None:
+                im = wxImageScaleKeepRatio(NDImage2wxImage(thumb), self.thumbnail_size)
+                self._list.SetItemImage(i, self._images.Add(im.ConvertToBitmap()))
+
+            if self._list.GetItemState(i, wx.LIST_STATE_SELECTED):
+                self._show_summary(i)
+
+    def _show_summary(self, i):
+        """
+        Display the summary of the content of a file
+        i (int): the index of the file
+        """
+        summary = self._summaries.get(i)
+        if summary is None:
+            self._txt_summary.SetLabel(self._files[i])
+            return
+
+        lines = [self._files[i]]
+        if summary["acq_date"] is not None:
+            lines.append("Acquired on %s" % time.strftime("%Y-%m-%d %H:%M:%S",
+                                                          time.localtime(summary["acq_date"])))
+        for d in summary["data"]:
+            lines.append(u"%s: %s" % (d["description"] or u"Data",
+                                      u" x ".join(str(s) for s in d["shape"])))
+        self._txt_summary.SetLabel(u"\n".join(lines))
+        self.Layout()
+
+    def _on_item_selected(self, evt):
+        i = evt.GetIndex()
+        self.path = self._files[i]
+        self._btn_ok.Enable(True)
+        self._show_summary(i)
+
+    def _on_item_activated(self, evt):
+        self.path = self._files[evt.GetIndex()]
+        self.EndModal(wx.ID_OK)
+
+    def _on_other_file(self, _):
+        self.EndModal(wx.ID_OPEN)
@@ -33,6 +33,8 @@ from ._dataflow import *
 from ._core import *
 from ._metadata import *
 from ._dataio import *
+from ._callstats import enableCallStats, disableCallStats, isCallStatsEnabled, \
+    getCallStats, resetCallStats, saveCallStats, loadCallStats
 
 
 #__all__ = []
@@ -0,0 +1,354 @@
+# -*- coding: utf-8 -*-
+'''
+Created on 18 Oct 2026
+
+@author: agent
+
+Copyright © 2026 agent
+
+This file is part of Odemis.
+
+Odemis is free software: you can redistribute it and/or modify it under the terms
+of the GNU General Public License version 2 as published by the Free Software
+Foundation.
+
+Odemis is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY;
+without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR
+PURPOSE. See the GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License along with
+Odemis. If not, see http://www.gnu.org/licenses/.
+'''
+# Opt-in instrumentation of the communication between containers: it records
+# the remote (Pyro) calls done by the proxies and the data received via the
+# (0MQ) dataflows, in order to find out which ones dominate the latency.
+# It is disabled by default. It can be enabled by calling enableCallStats(), or
+# by setting the environment variable ODEMIS_CALL_STATS before starting the
+# program. If the variable contains a filename, the statistics are saved to
+# this file when the program ends.
+
+from __future__ import division
+
+import Pyro4
+import atexit
+import bisect
+import json
+import logging
+import os
+import threading
+import time
+import urllib
+
+
+ENV_VAR = "ODEMIS_CALL_STATS"
+
+# Kinds of entries
+KIND_CALL = "call"  # remote method call, from the client side
+KIND_DATAFLOW = "dataflow"  # data received from a dataflow
+
+# Upper bound (in s) of each bin of the latency histograms: from 10µs to ~10s,
+# doubling every bin. There is an additional bin for all the longer durations.
+HIST_BOUNDS = tuple(10e-6 * 2 ** i for i in range(21))
+
+
+class CallStats(object):
+    """
+    Accumulates the statistics of the calls, per kind, object and method.
+    It is thread-safe.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = {}  # (kind, object, method) -> dict
+        self._start = time.time()
+
+    def record(self, kind, obj, method, duration, sent=0, received=0,
+               error=False, dropped=0):
+        """
+        Add one call to the statistics
+        kind (KIND_*): the type of call
+        obj (str): name of the object called
+        method (str): name of the method called
+        duration (0<=float): time it took (in s)
+        sent (0<=int): number of bytes sent
+        received (0<=int): number of bytes received
+        error (bool): True if the call failed
+        dropped (0<=int): number of messages discarded before this one
+        """
+        hbin = bisect.bisect_left(HIST_BOUNDS, duration)
+        key = (kind, obj, method)
+        with self._lock:
+            e = self._entries.get(key)
+            if e is None:
+                e = {"count": 0, "errors": 0, "dropped": 0,
+                     "time": 0, "min": duration, "max": duration,
+                     "sent": 0, "received": 0,
+                     "histogram": [0] * (len(HIST_BOUNDS) + 1)}
+                self._entries[key] = e
+            e["count"] += 1
+            if error:
+                e["errors"] += 1
+            e["dropped"] += dropped
+            e["time"] += duration
+            e["min"] = min(e["min"], duration)
+            e["max"] = max(e["max"], duration)
+            e["sent"] += sent
+            e["received"] += received
+            e["histogram"][hbin] += 1
+
+    def reset(self):
+        """
+        Forget all the calls recorded so far
+        """
+        with self._lock:
+            self._entries = {}
+            self._start = time.time()
+
+    def dump(self):
+        """
+        return (dict): all the statistics, only made of basic types (so that
+          it can be passed remotely and saved as JSON). It contains:
+          "pid" (int), "start" (float), "end" (float), "bounds" (list of float):
+          the histogram bin bounds, and "entries" (list of dict), with each
+          entry containing "kind", "object", "method", "count", "errors",
+          "dropped", "time", "min", "max", "sent", "received", "histogram".
+        """
+        with self._lock:
+            entries = []
+            for (kind, obj, method), e in self._entries.items():
+                d = dict(e)
+                d["histogram"] = list(e["histogram"])
+                d.update({"kind": kind, "object": obj, "method": method})
+                entries.append(d)
+            start = self._start
+
+        return {"pid": os.getpid(),
+                "start": start,
+                "end": time.time(),
+                "bounds": list(HIST_BOUNDS),
+                "entries": entries}
+
+
+_stats = CallStats()
+_enabled = False
+_orig_invoke = None
+_orig_send = None
+_orig_recv = None
+
+# Pyro object ID -> human readable name (eg, "Camera.exposureTime")
+_labels = {}
+
+# Number of bytes sent/received by the current thread
+_tls = threading.local()
+
+
+def setLabel(objid, label):
+    """
+    Associate a human readable name to a (remote) object
+    objid (str): the Pyro object ID
+    label (str): the name to show in the statistics
+    """
+    _labels[objid] = label
+
+
+def getLabel(objid):
+    """
+    return (str): the human readable name of the object, or the object ID
+      (unquoted) if it has none.
+    """
+    try:
+        return _labels[objid]
+    except KeyError:
+        return urllib.unquote(objid)
+
+
+def setLabels(comp, attrs):
+    """
+    Name the remote attributes of a component (VAs, DataFlows, Events) based
+      on the name of the component.
+    comp (str): name of the component
+    attrs (dict str -> Pyro.Proxy): attribute name -> proxy of the attribute
+    """
+    for n, p in attrs.items():
+        try:
+            _labels[p._pyroUri.object] = "%s.%s" % (comp, n)
+        except AttributeError:
+            pass  # Not a proxy
+
+
+def _count_bytes(name, n):
+    setattr(_tls, name, getattr(_tls, name, 0) + n)
+
+
+def _pyroInvoke(self, methodname, vargs, kwargs, *args, **kwa):
+    """
+    Replacement of Pyro4.core.Proxy._pyroInvoke, which records the call
+    """
+    _tls.sent = 0
+    _tls.received = 0
+    error = False
+    start = time.time()
+    try:
+        return _orig_invoke(self, methodname, vargs, kwargs, *args, **kwa)
+    except Exception:
+        error = True
+        raise
+    finally:
+        duration = time.time() - start
+        try:
+            uri = self._pyroUri
+            obj = getLabel(uri.object)
+            if uri.object == Pyro4.constants.DAEMON_NAME:
+                # Make the containers distinguishable
+                obj = "%s@%s" % (obj, os.path.basename(uri.sockname or ""))
+            if methodname == "__getattr__" and vargs:
+                methodname = "get:%s" % (vargs[0],)
+            _stats.record(KIND_CALL, obj, methodname, duration,
+                          _tls.sent, _tls.received, error)
+        except Exception:
+            logging.debug("Failed to record the call to %s", methodname, exc_info=True)
+
+
+def _send(self, data):
+    _count_bytes("sent", len(data))
+    return _orig_send(self, data)
+
+
+def _recv(self, size):
+    data = _orig_recv(self, size)
+    _count_bytes("received", len(data))
+    return data
+
+
+def recordDelivery(label, duration, received, dropped=0):
+    """
+    Record the reception of data from a dataflow. Does nothing if the statistics
+      are not enabled.
+    label (str): name of the dataflow
+    duration (float): time it took to process the data by the subscribers (in s)
+    received (int): number of bytes received
+    dropped (int): number of data discarded before this one
+    """
+    if _enabled:
+        _stats.record(KIND_DATAFLOW, label, "notify", duration, 0, received,
+                      False, dropped)
+
+
+def estimatePercentile(histogram, bounds, p):
+    """
+    Estimate a percentile of the duration, from the histogram
+    histogram (list of int): number of calls per bin
+    bounds (list of float): upper bound of each bin (the last bin has no bound)
+    p (0<float<=100): the percentile
+    return (float): upper bound of the bin containing the percentile (in s).
+      It's infinite if it is in the last bin, and 0 if the histogram is empty.
+    """
+    total = sum(histogram)
+    if total == 0:
+        return 0
+    acc = 0
+    for b, n in zip(bounds, histogram):
+        acc += n
+        if acc >= total * p / 100:
+            return b
+    return float("inf")
+
+
+def isCallStatsEnabled():
+    """
+    return (bool): True if the calls are currently recorded
+    """
+    return _enabled
+
+
+def enableCallStats():
+    """
+    Start recording the remote calls and the dataflow deliveries of this process
+    """
+    global _enabled, _orig_invoke, _orig_send, _orig_recv
+    if _enabled:
+        return
+    conn_cls = Pyro4.socketutil.SocketConnection
+    _orig_invoke = Pyro4.core.Proxy._pyroInvoke
+    _orig_send = conn_cls.send
+    _orig_recv = conn_cls.recv
+    Pyro4.core.Proxy._pyroInvoke = _pyroInvoke
+    conn_cls.send = _send
+    conn_cls.recv = _recv
+    _enabled = True
+    logging.info("Recording statistics of the remote calls")
+
+
+def disableCallStats():
+    """
+    Stop recording the remote calls. The statistics recorded so far are kept.
+    """
+    global _enabled
+    if not _enabled:
+        return
+    conn_cls = Pyro4.socketutil.SocketConnection
+    Pyro4.core.Proxy._pyroInvoke = _orig_invoke
+    conn_cls.send = _orig_send
+    conn_cls.recv = _orig_recv
+    _enabled = False
+
+
+def getCallStats():
+    """
+    return (dict): the statistics recorded in this process (cf CallStats.dump()),
+      with an extra "enabled" (bool) entry indicating if they are being recorded.
+    """
+    stats = _stats.dump()
+    stats["enabled"] = _enabled
+    return stats
+
+
+def resetCallStats():
+    """
+    Forget all the statistics recorded in this process
+    """
+    _stats.reset()
+
+
+def saveCallStats(filename, stats=None):
+    """
+    Write the statistics into a file, as JSON, for offline analysis
+    filename (str): path of the file to write
+    stats (None or dict or list of dict): the statistics (as returned by
+      getCallStats()). If None, the ones of this process are used.
+    """
+    if stats is None:
+        stats = getCallStats()
+    with open(filename, "w") as f:
+        json.dump(stats, f, indent=1, sort_keys=True)
+
+
+def loadCallStats(filename):
+    """
+    Read the statistics written by saveCallStats()
+    filename (str): path of the file to read
+    return (dict or list of dict): the statistics
+    """
+    with open(filename) as f:
+        return json.load(f)
+
+
+def _save_at_exit(filename):
+    try:
+        saveCallStats(filename)
+    except Exception:
+        logging.exception("Failed to save the call statistics to %s", filename)
+
+
+def _init_from_env():
+    """
+    Enable the statistics if requested via the environment variable
+    """
+    val = os.environ.get(ENV_VAR)
+    if not val:
+        return
+    enableCallStats()
+    if val.lower() not in ("1", "true", "yes"):
+        atexit.register(_save_at_exit, val)
+
+_init_from_env()
@@ -24,13 +24,14 @@ from __future__ import division
 import Pyro4
 from Pyro4.core import isasync
 from abc import ABCMeta, abstractmethod
+import collections
 import inspect
 import logging
 import odemis
 import urllib
 import weakref
 
-from . import _core, _dataflow, _vattributes, _metadata
+from . import _core, _callstats, _dataflow, _vattributes, _metadata
 from ._core import roattribute
 
 
@@ -163,6 +164,80 @@ class Component(ComponentBase):
     def name(self):
         return self._name
 
+    def getState(self, names=None):
+        """
+        Read at once the current state of the VAs of the component. Remotely,
+        it needs only one call, instead of several ones per VA.
+        names (None or iterable of str): names of the VAs to read. If None, all
+          the VAs are read.
+        return (dict str -> value):
+          "vas" (dict str -> dict str -> value): VA name -> info about the VA,
+            with the keys "value", "unit", "readonly", and if the VA has them,
+            "range" and "choices". If the value cannot be read, there is no
+            "value" key.
+          "metadata" (dict str -> value): the metadata of the component
+        raise AttributeError: if one of the names is not a VA of the component
+        """
+        vas = getVAs(self)
+        if names is None:
+            names = vas.keys()
+
+        vas_state = {}
+        for n in names:
+            try:
+                va = vas[n]
+            except KeyError:
+                raise AttributeError("Component %s has no VA %s" % (self.name, n))
+
+            info = {"unit": va.unit, "readonly": va.readonly}
+            try:
+                info["value"] = va.value
+            except Exception:
+                logging.warning("Failed to read the value of %s.%s", self.name, n,
+                                exc_info=True)
+            for mn in ("range", "choices"):
+                try:
+                    info[mn] = getattr(va, mn)
+                except (AttributeError, _vattributes.NotApplicableError):
+                    pass
+            vas_state[n] = info
+
+        return {"vas": vas_state, "metadata": self._getStateMetadata()}
+
+    def _getStateMetadata(self):
+        """
+        return (dict str -> value): the metadata to be returned by getState()
+        """
+        return {}
+
+    def setValues(self, values):
+        """
+        Change at once the value of several VAs of the component. Remotely, it
+        needs only one call, instead of one call per VA.
+        values (dict str -> value, or list of (str, value)): VA name -> new
+          value. If the order of the changes matters, pass a list.
+        return (dict str -> value): VA name -> value after the change (which
+          might be different from the requested value)
+        raise:
+          AttributeError: if one of the names is not a VA of the component
+          Any exception raised when setting a value. In such case, the VAs
+            which are after in the order are not changed.
+        """
+        if isinstance(values, collections.Mapping):
+            values = values.items()
+
+        vas = getVAs(self)
+        for n, v in values:
+            if n not in vas:
+                raise AttributeError("Component %s has no VA %s" % (self.name, n))
+
+        ret = {}
+        for n, v in values:
+            va = vas[n]
+            va.value = v
+            ret[n] = va.value
+        return ret
+
     def terminate(self):
         """
         Stop the Component from executing.
@@ -231,6 +306,45 @@ class ComponentProxy(ComponentBase, Pyro4.Proxy):
         _dataflow.load_dataflows(self, dataflows)
         _vattributes.load_vigilant_attributes(self, vas)
         _dataflow.load_events(self, events)
+        # To show the attributes with a readable name in the call statistics
+        name = roattributes.get("name", urllib.unquote(self._pyroUri.object))
+        for attrs in (dataflows, vas, events):
+            _callstats.setLabels(name, attrs)
+
+    def _getVAProxy(self, name):
+        """
+        return (VigilantAttributeProxy or None): the VA with the given name
+        """
+        va = self.__dict__.get(name)
+        if isinstance(va, _vattributes.VigilantAttributeProxy):
+            return va
+        return None
+
+    def getState(self, names=None):
+        # See Component.getState()
+        state = Pyro4.Proxy.__getattr__(self, "getState")(names)
+        # Share the information with the VAs, so that they don't need to read
+        # it again (remotely).
+        for n, info in state["vas"].items():
+            va = self._getVAProxy(n)
+            if va is not None:
+                va._update_from_state(info)
+        return state
+
+    def setValues(self, values):
+        # See Component.setValues()
+        try:
+            return Pyro4.Proxy.__getattr__(self, "setValues")(values)
+        finally:
+            if isinstance(values, collections.Mapping):
+                names = values.keys()
+            else:
+                names = [n for n, v in values]
+            # The values are changed remotely => the VAs must not use their cache
+            for n in names:
+                va = self._getVAProxy(n)
+                if va is not None:
+                    va._invalidate_value()
 
 # Note: this could be directly __reduce__ of Component, but is a separate function
 # to look more like the normal Proxy of Pyro
@@ -314,6 +428,9 @@ class HwComponent(Component):
         """
         return self._metadata
 
+    def _getStateMetadata(self):
+        return self.getMetadata()
+
     def _onSupplied(self, sup):
         # keep up to date with supplied changes
         self.powerSupply._value = sup[self.name]
@@ -31,6 +31,8 @@ import os
 import threading
 import urllib
 
+from . import _callstats
+
 
 # Pyro4.config.COMMTIMEOUT = 30.0 # a bit of timeout
 # There is a problem with threadpool: threads have a timeout on waiting for a
@@ -256,6 +258,30 @@ class ContainerObject(Pyro4.core.DaemonObject):
         """
         return self.getObject(self.daemon.rootId)
 
+    def getCallStats(self):
+        """
+        returns (dict): the statistics of the remote calls done from the
+          container (cf model.getCallStats())
+        """
+        return _callstats.getCallStats()
+
+    def resetCallStats(self):
+        """
+        forgets all the statistics of the remote calls done from the container
+        """
+        _callstats.resetCallStats()
+
+    def enableCallStats(self, enabled=True):
+        """
+        starts or stops recording the statistics of the remote calls done from
+          the container
+        enabled (bool): True to start, False to stop
+        """
+        if enabled:
+            _callstats.enableCallStats()
+        else:
+            _callstats.disableCallStats()
+
 # Basically a wrapper around the Pyro Daemon
 class Container(Pyro4.core.Daemon):
     def __init__(self, name):
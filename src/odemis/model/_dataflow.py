@@ -37,7 +37,7 @@ import threading
 import time
 import zmq
 
-from . import _core
+from . import _core, _callstats, _vattributes
 
 
 class DataArray(numpy.ndarray):
@@ -95,6 +95,89 @@ class DataArray(numpy.ndarray):
     #     out_arr.metadata = self.metadata
     #     return numpy.ndarray.__array_wrap__(self, out_arr, context)
 
+# Stages that the data goes through, from the acquisition to the display. The
+# latency at each stage is the time elapsed since the acquisition (MD_ACQ_DATE).
+DATAFLOW_STAGES = ("notify",  # the DataFlow is notified by the driver
+                   "sent",  # the data is sent to the remote subscribers
+                   "received",  # the data is received by the proxy
+                   "delivered",  # all the listeners have been called
+                   "projection",  # the data has been projected to an image (GUI)
+                   "display",  # the image has been passed to the canvas (GUI)
+                   )
+DATAFLOW_COUNTERS = ("produced", "sent", "received", "dropped", "delivered")
+DATAFLOW_STATS_PERIOD = 1  # s, minimum time between two updates of the statistics
+
+
+class DataFlowStats(object):
+    """
+    Counts the data going through a dataflow, and measures the latency at each
+    stage. A summary is regularly written in the given VA, as a dict with:
+     * each counter of DATAFLOW_COUNTERS (int): the total number of data
+     * "rate" (float): number of data delivered per second during the last period
+     * "latency" (dict str -> (float, float)): stage -> mean and maximum latency
+       (in s) during the last period
+    """
+    def __init__(self, va):
+        """
+        va (VigilantAttribute): read-only VA to update with the summary
+        """
+        self._va = va
+        self._lock = threading.Lock()
+        self._counters = dict.fromkeys(DATAFLOW_COUNTERS, 0)
+        self._prev_delivered = 0
+        self._latencies = {}  # stage -> [sum, max, number] during the period
+        self._tstart = time.time()  # beginning of the current period
+
+    def count(self, counter, n=1):
+        """
+        Increase a counter
+        counter (str): one of DATAFLOW_COUNTERS
+        n (int): increment
+        """
+        with self._lock:
+            self._counters[counter] += n
+        self._check_update()
+
+    def stage(self, stage, data):
+        """
+        Record that the data has reached a given stage
+        stage (str): one of DATAFLOW_STAGES
+        data (DataArray): the data, with the MD_ACQ_DATE metadata (otherwise
+          nothing is recorded)
+        """
+        try:
+            lat = time.time() - data.metadata[_metadata.MD_ACQ_DATE]
+        except (AttributeError, KeyError, TypeError):
+            return
+        with self._lock:
+            l = self._latencies.get(stage)
+            if l is None:
+                self._latencies[stage] = [lat, lat, 1]
+            else:
+                l[0] += lat
+                l[1] = max(l[1], lat)
+                l[2] += 1
+        self._check_update()
+
+    def _check_update(self):
+        now = time.time()
+        if now - self._tstart < DATAFLOW_STATS_PERIOD:
+            return
+        with self._lock:
+            dur = now - self._tstart
+            if dur < DATAFLOW_STATS_PERIOD:  # Someone else already updated it
+                return
+            summary = dict(self._counters)
+            delivered = self._counters["delivered"]
+            summary["rate"] = (delivered - self._prev_delivered) / dur
+            summary["latency"] = {st: (l[0] / l[2], l[1])
+                                  for st, l in self._latencies.items()}
+            self._prev_delivered = delivered
+            self._latencies = {}
+            self._tstart = now
+        self._va._set_value(summary, force_write=True)
+
+
 class DataFlowBase(object):
     """
     This is an abstract class that must be extended by each detector which
@@ -106,6 +189,9 @@ class DataFlowBase(object):
     def __init__(self):
         self._listeners = set()
         self._lock = threading.Lock() # need to be acquired to modify the set
+        # Summary of the statistics of the data going through (cf DataFlowStats)
+        self.stats = _vattributes.VigilantAttribute({}, readonly=True)
+        self._stats = DataFlowStats(self.stats)
 
     # to be overridden
     # not defined at all so that the proxy version automatically does a remote call
@@ -185,6 +271,21 @@ class DataFlowBase(object):
                 # we cannot abort just because one listener failed
                 logging.exception("Exception when notifying a data_flow")
 
+        if snapshot_listeners:
+            self._stats.count("delivered")
+            self._stats.stage("delivered", data)
+
+    def recordStage(self, stage, data):
+        """
+        Record in the statistics that the data has reached the given stage.
+        It's typically used by the users of the data to report the latency
+        of the later stages (eg, "display").
+        stage (str): one of DATAFLOW_STAGES
+        data (DataArray): the data (or any data derived from it which has
+          the same MD_ACQ_DATE)
+        """
+        self._stats.stage(stage, data)
+
 
 # DataFlow object to create on the server (in a component)
 class DataFlow(DataFlowBase):
@@ -353,7 +454,17 @@ class DataFlow(DataFlowBase):
             if count_before > 0 and count_after == 0:
                 self.stop_generate()
 
+    def getStats(self):
+        """
+        return (dict): the summary of the statistics (ie, .stats.value). Useful
+          to get the statistics of the original DataFlow from a proxy.
+        """
+        self._stats._check_update()  # In case no data came for a long time
+        return self.stats.value
+
     def notify(self, data):
+        self._stats.count("produced")
+        self._stats.stage("notify", data)
         # publish the data remotely
         if self.pipe and len(self._remote_listeners) > 0:
             # TODO thread-safe for self.pipe ?
@@ -373,6 +484,8 @@ class DataFlow(DataFlowBase):
                 logging.debug("Failed to send data with zero-copy")
                 data = numpy.require(data, requirements=["C_CONTIGUOUS"])
                 self.pipe.send(numpy.getbuffer(data), copy=False)
+            self._stats.count("sent")
+            self._stats.stage("sent", data)
 
         # publish locally
         DataFlowBase.notify(self, data)
@@ -435,7 +548,8 @@ class DataFlowProxy(DataFlowBase, Pyro4.Proxy):
         self._ctx = zmq.Context(1) # apparently 0MQ reuse contexts
         self._commands = self._ctx.socket(zmq.PAIR)
         self._commands.bind("inproc://" + self._global_name)
-        self._thread = SubscribeProxyThread(self.notify, self._global_name, self.max_discard, self._ctx)
+        self._thread = SubscribeProxyThread(self.notify, self._global_name, self.max_discard, self._ctx,
+                                            _callstats.getLabel(self._pyroUri.object), self._stats)
         self._thread.start()
 
     def start_generate(self):
@@ -481,16 +595,21 @@ class DataFlowProxy(DataFlowBase, Pyro4.Proxy):
 
 
 class SubscribeProxyThread(threading.Thread):
-    def __init__(self, notifier, uri, max_discard, zmq_ctx):
+    def __init__(self, notifier, uri, max_discard, zmq_ctx, label=None, stats=None):
         """
         notifier (callable): method to call when a new array arrives
         uri (string): unique string to identify the connection
         max_discard (int)
         zmq_ctx (0MQ context): available 0MQ context to use
+        label (None or str): name of the dataflow in the call statistics.
+          If None, the uri is used.
+        stats (None or DataFlowStats): where to count the data received and dropped
         """
         threading.Thread.__init__(self, name="zmq for dataflow " + uri)
         self.daemon = True
         self.uri = uri
+        self.label = label or uri
+        self._stats = stats
         self.max_discard = max_discard
         self._ctx = zmq_ctx
         # don't keep strong reference to notifier so that it can be garbage
@@ -529,6 +648,8 @@ class SubscribeProxyThread(threading.Thread):
             poller.register(self._commands, zmq.POLLIN)
             poller.register(self._data, zmq.POLLIN)
             discarded = 0
+            dropped_log = 0  # number of arrays dropped not yet logged
+            tlog = 0  # last time the dropped arrays were logged
             while True:
                 socks = dict(poller.poll())
 
@@ -556,6 +677,8 @@ class SubscribeProxyThread(threading.Thread):
                     array_format = self._data.recv_pyobj()
                     array_md = self._data.recv_pyobj()
                     array_buf = self._data.recv(copy=False)
+                    if self._stats:
+                        self._stats.count("received")
                     # logging.debug("Received new DataArray over ZMQ for %s", self.uri)
                     # more fresh data already?
                     if (self._data.getsockopt(zmq.EVENTS) & zmq.POLLIN and
@@ -563,10 +686,15 @@ class SubscribeProxyThread(threading.Thread):
                         discarded += 1
                         # logging.debug("Discarding object received as a newer one is available")
                         continue
-                    # TODO: only log the accumulated number every second, to avoid log flooding
-#                     if discarded:
-#                         logging.debug("Dataflow %s dropped %d arrays", self.uri, discarded)
-                    discarded = 0
+                    dropped, discarded = discarded, 0
+                    if dropped and self._stats:
+                        self._stats.count("dropped", dropped)
+                    # Only log the accumulated number every second, to avoid log flooding
+                    dropped_log += dropped
+                    if dropped_log and time.time() > tlog + DATAFLOW_STATS_PERIOD:
+                        logging.debug("Dataflow %s dropped %d arrays", self.uri, dropped_log)
+                        dropped_log = 0
+                        tlog = time.time()
                     # TODO: any need to use zmq.utils.rebuffer.array_from_buffer()?
                     if len(array_buf):
                         array = numpy.frombuffer(array_buf, dtype=array_format["dtype"])
@@ -574,11 +702,16 @@ class SubscribeProxyThread(threading.Thread):
                         array = numpy.empty((0,), dtype=array_format["dtype"])
                     array.shape = array_format["shape"]
                     darray = DataArray(array, metadata=array_md)
+                    if self._stats:
+                        self._stats.stage("received", darray)
 
+                    start = time.time()
                     try:
                         self.w_notifier(darray)
                     except WeakRefLostError:
                         return  # It's a sign there is nothing left to do
+                    _callstats.recordDelivery(self.label, time.time() - start,
+                                              len(array_buf), dropped)
         except:
             if logging:
                 logging.exception("Ending ZMQ thread due to exception")
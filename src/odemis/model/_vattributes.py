@@ -24,11 +24,15 @@ from __future__ import division
 import Pyro4
 from Pyro4.core import oneway
 import collections
+import copy
 import inspect
+import itertools
 import logging
 import numbers
 import numpy
+import os
 import threading
+import time
 from types import NoneType
 import zmq
 
@@ -45,6 +49,52 @@ class NotApplicableError(Exception):
     pass
 
 
+# If True, the proxies of VAs keep a local copy of the value (while subscribed)
+# and of the range and choices, instead of always reading them remotely.
+CACHE_PROXY_VALUES = True
+
+# Types which are never modified in-place
+_IMMUTABLE_TYPES = (NoneType, bool, numbers.Number, basestring)
+
+
+def _isCacheable(v):
+    """
+    Check whether a value can be cached by a proxy, which is the case if it
+      is only made of standard python types.
+    return (bool)
+    """
+    if isinstance(v, _IMMUTABLE_TYPES):
+        # numpy scalars are also numbers, but stay on the safe side
+        return not isinstance(v, numpy.generic)
+    elif isinstance(v, (tuple, list, set, frozenset)):
+        return all(_isCacheable(e) for e in v)
+    elif isinstance(v, dict):
+        return all(_isCacheable(k) and _isCacheable(e) for k, e in v.items())
+    return False
+
+
+def _isImmutable(v):
+    """
+    return (bool): True if the value (as accepted by _isCacheable) can never
+      be modified.
+    """
+    if isinstance(v, _IMMUTABLE_TYPES):
+        return True
+    elif isinstance(v, (tuple, frozenset)):
+        return all(_isImmutable(e) for e in v)
+    return False
+
+
+def _copyValue(v):
+    """
+    return (object): a copy of the value, unless it cannot be modified, in
+      which case it's the value itself.
+    """
+    if _isImmutable(v):
+        return v
+    return copy.deepcopy(v)
+
+
 class VigilantAttributeBase(object):
     """
     An abstract class for VigilantAttributes and its proxy
@@ -116,7 +166,8 @@ class VigilantAttribute(VigilantAttributeBase):
      * observable behaviour (anyone can ask to be notified when the value changes)
     """
 
-    def __init__(self, initval, readonly=False, setter=None, getter=None, max_discard=100, *args, **kwargs):
+    def __init__(self, initval, readonly=False, setter=None, getter=None, max_discard=100,
+                 dynamic_meta=False, *args, **kwargs):
         """
         readonly (bool): if True, value setter will raise an exception. It's still
             possible to change the value by calling _set() and then notify()
@@ -129,6 +180,8 @@ class VigilantAttribute(VigilantAttributeBase):
                            a new one is already available. 0 to keep (notify)
                            all the messages (dangerous if callback is slower
                            than the generator).
+        dynamic_meta (bool): if True, the range or choices might be changed
+          after the VA is shared, so the remote proxies will not cache them.
         """
         VigilantAttributeBase.__init__(self, initval, *args, **kwargs)
 
@@ -151,6 +204,7 @@ class VigilantAttribute(VigilantAttributeBase):
         self.pipe = None
         self.debug = False  # If True, this VA will print a call stack when its value is set
         self.max_discard = max_discard
+        self.dynamic_meta = dynamic_meta
 
     def __default_setter(self, value):
         return value
@@ -160,8 +214,10 @@ class VigilantAttribute(VigilantAttributeBase):
         Equivalent to __getstate__() of the proxy version
         """
         proxy_state = Pyro4.core.pyroObjectSerializer(self)[2]
+        # With a getter, the value can change without notification
+        cacheable = self._getter is None
         return (proxy_state, _core.dump_roattributes(self), self.unit,
-                self.readonly, self.max_discard)
+                self.readonly, self.max_discard, cacheable, self.dynamic_meta)
 
     def _check(self, value):
         """
@@ -299,6 +355,17 @@ class VigilantAttribute(VigilantAttributeBase):
         else:
             VigilantAttributeBase.subscribe(self, listener, init, **kwargs)
 
+    def _subscribe_value(self, listener):
+        """
+        Subscribe a remote listener, and return the current value. Contrarily
+        to subscribe(init=True), the value is not sent to all the remote
+        listeners.
+        listener (string): uri of listener of zmq
+        return (object): the current value. Any change after it is notified.
+        """
+        self._remote_listeners.add(listener)
+        return self.value
+
     @oneway
     def unsubscribe(self, listener):
         """
@@ -329,6 +396,13 @@ class VigilantAttribute(VigilantAttributeBase):
 
 # noinspection PyBroadException
 class VigilantAttributeProxy(VigilantAttributeBase, Pyro4.Proxy):
+    """
+    Proxy to a VigilantAttribute in another container.
+    While it is subscribed, the value is cached locally, and kept up-to-date
+    thanks to the notifications of changes (so that reading the value doesn't
+    need any remote call). The range and choices are cached as they don't
+    change, unless the VA is "dynamic_meta".
+    """
     # init is as light as possible to reduce creation overhead in case the
     # object is actually never used
     def __init__(self, uri):
@@ -340,49 +414,167 @@ class VigilantAttributeProxy(VigilantAttributeBase, Pyro4.Proxy):
         VigilantAttributeBase.__init__(self) # TODO setting value=None might not always be valid
         self.max_discard = 100
         self.readonly = False # will be updated in __setstate__
+        self._cacheable = False  # will be updated in __setstate__
+        self._dynamic_meta = True  # will be updated in __setstate__
+
+        self._hub = None  # SubscriptionHub, when subscribed at least once
+        self._hub_key = None  # key of the subscription in the hub, while subscribed
+        self._init_cache()
+
+    def _init_cache(self):
+        self._cache_lock = threading.Lock()
+        # The cache of the value is only used when subscribed, and once it's
+        # certain that all the changes will be received, which happens after
+        # receiving the value returned by the subscription, or the first change
+        # since the subscription ("primed").
+        self._cache_primed = False
+        self._cache_valid = False
+        self._cache_value = None
+        # Incremented every time a value is received or the cache is
+        # invalidated, to detect that a remote read might be out-dated.
+        self._cache_gen = 0
+        self._meta_cache = {}  # str (name of remote getter) -> value or NotApplicableError
+
+    def _read_value(self):
+        """
+        return (object): the current value, from the cache if possible
+        """
+        if not CACHE_PROXY_VALUES:
+            return Pyro4.Proxy.__getattr__(self, "_get_value")()
 
-        self._ctx = None
-        self._commands = None
-        self._thread = None
+        with self._cache_lock:
+            if self._cache_valid:
+                return _copyValue(self._cache_value)
+            gen = self._cache_gen
+
+        v = Pyro4.Proxy.__getattr__(self, "_get_value")()
+
+        with self._cache_lock:
+            # Only store the value if no newer value has been received meanwhile
+            if gen == self._cache_gen and self._cache_primed:
+                self._store_value(v)
+        return v
+
+    def _write_value(self, v):
+        """
+        Changes the value remotely
+        """
+        if self.readonly:
+            raise NotSettableError("Value is read-only")
+        try:
+            Pyro4.Proxy.__getattr__(self, "_set_value")(v)
+        finally:
+            self._invalidate_value()
+
+    def _invalidate_value(self):
+        """
+        To be called when the value has been changed remotely by this process
+        """
+        # The setter might have changed the value, and maybe a notification
+        # of an older value is still on its way => read it from the VA
+        # until the cache is safely filled again.
+        with self._cache_lock:
+            self._cache_gen += 1
+            self._cache_valid = False
+
+    def _update_from_state(self, info):
+        """
+        Update the cache with the information read via the component
+        info (dict str -> value): as returned by Component.getState() for the VA
+        """
+        # The value is not kept: it might have already changed by the time
+        # it's used, without any notification.
+        if not self._dynamic_meta:
+            for mn, getter in (("range", "_get_range"), ("choices", "_get_choices")):
+                if mn not in info:
+                    self._meta_cache[getter] = NotApplicableError
+                elif _isCacheable(info[mn]):
+                    self._meta_cache[getter] = _copyValue(info[mn])
+
+    def _store_value(self, v):
+        """
+        Update the cache of the value. Must be called with the _cache_lock taken.
+        """
+        if self._cacheable and _isCacheable(v):
+            self._cache_value = _copyValue(v)
+            self._cache_valid = True
+        else:
+            self._cache_valid = False
+
+    def _on_remote_value(self, v):
+        """
+        Called (by the SubscriptionHub) whenever a new value is received
+        """
+        with self._cache_lock:
+            self._cache_gen += 1
+            # The value is always a change which happened after the subscription
+            if not self._cache_primed or self._cache_valid:
+                self._cache_primed = True
+                self._store_value(v)
+
+        self.notify(v)
+
+    def _wrap_value(self, v):
+        """
+        Converts the value as received remotely into the value returned by .value
+        """
+        return v
 
     @property
     def value(self):
-        return self.__getattr__("_get_value")()
+        return self._wrap_value(self._read_value())
 
     @value.setter
     def value(self, v):
-        if self.readonly:
-            raise NotSettableError("Value is read-only")
-        return self.__getattr__("_set_value")(v)
+        self._write_value(v)
     # no delete remotely
 
-    # for enumerated VA
-    @property
-    def choices(self):
+    def _read_meta(self, getter):
+        """
+        Read a meta-information of the VA (which cannot be changed)
+        getter (str): name of the remote method to read it
+        raise NotApplicableError: if the VA doesn't have such meta-information
+        """
+        if CACHE_PROXY_VALUES and not self._dynamic_meta:
+            try:
+                v = self._meta_cache[getter]
+            except KeyError:
+                pass
+            else:
+                if v is NotApplicableError:
+                    raise NotApplicableError()
+                return _copyValue(v)
+
         try:
-            value = Pyro4.Proxy.__getattr__(self, "_get_choices")()
+            v = Pyro4.Proxy.__getattr__(self, getter)()
         except AttributeError:
             # if we let AttributeError, python will look in the super classes,
             # and eventually get a RemoteMethod from the Proxy :-(
             # So return our own NotApplicableError exception
+            if not self._dynamic_meta:
+                self._meta_cache[getter] = NotApplicableError
             raise NotApplicableError()
-        return value
+
+        if not self._dynamic_meta and _isCacheable(v):
+            self._meta_cache[getter] = _copyValue(v)
+        return v
+
+    # for enumerated VA
+    @property
+    def choices(self):
+        return self._read_meta("_get_choices")
 
     # for continuous VA
     @property
     def range(self):
-        try:
-            value = Pyro4.Proxy.__getattr__(self, "_get_range")()
-        except AttributeError:
-            raise NotApplicableError()
-        return value
+        return self._read_meta("_get_range")
 
     def __getstate__(self):
         # must permit to recreate a proxy in a different container
         proxy_state = Pyro4.Proxy.__getstate__(self)
         # we don't need value, it's always remotely accessed
         return (proxy_state, _core.dump_roattributes(self), self.unit,
-                self.readonly, self.max_discard)
+                self.readonly, self.max_discard, self._cacheable, self._dynamic_meta)
 
     def __setstate__(self, state):
         """
@@ -391,47 +583,66 @@ class VigilantAttributeProxy(VigilantAttributeBase, Pyro4.Proxy):
                             a new one is already available. 0 to keep (notify)
                             all the messages (dangerous if callback is slower
                             than the generator).
+        cacheable (bool): if True, the value only changes with a notification
+        dynamic_meta (bool): if True, the range and choices can change
         """
-        proxy_state, roattributes, unit, self.readonly, self.max_discard = state
+        (proxy_state, roattributes, unit, self.readonly, self.max_discard,
+         self._cacheable, self._dynamic_meta) = state
         Pyro4.Proxy.__setstate__(self, proxy_state)
         VigilantAttributeBase.__init__(self, unit=unit)
         _core.load_roattributes(self, roattributes)
 
         self._global_name = self._pyroUri.sockname + "@" + self._pyroUri.object
 
-        self._ctx = None
-        self._commands = None
-        self._thread = None
-
-    def _create_thread(self):
-        logging.debug("Creating thread for VA %s", self._global_name)
-        self._ctx = zmq.Context(1) # apparently 0MQ reuse contexts
-        self._commands = self._ctx.socket(zmq.PAIR)
-        self._commands.bind("inproc://" + self._global_name)
-        self._thread = SubscribeProxyThread(self.notify, self._global_name, self.max_discard, self._ctx)
-        self._thread.start()
+        self._hub = None
+        self._hub_key = None
+        self._init_cache()
 
     def subscribe(self, listener, init=False, **kwargs):
         count_before = len(self._listeners)
 
-        # TODO: when init=True, if already listening, reuse last received value
-        VigilantAttributeBase.subscribe(self, listener, init, **kwargs)
-
+        VigilantAttributeBase.subscribe(self, listener, **kwargs)
         if count_before == 0:
             self._start_listening()
 
+        if init:
+            # Once subscribed, the value is typically in the cache, so reading
+            # it doesn't need a remote call.
+            listener(self.value, **kwargs)
+
     def _start_listening(self):
         """
         start the remote subscription
         """
-        if not self._thread:
-            self._create_thread()
-        self._commands.send("SUB")
-        self._commands.recv() # synchronise
+        if CACHE_PROXY_VALUES:
+            with self._cache_lock:
+                self._cache_primed = False
+                self._cache_valid = False
+                self._cache_gen += 1
+                gen = self._cache_gen
+            notifier = self._on_remote_value
+        else:
+            notifier = self.notify
+
+        if not self._hub:
+            self._hub = SubscriptionHub.get(self._pyroUri.sockname)
+        # synchronous, so that the first value sent is received
+        self._hub_key = self._hub.subscribe(self._global_name, notifier, self.max_discard)
 
         # send subscription to the actual VA
         # a bit tricky because the underlying method gets created on the fly
-        Pyro4.Proxy.__getattr__(self, "subscribe")(self._global_name)
+        if CACHE_PROXY_VALUES:
+            # The VA returns its current value, and any change after it will be
+            # notified, so the cache can be used from now on.
+            v = Pyro4.Proxy.__getattr__(self, "_subscribe_value")(self._global_name)
+            with self._cache_lock:
+                # If a value has been received meanwhile, it's at least as
+                # recent as the one returned.
+                if gen == self._cache_gen:
+                    self._cache_primed = True
+                    self._store_value(v)
+        else:
+            Pyro4.Proxy.__getattr__(self, "subscribe")(self._global_name)
 
     def unsubscribe(self, listener):
         VigilantAttributeBase.unsubscribe(self, listener)
@@ -443,23 +654,27 @@ class VigilantAttributeProxy(VigilantAttributeBase, Pyro4.Proxy):
         stop the remote subscription
         """
         Pyro4.Proxy.__getattr__(self, "unsubscribe")(self._global_name)
-        if self._commands:
-            self._commands.send("UNSUB")
+        if self._hub_key is not None:
+            self._hub.unsubscribe(self._hub_key)
+            self._hub_key = None
+        with self._cache_lock:
+            self._cache_primed = False
+            self._cache_valid = False
+            self._cache_gen += 1
 
     def __del__(self):
-        # end the thread (but it will stop as soon as it notices we are gone anyway)
+        # stop receiving the values (but it will stop as soon as the hub notices
+        # we are gone anyway)
         try:
-            if self._thread:
-                if self._thread.is_alive():
-                    if len(self._listeners):
-                        logging.warning("Stopping subscription while there are still subscribers "
-                                        "because VA '%s' is going out of context",
-                                        self._global_name)
-                        Pyro4.Proxy.__getattr__(self, "unsubscribe")(self._global_name)
-                    self._commands.send("STOP")
-                    self._thread.join(1)
-                self._commands.close()
-            # self._ctx.term()
+            if self._hub_key is not None:
+                if len(self._listeners):
+                    logging.warning("Stopping subscription while there are still subscribers "
+                                    "because VA '%s' is going out of context",
+                                    self._global_name)
+                    Pyro4.Proxy.__getattr__(self, "unsubscribe")(self._global_name)
+                # Don't wake up the hub: it might be this very thread, in the
+                # middle of using the 0MQ sockets.
+                self._hub.unsubscribe(self._hub_key, wakeup=False)
         except Exception:
             pass
 
@@ -469,74 +684,438 @@ class VigilantAttributeProxy(VigilantAttributeBase, Pyro4.Proxy):
             pass  # don't be too rough if that fails, it's not big deal anymore
 
 
-class SubscribeProxyThread(threading.Thread):
-    def __init__(self, notifier, uri, max_discard, zmq_ctx):
+CONNECT_TIMEOUT = 1  # s, maximum time to wait for a VA subscription to be connected
+# Once the handshake is done, the publisher knows about the subscription, but
+# it's only reported by recent versions of 0MQ.
+if zmq.zmq_version_info() >= (4, 3):
+    _SUB_READY_EVENT = zmq.EVENT_HANDSHAKE_SUCCEEDED
+else:
+    _SUB_READY_EVENT = zmq.EVENT_CONNECTED
+
+
+NOTIFIER_THREADS = 4  # number of threads kept to call the listeners, per hub
+NOTIFIER_MAX_THREADS = 64  # maximum number of threads calling the listeners, per hub
+NOTIFIER_IDLE_TIMEOUT = 10  # s, time after which an extra thread stops if unused
+NOTIFIER_WAIT_TIME = 0.1  # s, time a notification can wait for a thread before a new one starts
+SLOW_LISTENER_TIME = 1  # s, listeners blocking longer than this are reported
+
+
+class _NotifierPool(object):
+    """
+    Pool of threads to call the listeners of a SubscriptionHub.
+    It keeps a few threads, and starts more when all of them are busy for too
+    long (see check()), so that some listeners blocking for a long time don't
+    delay the notification of the other VAs. The extra threads stop once they
+    are unused for a while.
+    """
+    def __init__(self, name, min_threads=NOTIFIER_THREADS, max_threads=NOTIFIER_MAX_THREADS):
         """
-        notifier (callable): method to call when a new value arrives
-        uri (string): unique string to identify the connection
-        max_discard (int)
-        zmq_ctx (0MQ context): available 0MQ context to use
+        name (string): name of the threads
+        min_threads (int): number of threads kept, even if unused
+        max_threads (int): maximum number of threads
         """
-        threading.Thread.__init__(self, name="zmq for VA " + uri)
-        self.daemon = True
+        self._name = name
+        self._min_threads = min_threads
+        self._max_threads = max_threads
+        self._tasks = collections.deque()  # (description, callable, args, submission time)
+        self._nthreads = 0
+        self._idle = 0  # number of threads waiting for a task
+        self._busy = {}  # thread -> (description, start time) of its task
+        self._full = False  # True once reported that all the threads are busy
+        # Protects all the attributes above
+        self._cond = threading.Condition()
+
+    def submit(self, desc, func, *args):
+        """
+        Run a function in one of the threads
+        desc (object): description of the task, used for reporting
+        func (callable): function to call
+        args: arguments to pass to the function
+        """
+        with self._cond:
+            self._tasks.append((desc, func, args, time.time()))
+            if self._idle >= len(self._tasks):
+                self._cond.notify()
+            elif self._nthreads < self._min_threads:
+                self._start_thread()
+            # Otherwise, all the threads are busy => the task waits
+
+    def check(self):
+        """
+        Start a new thread if a task has been waiting too long, because all
+          the threads are busy.
+        return (None or float): time (in ms) until the next check is needed
+        """
+        with self._cond:
+            if len(self._tasks) <= self._idle:
+                return None
+
+            now = time.time()
+            waited = now - self._tasks[0][3]
+            if waited < NOTIFIER_WAIT_TIME:
+                return (NOTIFIER_WAIT_TIME - waited) * 1000
+
+            busy = ", ".join("%s (%g s)" % (d, now - st) for d, st in self._busy.values())
+            if self._nthreads >= self._max_threads:
+                if not self._full:
+                    self._full = True
+                    logging.warning("All the %d notifier threads are busy, listeners blocking: %s",
+                                    self._nthreads, busy)
+                return None  # Nothing to do until a thread is free
+
+            logging.info("Starting a new notifier thread, as all are busy: %s", busy)
+            self._start_thread()
+            return NOTIFIER_WAIT_TIME * 1000
+
+    def _start_thread(self):
+        """
+        Must be called with the lock taken
+        """
+        self._nthreads += 1
+        t = threading.Thread(target=self._run, name=self._name)
+        t.daemon = True
+        t.start()
+
+    def _run(self):
+        thread = threading.current_thread()
+        while True:
+            with self._cond:
+                self._idle += 1
+                deadline = time.time() + NOTIFIER_IDLE_TIMEOUT
+                while not self._tasks:
+                    if self._nthreads > self._min_threads:
+                        timeout = deadline - time.time()
+                        if timeout <= 0:
+                            # Extra thread, unused for long => stop
+                            self._idle -= 1
+                            self._nthreads -= 1
+                            return
+                        self._cond.wait(timeout)
+                    else:
+                        self._cond.wait()
+                self._idle -= 1
+                desc, func, args, _ = self._tasks.popleft()
+                self._busy[thread] = (desc, time.time())
+
+            try:
+                func(*args)
+            except Exception:
+                logging.exception("Failed to run notification task %s", desc)
+            finally:
+                with self._cond:
+                    del self._busy[thread]
+                    self._full = False
+
+
+class _HubSubscription(object):
+    """
+    State of the reception of the values of one VA by a SubscriptionHub
+    """
+    def __init__(self, key, uri, sock, w_notifier, max_discard):
+        self.key = key
         self.uri = uri
+        self.sock = sock
+        self.w_notifier = w_notifier
         self.max_discard = max_discard
+        self.discarded = 0  # number of values discarded in a row
+        self.active = True  # False once unsubscribed
+        self.values = collections.deque()  # values received, to be notified
+        self.notifying = False  # True while a thread is notifying the values
+        # Protects .active, .values, .notifying and .discarded
+        self.lock = threading.Lock()
+
+        # While connecting
+        self.monitor = None  # 0MQ socket reporting the connection events
+        self.connected = None  # threading.Event set once connected (or given up)
+        self.connect_deadline = None  # time after which to give up waiting
+
+
+class SubscriptionHub(threading.Thread):
+    """
+    Receives the values of all the remote VAs of a container which are
+    subscribed in this process, and notifies the corresponding proxies.
+    Each VA has its own 0MQ subscription socket, but they are all handled by
+    a single thread (per container), instead of one thread per VA.
+    The listeners are called from a pool of threads, which grows when all the
+    threads are busy, so that a slow listener doesn't delay the reception of
+    the other VAs. The values of a given VA are always notified in order, one
+    at a time.
+    """
+    _hubs = {}  # container socket name -> SubscriptionHub
+    _hubs_lock = threading.Lock()
+    _hubs_pid = None  # PID of the process which created the hubs
+    _ctx = None  # 0MQ context shared by all the hubs
+
+    @classmethod
+    def get(cls, container):
+        """
+        Get the hub for a container, and create it if it doesn't exist yet
+        container (string): name of the socket of the container
+        return (SubscriptionHub): the hub, running
+        """
+        with cls._hubs_lock:
+            if cls._hubs_pid != os.getpid():
+                # New process (or after a fork): threads and sockets are gone
+                cls._hubs = {}
+                cls._ctx = zmq.Context(1)
+                cls._hubs_pid = os.getpid()
+            try:
+                return cls._hubs[container]
+            except KeyError:
+                logging.debug("Creating subscription hub for container %s", container)
+                hub = cls(cls._ctx, container)
+                hub.start()
+                cls._hubs[container] = hub
+                return hub
+
+    def __init__(self, zmq_ctx, container):
+        """
+        zmq_ctx (0MQ context): available 0MQ context to use
+        container (string): name of the socket of the container
+        """
+        threading.Thread.__init__(self, name="zmq for VAs of " + container)
+        self.daemon = True
         self._ctx = zmq_ctx
-        # don't keep strong reference to notifier so that it can be garbage
-        # collected normally and it will let us know then that we can stop
-        self.w_notifier = WeakMethod(notifier)
 
-        # create a zmq synchronised channel to receive commands
-        self._commands = zmq_ctx.socket(zmq.PAIR)
-        self._commands.connect("inproc://" + uri)
+        # Requests from the other threads: (callable, args, threading.Event or None)
+        self._requests = collections.deque()
+        # Protects the (sender side) wake-up socket
+        self._wakeup_lock = threading.Lock()
+
+        # create a zmq synchronised channel to wake up the thread
+        addr = "inproc://vahub-%x-%x" % (os.getpid(), id(self))
+        self._wakeup_in = zmq_ctx.socket(zmq.PAIR)
+        self._wakeup_in.bind(addr)
+        self._wakeup_out = zmq_ctx.socket(zmq.PAIR)
+        self._wakeup_out.connect(addr)
+
+        # Each subscription gets a new key, so that a late unsubscription
+        # never stops a more recent one.
+        self._key_counter = itertools.count()
+        self._notifiers = _NotifierPool("VA notifier for " + container)
+
+        # Only accessed from within the thread
+        self._poller = zmq.Poller()
+        self._keys = {}  # key -> _HubSubscription
+        self._subs = {}  # socket -> _HubSubscription
+        self._monitors = {}  # monitor socket -> _HubSubscription, while connecting
+
+    def _request(self, func, args, wait, wakeup=True):
+        """
+        Run the given function within the hub thread
+        wait (bool): if True, blocks until the function is executed
+        wakeup (bool): if False, the function will only be run when the hub
+          wakes up for another reason.
+        """
+        if threading.current_thread() is self:
+            func(*args)
+            return
 
-        # create a zmq subscription to receive the data
-        self.data = zmq_ctx.socket(zmq.SUB)
-        self.data.connect("ipc://" + uri)
+        done = threading.Event() if wait else None
+        self._requests.append((func, args, done))
+        if wakeup:
+            with self._wakeup_lock:
+                self._wakeup_out.send("")
+        if done:
+            done.wait()
 
-    def run(self):
-        # Process messages for commands and data
-        poller = zmq.Poller()
-        poller.register(self._commands, zmq.POLLIN)
-        poller.register(self.data, zmq.POLLIN)
-        discarded = 0
-        while True:
-            socks = dict(poller.poll())
-
-            # process commands
-            if socks.get(self._commands) == zmq.POLLIN:
-                message = self._commands.recv()
-                if message == "SUB":
-                    self.data.setsockopt(zmq.SUBSCRIBE, '')
-                    self._commands.send("SUBD")
-                elif message == "UNSUB":
-                    self.data.setsockopt(zmq.UNSUBSCRIBE, '')
-                    # no confirmation (async)
-                elif message == "STOP":
-                    self._commands.close()
-                    self.data.close()
-                    return
+    def subscribe(self, uri, notifier, max_discard):
+        """
+        Start receiving the values of a VA. It returns only once it's ready
+        to receive the values.
+        uri (string): name of the VA (on 0MQ)
+        notifier (callable): method to call when a new value arrives. Only a
+          weak reference is kept.
+        max_discard (int): amount of values that can be discarded in a row if a
+          newer one is already available
+        return (int): key of the subscription, to pass to unsubscribe()
+        """
+        key = next(self._key_counter)
+        # The connection is waited for here, instead of within the hub thread,
+        # so that the values of the other VAs are still received meanwhile.
+        connected = threading.Event()
+        self._request(self._subscribe, (key, uri, WeakMethod(notifier), max_discard, connected),
+                      wait=False)
+        if threading.current_thread() is not self:
+            connected.wait()
+        return key
+
+    def unsubscribe(self, key, wakeup=True):
+        """
+        Stop receiving the values of a VA. It's asynchronous.
+        key (int): identifier of the subscription, as returned by subscribe()
+        wakeup (bool): if False, the subscription is only stopped later, when
+          the hub is active again. Useful if the caller might be the hub itself.
+        """
+        self._request(self._unsubscribe, (key,), wait=False, wakeup=wakeup)
 
-            # receive data
-            if socks.get(self.data) == zmq.POLLIN:
-                value = self.data.recv_pyobj()
+    def _subscribe(self, key, uri, w_notifier, max_discard, connected):
+        sock = monitor = None
+        try:
+            sock = self._ctx.socket(zmq.SUB)
+            sock.setsockopt(zmq.SUBSCRIBE, '')
+            # The subscriber waits for the connection to be established,
+            # otherwise the first values sent (right after the remote
+            # subscription) could be lost. The connection events are received
+            # by the main loop.
+            monitor = sock.get_monitor_socket(_SUB_READY_EVENT)
+            sock.connect("ipc://" + uri)
+        except Exception:
+            if monitor is not None:
+                monitor.close()
+            if sock is not None:
+                sock.close()
+            connected.set()  # Don't block the subscriber
+            raise
+
+        sub = _HubSubscription(key, uri, sock, w_notifier, max_discard)
+        sub.monitor = monitor
+        sub.connected = connected
+        sub.connect_deadline = time.time() + CONNECT_TIMEOUT
+        self._poller.register(monitor, zmq.POLLIN)
+        self._monitors[sub.monitor] = sub
+        self._poller.register(sock, zmq.POLLIN)
+        self._keys[key] = sub
+        self._subs[sock] = sub
+
+    def _end_connection(self, sub):
+        """
+        Stop monitoring the connection of a subscription, and let the
+        subscriber continue
+        """
+        if self._monitors.pop(sub.monitor, None) is not None:
+            self._poller.unregister(sub.monitor)
+        sub.sock.disable_monitor()
+        sub.monitor.close()
+        sub.monitor = None
+        sub.connected.set()
+
+    def _check_connections(self):
+        """
+        Give up waiting for the connections which take too long
+        return (None or float): time (in ms) until the next connection deadline
+        """
+        if not self._monitors:
+            return None
+
+        now = time.time()
+        for sub in list(self._monitors.values()):
+            if sub.connect_deadline <= now:
+                logging.warning("VA %s not connected after %g s", sub.uri, CONNECT_TIMEOUT)
+                self._end_connection(sub)
+
+        if not self._monitors:
+            return None
+        next_deadline = min(sub.connect_deadline for sub in self._monitors.values())
+        return max(0, next_deadline - now) * 1000
+
+    def _unsubscribe(self, key):
+        sub = self._keys.pop(key, None)
+        if sub is None:
+            return
+        if sub.monitor is not None:
+            self._end_connection(sub)
+        del self._subs[sub.sock]
+        self._poller.unregister(sub.sock)
+        sub.sock.close()
+        with sub.lock:
+            sub.active = False
+            sub.values.clear()
+
+    def _process_requests(self):
+        # Empty the wake-up messages
+        try:
+            while True:
+                self._wakeup_in.recv(zmq.NOBLOCK)
+        except zmq.Again:
+            pass
+
+        while self._requests:
+            func, args, done = self._requests.popleft()
+            try:
+                func(*args)
+            except Exception:
+                logging.exception("Failed to process request %s", func)
+            finally:
+                if done:
+                    done.set()
+
+    def _receive(self, sock):
+        sub = self._subs[sock]
+        value = sock.recv_pyobj()
+        with sub.lock:
+            if sub.discarded < sub.max_discard:
                 # more fresh data already?
-                if (
-                        self.data.getsockopt(zmq.EVENTS) & zmq.POLLIN and
-                        discarded < self.max_discard
-                ):
-                    discarded += 1
-                    continue
-                if discarded:
-                    logging.debug("VA discarded %d values", discarded)
-                discarded = 0
-
-                try:
-                    self.w_notifier(value)
-                except WeakRefLostError:
-                    self._commands.close()
-                    self.data.close()
+                if sock.getsockopt(zmq.EVENTS) & zmq.POLLIN:
+                    sub.discarded += 1
+                    return
+                # previous value not yet notified => only notify the new one
+                if sub.values:
+                    sub.values.pop()
+                    sub.discarded += 1
+            sub.values.append(value)
+            if sub.notifying:
+                return  # the thread notifying will also take care of this value
+            sub.notifying = True
+        self._notifiers.submit(sub.uri, self._notify, sub)
+
+    def _notify(self, sub):
+        """
+        Notify all the values received for a subscription, in order.
+        Called in one of the notifier threads.
+        """
+        while True:
+            with sub.lock:
+                if not sub.active or not sub.values:
+                    sub.notifying = False
                     return
+                value = sub.values.popleft()
+                discarded, sub.discarded = sub.discarded, 0
+            if discarded:
+                logging.debug("VA %s discarded %d values", sub.uri, discarded)
+
+            try:
+                start = time.time()
+                sub.w_notifier(value)
+                dur = time.time() - start
+                if dur > SLOW_LISTENER_TIME:
+                    logging.warning("Listener of VA %s blocked for %g s", sub.uri, dur)
+            except WeakRefLostError:
+                with sub.lock:
+                    sub.active = False
+                    sub.notifying = False
+                self.unsubscribe(sub.key)
+                return
+            except Exception:
+                logging.exception("Failed to notify new value of VA %s", sub.uri)
+
+    def run(self):
+        self._poller.register(self._wakeup_in, zmq.POLLIN)
+        while True:
+            try:
+                timeout = self._check_connections()
+                ntimeout = self._notifiers.check()
+                if ntimeout is not None:
+                    timeout = ntimeout if timeout is None else min(timeout, ntimeout)
+                socks = dict(self._poller.poll(timeout))
+
+                # process requests first, so that the removed subscriptions
+                # are not notified anymore
+                if self._wakeup_in in socks:
+                    self._process_requests()
+
+                for sock in socks:
+                    if sock in self._subs:
+                        self._receive(sock)
+                    elif sock in self._monitors:
+                        sock.recv_multipart()
+                        self._end_connection(self._monitors[sock])
+
+                # Subscriptions removed without waking up (eg, from __del__)
+                if self._requests:
+                    self._process_requests()
+            except Exception:
+                logging.exception("Failure in the VA subscription hub")
 
 
 def unregister_vigilant_attributes(self):
@@ -733,13 +1312,14 @@ class ListVA(VigilantAttribute):
 class ListVAProxy(VigilantAttributeProxy):
     # VAProxy + listen to modifications inside the list
 
-    @property
-    def value(self):
+    def _wrap_value(self, v):
         # Transform a normal list into a notifying one
-        raw_list = self.__getattr__("_get_value")()
         # When value change, same as setting the value
-        val = _NotifyingList(raw_list, notifier=self.__value_setter)
-        return val
+        return _NotifyingList(v, notifier=self.__value_setter)
+
+    @property
+    def value(self):
+        return self._wrap_value(self._read_value())
 
     @value.setter
     def value(self, v):
@@ -747,9 +1327,7 @@ class ListVAProxy(VigilantAttributeProxy):
 
     # needs to be an explicit method to be able to reference it from the list
     def __value_setter(self, v):
-        if self.readonly:
-            raise NotSettableError("Value is read-only")
-        self.__getattr__("_set_value")(v)
+        self._write_value(v)
 
 
 class BooleanVA(VigilantAttribute):
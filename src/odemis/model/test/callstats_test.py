@@ -0,0 +1,139 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+Created on 18 Oct 2026
+
+@author: agent
+
+Copyright © 2026 agent
+
+This file is part of Odemis.
+
+Odemis is free software: you can redistribute it and/or modify it under the terms
+of the GNU General Public License version 2 as published by the Free Software
+Foundation.
+
+Odemis is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY;
+without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR
+PURPOSE. See the GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License along with
+Odemis. If not, see http://www.gnu.org/licenses/.
+'''
+from __future__ import division
+
+import Pyro4
+import logging
+from odemis import model
+from odemis.model import _callstats
+import os
+import tempfile
+import threading
+import unittest
+
+
+logging.getLogger().setLevel(logging.DEBUG)
+
+
+class Echo(object):
+    def echo(self, data):
+        return data
+
+
+class TestCallStats(unittest.TestCase):
+
+    def test_record(self):
+        stats = _callstats.CallStats()
+        stats.record(_callstats.KIND_CALL, "comp", "foo", 0.001, 10, 1000)
+        stats.record(_callstats.KIND_CALL, "comp", "foo", 0.003, 10, 2000, error=True)
+        stats.record(_callstats.KIND_CALL, "comp", "bar", 20)  # Too long for the histogram
+        stats.record(_callstats.KIND_DATAFLOW, "comp.data", "notify", 0.01, dropped=2)
+
+        d = stats.dump()
+        self.assertEqual(d["pid"], os.getpid())
+        self.assertEqual(len(d["bounds"]), len(_callstats.HIST_BOUNDS))
+        entries = {(e["kind"], e["object"], e["method"]): e for e in d["entries"]}
+        self.assertEqual(len(entries), 3)
+
+        foo = entries[(_callstats.KIND_CALL, "comp", "foo")]
+        self.assertEqual(foo["count"], 2)
+        self.assertEqual(foo["errors"], 1)
+        self.assertAlmostEqual(foo["time"], 0.004)
+        self.assertEqual(foo["min"], 0.001)
+        self.assertEqual(foo["max"], 0.003)
+        self.assertEqual((foo["sent"], foo["received"]), (20, 3000))
+        self.assertEqual(sum(foo["histogram"]), 2)
+
+        bar = entries[(_callstats.KIND_CALL, "comp", "bar")]
+        self.assertEqual(bar["histogram"][-1], 1)
+        p50 = _callstats.estimatePercentile(bar["histogram"], d["bounds"], 50)
+        self.assertEqual(p50, float("inf"))
+
+        df = entries[(_callstats.KIND_DATAFLOW, "comp.data", "notify")]
+        self.assertEqual(df["dropped"], 2)
+
+        stats.reset()
+        self.assertEqual(stats.dump()["entries"], [])
+
+    def test_percentile(self):
+        bounds = [1, 2, 4, 8]
+        hist = [0, 90, 9, 1, 0]
+        self.assertEqual(_callstats.estimatePercentile(hist, bounds, 50), 2)
+        self.assertEqual(_callstats.estimatePercentile(hist, bounds, 90), 2)
+        self.assertEqual(_callstats.estimatePercentile(hist, bounds, 99), 4)
+        self.assertEqual(_callstats.estimatePercentile(hist, bounds, 100), 8)
+        self.assertEqual(_callstats.estimatePercentile([0] * 5, bounds, 50), 0)
+
+    def test_save(self):
+        stats = _callstats.CallStats()
+        stats.record(_callstats.KIND_CALL, u"comp", u"foo", 0.001, 10, 1000)
+        d = stats.dump()
+        f = tempfile.NamedTemporaryFile(suffix=".json", delete=False)
+        f.close()
+        try:
+            model.saveCallStats(f.name, d)
+            self.assertEqual(model.loadCallStats(f.name), d)
+        finally:
+            os.remove(f.name)
+
+    def test_remote_calls(self):
+        """
+        Check the calls of a Pyro proxy are recorded only when enabled
+        """
+        daemon = Pyro4.Daemon()
+        uri = daemon.register(Echo(), "echo")
+        t = threading.Thread(target=daemon.requestLoop)
+        t.daemon = True
+        t.start()
+        try:
+            proxy = Pyro4.Proxy(uri)
+            model.resetCallStats()
+            proxy.echo("a")
+            self.assertFalse(model.isCallStatsEnabled())
+            self.assertEqual(model.getCallStats()["entries"], [])
+
+            model.enableCallStats()
+            try:
+                for i in range(5):
+                    proxy.echo("b" * 1000)
+            finally:
+                model.disableCallStats()
+            proxy.echo("c")
+
+            entries = model.getCallStats()["entries"]
+            self.assertEqual(len(entries), 1)
+            e = entries[0]
+            self.assertEqual((e["object"], e["method"]), ("echo", "echo"))
+            self.assertEqual(e["count"], 5)
+            self.assertGreater(e["sent"], 5 * 1000)
+            self.assertGreater(e["received"], 5 * 1000)
+            self.assertGreater(e["time"], 0)
+            proxy._pyroRelease()
+        finally:
+            daemon.shutdown()
+            t.join(5)
+            model.resetCallStats()
+
+
+if __name__ == "__main__":
+    unittest.main()
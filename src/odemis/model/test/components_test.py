@@ -227,6 +227,49 @@ class TestActuator(unittest.TestCase):
 #             self.assertAlmostEqual(val, abs_mov_back[axis])
 
 
+class TestComponentState(unittest.TestCase):
+
+    def setUp(self):
+        self.comp = DigitalCamera("testcam", "ccd")
+        self.comp.exposureTime = model.FloatContinuous(0.1, (1e-3, 10), unit="s")
+        self.comp.binning = model.VAEnumerated((1, 1), {(1, 1), (2, 2)})
+        self.comp.updateMetadata({model.MD_LENS_MAG: 10})
+
+    def test_get_state(self):
+        state = self.comp.getState()
+        self.assertEqual(state["metadata"], {model.MD_LENS_MAG: 10})
+        vas = state["vas"]
+        self.assertEqual(set(vas.keys()), set(model.getVAs(self.comp).keys()))
+        self.assertEqual(vas["exposureTime"],
+                         {"value": 0.1, "unit": "s", "readonly": False, "range": (1e-3, 10)})
+        self.assertEqual(vas["binning"]["choices"], {(1, 1), (2, 2)})
+        self.assertNotIn("range", vas["binning"])
+        self.assertTrue(vas["depthOfField"]["readonly"])
+
+        state = self.comp.getState(["binning"])
+        self.assertEqual(state["vas"].keys(), ["binning"])
+
+        with self.assertRaises(AttributeError):
+            self.comp.getState(["binning", "foo"])
+
+    def test_set_values(self):
+        ret = self.comp.setValues({"exposureTime": 2, "binning": (2, 2)})
+        self.assertEqual(ret, {"exposureTime": 2, "binning": (2, 2)})
+        self.assertEqual(self.comp.exposureTime.value, 2)
+        self.assertEqual(self.comp.binning.value, (2, 2))
+
+        # Values are set in order => up to the error
+        with self.assertRaises(IndexError):
+            self.comp.setValues([("exposureTime", 1), ("binning", (3, 3)),
+                                 ("exposureTime", 3)])
+        self.assertEqual(self.comp.exposureTime.value, 1)
+
+        # Unknown VA => nothing is changed
+        with self.assertRaises(AttributeError):
+            self.comp.setValues({"exposureTime": 5, "foo": 1})
+        self.assertEqual(self.comp.exposureTime.value, 1)
+
+
 class FakeActuator(Actuator):
     @isasync
     def moveRel(self, shift):
@@ -42,7 +42,8 @@ class SimpleDataFlow(model.DataFlow):
         # generate a stupid array every 0.1s
         while not self._thread_must_stop.wait(0.1):
             self.startAcquire.notify()
-            data = model.DataArray([[i, 0],[0, 0]], metadata={"a": 1, "num": i})
+            data = model.DataArray([[i, 0],[0, 0]], metadata={"a": 1, "num": i,
+                                                             model.MD_ACQ_DATE: time.time()})
             i += 1
             self.notify(data)
         self._thread_must_stop.clear()
@@ -295,6 +296,42 @@ class TestDataFlow(unittest.TestCase):
         
         self.assertEqual(self.left, 0)
 
+    def test_stats(self):
+        """
+        Check the statistics of the dataflow are updated
+        """
+        self.df = SimpleDataFlow()
+        self.assertEqual(self.df.stats.value, {})
+        with self.assertRaises(model.NotSettableError):
+            self.df.stats.value = {"produced": 3}
+
+        self.nstats = []
+        self.df.stats.subscribe(self.receive_stats)
+        self.df.subscribe(self.receive_stats_data)
+        time.sleep(model.DATAFLOW_STATS_PERIOD + 0.5)
+        self.df.unsubscribe(self.receive_stats_data)
+        time.sleep(0.2)
+
+        stats = self.df.getStats()
+        self.assertGreaterEqual(len(self.nstats), 1)
+        self.assertGreaterEqual(stats["produced"], 5)
+        # The last data might have been produced just after unsubscribing
+        self.assertLessEqual(stats["delivered"], stats["produced"])
+        self.assertGreaterEqual(stats["delivered"], stats["produced"] - 1)
+        self.assertEqual(stats["sent"], 0)  # No remote subscriber
+        # The latency is recorded for the stages where the metadata has MD_ACQ_DATE
+        self.assertIn("notify", stats["latency"])
+        self.assertIn("delivered", stats["latency"])
+        mean, mx = stats["latency"]["notify"]
+        self.assertLessEqual(mean, mx)
+        self.assertLess(mx, 0.1)
+
+    def receive_stats_data(self, dataflow, data):
+        self.assertEqual(dataflow, self.df)
+
+    def receive_stats(self, stats):
+        self.nstats.append(stats)
+
         
 if __name__ == "__main__":
     unittest.main()
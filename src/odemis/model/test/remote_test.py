@@ -769,6 +769,141 @@ class RemoteTest(unittest.TestCase):
         self.last_value = value
         self.assertIsInstance(value, list)
 
+    def test_get_state(self):
+        state = self.comp.getState(["prop", "cont", "enum", "counted"])
+        self.assertEqual(state["metadata"], {})
+        vas = state["vas"]
+        self.assertEqual(vas["prop"]["value"], 42)
+        self.assertEqual(vas["cont"]["range"], (-1, 3.4))
+        self.assertEqual(vas["cont"]["unit"], "C")
+        self.assertNotIn("choices", vas["cont"])
+        self.assertEqual(vas["enum"]["choices"], {"a", "c", "bfds"})
+
+        # The VAs don't need to read the range again
+        cnt = self.comp.counted
+        self.assertEqual(cnt.range, (0, 10))
+        self.assertEqual(self.comp.get_meta_read_count(), 1)
+
+        # Nor the value at subscription, which is returned by the subscription
+        reads = self.comp.get_read_count()
+        self.called = 0
+        cnt.subscribe(self.receive_va_update, init=True)
+        time.sleep(0.1)
+        self.assertEqual(self.called, 1)
+        self.assertEqual(self.last_value, 1)
+        self.assertEqual(self.comp.get_read_count(), reads)
+        cnt.unsubscribe(self.receive_va_update)
+
+    def test_set_values(self):
+        prop = self.comp.prop
+        self.called = 0
+        prop.subscribe(self.receive_va_update)
+        ret = self.comp.setValues({"prop": 3, "cont": 1.0})
+        self.assertEqual(ret, {"prop": 3, "cont": 1.0})
+        # The new value is immediately visible
+        self.assertEqual(prop.value, 3)
+        self.assertEqual(self.comp.cont.value, 1.0)
+        time.sleep(0.1)
+        self.assertEqual(self.called, 1)
+        prop.unsubscribe(self.receive_va_update)
+
+        with self.assertRaises(IndexError):
+            self.comp.setValues([("prop", 5), ("cont", 10.0)])
+        self.assertEqual(prop.value, 5)
+
+    def test_va_cache(self):
+        """
+        Check the value, range, and choices are read from the cache when possible
+        """
+        cnt = self.comp.counted
+        self.assertEqual(cnt.value, 1)
+        self.assertEqual(self.comp.get_read_count(), 1)
+
+        # Not subscribed => always read remotely
+        cnt.value
+        self.assertEqual(self.comp.get_read_count(), 2)
+
+        self.called = 0
+        cnt.subscribe(self.receive_va_update, init=True)
+        time.sleep(0.1)
+        # Only the initial call, the subscription itself doesn't notify
+        self.assertEqual(self.called, 1)
+        reads = self.comp.get_read_count()
+        for i in range(100):
+            self.assertEqual(cnt.value, 1)
+        self.assertEqual(self.comp.get_read_count(), reads)
+
+        # Remote change => received via the subscription
+        self.comp.change_counted(3)
+        time.sleep(0.1)
+        self.assertEqual(self.called, 2)
+        self.assertEqual(cnt.value, 3)
+        self.assertEqual(self.comp.get_read_count(), reads)
+
+        # Local change => the next read is done remotely
+        cnt.value = 5
+        self.assertEqual(cnt.value, 5)
+        time.sleep(0.1)
+        self.assertEqual(self.last_value, 5)
+        reads = self.comp.get_read_count()
+        cnt.value
+        cnt.value
+        self.assertLessEqual(self.comp.get_read_count(), reads + 1)
+
+        cnt.unsubscribe(self.receive_va_update)
+        reads = self.comp.get_read_count()
+        self.assertEqual(cnt.value, 5)
+        self.assertEqual(self.comp.get_read_count(), reads + 1)
+
+        # range and choices never change
+        self.assertEqual(cnt.range, (0, 10))
+        self.assertEqual(cnt.range, (0, 10))
+        self.assertEqual(self.comp.get_meta_read_count(), 1)
+        with self.assertRaises(model.NotApplicableError):
+            cnt.choices
+        self.assertFalse(hasattr(cnt, "choices"))
+
+        # A VA with a getter is never cached
+        cut = self.comp.cut
+        self.called = 0
+        cut.subscribe(self.receive_va_update)
+        time.sleep(0.1)
+        cut.value = 12
+        time.sleep(0.1)
+        self.comp.set_cut_directly(15)
+        self.assertEqual(cut.value, 15)
+        cut.unsubscribe(self.receive_va_update)
+
+    def test_va_cache_other_subscriber(self):
+        """
+        Check the subscription of a proxy doesn't notify the other proxies
+        """
+        cnt = self.comp.counted
+        cnt2 = pickle.loads(pickle.dumps(cnt))
+        self.called = 0
+        cnt.subscribe(self.receive_va_update)
+        time.sleep(0.1)
+
+        values2 = []
+
+        def on_value2(v):
+            values2.append(v)
+
+        cnt2.subscribe(on_value2, init=True)
+        time.sleep(0.1)
+        self.assertEqual(values2, [cnt.value])
+        self.assertEqual(self.called, 0)
+
+        # Both caches are up-to-date
+        self.comp.change_counted(7)
+        time.sleep(0.1)
+        self.assertEqual(self.called, 1)
+        self.assertEqual(cnt.value, 7)
+        self.assertEqual(cnt2.value, 7)
+
+        cnt2.unsubscribe(on_value2)
+        cnt.unsubscribe(self.receive_va_update)
+
 # a basic server (component container)
 def ServerLoop(socket_name):
     try:
@@ -836,13 +971,40 @@ class MyComponent(model.Component):
         self.prop = model.IntVA(42)
         self.cont = model.FloatContinuous(2.0, [-1, 3.4], unit="C")
         self.enum = model.StringEnumerated("a", set(["a", "c", "bfds"]))
-        self.cut = model.IntVA(0, setter=self._setCut)
+        self.cut = model.IntVA(0, setter=self._setCut, getter=self._getCut)
         self.listval = model.ListVA([2, 65])
+        self.counted = ReadCountedIntVA(1, (0, 10))
 
     def _setCut(self, value):
         self.data.cut = value
         return self.data.cut
 
+    def _getCut(self):
+        return self.data.cut
+
+    def set_cut_directly(self, value):
+        """
+        change the cut without going through the VA
+        """
+        self.data.cut = value
+
+    # oneway to ensure that it will be set in a different thread than the call
+    @oneway
+    def change_counted(self, value):
+        self.counted.value = value
+
+    def get_read_count(self):
+        """
+        return (int): number of times the value of .counted has been read
+        """
+        return self.counted.reads
+
+    def get_meta_read_count(self):
+        """
+        return (int): number of times the range of .counted has been read
+        """
+        return self.counted.meta_reads
+
     @roattribute
     def my_value(self):
         return "ro"
@@ -965,6 +1127,24 @@ def executeTask(future, fn, *args, **kwargs):
         future.set_result(result)
 
 
+class ReadCountedIntVA(model.IntContinuous):
+    """
+    VA which counts how many times its value and range are read
+    """
+    def __init__(self, *args, **kwargs):
+        model.IntContinuous.__init__(self, *args, **kwargs)
+        self.reads = 0
+        self.meta_reads = 0
+
+    def _get_value(self):
+        self.reads += 1
+        return model.IntContinuous._get_value(self)
+
+    def _get_range(self):
+        self.meta_reads += 1
+        return model.IntContinuous._get_range(self)
+
+
 class FamilyValueComponent(model.Component):
     """
     Simple component referencing other components
@@ -24,11 +24,16 @@ from __future__ import division
 
 import logging
 from odemis import model
+from odemis.model import _vattributes
+import os
 import pickle
+import threading
+import time
 import unittest
 from unittest.case import skip
 import weakref
 import numpy
+import zmq
 
 logging.getLogger().setLevel(logging.DEBUG)
 
@@ -428,6 +433,214 @@ class VigilantAttributeTest(unittest.TestCase):
         prop.value = ((),) # +1
         self.assertEqual(self.called, 4, "Called has value %s" % self.called)
 
+
+class SubscriptionHubTest(unittest.TestCase):
+    """
+    Test the reception of remote VA values, directly via 0MQ
+    """
+
+    def setUp(self):
+        self._ctx = zmq.Context(1)
+        self.pubs = []
+        self.uris = []
+        for i in range(2):
+            uri = "/tmp/test-va-hub-%d-%d" % (os.getpid(), i)
+            pub = self._ctx.socket(zmq.PUB)
+            pub.bind("ipc://" + uri)
+            self.pubs.append(pub)
+            self.uris.append(uri)
+        self.hub = _vattributes.SubscriptionHub.get("/tmp/test-va-hub.ipc")
+
+    def tearDown(self):
+        for pub in self.pubs:
+            pub.close()
+        self._ctx.term()
+
+    def test_one_thread(self):
+        self.assertIs(self.hub, _vattributes.SubscriptionHub.get("/tmp/test-va-hub.ipc"))
+        nthreads = threading.active_count()
+        listeners = [ListObject() for i in range(50)]
+        keys = []
+        for l in listeners:
+            keys.append(self.hub.subscribe(self.uris[0], l.callback, 0))
+        self.assertEqual(threading.active_count(), nthreads)
+
+        time.sleep(0.1)  # 0MQ connection is asynchronous
+        self.pubs[0].send_pyobj(5)
+        time.sleep(0.2)
+        for l in listeners:
+            self.assertEqual(l.values, [5])
+        # Only the threads calling the listeners are added
+        self.assertLessEqual(threading.active_count(),
+                             nthreads + _vattributes.NOTIFIER_THREADS)
+
+        for k in keys:
+            self.hub.unsubscribe(k)
+        time.sleep(0.1)
+        self.pubs[0].send_pyobj(6)
+        time.sleep(0.2)
+        for l in listeners:
+            self.assertEqual(l.values, [5])
+
+    def test_discard(self):
+        lall = ListObject()  # receives all the values
+        llast = ListObject()  # receives at least the last value
+        kall = self.hub.subscribe(self.uris[0], lall.callback, 0)
+        klast = self.hub.subscribe(self.uris[1], llast.callback, 100)
+        time.sleep(0.1)
+
+        for i in range(100):
+            for pub in self.pubs:
+                pub.send_pyobj(i)
+        time.sleep(0.5)
+
+        self.assertEqual(lall.values, list(range(100)))
+        self.assertEqual(llast.values[-1], 99)
+        self.assertEqual(sorted(llast.values), llast.values)
+        self.hub.unsubscribe(kall)
+        self.hub.unsubscribe(klast)
+
+    def test_subscribe_from_callback(self):
+        linner = ListObject()
+        kinner = []
+
+        def on_value(v):
+            kinner.append(self.hub.subscribe(self.uris[1], linner.callback, 100))
+
+        kouter = self.hub.subscribe(self.uris[0], on_value, 100)
+        time.sleep(0.1)
+        self.pubs[0].send_pyobj(1)
+        time.sleep(0.2)
+        self.pubs[1].send_pyobj(2)
+        time.sleep(0.2)
+        self.assertEqual(linner.values, [2])
+        self.hub.unsubscribe(kouter)
+        self.hub.unsubscribe(kinner[0])
+
+    def test_slow_listener(self):
+        """
+        A slow listener doesn't delay the values of the other VAs
+        """
+        lslow = SlowListObject(1)
+        lfast = ListObject()
+        kslow = self.hub.subscribe(self.uris[0], lslow.callback, 0)
+        kfast = self.hub.subscribe(self.uris[1], lfast.callback, 0)
+        time.sleep(0.1)
+
+        self.pubs[0].send_pyobj(1)
+        self.pubs[0].send_pyobj(2)
+        time.sleep(0.1)
+        self.pubs[1].send_pyobj(3)
+        time.sleep(0.2)
+        self.assertEqual(lfast.values, [3])
+        self.assertEqual(lslow.values, [1])
+
+        # The values of the slow VA are still all notified, in order
+        time.sleep(2)
+        self.assertEqual(lslow.values, [1, 2])
+        self.hub.unsubscribe(kslow)
+        self.hub.unsubscribe(kfast)
+
+    def test_blocking_listeners(self):
+        """
+        Listeners blocking all the notifier threads don't delay the other VAs
+        """
+        unblock = threading.Event()
+        lblocked = [BlockingListObject(unblock) for i in range(_vattributes.NOTIFIER_THREADS + 2)]
+        kblocked = [self.hub.subscribe(self.uris[0], l.callback, 0) for l in lblocked]
+        l = ListObject()
+        k = self.hub.subscribe(self.uris[1], l.callback, 0)
+        time.sleep(0.1)
+
+        try:
+            self.pubs[0].send_pyobj(1)
+            time.sleep(0.1)
+            self.pubs[1].send_pyobj(2)
+            # A new thread is started for every task waiting (for 0.1 s)
+            time.sleep(0.5)
+            self.assertEqual(l.values, [2])
+            for lb in lblocked:
+                self.assertEqual(lb.values, [1])
+        finally:
+            unblock.set()
+
+        for kb in kblocked:
+            self.hub.unsubscribe(kb)
+        self.hub.unsubscribe(k)
+
+    def test_connection_not_blocking(self):
+        """
+        Waiting for the connection of a VA doesn't block the other VAs
+        """
+        l = ListObject()
+        k = self.hub.subscribe(self.uris[0], l.callback, 0)
+        time.sleep(0.1)
+
+        # No publisher => the subscription waits until the connection timeout
+        lnone = ListObject()
+        knone = []
+        t = threading.Thread(target=lambda: knone.append(
+            self.hub.subscribe("/tmp/test-va-hub-none", lnone.callback, 0)))
+        t.start()
+        time.sleep(0.1)
+        self.pubs[0].send_pyobj(1)
+        time.sleep(0.2)
+        self.assertTrue(t.is_alive())
+        self.assertEqual(l.values, [1])
+
+        t.join(_vattributes.CONNECT_TIMEOUT + 1)
+        self.assertFalse(t.is_alive())
+        self.hub.unsubscribe(knone[0])
+        self.hub.unsubscribe(k)
+
+    def test_unique_key(self):
+        """
+        A late unsubscription doesn't stop a newer subscription of the same VA
+        """
+        l = ListObject()
+        kold = self.hub.subscribe(self.uris[0], l.callback, 0)
+        knew = self.hub.subscribe(self.uris[0], l.callback, 0)
+        self.assertNotEqual(kold, knew)
+        self.hub.unsubscribe(kold)
+        time.sleep(0.1)
+
+        self.pubs[0].send_pyobj(4)
+        time.sleep(0.2)
+        self.assertEqual(l.values, [4])
+        self.hub.unsubscribe(knew)
+
+
+class ListObject(object):
+    def __init__(self):
+        self.values = []
+
+    def callback(self, value):
+        self.values.append(value)
+
+
+class BlockingListObject(ListObject):
+    def __init__(self, unblock):
+        """
+        unblock (threading.Event): the callback blocks until it is set
+        """
+        ListObject.__init__(self)
+        self.unblock = unblock
+
+    def callback(self, value):
+        ListObject.callback(self, value)
+        self.unblock.wait()
+
+
+class SlowListObject(ListObject):
+    def __init__(self, delay):
+        ListObject.__init__(self)
+        self.delay = delay
+
+    def callback(self, value):
+        ListObject.callback(self, value)
+        time.sleep(self.delay)
+
+
 class LittleObject(object):
     def __init__(self):
         self.called = 0
@@ -77,6 +77,8 @@ def data_to_static_streams(data):
             # (expected it's on the 4th dim, in s, instead of 5th dim in m).
             # FIXME: make the StaticSpectrumStream more generic, to support any
             # 3D data (ie, dYX).
+            if isinstance(d, model.DataArrayShadow):
+                d = d.getData()
             i3d = [0] * (d.ndim - 2) + [slice(None), slice(None)]
             i3d[ti] = slice(None)
             sda = d[tuple(i3d)] # basically, d[0, :, 0, :, :] for CTZYX
@@ -128,7 +130,8 @@ def data_to_static_streams(data):
             # Now, either it's a flat greyscale image and we decide it's a SEM image,
             # or it's gone too weird and we try again on flat images
             if numpy.prod(d.shape[:-2]) != 1:
-                # FIXME: doesn't work currently if d is a DAS
+                if isinstance(d, model.DataArrayShadow):
+                    d = d.getData()
                 subdas = _split_planes(d)
                 logging.info("Reprocessing data of shape %s into %d sub-data",
                              d.shape, len(subdas))
@@ -156,6 +159,56 @@ def data_to_static_streams(data):
     return result_streams
 
 
+def _load_cost(data):
+    """
+    Estimates how long it takes to create a stream from the data
+    data (DataArray or DataArrayShadow)
+    return (tuple of int): arbitrary unit, the higher, the slower
+    """
+    if getattr(data, "maxzoom", 0) > 0:
+        # Pyramidal: only the tiles needed for the display are loaded
+        return 0, 0
+    # Cubes (eg, spectrum) need more processing than images of the same size
+    is_cube = numpy.prod(data.shape[:-2]) > 1
+    return int(is_cube), numpy.prod(data.shape)
+
+
+def data_to_static_streams_iter(data, on_error=None):
+    """
+    Same as data_to_static_streams(), but creates the streams progressively.
+    The quickest streams are created first: pyramidal images, then the other
+    images by increasing size, then the cubes (eg, spectrum) by increasing
+    size, and finally the AR data (merged in one stream).
+    data (list of DataArrays or DataArrayShadows): data to be split
+    on_error (None or callable): if not None, it is called with the list of
+      data and the exception when creating their streams fails, and the next
+      data is processed. If None, the exception is raised.
+    yields (list of Stream): the streams created for each data. It can be
+      empty (eg, for an anchor region) or contain several streams.
+    """
+    ar_data = []
+    other_data = []
+    for d in data:
+        if model.MD_AR_POLE in d.metadata:
+            ar_data.append(d)
+        else:
+            other_data.append(d)
+
+    groups = [[d] for d in sorted(other_data, key=_load_cost)]
+    if ar_data:
+        groups.append(ar_data)
+
+    for g in groups:
+        try:
+            sts = data_to_static_streams(g)
+        except Exception as ex:
+            if on_error is None:
+                raise
+            on_error(g, ex)
+            continue
+        yield sts
+
+
 def _split_planes(data):
     """ Separate a DataArray into multiple DataArrays along the high dimensions (ie, not XY)
 
@@ -220,6 +273,21 @@ def open_acquisition(filename, fmt=None):
     return data
 
 
+def save_acquisition(exporter, filename, data, thumbnail=None):
+    """
+    Saves the data of an acquisition as fast as possible: if the exporter
+      supports it, the images are compressed in parallel on all the CPUs.
+    exporter (module): the converter to use (cf dataio.get_converter())
+    filename (unicode): filename of the file to create (including path)
+    data (list of model.DataArray): the data to export
+    thumbnail (None or DataArray): image used as thumbnail for the file
+    """
+    kwargs = {}
+    if getattr(exporter, "CAN_COMPRESS_PARALLEL", False):
+        kwargs["parallel"] = True
+    exporter.export(filename, data, thumbnail, **kwargs)
+
+
 def splitext(path):
     """
     Split a pathname into basename + ext (.XXX).
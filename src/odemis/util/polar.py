@@ -16,12 +16,16 @@ You should have received a copy of the GNU General Public License along with Ode
 '''
 from __future__ import division
 
+import collections
 import math
 from matplotlib.delaunay import Triangulation
 from matplotlib.delaunay.triangulate import DuplicatePointWarning
 from numpy import ma
 import numpy
 from odemis import model
+from scipy import ndimage, sparse
+from scipy.spatial import Delaunay
+import threading
 import warnings
 
 
@@ -39,6 +43,13 @@ AR_HOLE_DIAMETER = 0.6e-3  # m, diameter the hole in the mirror
 AR_FOCUS_DISTANCE = 0.5e-3  # m, the vertical mirror cutoff, iow the min distance between the mirror and the sample
 AR_PARABOLA_F = 2.5e-3  # m, parabola_parameter=1/4f
 
+# Cache of the polar projection matrices, as they only depend on the geometry
+# (shape of the image, pixel size, pole position, mirror parameters...).
+# Each matrix takes ~50 MB for a 1134x1134 output.
+MAX_CACHED_PROJECTIONS = 4
+_projection_cache = collections.OrderedDict()  # key -> sparse matrix, LRU ordered
+_projection_cache_lock = threading.Lock()
+
 
 def AngleResolved2Polar(data, output_size, hole=True, dtype=None):
     """
@@ -55,37 +66,80 @@ def AngleResolved2Polar(data, output_size, hole=True, dtype=None):
     assert(len(data.shape) == 2)  # => 2D with greyscale
     # TODO: separate raw projection to another function, named AngleResolved2Rectangular()
 
-    # Get the metadata
+    if dtype is None:
+        dtype = numpy.float64
+
+    # The projection only depends on the geometry, so it's computed once, as
+    # a (sparse) matrix, and reused for all the images with the same geometry.
+    pmatrix = _GetPolarProjection(data, output_size, hole, dtype)
+    qz = pmatrix.dot(numpy.asarray(data, dtype=pmatrix.dtype).ravel())
+    qz.shape = (output_size, output_size)
+
+    result = model.DataArray(qz, data.metadata)
+
+    return result
+
+
+def _GetPolarProjection(data, output_size, hole, dtype):
+    """
+    Returns the matrix to project an angle resolved image to polar view,
+      computing it only if it's not already in the cache.
+    data (model.DataArray): The angle resolved image (only the shape and
+      metadata are used)
+    output_size (int): The size of the output image (assumed to be square)
+    hole (boolean): Crop the pole if True
+    dtype (numpy dtype): intermediary dtype for computing the theta/phi data
+    returns (scipy.sparse.csr_matrix of shape (output_size², Y * X)): matrix
+      which converts the flattened image to the flattened polar view.
+    """
     try:
         pixel_size = data.metadata[model.MD_PIXEL_SIZE]
-        mirror_x, mirror_y = data.metadata[model.MD_AR_POLE]
-        parabola_f = data.metadata.get(model.MD_AR_PARABOLA_F, AR_PARABOLA_F)
+        pole_pos = data.metadata[model.MD_AR_POLE]
     except KeyError:
         raise ValueError("Metadata required: MD_PIXEL_SIZE, MD_AR_POLE.")
 
-    if dtype is None:
-        dtype = numpy.float64
+    key = (data.shape, tuple(pixel_size), tuple(pole_pos),
+           data.metadata.get(model.MD_AR_PARABOLA_F, AR_PARABOLA_F),
+           data.metadata.get(model.MD_AR_XMAX, AR_XMAX),
+           data.metadata.get(model.MD_AR_HOLE_DIAMETER, AR_HOLE_DIAMETER),
+           data.metadata.get(model.MD_AR_FOCUS_DISTANCE, AR_FOCUS_DISTANCE),
+           output_size, hole, numpy.dtype(dtype).str)
 
-    # Crop the input image to half circle
-    cropped_image = _CropHalfCircle(data, pixel_size, (mirror_x, mirror_y), hole)
+    with _projection_cache_lock:
+        try:
+            # Re-insert it, to mark it as the most recently used
+            pmatrix = _projection_cache.pop(key)
+            _projection_cache[key] = pmatrix
+            return pmatrix
+        except KeyError:
+            pass
 
-    theta_data = numpy.empty(shape=cropped_image.shape, dtype=dtype)
-    phi_data = numpy.empty(shape=cropped_image.shape, dtype=dtype)
-    omega_data = numpy.empty(shape=cropped_image.shape)
+    # Computed outside of the lock, as it can take a few seconds
+    pmatrix = _ComputePolarProjection(data, output_size, hole, dtype)
 
-    # For each pixel of the input ndarray, input metadata is used to
-    # calculate the corresponding theta, phi and radiant intensity
-    image_x, image_y = cropped_image.shape
-    jj = numpy.linspace(0, image_y - 1, image_y)
-    xpix = mirror_x - jj
+    with _projection_cache_lock:
+        _projection_cache[key] = pmatrix
+        while len(_projection_cache) > MAX_CACHED_PROJECTIONS:
+            _projection_cache.popitem(last=False)
+
+    return pmatrix
 
-    for i in xrange(image_x):
-        ypix = (i - mirror_y) + (2 * parabola_f) / pixel_size[1]
-        theta, phi, omega = _FindAngle(data, xpix, ypix, pixel_size)
 
-        theta_data[i, :] = theta
-        phi_data[i, :] = phi
-        omega_data[i, :] = cropped_image[i] / omega
+def _ComputePolarProjection(data, output_size, hole, dtype):
+    """
+    Computes the matrix to project an angle resolved image to polar view.
+    It corresponds to a linear interpolation of the (flattened) image pixels,
+    after masking it and dividing it by the solid angle of each pixel.
+    See _GetPolarProjection for the arguments.
+    returns (scipy.sparse.csr_matrix of shape (output_size², Y * X))
+    """
+    pixel_size = data.metadata[model.MD_PIXEL_SIZE]
+    pole_pos = data.metadata[model.MD_AR_POLE]
+
+    # Mask the input image to half circle, and normalise by the solid angle
+    circle_mask = _CreateMirrorMask(data, pixel_size, pole_pos, hole)
+    theta_data, phi_data, omega_data = _ComputeAngles(data, pixel_size, pole_pos, dtype)
+    pxl_weight = (circle_mask / omega_data).ravel()
 
     # Convert into polar coordinates
     h_output_size = output_size / 2
@@ -94,55 +148,65 @@ def AngleResolved2Polar(data, output_size, hole=True, dtype=None):
     theta_data = numpy.cos(phi) * theta
     phi_data = numpy.sin(phi) * theta
 
-    # Interpolation into 2d array
-    # FIXME: griddata() uses a 3x less memory (and especially, doesn't leak),
-    # but it's 5x slower
-    # => create a cpython function calling libqhull directly?
-#     grid_x, grid_y = numpy.mgrid[-h_output_size:h_output_size:output_size * 1j,
-#                                  - h_output_size:h_output_size:output_size * 1j]
-#
-#     #One way possible to increase the speed is to discard points too close from
-#     #each other. Everything < 1 px apart is pretty useless. As they are
-#     #spatially ordered, it's shouldn't be too costly to check
-#     #See kmeans clustering maybe?
-#     #nt, np, no = [theta_data[0, 0]], [phi_data[0, 0]], [omega_data[0, 0]]
-#     #for t, p, o in zip(theta_data.flat, phi_data.flat, omega_data.flat):
-#     #    if math.hypot(t - nt[-1], p - np[-1]) > 0.9:
-#     #        nt.append(t)
-#     #        np.append(p)
-#     #        no.append(o)
-#     #logging.warning("Reduce size to %d", len(no))
-#     #qz = griddata((nt, np), no, (grid_x, grid_y), method='linear', fill_value=0)
-#     qz = griddata((theta_data.flat, phi_data.flat), omega_data.flat, (grid_x, grid_y),
-#                   method='linear', fill_value=0)
-#     qz = qz[:, ::-1]
-
-    # Warning: Uses a lot of memory, which is not recovered until the thread is
-    # ended. Every thread will use a different memory pool.
-    # FIXME: need rotation (=swap axes), but swapping theta/phi slows down the
-    # interpolation by 3 ?!
-    with warnings.catch_warnings():
-        # Some points might be so close that they are identical (within float
-        # precision). It's fine, no need to generate a warning.
-        warnings.simplefilter("ignore", DuplicatePointWarning)
-        triang = Triangulation(theta_data.flat, phi_data.flat)  # FIXME: Leaks memory when run in a separate thread
-    interp = triang.linear_interpolator(omega_data.flat, default_value=0)
-    qz = interp[-h_output_size:h_output_size:complex(0, output_size),  # Y
-                - h_output_size:h_output_size:complex(0, output_size)]  # X
-    qz = qz.swapaxes(0, 1)[:, ::-1]  # rotate by 90°
-
-# TODO use the standard matplotlib.tri.Triangulation, but it uses 3x more memory
-# also leaks, and is slower!
-#     triang = Triangulation(phi_data.flat, theta_data.flat)
-#     interp = LinearTriInterpolator(triang, omega_data.flat)
-#     xi, yi = numpy.meshgrid(numpy.linspace(-h_output_size, h_output_size, output_size),
-#                             numpy.linspace(-h_output_size, h_output_size, output_size))
-#     qz = interp(xi, yi)
-#     qz = qz[:, ::-1]
-
-    result = model.DataArray(qz, data.metadata)
+    # Linear interpolation (on a Delaunay triangulation) into the 2D output.
+    # For each output pixel, it's just a weighted sum of the 3 pixels of the
+    # triangle in which it falls. Outside of the triangulation, the value is 0.
+    # The output is rotated by 90° (ie, theta is the first dimension, and phi
+    # is the second, inverted).
+    # The pixels far outside of the mirror are always 0, so they don't need to
+    # be part of the triangulation (which is the slowest part). A border is
+    # kept, so that the triangles along the edge of the mirror are unchanged.
+    outer_mask = _CreateMirrorMask(data, pixel_size, pole_pos, hole=False)
+    used = ndimage.binary_dilation(outer_mask, iterations=3).ravel()
+    used_idx = numpy.nonzero(used)[0]
+    points = numpy.column_stack((theta_data.ravel()[used], phi_data.ravel()[used]))
+    triang = Delaunay(points.astype(numpy.float64))
+    grid = numpy.linspace(-h_output_size, h_output_size, output_size)
+    grid_t, grid_p = numpy.meshgrid(grid, grid[::-1], indexing="ij")
+    grid_pts = numpy.column_stack((grid_t.ravel(), grid_p.ravel()))
+    simplices = triang.find_simplex(grid_pts)
+    inside = numpy.nonzero(simplices >= 0)[0]
+    simplices = simplices[inside]
+
+    # Barycentric coordinates of each output pixel in its triangle
+    trans = triang.transform[simplices]
+    bary = numpy.einsum("nij,nj->ni", trans[:, :2], grid_pts[inside] - trans[:, 2])
+    bary = numpy.column_stack((bary, 1 - bary.sum(axis=1)))
+    # Output pixels exactly on an edge get tiny weights due to rounding errors
+    bary[numpy.abs(bary) < 1e-12] = 0
+    vertices = used_idx[triang.simplices[simplices]]
+
+    if numpy.dtype(dtype).itemsize < 8:
+        wdtype = numpy.float32  # Reduced precision, to save memory
+    else:
+        wdtype = numpy.float64
+    weights = (bary * pxl_weight[vertices]).astype(wdtype)
+    pmatrix = sparse.csr_matrix((weights.ravel(),
+                                 (numpy.repeat(inside, 3), vertices.ravel())),
+                                shape=(output_size * output_size, pxl_weight.size))
+    pmatrix.eliminate_zeros()  # All the pixels outside of the mask
+    return pmatrix
+
+
+def _ComputeAngles(data, pixel_size, pole_pos, dtype):
+    """
+    Computes the angles of the ray corresponding to each pixel of the image
+    data (model.DataArray): The DataArray with the image
+    pixel_size (float, float): effective pixel size = sensor_pixel_size * binning / magnification
+    pole_pos (float, float): x/y coordinates of the pole (MD_AR_POLE)
+    dtype (numpy dtype): dtype of the theta/phi data
+    returns (3 numpy.arrays of the same shape as data): theta, phi, and omega
+      (solid angle)
+    """
+    parabola_f = data.metadata.get(model.MD_AR_PARABOLA_F, AR_PARABOLA_F)
+    mirror_x, mirror_y = pole_pos
+    image_x, image_y = data.shape
+    xpix = mirror_x - numpy.arange(image_y)
+    ypix = (numpy.arange(image_x) - mirror_y) + (2 * parabola_f) / pixel_size[1]
+    theta, phi, omega = _FindAngle(data, xpix[numpy.newaxis, :],
+                                   ypix[:, numpy.newaxis], pixel_size)
 
-    return result
+    return theta.astype(dtype), phi.astype(dtype), omega
 
 
 def AngleResolved2Rectangular(data, output_size, hole=True, dtype=None):
@@ -175,23 +239,11 @@ def AngleResolved2Rectangular(data, output_size, hole=True, dtype=None):
     # Crop the input image to half circle
     cropped_image = _CropHalfCircle(data, pixel_size, (mirror_x, mirror_y), hole)
 
-    theta_data = numpy.empty(shape=cropped_image.shape, dtype=dtype)
-    phi_data = numpy.empty(shape=cropped_image.shape, dtype=dtype)
-    omega_data = numpy.empty(shape=cropped_image.shape)
-
     # For each pixel of the input ndarray, input metadata is used to
     # calculate the corresponding theta, phi and radiant intensity
-    image_x, image_y = cropped_image.shape
-    jj = numpy.linspace(0, image_y - 1, image_y)
-    xpix = mirror_x - jj
-
-    for i in xrange(image_x):
-        ypix = (i - mirror_y) + (2 * parabola_f) / pixel_size[1]
-        theta, phi, omega = _FindAngle(data, xpix, ypix, pixel_size)
-
-        theta_data[i, :] = theta
-        phi_data[i, :] = phi
-        omega_data[i, :] = cropped_image[i] / omega
+    theta_data, phi_data, omega = _ComputeAngles(data, pixel_size,
+                                                 (mirror_x, mirror_y), dtype)
+    omega_data = cropped_image / omega
 
     # compute new mask
     phi_lin = numpy.linspace(0, 2 * math.pi, output_size[1])
@@ -240,7 +292,8 @@ def _FindAngle(data, xpix, ypix, pixel_size):
     For given pixels, finds the angle of the corresponding ray
     data (model.DataArray): The DataArray with the image
     xpix (numpy.array): x coordinates of the pixels
-    ypix (float): y coordinate of the pixel
+    ypix (float or numpy.array): y coordinate of the pixels (must be
+      broadcastable with xpix)
     pixel_size (2 floats): CCD pixelsize (X/Y)
     returns (3 numpy.arrays): theta, phi (the corresponding spherical coordinates for each pixel in ccd)
                               and omega (solid angle)
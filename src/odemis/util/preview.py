@@ -0,0 +1,379 @@
+# -*- coding: utf-8 -*-
+"""
+Created on 18 Oct 2026
+
+@author: Éric Piel
+
+Copyright © 2026 Éric Piel, Delmic
+
+This file is part of Odemis.
+
+Odemis is free software: you can redistribute it and/or modify it under the terms of the GNU
+General Public License version 2 as published by the Free Software Foundation.
+
+Odemis is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even
+the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU General
+Public License for more details.
+
+You should have received a copy of the GNU General Public License along with Odemis. If not,
+see http://www.gnu.org/licenses/.
+
+"""
+# On-disk cache of the previews of the acquisition files: for each file, its
+# thumbnail and a short summary of its metadata. This avoids opening every
+# file when browsing a folder containing many acquisitions.
+
+from __future__ import division
+
+from concurrent.futures import CancelledError
+import hashlib
+import json
+import logging
+import numpy
+from odemis import model, dataio
+from odemis.acq._futures import executeTask
+from odemis.util import img
+import os
+import threading
+import time
+
+
+PREVIEW_CACHE_SIZE = 64 * 2 ** 20  # B, default maximum size of the cache on disk
+
+# Extension of the files of each entry
+SUMMARY_EXT = ".json"
+THUMB_EXT = ".npy"
+
+
+def summarize_metadata(data):
+    """
+    Create a compact summary of the content of an acquisition file
+    data (list of DataArray(Shadow)): the content of the file
+    return (dict): contains "acq_date" (float or None): the acquisition date of
+      the newest data, and "data" (list of dict): for each data, its
+      "description" (unicode), "shape" (list of int), "dims" (str),
+      "dtype" (str), and "acq_date" (float or None).
+    """
+    ldata = []
+    for d in data:
+        md = d.metadata
+        ldata.append({"description": md.get(model.MD_DESCRIPTION, u""),
+                      "shape": list(d.shape),
+                      "dims": md.get(model.MD_DIMS, "CTZYX"[-len(d.shape):]),
+                      "dtype": numpy.dtype(d.dtype).str,
+                      "acq_date": md.get(model.MD_ACQ_DATE),
+                     })
+
+    acq_dates = [s["acq_date"] for s in ldata if s["acq_date"] is not None]
+    return {"acq_date": max(acq_dates) if acq_dates else None,
+            "data": ldata}
+
+
+def thumbnail_to_rgb(thumb):
+    """
+    Convert a thumbnail to an RGB image, so that it can be directly displayed
+    thumb (DataArray): greyscale (YX) or RGB(A) image, with the colour as
+      first (CYX) or last (YXC) dimension
+    return (numpy.ndarray of uint8 of shape YX3 or YX4): the RGB(A) image
+    raises:
+        ValueError if the thumbnail cannot be converted
+    """
+    if thumb.ndim == 2:
+        return img.DataArray2RGB(thumb)
+    elif thumb.ndim != 3:
+        raise ValueError("Thumbnail of shape %s is not an image" % (thumb.shape,))
+
+    dims = getattr(thumb, "metadata", {}).get(model.MD_DIMS)
+    if dims is None:
+        dims = "YXC" if thumb.shape[-1] in (3, 4) else "CYX"
+    if dims == "CYX":
+        thumb = numpy.rollaxis(thumb, 0, 3)
+    elif dims != "YXC":
+        raise ValueError("Thumbnail with dimensions %s not supported" % (dims,))
+    if thumb.shape[-1] not in (3, 4) or thumb.dtype != numpy.uint8:
+        raise ValueError("Thumbnail of shape %s and type %s is not RGB" %
+                         (thumb.shape, thumb.dtype))
+    return numpy.ascontiguousarray(thumb)
+
+
+def read_preview(filename):
+    """
+    Read the thumbnail and the summary of the metadata of an acquisition file.
+      If the format supports it (eg, TIFF and HDF5), the data itself is not
+      read, only the metadata and the thumbnail.
+    filename (unicode): path to the file
+    return (numpy.ndarray or None, dict): the first thumbnail of the file as
+      an RGB image (cf thumbnail_to_rgb()), or None if it has no thumbnail, and
+      the summary of the metadata (cf summarize_metadata())
+    raises:
+        IOError in case the file format is not as expected.
+    """
+    converter = dataio.find_fittest_converter(filename, mode=os.O_RDONLY)
+    if hasattr(converter, "open_data"):
+        acd = converter.open_data(filename)
+        data = acd.content
+        thumb = acd.thumbnails[0].getData() if acd.thumbnails else None
+    else:
+        logging.debug("Format %s doesn't support partial reading, so %s is "
+                      "fully read", converter.FORMAT, filename)
+        data = converter.read_data(filename)
+        thumb = None
+        if hasattr(converter, "read_thumbnail"):
+            thumbs = converter.read_thumbnail(filename)
+            if thumbs:
+                thumb = thumbs[0]
+
+    if thumb is not None:
+        try:
+            thumb = thumbnail_to_rgb(thumb)
+        except ValueError as ex:
+            logging.info("Skipping thumbnail of %s: %s", filename, ex)
+            thumb = None
+
+    return thumb, summarize_metadata(data)
+
+
+class PreviewCache(object):
+    """
+    Stores on disk the preview of acquisition files (cf read_preview()).
+    Each entry is identified by the path, the modification time and the size
+      of the file, so a modified file is read again. When the cache grows
+      bigger than its maximum size, the least recently used entries are
+      removed.
+    It is thread-safe.
+    """
+
+    def __init__(self, directory, max_size=PREVIEW_CACHE_SIZE):
+        """
+        directory (unicode): path to the directory where to store the cache.
+          It is created if it doesn't exist.
+        max_size (0<int): maximum size of the files of the cache (in bytes)
+        """
+        self.directory = directory
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+        self._entries = {}  # key (str) -> [last use (float), size (int)]
+        self._total_size = 0
+        self._load_index()
+
+    def _load_index(self):
+        """
+        Find the entries already in the cache directory
+        """
+        for fn in os.listdir(self.directory):
+            key, ext = os.path.splitext(fn)
+            if ext not in (SUMMARY_EXT, THUMB_EXT):
+                continue
+            st = os.stat(os.path.join(self.directory, fn))
+            e = self._entries.setdefault(key, [0, 0])
+            if ext == SUMMARY_EXT:
+                # the modification time of the summary is the time of last use
+                e[0] = st.st_mtime
+            e[1] += st.st_size
+            self._total_size += st.st_size
+
+    def _get_key(self, filename):
+        """
+        return (str): the identifier of the entry corresponding to the file
+        raises:
+            OSError: if the file doesn't exist
+        """
+        filename = os.path.abspath(filename)
+        st = os.stat(filename)
+        if isinstance(filename, unicode):
+            filename = filename.encode("utf-8")
+        return hashlib.sha1("%s|%r|%d" % (filename, st.st_mtime, st.st_size)).hexdigest()
+
+    def _get_path(self, key, ext):
+        return os.path.join(self.directory, key + ext)
+
+    def __contains__(self, filename):
+        try:
+            key = self._get_key(filename)
+        except OSError:
+            return False
+        with self._lock:
+            return key in self._entries
+
+    def get(self, filename):
+        """
+        Read the preview of a file, from the cache if it's present, or from the
+          file otherwise (and it's then added to the cache).
+        filename (unicode): path to the file
+        return (numpy.ndarray or None, dict): the thumbnail and the summary of the
+          metadata (cf read_preview())
+        raises:
+            IOError/OSError if the file cannot be read
+        """
+        key = self._get_key(filename)
+        with self._lock:
+            if key in self._entries:
+                try:
+                    return self._read_entry(key)
+                except Exception:
+                    logging.warning("Failed to read preview cache entry %s, will regenerate it",
+                                    key, exc_info=True)
+                    self._remove_entry(key)
+
+        thumb, summary = read_preview(filename)
+        with self._lock:
+            try:
+                self._write_entry(key, thumb, summary)
+                self._evict()
+            except (IOError, OSError):
+                logging.warning("Failed to store preview of %s in the cache",
+                                filename, exc_info=True)
+                self._remove_entry(key)
+        return thumb, summary
+
+    def _read_entry(self, key):
+        """
+        Must be called with the lock taken
+        """
+        spath = self._get_path(key, SUMMARY_EXT)
+        with open(spath) as f:
+            summary = json.load(f)
+        tpath = self._get_path(key, THUMB_EXT)
+        if os.path.exists(tpath):
+            thumb = numpy.load(tpath)
+        else:
+            thumb = None
+
+        # Record the time of use, for the LRU eviction
+        now = time.time()
+        os.utime(spath, (now, now))
+        self._entries[key][0] = now
+        return thumb, summary
+
+    def _write_entry(self, key, thumb, summary):
+        """
+        Must be called with the lock taken
+        """
+        if key in self._entries:
+            # Written simultaneously by another thread => replace it
+            self._remove_entry(key)
+
+        size = 0
+        if thumb is not None:
+            tpath = self._get_path(key, THUMB_EXT)
+            numpy.save(tpath, numpy.asarray(thumb))
+            size += os.path.getsize(tpath)
+
+        spath = self._get_path(key, SUMMARY_EXT)
+        with open(spath, "w") as f:
+            json.dump(summary, f)
+        size += os.path.getsize(spath)
+
+        self._entries[key] = [time.time(), size]
+        self._total_size += size
+
+    def _remove_entry(self, key):
+        """
+        Must be called with the lock taken
+        """
+        for ext in (SUMMARY_EXT, THUMB_EXT):
+            try:
+                os.remove(self._get_path(key, ext))
+            except OSError:
+                pass  # Probably didn't exist
+        try:
+            self._total_size -= self._entries.pop(key)[1]
+        except KeyError:
+            pass
+
+    def _evict(self):
+        """
+        Remove the least recently used entries until the cache is small enough
+        Must be called with the lock taken
+        """
+        if self._total_size <= self.max_size:
+            return
+        lru = sorted(self._entries.items(), key=lambda i: i[1][0])
+        for key, (lastu, size) in lru:
+            if self._total_size <= self.max_size:
+                break
+            logging.debug("Removing preview %s from the cache", key)
+            self._remove_entry(key)
+
+    def clear(self):
+        """
+        Remove all the entries of the cache
+        """
+        with self._lock:
+            for key in list(self._entries.keys()):
+                self._remove_entry(key)
+
+
+def list_acquisition_files(directory):
+    """
+    return (list of unicode): the files which can be read by Odemis in the
+      directory (not recursive), the most recent ones first.
+    """
+    exts = set()
+    for fexts in dataio.get_available_formats(os.O_RDONLY).values():
+        exts.update(fexts)
+
+    files = []
+    for fn in os.listdir(directory):
+        if any(fn.endswith(e) for e in exts):
+            path = os.path.join(directory, fn)
+            if os.path.isfile(path):
+                files.append(path)
+
+    return sorted(files, key=os.path.getmtime, reverse=True)
+
+
+def index_directory(cache, directory):
+    """
+    Add to the cache the preview of all the acquisition files of a directory.
+      It runs in a separate thread.
+    cache (PreviewCache): the cache to fill
+    directory (unicode): path to the directory
+    return (ProgressiveFuture): to follow the progress, or cancel the indexing.
+      Its result is the number of files indexed.
+    """
+    f = model.ProgressiveFuture()
+    f._index_must_stop = threading.Event()
+    f.task_canceller = _cancel_index_directory
+
+    index_thread = threading.Thread(target=executeTask,
+                                    name="Preview indexing",
+                                    args=(f, _do_index_directory, f, cache, directory))
+    index_thread.daemon = True
+    index_thread.start()
+    return f
+
+
+def _cancel_index_directory(future):
+    future._index_must_stop.set()
+    return True
+
+
+def _do_index_directory(future, cache, directory):
+    """
+    The actual work of index_directory()
+    raises:
+        CancelledError() if cancelled
+    """
+    startt = time.time()
+    files = list_acquisition_files(directory)
+    nindexed = 0
+    for i, fn in enumerate(files):
+        if future._index_must_stop.is_set():
+            raise CancelledError()
+        if fn not in cache:
+            try:
+                cache.get(fn)
+                nindexed += 1
+            except Exception as ex:
+                logging.info("Skipping preview of %s: %s", fn, ex)
+
+        # Estimate the end based on the time spent so far
+        dur = time.time() - startt
+        future.set_progress(end=time.time() + dur / (i + 1) * (len(files) - i - 1))
+
+    logging.debug("Indexed %d new files out of %d in %s", nindexed, len(files), directory)
+    return nindexed
@@ -22,7 +22,7 @@ from odemis import model
 from odemis.acq import stream
 from odemis.dataio import tiff
 from odemis.util.dataio import data_to_static_streams, open_acquisition, \
-    splitext
+    splitext, data_to_static_streams_iter
 import time
 import unittest
 
@@ -137,6 +137,50 @@ class TestDataIO(unittest.TestCase):
         self.assertEqual(bright, 1)
         self.assertEqual(sem, 1)
 
+    def test_data_to_stream_iter(self):
+        """
+        Check data_to_static_streams_iter creates the images first, then the cubes
+        """
+        md_sem = {model.MD_DESCRIPTION: "sem",
+                  model.MD_PIXEL_SIZE: (1e-7, 1e-7),  # m/px
+                  model.MD_POS: (1e-3, -30e-3),  # m
+                 }
+        md_spec = {model.MD_DESCRIPTION: "spectrum",
+                   model.MD_PIXEL_SIZE: (1e-6, 1e-6),  # m/px
+                   model.MD_POS: (1e-3, -30e-3),  # m
+                   model.MD_WL_LIST: list(numpy.linspace(500e-9, 600e-9, 10)),
+                  }
+        md_ar = {model.MD_DESCRIPTION: "ar",
+                 model.MD_PIXEL_SIZE: (1e-6, 1e-6),  # m/px
+                 model.MD_POS: (1e-3, -30e-3),  # m
+                 model.MD_AR_POLE: (100, 100),  # px
+                }
+        ldata = [model.DataArray(numpy.zeros((200, 200), numpy.uint16), md_ar.copy()),
+                 model.DataArray(numpy.zeros((10, 1, 1, 20, 30), numpy.uint16), md_spec),
+                 model.DataArray(numpy.zeros((200, 200), numpy.uint16), md_ar.copy()),
+                 model.DataArray(numpy.zeros((256, 512), numpy.uint16), md_sem),
+                ]
+
+        # The spectrum cube is smaller than the SEM image, but comes after it
+        lsts = list(data_to_static_streams_iter(ldata))
+        self.assertEqual(len(lsts), 3)
+        self.assertEqual([len(sts) for sts in lsts], [1, 1, 1])
+        self.assertIsInstance(lsts[0][0], stream.EMStream)
+        self.assertIsInstance(lsts[1][0], stream.StaticSpectrumStream)
+        self.assertIsInstance(lsts[2][0], stream.StaticARStream)
+
+        # A data which fails is reported, and the other ones are still created
+        # (spectrum cubes with several time points are not supported)
+        ldata[1] = model.DataArray(numpy.zeros((10, 2, 1, 20, 30), numpy.uint16), md_spec)
+        errors = []
+        lsts = list(data_to_static_streams_iter(ldata,
+                                                on_error=lambda d, ex: errors.append(d)))
+        self.assertEqual(len(errors), 1)
+        self.assertIs(errors[0][0], ldata[1])
+        self.assertEqual(len(lsts), 2)
+        self.assertIsInstance(lsts[0][0], stream.EMStream)
+        self.assertIsInstance(lsts[1][0], stream.StaticARStream)
+
     def test_data_to_stream_pyramidal(self):
         """
         Check data_to_static_streams with pyramidal images using DataArrayShadows
@@ -141,6 +141,32 @@ class TestPolarConversion(unittest.TestCase):
 
         numpy.testing.assert_allclose(result, desired_output[0], rtol=1e-04)
 
+    def test_cached_projection(self):
+        """
+        Test that converting twice the same geometry gives the same result, and
+        that a change of geometry is taken into account.
+        """
+        data = self.data
+        C, T, Z, Y, X = data[0].shape
+        data[0].shape = Y, X
+        result = polar.AngleResolved2Polar(data[0], 201)
+
+        # Same geometry, different data => re-uses the projection
+        data2 = model.DataArray(data[0] * 2, data[0].metadata.copy())
+        result2 = polar.AngleResolved2Polar(data2, 201)
+        numpy.testing.assert_allclose(result2, result * 2, rtol=1e-04)
+
+        # Pole position changed => different projection
+        pole = data2.metadata[model.MD_AR_POLE]
+        data2.metadata[model.MD_AR_POLE] = (pole[0] + 10, pole[1])
+        result3 = polar.AngleResolved2Polar(data2, 201)
+        self.assertFalse(numpy.allclose(result3, result * 2, rtol=1e-04))
+
+        # Cache never grows bigger than the maximum
+        for i in range(polar.MAX_CACHED_PROJECTIONS + 2):
+            polar.AngleResolved2Polar(data[0], 51 + i)
+        self.assertLessEqual(len(polar._projection_cache), polar.MAX_CACHED_PROJECTIONS)
+
     def test_uint16_input(self):
         """
         Tests for input of DataArray with uint16 ndarray.
@@ -0,0 +1,161 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+Created on 18 Oct 2026
+
+@author: Éric Piel
+
+Copyright © 2026 Éric Piel, Delmic
+
+This file is part of Odemis.
+
+Odemis is free software: you can redistribute it and/or modify it under the terms of the GNU General Public License version 2 as published by the Free Software Foundation.
+
+Odemis is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License along with Odemis. If not, see http://www.gnu.org/licenses/.
+'''
+from __future__ import division
+
+import logging
+import numpy
+from odemis import model
+from odemis.dataio import tiff, hdf5
+from odemis.util import preview
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+
+logging.getLogger().setLevel(logging.DEBUG)
+
+
+class TestPreviewCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.cachedir = os.path.join(self.tmpdir, "cache")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def _create_file(self, name, exporter=tiff, shape=(256, 512)):
+        """
+        return (unicode): path to a new acquisition file with a thumbnail
+        """
+        md = {model.MD_DESCRIPTION: u"sem",
+              model.MD_ACQ_DATE: time.time(),
+              model.MD_PIXEL_SIZE: (1e-7, 1e-7),  # m/px
+              model.MD_POS: (1e-3, -30e-3),  # m
+             }
+        data = model.DataArray(numpy.zeros(shape, numpy.uint16), md)
+        thumbnail = model.DataArray(numpy.zeros((20, 30, 3), numpy.uint8))
+        thumbnail[:, :, 0] = 255  # red
+        fn = os.path.join(self.tmpdir, name + exporter.EXTENSIONS[0])
+        exporter.export(fn, [data], thumbnail)
+        return fn
+
+    def test_get(self):
+        fn = self._create_file("test1")
+        cache = preview.PreviewCache(self.cachedir)
+        self.assertNotIn(fn, cache)
+
+        thumb, summary = cache.get(fn)
+        self.assertIn(fn, cache)
+        self.assertEqual(thumb.shape, (20, 30, 3))
+        self.assertEqual(len(summary["data"]), 1)
+        self.assertEqual(summary["data"][0]["description"], u"sem")
+        self.assertEqual(summary["data"][0]["shape"][-2:], [256, 512])
+        self.assertIsNotNone(summary["acq_date"])
+
+        # Read again, from the cache: the same result
+        thumb2, summary2 = cache.get(fn)
+        numpy.testing.assert_array_equal(thumb, thumb2)
+        self.assertEqual(summary, summary2)
+
+        # A new cache object on the same directory finds the previous entries
+        cache = preview.PreviewCache(self.cachedir)
+        self.assertIn(fn, cache)
+
+        # After modification of the file, it's not in the cache anymore
+        time.sleep(0.01)
+        self._create_file("test1", shape=(100, 200))
+        self.assertNotIn(fn, cache)
+        thumb, summary = cache.get(fn)
+        self.assertEqual(summary["data"][0]["shape"][-2:], [100, 200])
+
+    def test_hdf5(self):
+        fn = self._create_file("test1", exporter=hdf5)
+        cache = preview.PreviewCache(self.cachedir)
+
+        # Only the thumbnail should be read, not the data
+        read_shapes = []
+        orig_get_data = hdf5.DataArrayShadowHDF5.getData
+        def getData(das):
+            read_shapes.append(das.shape)
+            return orig_get_data(das)
+
+        hdf5.DataArrayShadowHDF5.getData = getData
+        try:
+            thumb, summary = cache.get(fn)
+        finally:
+            hdf5.DataArrayShadowHDF5.getData = orig_get_data
+
+        self.assertEqual(read_shapes, [(20, 30, 3)])
+        self.assertEqual(thumb.shape, (20, 30, 3))
+        self.assertEqual(len(summary["data"]), 1)
+        self.assertEqual(summary["data"][0]["shape"][-2:], [256, 512])
+
+    def test_thumbnail_to_rgb(self):
+        grey = model.DataArray(numpy.zeros((20, 30), numpy.uint16))
+        self.assertEqual(preview.thumbnail_to_rgb(grey).shape, (20, 30, 3))
+
+        cyx = model.DataArray(numpy.zeros((3, 20, 30), numpy.uint8),
+                              {model.MD_DIMS: "CYX"})
+        rgb = preview.thumbnail_to_rgb(cyx)
+        self.assertEqual(rgb.shape, (20, 30, 3))
+        self.assertEqual(rgb.dtype, numpy.uint8)
+
+        with self.assertRaises(ValueError):
+            preview.thumbnail_to_rgb(model.DataArray(numpy.zeros((20, 30, 3), numpy.float32)))
+
+    def test_eviction(self):
+        fns = [self._create_file("test%d" % i) for i in range(5)]
+        cache = preview.PreviewCache(self.cachedir)
+        cache.get(fns[0])
+        entry_size = cache._total_size
+
+        # Only 3 entries fit
+        cache = preview.PreviewCache(self.cachedir, max_size=entry_size * 3.5)
+        for fn in fns[1:4]:
+            cache.get(fn)
+        cache.get(fns[0])  # Used recently => should be kept
+        cache.get(fns[4])
+        self.assertLessEqual(cache._total_size, cache.max_size)
+        self.assertIn(fns[0], cache)
+        self.assertNotIn(fns[1], cache)
+        self.assertIn(fns[4], cache)
+
+        cache.clear()
+        self.assertEqual(cache._total_size, 0)
+        self.assertEqual(os.listdir(self.cachedir), [])
+
+    def test_index_directory(self):
+        fns = [self._create_file("test%d" % i) for i in range(4)]
+        with open(os.path.join(self.tmpdir, "notes.txt"), "w") as f:
+            f.write("not an acquisition")
+        cache = preview.PreviewCache(self.cachedir)
+        f = preview.index_directory(cache, self.tmpdir)
+        self.assertEqual(f.result(30), 4)
+        for fn in fns:
+            self.assertIn(fn, cache)
+
+        # Nothing new to index
+        f = preview.index_directory(cache, self.tmpdir)
+        self.assertEqual(f.result(30), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()